@@ -234,6 +234,7 @@ setup_args = {
     'package_dir'        : {'': 'src'},
     'scripts'            : [
                             'bin/radical-pilot-agent',
+                            'bin/radical-pilot-agent-report',
                             'bin/radical-pilot-agent-statepush',
                             'bin/radical-pilot-bridge',
                             'bin/radical-pilot-bson2json',
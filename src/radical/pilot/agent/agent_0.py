@@ -264,6 +264,12 @@ class Agent_0(rpu.Worker):
         self._hb.stop()
         self._cmgr.close()
 
+        # components are gone - remove the task descriptions they left behind
+        # (in any store enabled bridge, not only in those used by this agent)
+        if any(bcfg.get('task_store')
+               for bcfg in self._cfg.get('bridges', {}).values()):
+            rpu.TaskStore.purge(self._cfg.sid)
+
         if self._rm:
             self._rm.stop()
 
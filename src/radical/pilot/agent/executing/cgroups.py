@@ -0,0 +1,215 @@
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import os
+import errno
+
+
+# cgroup v2 mount point
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# period for `cpu.max` (usec)
+_CPU_PERIOD = 100000
+
+# attempts to move processes between cgroups (processes may fork meanwhile)
+_MOVE_ATTEMPTS = 3
+
+
+# ------------------------------------------------------------------------------
+#
+class TaskCgroups(object):
+    '''
+    Manage one cgroup (v2) per task: the cgroup limits the task's memory and
+    CPU use to what the scheduler assigned to it, and accounts for what the task
+    actually used.
+
+    Task cgroups are created below `base`.  If no `base` is given, a cgroup
+    named `name` is created below the agent's own cgroup - which requires the
+    `memory` and `cpu` controllers to be delegated to the agent.  As a cgroup
+    which holds processes can't enable controllers for its children, the
+    processes of the agent's cgroup are then moved into a leaf cgroup named
+    `agent`.  If the cgroups can't be set up, `available` is `False`.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, log, name, base=None):
+
+        self._log  = log
+        self._base = None
+
+        try:
+            self._base = self._setup(name, base)
+            self._log.info('task cgroups at %s', self._base)
+
+        except Exception as e:
+            self._log.warn('task cgroups not available: %s', e)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def available(self):
+
+        return bool(self._base)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _setup(self, name, base):
+
+        if not base:
+
+            if not os.path.isfile('%s/cgroup.controllers' % CGROUP_ROOT):
+                raise RuntimeError('no cgroup v2 hierarchy')
+
+            own = self._own_cgroup()
+            if own is None:
+                raise RuntimeError('agent is not in a cgroup v2')
+
+            parent = os.path.normpath('%s/%s' % (CGROUP_ROOT, own))
+
+            try:
+                self._write(parent, 'cgroup.subtree_control', '+memory +cpu')
+
+            except OSError as e:
+                if e.errno != errno.EBUSY:
+                    raise
+
+                # the no-internal-process rule: move the agent's processes
+                # into a leaf cgroup before enabling the controllers
+                self._log.info('move processes of %s to a leaf cgroup', parent)
+                self._move_procs(parent, '%s/agent' % parent)
+                self._write(parent, 'cgroup.subtree_control', '+memory +cpu')
+
+            base = '%s/%s' % (parent, name)
+
+        os.makedirs(base, exist_ok=True)
+        self._write(base, 'cgroup.subtree_control', '+memory +cpu')
+
+        return base
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _own_cgroup(self):
+        '''
+        return the path of the agent's cgroup (v2), relative to `CGROUP_ROOT`
+        '''
+
+        with open('/proc/self/cgroup', 'r') as fin:
+            for line in fin:
+                if line.startswith('0::'):
+                    return line[3:].strip()
+
+        return None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _move_procs(self, src, tgt):
+        '''
+        move all processes of cgroup `src` into cgroup `tgt` (which is created
+        if needed)
+        '''
+
+        os.makedirs(tgt, exist_ok=True)
+
+        for _ in range(_MOVE_ATTEMPTS):
+
+            pids = (self._read(src, 'cgroup.procs') or '').split()
+            if not pids:
+                break
+
+            for pid in pids:
+                try:
+                    self._write(tgt, 'cgroup.procs', pid)
+                except OSError as e:
+                    # the process is gone (or can't be moved)
+                    self._log.debug('cannot move process %s: %s', pid, e)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _write(self, path, fname, data):
+
+        with open('%s/%s' % (path, fname), 'w') as fout:
+            fout.write(data)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _read(self, path, fname):
+
+        try:
+            with open('%s/%s' % (path, fname), 'r') as fin:
+                return fin.read()
+        except OSError:
+            return None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def create(self, uid, n_cores=0, mem=0):
+        '''
+        Create a cgroup for the given task, limited to `n_cores` cores and `mem`
+        MB of memory (no limit for `0`), and return its path.  Processes are
+        moved into the cgroup by writing their pid to `<path>/cgroup.procs`.
+        '''
+
+        path = '%s/%s' % (self._base, uid)
+        os.mkdir(path)
+
+        if mem:
+            self._write(path, 'memory.max', '%d' % (mem * 1024 * 1024))
+
+        if n_cores:
+            self._write(path, 'cpu.max', '%d %d' % (n_cores * _CPU_PERIOD,
+                                                    _CPU_PERIOD))
+        return path
+
+
+    # --------------------------------------------------------------------------
+    #
+    def collect(self, path):
+        '''
+        Return the resource usage of the (completed) task in the given cgroup,
+        and remove the cgroup:
+
+          - `cpu_time`: user and system CPU time of all task processes (s)
+          - `mem_peak`: peak memory use of all task processes (bytes), `None`
+                        if not supported by the kernel (< 5.19)
+        '''
+
+        usage = {'cpu_time': None,
+                 'mem_peak': None,
+                 'source'  : 'cgroup'}
+
+        for line in (self._read(path, 'cpu.stat') or '').split('\n'):
+            if line.startswith('usage_usec '):
+                usage['cpu_time'] = int(line.split()[1]) / 1e6
+                break
+
+        mem_peak = self._read(path, 'memory.peak')
+        if mem_peak:
+            usage['mem_peak'] = int(mem_peak)
+
+        self.remove(path)
+
+        return usage
+
+
+    # --------------------------------------------------------------------------
+    #
+    def remove(self, path):
+
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            # processes which outlive the task keep the cgroup alive
+            self._log.warn('cannot remove cgroup %s: %s', path, e)
+
+
+# ------------------------------------------------------------------------------
+
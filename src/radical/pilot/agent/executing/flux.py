@@ -3,6 +3,7 @@ __copyright__ = 'Copyright 2013-2020, http://radical.rutgers.edu'
 __license__   = 'MIT'
 
 
+import os
 import time
 import queue
 import threading as mt
@@ -36,10 +37,11 @@ class Flux(AgentExecutingComponent) :
 
           - the main thread listens for incoming tasks from the scheduler, and
             pushes them toward the watcher thread;
-          - an event listener thread listens for flux events which signify task
-            state updates, and pushes those events also to the watcher thread;
-          - the watcher thread matches events and tasks, enacts state updates,
-            and pushes completed tasks toward output staging.
+          - an event listener thread consumes the flux event journal (or, for
+            older flux versions, the `job-state` events) as a stream, and pushes
+            the events in batches to the watcher thread;
+          - the watcher thread matches events and tasks, enacts state updates
+            in bulks, and pushes completed tasks toward output staging.
 
         NOTE: we get tasks in *AGENT_SCHEDULING* state, and enact all
               further state changes in this component.
@@ -55,6 +57,16 @@ class Flux(AgentExecutingComponent) :
                            'PRIORITY': None,
                           }
 
+        # translate Flux journal events to the Flux states they lead to
+        self._journal_map = {'priority': 'SCHED',
+                             'alloc'   : 'RUN',
+                             'finish'  : 'CLEANUP',
+                             'clean'   : 'INACTIVE',
+                            }
+
+        # max number of events the listener collects per batch
+        self._batch = self._cfg.get('flux_batch', 1024)
+
         # we get an instance of the resource manager (init from registry info)
         self._rm = ResourceManager.create(name=self._cfg.resource_manager,
                                           cfg=self._cfg, log=self._log,
@@ -66,9 +78,13 @@ class Flux(AgentExecutingComponent) :
         # thread termination signal
         self._term = mt.Event()
 
-        # need two queues, for tasks and events
-        self._task_q  = queue.Queue()
-        self._event_q = queue.Queue()
+        # need three queues, for tasks, events and cancel requests
+        self._task_q   = queue.Queue()
+        self._event_q  = queue.Queue()
+        self._cancel_q = queue.Queue()
+
+        # the launch method is created by the listener thread
+        self._lm = None
 
         # run listener thread
         self._listener_setup  = mt.Event()
@@ -107,12 +123,17 @@ class Flux(AgentExecutingComponent) :
         self._log.info('command_cb [%s]: %s', topic, msg)
 
         cmd = msg['cmd']
-      # arg = msg['arg']
+        arg = msg['arg']
 
         if cmd == 'cancel_tasks':
 
-            # FIXME: clarify how to cancel tasks in Flux
-            pass
+            # The watcher thread knows the flux IDs of the tasks, and cancels
+            # the respective flux jobs.  Tasks which the watcher does not know
+            # yet are canceled once they arrive.  Canceled tasks are reported
+            # as such on completion.
+            uids = ru.as_list(arg['uids'])
+            self._cancel_list.add(uids)
+            self._cancel_q.put(uids)
 
         return True
 
@@ -137,45 +158,33 @@ class Flux(AgentExecutingComponent) :
         lm_cfg['reg_addr']  = self._cfg.reg_addr
         lm                  = LaunchMethod.create('FLUX', lm_cfg, self._cfg,
                                                   self._log, self._prof)
+        self._lm            = lm
         flux_handle = None
+        journal     = None
         try:
 
             flux_handle = lm.fh.get_handle()
-            flux_handle.event_subscribe('job-state')
-
-            # FIXME: how tot subscribe for task return code information?
-            # pylint: disable=import-error
-          # def _flux_cb(self, *args, **kwargs):
-          #     print('--------------- flux cb %s' % [args, kwargs])
-          #
-          # from flux import future as flux_future
-          # fh = self._flux.flux_job_event_watch(jobid, 'eventlog', 0)
-          # f  = flux_future.Future(fh)
-          # f.then(_flux_cb)
+            journal     = self._open_journal(flux_handle)
 
+            if not journal:
+                self._log.warn('no flux event journal, use job-state events')
+                flux_handle.event_subscribe('job-state')
 
             # signal successful setup to main thread
             self._listener_setup.set()
 
-            while True:
-
-                # FIXME: how can recv be timed out or interrupted after work
-                #        completed?
-                event = flux_handle.event_recv()
-
-                if 'transitions' not in event.payload:
-                    self._log.warn('unexpected flux event: %s' %
-                                    event.payload)
-                    continue
+            while not self._term.is_set():
 
-                transitions = ru.as_list(event.payload['transitions'])
+                if journal: events = self._recv_journal(journal)
+                else      : events = self._recv_states(flux_handle)
 
-                self._event_q.put(transitions)
+                if events:
+                    self._event_q.put(events)
 
 
         except Exception:
 
-            if flux_handle:
+            if flux_handle and not journal:
                 flux_handle.event_unsubscribe('job-state')
 
             self._log.exception('Error in listener loop')
@@ -184,42 +193,181 @@ class Flux(AgentExecutingComponent) :
 
     # --------------------------------------------------------------------------
     #
-    def handle_events(self, task, events):
+    def _open_journal(self, flux_handle):
+        '''
+        Return a consumer of the job manager's event journal, or `None` if the
+        flux version does not support it.  Other than `job-state` events,
+        journal events carry the time of the event and the job's exit status.
+        '''
+
+        # pylint: disable=import-error
+        try:
+            from flux.job import JournalConsumer
+        except ImportError:
+            return None
+
+        return JournalConsumer(flux_handle).start()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _recv_journal(self, journal):
+        '''
+        Wait (up to a second) for the next journal event, then collect all
+        events which are already available, up to `self._batch` events.
+        Events are returned as `[flux_id, flux_state, timestamp, context]`.
+        '''
+
+        events  = list()
+        timeout = 1.0
+
+        while len(events) < self._batch:
+
+            try:
+                event = journal.poll(timeout=timeout)
+            except TimeoutError:
+                break
+
+            if event is None:
+                # end of stream
+                self._term.set()
+                break
+
+            timeout    = 0.0
+            flux_state = self._journal_map.get(event.name)
+
+            if flux_state:
+                events.append([event.jobid, flux_state, event.timestamp,
+                               event.context])
+
+        return events
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _recv_states(self, flux_handle):
+        '''
+        Wait for the next `job-state` event, which holds a batch of state
+        transitions.  Events are returned as for `_recv_journal()`.
         '''
-        Return `True` on final events so that caller can clean caches.
-        Note that this relies on Flux events to arrive in order
+
+        # FIXME: how can recv be timed out or interrupted after work
+        #        completed?
+        event = flux_handle.event_recv()
+
+        if 'transitions' not in event.payload:
+            self._log.warn('unexpected flux event: %s' % event.payload)
+            return None
+
+        events = list()
+        for trans in ru.as_list(event.payload['transitions']):
+            # transition: flux_id, flux_state[, timestamp]
+            ts = trans[2] if len(trans) > 2 else time.time()
+            events.append([trans[0], trans[1], ts, None])
+
+        return events
+
+
+    # --------------------------------------------------------------------------
+    #
+    def handle_events(self, task, events, bulk):
+        '''
+        Translate the task's flux events into state transitions, and collect
+        those as `[task, state, timestamp]` in `bulk`, to be enacted by
+        `_advance_bulk()`.  Return `True` on final events so that caller can
+        clean caches.  Note that this relies on Flux events to arrive in order
         (or at least in ordered bulks).
         '''
 
         ret = False
+        uid = task['uid']
+
+        for flux_id, flux_state, ts, context in events:
+
+            if flux_state == 'CLEANUP' and context and 'status' in context:
 
-        for event in events:
+                # job finished, `status` is the wait status of the job shell
+                status = context['status']
+                if os.WIFSIGNALED(status): exit_code = -os.WTERMSIG(status)
+                else                     : exit_code = os.WEXITSTATUS(status)
+
+                task['exit_code'] = exit_code
+                self._prof.prof('task_run_stop', uid=uid, ts=ts)
 
-            flux_state = event[1]  # event: flux_id, flux_state
             state = self._event_map.get(flux_state)
 
             if state is None:
                 # ignore this state transition
-                self._log.debug('ignore flux event %s:%s' %
-                                (task['uid'], flux_state))
+                self._log.debug('ignore flux event %s:%s', uid, flux_state)
+                continue
+
+            if state == rps.AGENT_EXECUTING:
+                self._prof.prof('task_run_start', uid=uid, ts=ts)
 
-            # FIXME: how to get actual event transition timestamp?
-          # ts = event.time
-            ts = time.time()
+            elif state == rps.AGENT_STAGING_OUTPUT_PENDING:
+
+                if self._cancel_list.pop(uid):
+                    # canceled task - no output staging
+                    self._prof.prof('task_run_cancel_stop', uid=uid, ts=ts)
+                    state = rps.CANCELED
+
+                elif task.get('exit_code'):
+                    # the task failed - fail after staging output
+                    task['target_state'] = rps.FAILED
+
+                else:
+                    # the exit code is unknown for `job-state` events
+                    task['target_state'] = rps.DONE
 
-            if state == rps.AGENT_STAGING_OUTPUT_PENDING:
-                task['target_state'] = rps.DONE  # FIXME
-                # on completion, push toward output staging
-                self.advance(task, state, ts=ts, publish=True, push=True)
                 ret = True
 
-            else:
-                # otherwise only push a state update
-                self.advance(task, state, ts=ts, publish=True, push=False)
+            bulk.append([task, state, ts])
 
         return ret
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _advance_bulk(self, bulk):
+        '''
+        Enact the state transitions collected by `handle_events()`: the
+        transitions are profiled with the time of the respective flux event,
+        and are advanced in one bulk per state, in the order of the state
+        model.
+        '''
+
+        if not bulk:
+            return
+
+        buckets = dict()
+        for task, state, ts in bulk:
+            self._prof.prof('advance', uid=task['uid'], state=state, ts=ts)
+            if state not in buckets:
+                buckets[state] = list()
+            buckets[state].append(task)
+
+        for state in sorted(buckets, key=rps._task_state_value):
+
+            # on completion, push toward output staging - otherwise only
+            # push a state update
+            push = (state == rps.AGENT_STAGING_OUTPUT_PENDING)
+            self.advance(buckets[state], state, publish=True, push=push,
+                         prof=False)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _drain(self, q):
+
+        # get all bulks from the queue, as one list
+        ret = list()
+        while True:
+            try:
+                ret += q.get_nowait()
+            except queue.Empty:
+                return ret
+
+
     # --------------------------------------------------------------------------
     #
     def _watch(self):
@@ -229,6 +377,8 @@ class Flux(AgentExecutingComponent) :
             # thread local initialization
             tasks  = dict()
             events = dict()
+            uids   = dict()  # uid: flux_id
+            fh     = None    # flux handle for cancellation
 
             self.register_output(rps.AGENT_STAGING_OUTPUT_PENDING,
                                  rpc.AGENT_STAGING_OUTPUT_QUEUE)
@@ -238,72 +388,74 @@ class Flux(AgentExecutingComponent) :
 
             while not self._term.is_set():
 
-                active = False
+                bulk      = list()   # state transitions to enact
+                new_tasks = self._drain(self._task_q)
+                new_evts  = self._drain(self._event_q)
+                cancels   = self._drain(self._cancel_q)
 
-                try:
-                    for task in self._task_q.get_nowait():
+                for task in new_tasks:
 
-                        active = True
-                        try:
+                    try:
 
-                            flux_id = task['flux_id']
-                            assert flux_id not in tasks
-                            tasks[flux_id] = task
+                        uid     = task['uid']
+                        flux_id = task['flux_id']
+                        assert flux_id not in tasks
+                        tasks[flux_id] = task
+                        uids[uid]      = flux_id
 
-                            # handle and purge cached events for that task
-                            if flux_id in events:
-                                if self.handle_events(task, events[flux_id]):
-                                    # task completed - purge data
-                                    # NOTE: this assumes events are ordered
-                                    if flux_id in events: del events[flux_id]
-                                    if flux_id in tasks : del tasks[flux_id]
+                        # task got canceled before it arrived
+                        if uid in self._cancel_list:
+                            fh = self._cancel_flux(fh, {uid: flux_id})
 
-                        except Exception:
-
-                            self._log.exception("error collecting Task")
-                            if task['stderr'] is None:
-                                task['stderr'] = ''
-                            task['stderr'] += '\nPilot cannot collect task:\n'
-                            task['stderr'] += '\n'.join(ru.get_exception_trace())
+                        # handle and purge cached events for that task
+                        if flux_id in events:
+                            if self.handle_events(task, events.pop(flux_id),
+                                                  bulk):
+                                # task completed - purge data
+                                # NOTE: this assumes events are ordered
+                                del uids[tasks.pop(flux_id)['uid']]
 
-                            # can't rely on the executor base to free the task resources
-                            self._prof.prof('unschedule_start', uid=task['uid'])
-                            self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, task)
+                    except Exception:
 
-                            self.advance(task, rps.FAILED, publish=True, push=False)
+                        self._log.exception("error collecting Task")
+                        if task['stderr'] is None:
+                            task['stderr'] = ''
+                        task['stderr'] += '\nPilot cannot collect task:\n'
+                        task['stderr'] += '\n'.join(ru.get_exception_trace())
 
-                except queue.Empty:
-                    # nothing found -- no problem, check if we got some events
-                    pass
+                        # can't rely on the executor base to free the task
+                        # resources
+                        self._prof.prof('unschedule_start', uid=task['uid'])
+                        self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, task)
 
-                try:
+                        self.advance(task, rps.FAILED, publish=True,
+                                                       push=False)
 
-                    for event in self._event_q.get_nowait():
+                for event in new_evts:
 
-                        flux_id = event[0]  # event: flux_id, flux_state
+                    flux_id = event[0]  # event: flux_id, flux_state, ts, ctx
 
-                        if flux_id in tasks:
+                    if flux_id in tasks:
 
-                            # known task - handle events
-                            if self.handle_events(tasks[flux_id], [event]):
-                                # task completed - purge data
-                                # NOTE: this assumes events are ordered
-                                if flux_id in events: del events[flux_id]
-                                if flux_id in tasks : del tasks[flux_id]
+                        # known task - handle events
+                        if self.handle_events(tasks[flux_id], [event], bulk):
+                            # task completed - purge data
+                            # NOTE: this assumes events are ordered
+                            del uids[tasks.pop(flux_id)['uid']]
 
-                        else:
-                            # unknown task, store events for later
-                            if flux_id not in events:
-                                events[flux_id] = list()
-                            events[flux_id].append(event)
+                    else:
+                        # unknown task, store events for later
+                        if flux_id not in events:
+                            events[flux_id] = list()
+                        events[flux_id].append(event)
 
-                    active = True
+                self._advance_bulk(bulk)
 
-                except queue.Empty:
-                    # nothing found -- no problem, check if we got some tasks
-                    pass
+                to_cancel = {uid: uids[uid] for uid in cancels if uid in uids}
+                if to_cancel:
+                    fh = self._cancel_flux(fh, to_cancel)
 
-                if not active:
+                if not new_tasks and not new_evts and not cancels:
                     time.sleep(0.01)
 
         except Exception:
@@ -311,5 +463,32 @@ class Flux(AgentExecutingComponent) :
             self._term.set()
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _cancel_flux(self, fh, flux_ids):
+        '''
+        Cancel the flux jobs of the given tasks (`{uid: flux_id}`).  The flux
+        handle `fh` is created on first use and returned, so that the calling
+        (watcher) thread can reuse it.
+        '''
+
+        # pylint: disable=import-error
+        import flux.job
+
+        if not fh:
+            fh = self._lm.fh.get_handle()
+
+        for uid, flux_id in flux_ids.items():
+
+            self._prof.prof('task_run_cancel_start', uid=uid)
+            try:
+                flux.job.cancel(fh, flux_id)
+            except Exception:
+                # the job may have completed already
+                self._log.exception('failed to cancel %s (%s)', uid, flux_id)
+
+        return fh
+
+
 # ------------------------------------------------------------------------------
 
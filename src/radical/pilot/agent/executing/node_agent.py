@@ -0,0 +1,226 @@
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import os
+import sys
+import signal
+import subprocess
+
+import threading     as mt
+
+import radical.utils as ru
+
+
+# ------------------------------------------------------------------------------
+#
+class NodeAgent(object):
+    '''
+    A node agent is a small resident daemon which runs on a compute node and
+    launches task processes on behalf of the `Popen` executor.  Task launches
+    thus no longer need a process (and, for remote nodes, a connection) to be
+    set up by the agent for each task.
+
+    The node agent pulls requests from the executor via a ZMQ pipe, and pushes
+    results back to the executor via another pipe.  Requests are dicts with
+    a `cmd` field:
+
+      - `launch`: run the task's launch script (`script`) in the task sandbox
+                  (`sbox`), with output redirected to `out`;
+      - `cancel`: terminate the task with the given `uid`;
+      - `stop`  : terminate all tasks and exit.
+
+    Once connected, the node agent sends a `hello` message.  Task exit codes
+    are sent in bulks as `done` messages, which hold a list of
+    `[uid, exit_code, canceled]` tuples.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, uid, req_url, res_url, log=None):
+
+        self._uid      = uid
+        self._log      = log or ru.Logger(uid, ns='radical.pilot',
+                                             path=os.getcwd())
+        self._req      = ru.zmq.Pipe(ru.zmq.MODE_PULL, req_url)
+        self._res      = ru.zmq.Pipe(ru.zmq.MODE_PUSH, res_url)
+        self._res_lock = mt.Lock()  # ZMQ sockets are not thread safe
+
+        self._lock     = mt.Lock()
+        self._procs    = dict()    # pid: uid
+        self._pids     = dict()    # uid: pid
+        self._canceled = set()     # uids
+        self._running  = mt.Event()
+        self._term     = mt.Event()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run(self):
+
+        self._log.info('node agent %s up', self._uid)
+        self._send({'cmd': 'hello', 'uid': self._uid})
+
+        reaper = mt.Thread(target=self._reap)
+        reaper.daemon = True
+        reaper.start()
+
+        try:
+            while not self._term.is_set():
+
+                msg = self._req.get_nowait(timeout=1.0)
+                if not msg:
+                    continue
+
+                cmd = msg['cmd']
+
+                if   cmd == 'launch': self._launch(msg)
+                elif cmd == 'cancel': self._cancel(msg['uid'])
+                elif cmd == 'stop'  : self._term.set()
+                else                : self._log.error('unknown cmd %s', cmd)
+
+        finally:
+            with self._lock:
+                for pid in self._procs:
+                    try   : os.killpg(pid, signal.SIGTERM)
+                    except: pass
+
+            self._log.info('node agent %s down', self._uid)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _send(self, msg):
+        '''
+        push a result message - results are sent by the request handling
+        thread (failed launches) and by the reaper thread (exit codes)
+        '''
+
+        with self._res_lock:
+            self._res.put(msg)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _launch(self, msg):
+
+        uid = msg['uid']
+
+        # the process is registered before the reaper can collect it
+        with self._lock:
+
+            try:
+                if hasattr(os, 'posix_spawn'):
+                    pid = os.posix_spawn('/bin/sh',
+                            ['/bin/sh', '-c', 'cd "$1" && exec /bin/sh "$2"',
+                             'sh', msg['sbox'], msg['script']],
+                            os.environ,
+                            file_actions=[(os.POSIX_SPAWN_OPEN, 1, msg['out'],
+                                           os.O_WRONLY | os.O_CREAT |
+                                           os.O_TRUNC, 0o644),
+                                          (os.POSIX_SPAWN_DUP2, 1, 2)],
+                            setpgroup=0)
+                else:
+                    with ru.ru_open(msg['out'], 'w') as fout:
+                        pid = subprocess.Popen(['/bin/sh', msg['script']],
+                                               stdout=fout,
+                                               stderr=subprocess.STDOUT,
+                                               cwd=msg['sbox'],
+                                               start_new_session=True).pid
+
+            except Exception:
+                self._log.exception('failed to launch %s', uid)
+                self._send({'cmd': 'done', 'tasks': [[uid, 1, False]]})
+                return
+
+            self._procs[pid] = uid
+            self._pids[uid]  = pid
+            self._running.set()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _cancel(self, uid):
+
+        with self._lock:
+
+            pid = self._pids.get(uid)
+            if pid is None:
+                return
+
+            self._canceled.add(uid)
+
+        try:
+            os.killpg(pid, signal.SIGTERM)
+        except OSError:
+            # process is already gone
+            pass
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _reap(self):
+
+        while not self._term.is_set():
+
+            if not self._running.wait(timeout=1.0):
+                continue
+
+            # all child processes are task processes
+            try:
+                pid, status = os.wait()
+
+            except ChildProcessError:
+                with self._lock:
+                    if not self._procs:
+                        self._running.clear()
+                continue
+
+            # collect all other exited processes, and report them in one bulk
+            exited = [[pid, status]]
+            while True:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if not pid:
+                    break
+                exited.append([pid, status])
+
+            done = list()
+            with self._lock:
+
+                for pid, status in exited:
+
+                    uid = self._procs.pop(pid, None)
+                    if uid is None:
+                        continue
+
+                    del self._pids[uid]
+
+                    if os.WIFSIGNALED(status): exit_code = -os.WTERMSIG(status)
+                    else                     : exit_code = os.WEXITSTATUS(status)
+
+                    canceled = uid in self._canceled
+                    self._canceled.discard(uid)
+
+                    done.append([uid, exit_code, canceled])
+
+            if done:
+                self._send({'cmd': 'done', 'tasks': done})
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    if len(sys.argv) != 4:
+        sys.stderr.write('usage: %s <uid> <request url> <result url>\n'
+                         % sys.argv[0])
+        sys.exit(1)
+
+    NodeAgent(sys.argv[1], sys.argv[2], sys.argv[3]).run()
+
+
+# ------------------------------------------------------------------------------
+
@@ -5,26 +5,31 @@ __license__   = 'MIT'
 
 
 import os
+import sys
 import stat
 import time
 import queue
 import atexit
 import pprint
+import select
 import signal
 import threading as mt
 import subprocess
+import collections
 
 import radical.utils as ru
 
 from ...  import states    as rps
 from ...  import constants as rpc
+from ...  import TaskDescription
 
-from .base import AgentExecutingComponent
+from .base    import AgentExecutingComponent
+from .cgroups import TaskCgroups
 
 
 # ------------------------------------------------------------------------------
 # ensure tasks are killed on termination
-_pids = list()
+_pids = set()
 
 
 # pylint: disable=unused-argument
@@ -46,6 +51,69 @@ signal.signal(signal.SIGINT,  _kill)
 # ------------------------------------------------------------------------------
 
 
+# ------------------------------------------------------------------------------
+#
+class _Proc(object):
+    '''
+    Stand-in for `subprocess.Popen` for task processes created via
+    `os.posix_spawn`: the watcher only needs the pid and the exit code.  The
+    resource usage of the process (and its descendants) is kept as `rusage`.
+    A process whose exit status can't be collected (because it was reaped
+    elsewhere) is reported as failed.
+    '''
+
+    def __init__(self, pid, log):
+
+        self.pid        = pid
+        self.returncode = None
+        self.rusage     = None
+
+        self._log       = log
+
+
+    def _set_status(self, status):
+
+        if os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        else:
+            self.returncode = os.WEXITSTATUS(status)
+
+
+    def _set_lost(self):
+
+        # the exit status is gone - we can't tell if the process succeeded
+        self._log.error('exit status of process %d is lost', self.pid)
+        self.returncode = 1
+
+
+    def poll(self):
+
+        if self.returncode is None:
+            try:
+                pid, status, rusage = os.wait4(self.pid, os.WNOHANG)
+            except ChildProcessError:
+                self._set_lost()
+            else:
+                if pid == self.pid:
+                    self._set_status(status)
+                    self.rusage = rusage
+
+        return self.returncode
+
+
+    def wait(self):
+
+        if self.returncode is None:
+            try:
+                _, status, self.rusage = os.wait4(self.pid, 0)
+            except ChildProcessError:
+                self._set_lost()
+            else:
+                self._set_status(status)
+
+        return self.returncode
+
+
 # ------------------------------------------------------------------------------
 #
 class Popen(AgentExecutingComponent):
@@ -60,13 +128,72 @@ class Popen(AgentExecutingComponent):
       # self._log.debug('popen initialize start')
         AgentExecutingComponent.initialize(self)
 
+        # cancel requests are registered in `self._cancel_list` (shared with
+        # the component base).  Running tasks are killed right away, via the
+        # pids of all spawned tasks.  Those are registered on spawn, under the
+        # cancel lock, so that no cancel request gets lost.
         self._cancel_lock     = mt.RLock()
-        self._tasks_to_cancel = list()
-        self._tasks_to_watch  = list()
+        self._tasks_to_watch  = dict()    # pid: task
+        self._uids_to_watch   = dict()    # uid: pid
         self._watch_queue     = queue.Queue()
 
+        # task independent script fragments, see `_get_script_fragments`
+        self._script_cache      = collections.OrderedDict()
+        self._script_cache_size = self._cfg.get('script_cache_size', 1024)
+        self._script_hits       = 0
+        self._script_misses     = 0
+
+        # The watcher thread sleeps until task processes exit: on Linux, each
+        # task process is watched via a pidfd in an epoll set.  Otherwise, the
+        # watcher falls back to polling all running processes every
+        # `watch_timeout` seconds.  A pipe wakes the watcher up on new tasks
+        # (when polling).
+        self._watch_timeout   = self._cfg.get('watch_timeout', 0.1)
+        self._wake_r, \
+        self._wake_w          = os.pipe()
+        self._pidfds          = dict()    # pidfd: pid
+        self._epoll           = None
+        self._epoll_lock      = mt.Lock()  # guards pidfd (un)registration
+
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+        if hasattr(os, 'pidfd_open') and hasattr(select, 'epoll'):
+            self._epoll = select.epoll()
+            self._epoll.register(self._wake_r, select.EPOLLIN)
+
         self._pid = self._cfg['pid']
 
+        # Optionally, tasks are launched by resident node agents (see
+        # `node_agent.py`) instead of being spawned by this executor.  Only
+        # single rank tasks of the listed launch methods use node agents, as
+        # the node agent replaces the launch method.
+        self._node_agents    = dict()     # node_id: request pipe
+        self._node_agent_lms = self._cfg.get('node_agent_lms',
+                                             ['FORK', 'SSH', 'RSH'])
+        self._na_lock        = mt.Lock()
+        self._na_tasks       = dict()     # uid: task launched by node agent
+        self._na_launch      = dict()     # uid: pipe of node agent to launch
+
+        # Optionally, the resource usage of tasks is collected.  Tasks of the
+        # listed launch methods (which run on the agent node) are placed into
+        # cgroups sized from their slots, which also enforce those limits.
+        # Without cgroups, the usage of the launch script's process tree is
+        # reported (as collected by `wait4`).
+        self._task_usage  = bool(self._cfg.get('task_cgroups'))
+        self._cgroups     = None
+        self._cgroup_lms  = self._cfg.get('cgroup_lms', ['FORK'])
+        self._cgroup_path = dict()        # uid: cgroup path
+
+        if self._task_usage:
+            cgroups = TaskCgroups(self._log, '%s.%s' % (self._pid, self.uid),
+                                  base=self._cfg.get('cgroup_base'))
+            if cgroups.available:
+                self._cgroups = cgroups
+
+        if self._cfg.get('node_agents'):
+            self._start_node_agents()
+
         # run watcher thread
         self._watcher = mt.Thread(target=self._watch)
       # self._watcher.daemon = True
@@ -86,49 +213,149 @@ class Popen(AgentExecutingComponent):
         if cmd == 'cancel_tasks':
 
             self._log.info('cancel_tasks command (%s)' % arg)
+
+            uids = ru.as_list(arg['uids'])
+
+            # Register the request before looking for the tasks: tasks which
+            # are not spawned yet check the registry before spawning, tasks
+            # which completed are reported as canceled by the watcher.  The
+            # component base may not have seen the request yet.
+            self._cancel_list.add(uids)
+
+            # tasks run by node agents are canceled by those
+            with self._na_lock:
+                for uid in uids:
+                    entry = self._na_tasks.get(uid)
+                    if entry:
+                        entry[1].put({'cmd': 'cancel', 'uid': uid})
+
+            # send SIGTERM to the process group of running tasks (which should
+            # include the actual launch method) - the watcher gets notified
+            # about their exit as usual.
             with self._cancel_lock:
-                self._tasks_to_cancel.extend(arg['uids'])
+                for uid in uids:
+                    pid = self._uids_to_watch.get(uid)
+                    if pid is None:
+                        continue
+                    self._prof.prof('task_run_cancel_start', uid=uid)
+                    try:
+                        os.killpg(pid, signal.SIGTERM)
+                    except OSError:
+                        # task is already gone, we ignore this
+                        pass
 
         return True
 
+
+    # --------------------------------------------------------------------------
+    #
+    def _wake(self):
+        '''
+        wake up the watcher thread
+        '''
+
+        try:
+            os.write(self._wake_w, b'.')
+        except BlockingIOError:
+            # the pipe is full, so the watcher will wake up anyway
+            pass
+
     # --------------------------------------------------------------------------
     #
     def work(self, tasks):
 
         self.advance(tasks, rps.AGENT_EXECUTING, publish=True, push=False)
 
+        # The bulk is launched in two passes: the launch and exec scripts are
+        # written for all tasks first, then all task processes are spawned in
+        # one tight loop.  Tasks which fail to launch are failed in one bulk.
+        prepared = list()
+        failed   = list()
+
         for task in tasks:
 
+            self._prof.prof('task_start', uid=task['uid'])
+
+            try:
+                self._prepare_task(task)
+                prepared.append(task)
+
+            except Exception:
+                self._log.exception("error preparing Task")
+                self._drop_cgroup(task['uid'])
+                self._fail_task(task)
+                failed.append(task)
+
+        # the environment is converted for `posix_spawn` on every call, which
+        # is cheaper for a plain dict
+        env      = dict(os.environ)
+        canceled = list()
+
+        for task in prepared:
+
             try:
-                self._prof.prof('task_start', uid=task['uid'])
-                self._handle_task(task)
+                if not self._spawn_task(task, env):
+                    canceled.append(task)
 
             except Exception:
-                # append the startup error to the tasks stderr.  This is
-                # not completely correct (as this text is not produced
-                # by the task), but it seems the most intuitive way to
-                # communicate that error to the application/user.
                 self._log.exception("error running Task")
-                if task['stderr'] is None:
-                    task['stderr'] = ''
-                task['stderr'] += '\nPilot cannot start task:\n'
-                task['stderr'] += '\n'.join(ru.get_exception_trace())
+                self._drop_cgroup(task['uid'])
+                self._fail_task(task)
+                failed.append(task)
 
-                # can't rely on the executor base to free the task resources
+        # the polling watcher needs to learn about new tasks
+        if prepared and not self._epoll:
+            self._wake()
+
+        for task in tasks:
+            self._prof.prof('task_stop', uid=task['uid'])
+
+        if failed:
+            # can't rely on the executor base to free the task resources
+            for task in failed:
                 self._prof.prof('unschedule_start', uid=task['uid'])
-                self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, task)
+            self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, failed)
+            self.advance(failed, rps.FAILED, publish=True, push=False)
 
-                task['control'] = 'tmgr_pending'
-                task['$all']    = True
-                self.advance(task, rps.FAILED, publish=True, push=False)
+        if canceled:
+            self._advance_completed(canceled, [])
 
-            finally:
-                self._prof.prof('task_stop', uid=task['uid'])
+
+    # --------------------------------------------------------------------------
+    #
+    def _fail_task(self, task):
+
+        # append the startup error to the tasks stderr.  This is not completely
+        # correct (as this text is not produced by the task), but it seems the
+        # most intuitive way to communicate that error to the application/user.
+        if task.get('stderr') is None:
+            task['stderr'] = ''
+        task['stderr'] += '\nPilot cannot start task:\n'
+        task['stderr'] += '\n'.join(ru.get_exception_trace())
+
+        task['control'] = 'tmgr_pending'
+        task['$all']    = True
 
 
     # --------------------------------------------------------------------------
     #
     def _handle_task(self, task):
+        '''
+        prepare and spawn a single task
+        '''
+
+        self._prepare_task(task)
+
+        if not self._spawn_task(task):
+            self._advance_completed([task], [])
+
+        elif not self._epoll:
+            self._wake()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _prepare_task(self, task):
 
         # before we start handling the task, check if it should run in a named
         # env.  If so, inject the activation of that env in the task's pre_exec
@@ -246,135 +473,58 @@ class Popen(AgentExecutingComponent):
         exec_script   = '%s.exec.sh'          % tid
         exec_path     = '$RP_TASK_SANDBOX/%s' % exec_script
 
-        ru.rec_makedir(sbox)
-
-        with ru.ru_open('%s/%s' % (sbox, launch_script), 'w') as fout:
-
-            tmp  = ''
-            tmp += self._header
-            tmp += self._separator
-            tmp += self._get_rp_env(task)
-            tmp += self._separator
-            tmp += self._get_prof('launch_start', tid)
+        # the sandbox is usually created by the agent's input staging
+        self._prof.prof('task_mkdir', uid=tid)
+        if not task.get('sandbox_exists'):
+            ru.rec_makedir(sbox)
+        self._prof.prof('task_mkdir_done', uid=tid)
 
-            tmp += self._separator
-            tmp += '# change to task sandbox\n'
-            tmp += 'cd $RP_TASK_SANDBOX\n'
+        ranks   = task['slots']['ranks']
+        n_ranks = len(ranks)
 
-            tmp += self._separator
-            tmp += '# prepare launcher env\n'
-            tmp += self._get_launch_env(task, launcher)
+        # node agents execute the exec script directly
+        node_agent = self._get_node_agent(task, launcher, n_ranks)
+        if node_agent:
+            self._na_launch[tid] = node_agent
 
-            tmp += self._separator
-            tmp += '# pre-launch commands\n'
-            tmp += self._get_prof('launch_pre', tid)
-            tmp += self._get_pre_launch(task)
+        elif self._cgroups and launcher.name in self._cgroup_lms:
+            self._cgroup_path[tid] = self._cgroups.create(tid,
+                    n_cores=sum(len(core) for rank in ranks
+                                          for core in rank['core_map']),
+                    mem=sum(rank['mem'] for rank in ranks))
 
-            tmp += self._separator
-            tmp += '# launch commands\n'
-            tmp += self._get_prof('launch_submit', tid)
-            tmp += '%s\n' % self._get_launch_cmds(task, launcher, exec_path)
-            tmp += 'RP_RET=$?\n'
-            tmp += self._get_prof('launch_collect', tid)
+        # only the task specific parts of the scripts are rendered per task,
+        # the remainder is taken from the script cache
+        launch_pre, launch_post, exec_ids, exec_pre, exec_post = \
+                self._get_script_fragments(task, launcher, n_ranks)
 
-            tmp += self._separator
-            tmp += '# post-launch commands\n'
-            tmp += self._get_prof('launch_post', tid)
-            tmp += self._get_post_launch(task)
+        rp_env = self._get_rp_env(task)
 
-            tmp += self._separator
-            tmp += self._get_prof('launch_stop', tid)
-            tmp += 'exit $RP_RET\n'
+        with ru.ru_open('%s/%s' % (sbox, launch_script), 'w') as fout:
 
+            tmp  = ''
+            tmp += self._header
             tmp += self._separator
-            tmp += '\n'
+            tmp += rp_env
+            tmp += launch_pre
+            tmp += '%s\n' % self._get_launch_cmds(task, launcher, exec_path,
+                                                   direct=bool(node_agent))
+            tmp += launch_post
 
             fout.write(tmp)
 
 
-        ranks   = task['slots']['ranks']
-        n_ranks = len(ranks)
-
         with ru.ru_open('%s/%s' % (sbox, exec_script), 'w') as fout:
 
             tmp  = ''
-            tmp += self._header
-            tmp += self._separator
-            tmp += '# rank ID\n'
-            tmp += self._get_rank_ids(n_ranks, launcher)
-
-            tmp += self._separator
-            tmp += self._get_rp_env(task)
-            tmp += self._separator
-            tmp += self._get_prof('exec_start', tid)
-
-            tmp += '# task environment\n'
-            tmp += self._get_task_env(task, launcher)
-
-            tmp += self._separator
-            tmp += '# pre-exec commands\n'
-            tmp += self._get_prof('exec_pre', tid)
-            tmp += self._get_pre_exec(task)
-
-            # pre_rank list is applied to rank 0, dict to the ranks listed
-            pre_rank = td.get('pre_rank')
-            if isinstance(pre_rank, list): pre_rank = {'0': pre_rank}
-
-            if pre_rank:
-                tmp += self._separator
-                tmp += self._get_prof('rank_pre', tid)
-                tmp += '# pre-rank commands\n'
-                tmp += 'case "$RP_RANK" in\n'
-                for rank_id, cmds in pre_rank.items():
-                    rank_id = int(rank_id)
-                    tmp += '    %d)\n' % rank_id
-                    tmp += self._get_pre_rank(cmds)
-                    tmp += '        ;;\n'
-                tmp += 'esac\n\n'
-
-                tmp += self._get_rank_sync('pre_rank', n_ranks)
-
-            tmp += self._separator
-            tmp += '# execute ranks\n'
-            tmp += self._get_prof('rank_start', tid)
-            tmp += 'case "$RP_RANK" in\n'
+            tmp += exec_ids
+            tmp += rp_env
+            tmp += exec_pre
             for rank_id, rank in enumerate(ranks):
                 tmp += '    %d)\n' % rank_id
                 tmp += self._get_rank_exec(task, rank_id, rank, launcher)
                 tmp += '        ;;\n'
-            tmp += 'esac\n'
-            tmp += 'RP_RET=$?\n'
-            tmp += self._get_prof('rank_stop', tid)
-
-            # post_rank list is applied to rank 0, dict to the ranks listed
-            post_rank = td.get('post_rank')
-            if isinstance(post_rank, list): post_rank = {'0': post_rank}
-
-            if post_rank:
-                tmp += self._separator
-                tmp += self._get_prof('rank_post', tid)
-                tmp += self._get_rank_sync('post_rank', n_ranks)
-
-                tmp += '\n# post-rank commands\n'
-                tmp += 'case "$RP_RANK" in\n'
-                for rank_id, cmds in post_rank.items():
-                    rank_id = int(rank_id)
-                    tmp += '    %d)\n' % rank_id
-                    tmp += self._get_post_rank(cmds)
-                    tmp += '        ;;\n'
-                tmp += 'esac\n\n'
-
-            tmp += self._separator
-            tmp += self._get_prof('exec_post', tid)
-            tmp += '# post exec commands\n'
-            tmp += self._get_post_exec(task)
-
-            tmp += self._separator
-            tmp += self._get_prof('exec_stop', tid)
-            tmp += 'exit $RP_RET\n'
-
-            tmp += self._separator
-            tmp += '\n'
+            tmp += exec_post
 
             fout.write(tmp)
 
@@ -385,80 +535,458 @@ class Popen(AgentExecutingComponent):
         os.chmod('%s/%s' % (sbox, launch_script), st_l.st_mode | stat.S_IEXEC)
         os.chmod('%s/%s' % (sbox, exec_script),   st_e.st_mode | stat.S_IEXEC)
 
-        # make sure the sandbox exists
         slots_fname = '%s/%s.sl' % (sbox, tid)
 
         with ru.ru_open(slots_fname, 'w') as fout:
             fout.write('\n%s\n\n' % pprint.pformat(task['slots']))
 
-        # make sure the sandbox exists
-        self._prof.prof('task_mkdir', uid=tid)
-        ru.rec_makedir(sbox)
-        self._prof.prof('task_mkdir_done', uid=tid)
 
-        # launch and exec script are done, get ready for execution.
-        cmdline = '/bin/sh %s' % launch_script
+    # --------------------------------------------------------------------------
+    #
+    def _get_script_fragments(self, task, launcher, n_ranks):
+        '''
+        Return the task independent fragments of the launch and exec scripts
+        for the given task.  The fragments only depend on the launcher, the
+        named env, the number of ranks and the task's directives, and are
+        cached for those, so that bags of similar tasks only need their task
+        specific script parts to be rendered.  The cache is bounded, and the
+        least recently used fragments are evicted first.
+        '''
+
+        tid = task['uid']
+        td  = task['description']
+        key = str((launcher.name, td['named_env'], n_ranks, td['environment'],
+                   td['pre_launch'], td['post_launch'],
+                   td['pre_exec'],   td['post_exec'],
+                   td.get('pre_rank'), td.get('post_rank')))
+
+        frags = self._script_cache.get(key)
+        if frags is not None:
+            self._script_cache.move_to_end(key)
+            self._script_hits += 1
+            self._prof.prof('script_cache_hit', uid=tid,
+                            msg=str(self._script_hits))
+            return frags
+
+        self._script_misses += 1
+        self._prof.prof('script_cache_miss', uid=tid,
+                        msg=str(self._script_misses))
+
+        # launch script, up to the launch command
+        launch_pre  = ''
+        launch_pre += self._separator
+        launch_pre += self._get_prof('launch_start', tid)
+
+        launch_pre += self._separator
+        launch_pre += '# change to task sandbox\n'
+        launch_pre += 'cd $RP_TASK_SANDBOX\n'
+
+        launch_pre += self._separator
+        launch_pre += '# prepare launcher env\n'
+        launch_pre += self._get_launch_env(task, launcher)
+
+        launch_pre += self._separator
+        launch_pre += '# pre-launch commands\n'
+        launch_pre += self._get_prof('launch_pre', tid)
+        launch_pre += self._get_pre_launch(task)
+
+        launch_pre += self._separator
+        launch_pre += '# launch commands\n'
+        launch_pre += self._get_prof('launch_submit', tid)
+
+        # launch script, after the launch command
+        launch_post  = ''
+        launch_post += 'RP_RET=$?\n'
+        launch_post += self._get_prof('launch_collect', tid)
+
+        launch_post += self._separator
+        launch_post += '# post-launch commands\n'
+        launch_post += self._get_prof('launch_post', tid)
+        launch_post += self._get_post_launch(task)
+
+        launch_post += self._separator
+        launch_post += self._get_prof('launch_stop', tid)
+        launch_post += 'exit $RP_RET\n'
+
+        launch_post += self._separator
+        launch_post += '\n'
+
+        # exec script, up to the task environment
+        exec_ids  = ''
+        exec_ids += self._header
+        exec_ids += self._separator
+        exec_ids += '# rank ID\n'
+        exec_ids += self._get_rank_ids(n_ranks, launcher)
+        exec_ids += self._separator
+
+        # exec script, up to the rank execution
+        exec_pre  = ''
+        exec_pre += self._separator
+        exec_pre += self._get_prof('exec_start', tid)
+
+        exec_pre += '# task environment\n'
+        exec_pre += self._get_task_env(task, launcher)
+
+        exec_pre += self._separator
+        exec_pre += '# pre-exec commands\n'
+        exec_pre += self._get_prof('exec_pre', tid)
+        exec_pre += self._get_pre_exec(task)
+
+        # pre_rank list is applied to rank 0, dict to the ranks listed
+        pre_rank = td.get('pre_rank')
+        if isinstance(pre_rank, list): pre_rank = {'0': pre_rank}
+
+        if pre_rank:
+            exec_pre += self._separator
+            exec_pre += self._get_prof('rank_pre', tid)
+            exec_pre += '# pre-rank commands\n'
+            exec_pre += 'case "$RP_RANK" in\n'
+            for rank_id, cmds in pre_rank.items():
+                rank_id = int(rank_id)
+                exec_pre += '    %d)\n' % rank_id
+                exec_pre += self._get_pre_rank(cmds)
+                exec_pre += '        ;;\n'
+            exec_pre += 'esac\n\n'
+
+            exec_pre += self._get_rank_sync('pre_rank', n_ranks)
+
+        exec_pre += self._separator
+        exec_pre += '# execute ranks\n'
+        exec_pre += self._get_prof('rank_start', tid)
+        exec_pre += 'case "$RP_RANK" in\n'
+
+        # exec script, after the rank execution
+        exec_post  = ''
+        exec_post += 'esac\n'
+        exec_post += 'RP_RET=$?\n'
+        exec_post += self._get_prof('rank_stop', tid)
+
+        # post_rank list is applied to rank 0, dict to the ranks listed
+        post_rank = td.get('post_rank')
+        if isinstance(post_rank, list): post_rank = {'0': post_rank}
+
+        if post_rank:
+            exec_post += self._separator
+            exec_post += self._get_prof('rank_post', tid)
+            exec_post += self._get_rank_sync('post_rank', n_ranks)
+
+            exec_post += '\n# post-rank commands\n'
+            exec_post += 'case "$RP_RANK" in\n'
+            for rank_id, cmds in post_rank.items():
+                rank_id = int(rank_id)
+                exec_post += '    %d)\n' % rank_id
+                exec_post += self._get_post_rank(cmds)
+                exec_post += '        ;;\n'
+            exec_post += 'esac\n\n'
+
+        exec_post += self._separator
+        exec_post += self._get_prof('exec_post', tid)
+        exec_post += '# post exec commands\n'
+        exec_post += self._get_post_exec(task)
+
+        exec_post += self._separator
+        exec_post += self._get_prof('exec_stop', tid)
+        exec_post += 'exit $RP_RET\n'
+
+        exec_post += self._separator
+        exec_post += '\n'
+
+        frags = (launch_pre, launch_post, exec_ids, exec_pre, exec_post)
+
+        self._script_cache[key] = frags
+        if len(self._script_cache) > self._script_cache_size:
+            self._script_cache.popitem(last=False)
+
+        return frags
 
-        self._log.info('Launching task %s via %s in %s', tid, cmdline, sbox)
 
-        _launch_out_h = ru.ru_open('%s/%s.launch.out' % (sbox, tid), 'w')
+    # --------------------------------------------------------------------------
+    #
+    def _spawn_task(self, task, env=None):
+        '''
+        Spawn the task's launch script.  Return `False` if the task got canceled
+        before it could be spawned, `True` otherwise.
+        '''
+
+        # launch and exec script are done, get ready for execution.
+        tid           = task['uid']
+        sbox          = task['task_sandbox_path']
+        launch_script = '%s.launch.sh'     % tid
+        launch_out    = '%s/%s.launch.out' % (sbox, tid)
+
+        self._log.info('Launching task %s via %s in %s', tid, launch_script,
+                                                          sbox)
 
         self._prof.prof('task_run_start', uid=tid)
-        task['proc'] = subprocess.Popen(args       = cmdline,
-                                        executable = None,
-                                        stdin      = None,
-                                        stdout     = _launch_out_h,
-                                        stderr     = subprocess.STDOUT,
-                                        close_fds  = True,
-                                        shell      = True,
-                                        cwd        = sbox)
-        # decoupling from parent process group is disabled,
-        # in case of enabling it, one of the following options should be added:
-        #    `preexec_fn=os.setsid` OR `start_new_session=True`
+
+        node_agent = self._na_launch.pop(tid, None)
+        if node_agent:
+            # completion is reported by the node agent
+            with self._na_lock:
+                if self._cancel_list.pop(tid):
+                    return False
+                self._na_tasks[tid] = [task, node_agent]
+                node_agent.put({'cmd'   : 'launch',
+                                'uid'   : tid,
+                                'sbox'  : sbox,
+                                'script': launch_script,
+                                'out'   : launch_out})
+            self._prof.prof('task_run_ok', uid=tid)
+            return True
+
+        with self._cancel_lock:
+
+            if self._cancel_list.pop(tid):
+                self._drop_cgroup(tid)
+                return False
+
+            task['proc'] = self._spawn(sbox, launch_script, launch_out, env,
+                                       self._cgroup_path.get(tid))
+            pid          = task['proc'].pid
+
+            self._uids_to_watch[tid] = pid
+
         self._prof.prof('task_run_ok', uid=tid)
 
         # store pid for last-effort termination
-        _pids.append(task['proc'].pid)
+        _pids.add(pid)
 
         self._watch_queue.put(task)
 
+        # watch the process for termination - the watcher gets woken up by
+        # the process exit and only then needs to know about the task
+        if self._epoll:
+            try:
+                pidfd = os.pidfd_open(pid)
+            except OSError:
+                # pidfds are not supported by the kernel: poll from now on
+                self._log.warn('pidfd_open failed - fall back to polling')
+                self._close_epoll()
+                self._wake()
+            else:
+                with self._epoll_lock:
+                    if self._epoll:
+                        self._pidfds[pidfd] = pid
+                        self._epoll.register(pidfd, select.EPOLLIN)
+                    else:
+                        os.close(pidfd)
+
+        return True
+
 
     # --------------------------------------------------------------------------
     #
-    def _watch(self):
+    def _spawn(self, sbox, launch_script, launch_out, env=None, cgroup=None):
+        '''
+        run the given launch script in the given sandbox (and cgroup), and
+        return a process handle
+        '''
+
+        if hasattr(os, 'posix_spawn'):
+            # `posix_spawn` does not copy the agent's address space (as `fork`
+            # does), which makes process creation cheap even for a large
+            # agent.  It has no `cwd` argument, so a shell changes into the
+            # sandbox first (and moves itself into the task's cgroup).  The
+            # process becomes a process group leader, so that `killpg` reaches
+            # the launcher and all task ranks.
+            args = ['/bin/sh', '-c', 'cd "$1" && exec /bin/sh "$2"',
+                    'sh', sbox, launch_script]
+            if cgroup:
+                args[2] = 'echo $$ > "$3/cgroup.procs" && ' + args[2]
+                args.append(cgroup)
+
+            pid = os.posix_spawn('/bin/sh', args, env or os.environ,
+                       file_actions=[(os.POSIX_SPAWN_OPEN, 1, launch_out,
+                                      os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                                      0o644),
+                                     (os.POSIX_SPAWN_DUP2, 1, 2)],
+                       setpgroup=0)
+            return _Proc(pid, self._log)
+
+        cmd = '/bin/sh %s' % launch_script
+        if cgroup:
+            cmd = 'echo $$ > "%s/cgroup.procs" && exec %s' % (cgroup, cmd)
+
+        with ru.ru_open(launch_out, 'w') as launch_out_h:
+            # decoupling from parent process group is disabled,
+            # in case of enabling it, one of the following options should be
+            # added: `preexec_fn=os.setsid` OR `start_new_session=True`
+            return subprocess.Popen(args       = cmd,
+                                    executable = None,
+                                    stdin      = None,
+                                    stdout     = launch_out_h,
+                                    stderr     = subprocess.STDOUT,
+                                    close_fds  = True,
+                                    shell      = True,
+                                    cwd        = sbox)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _start_node_agents(self):
+        '''
+        Start a node agent on each compute node, via the launch method which
+        would be used for a single rank task on that node, and wait for the
+        node agents to connect.  Tasks on nodes without a node agent are
+        launched by this executor as usual.
+        '''
+
+        self._na_results = ru.zmq.Pipe(ru.zmq.MODE_PULL)
+
+        # the pipes bind to all interfaces - tell the node agents where to
+        # connect to
+        hostip  = ru.get_hostip()
+        res_url = ru.as_string(self._na_results.url).replace('0.0.0.0', hostip)
+        pending = dict()
+
+        for node in self._rm.info.node_list:
+
+            uid  = 'node_agent.%s' % node['node_id']
+            sbox = '%s/%s' % (self._pwd, uid)
+            pipe = ru.zmq.Pipe(ru.zmq.MODE_PUSH)
+            url  = ru.as_string(pipe.url).replace('0.0.0.0', hostip)
+
+            task = {'uid'              : uid,
+                    'task_sandbox_path': sbox,
+                    'description'      : TaskDescription({
+                        'uid'           : uid,
+                        'ranks'         : 1,
+                        'executable'    : sys.executable,
+                        'arguments'     : ['-m', __package__ + '.node_agent',
+                                           uid, url, res_url]
+                    }).as_dict(),
+                    'slots'            : {'ranks': [{
+                        'node_name': node['node_name'],
+                        'node_id'  : node['node_id'],
+                        'core_map' : [[0]],
+                        'gpu_map'  : [],
+                        'lfs'      : 0,
+                        'mem'      : 0}]}}
+
+            try:
+                self._prepare_task(task)
+                # node agents must not be confined to a task cgroup
+                self._drop_cgroup(uid)
+                proc = self._spawn(sbox, '%s.launch.sh' % uid,
+                                   '%s/%s.launch.out' % (sbox, uid))
+                _pids.add(proc.pid)
+
+            except Exception:
+                self._log.exception('cannot start node agent %s', uid)
+                continue
+
+            pending[uid] = [node['node_id'], pipe]
+
+        timeout = self._cfg.get('node_agent_timeout', 60.0)
+        start   = time.time()
+        while pending and time.time() - start < timeout:
+
+            msg = self._na_results.get_nowait(timeout=1.0)
+            if msg and msg['cmd'] == 'hello' and msg['uid'] in pending:
+                node_id, pipe = pending.pop(msg['uid'])
+                self._node_agents[node_id] = pipe
+
+        for uid in pending:
+            self._log.warn('node agent %s did not connect', uid)
+
+        self._log.info('%d node agents up', len(self._node_agents))
+
+        self._na_watcher = mt.Thread(target=self._watch_node_agents)
+        self._na_watcher.daemon = True
+        self._na_watcher.start()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get_node_agent(self, task, launcher, n_ranks):
+        '''
+        return the request pipe of the node agent to launch the task, or `None`
+        if the task is to be launched by this executor
+        '''
+
+        if not self._node_agents:
+            return None
+
+        if n_ranks != 1 or launcher.name not in self._node_agent_lms:
+            return None
+
+        return self._node_agents.get(task['slots']['ranks'][0]['node_id'])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _watch_node_agents(self):
 
         try:
             while not self._term.is_set():
 
-                tasks = list()
-                try:
+                msg = self._na_results.get_nowait(timeout=1.0)
+                if msg and msg['cmd'] == 'done':
+                    self._node_agent_done(msg['tasks'])
+
+        except Exception as e:
+            self._log.exception('Error in node agent watch loop (%s)' % e)
+
 
-                    # FIXME: we don't want to only wait for one Task -- then we
-                    #        would pull Task state too frequently.  OTOH, we
-                    #        also don't want to learn about tasks until all
-                    #        slots are filled, because then we may not be able
-                    #        to catch finishing tasks in time -- so there is
-                    #        a fine balance here.  Balance means 100.
-                    MAX_QUEUE_BULKSIZE = 100
+    # --------------------------------------------------------------------------
+    #
+    def _node_agent_done(self, results):
+        '''
+        pass on the tasks whose completion got reported by node agents
+        '''
 
-                    while len(tasks) < MAX_QUEUE_BULKSIZE :
-                        tasks.append (self._watch_queue.get_nowait())
+        canceled = list()
+        done     = list()
 
-                except queue.Empty:
-                    # nothing found -- no problem, see if any tasks finished
-                    pass
+        with self._na_lock:
 
-                # add all tasks we found to the watchlist
-                for task in tasks :
-                    self._tasks_to_watch.append (task)
+            for tid, exit_code, was_canceled in results:
 
-                # check on the known tasks.
-                action = self._check_running()
+                entry = self._na_tasks.pop(tid, None)
+                if not entry:
+                    continue
+
+                task = entry[0]
+
+                if self._cancel_list.pop(tid) or was_canceled:
+                    self._prof.prof('task_run_cancel_stop', uid=tid)
+                    canceled.append(task)
+                else:
+                    self._set_exit_code(task, exit_code)
+                    done.append(task)
+
+        return self._advance_completed(canceled, done)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def finalize(self):
+
+        with self._na_lock:
+            for pipe in self._node_agents.values():
+                pipe.put({'cmd': 'stop'})
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _watch(self):
+
+        try:
+            while not self._term.is_set():
 
-                if not action and not tasks :
-                    # nothing happened at all!  Zzz for a bit.
-                    # FIXME: make configurable
-                    time.sleep(0.1)
+                # wait for task processes to exit, or for new tasks
+                exited = self._wait_exited()
+
+                # add all new tasks to the watchlist
+                while True:
+                    try:
+                        task = self._watch_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._tasks_to_watch[task['proc'].pid] = task
+
+                # check on the known tasks.
+                self._check_running(exited)
 
         except Exception as e:
             self._log.exception('Error in ExecWorker watch loop (%s)' % e)
@@ -466,87 +994,221 @@ class Popen(AgentExecutingComponent):
 
 
     # --------------------------------------------------------------------------
-    # Iterate over all running tasks, check their status, and decide on the
-    # next step.  Also check for a requested cancellation for the tasks.
-    def _check_running(self):
+    #
+    def _wait_exited(self):
+        '''
+        Wait until task processes exit, or until the watcher is woken up.
+        Return the list of pids of exited processes, or `None` if the
+        processes need to be polled.
+        '''
 
-        action = 0
-        for task in self._tasks_to_watch:
+        epoll = self._epoll
 
-            # poll subprocess object
-            exit_code = task['proc'].poll()
-            tid       = task['uid']
+        if not epoll:
+            select.select([self._wake_r], [], [], self._watch_timeout)
+            self._drain_wake()
+            return None
 
-            if exit_code is None:
-                # Process is still running
+        try:
+            events = epoll.poll(timeout=self._watch_timeout)
+        except ValueError:
+            # epoll got closed (see `_close_epoll`)
+            return None
 
-                if tid in self._tasks_to_cancel:
+        exited = list()
+        with self._epoll_lock:
 
-                    # FIXME: there is a race condition between the state poll
-                    # above and the kill command below.  We probably should pull
-                    # state after kill again?
+            if self._epoll is not epoll:
+                # fell back to polling meanwhile - the pidfds are closed
+                return None
 
-                    self._prof.prof('task_run_cancel_start', uid=tid)
+            for fd, _ in events:
 
-                    # We got a request to cancel this task - send SIGTERM to the
-                    # process group (which should include the actual launch
-                    # method)
-                  # task['proc'].kill()
-                    action += 1
-                    try:
-                        os.killpg(task['proc'].pid, signal.SIGTERM)
-                    except OSError:
-                        # task is already gone, we ignore this
-                        pass
-                    task['proc'].wait()  # make sure proc is collected
+                if fd == self._wake_r:
+                    self._drain_wake()
+                    continue
 
-                    with self._cancel_lock:
-                        self._tasks_to_cancel.remove(tid)
+                epoll.unregister(fd)
+                os.close(fd)
+                exited.append(self._pidfds.pop(fd))
 
-                    self._prof.prof('task_run_cancel_stop', uid=tid)
+        return exited
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _close_epoll(self):
+        '''
+        Stop watching processes via pidfds: close the epoll set and all
+        registered pidfds.  The watcher polls all running processes from now
+        on.
+        '''
 
-                    del task['proc']  # proc is not json serializable
-                    self._prof.prof('unschedule_start', uid=tid)
-                    self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, task)
-                    self.advance(task, rps.CANCELED, publish=True, push=False)
+        with self._epoll_lock:
 
-                    # we don't need to watch canceled tasks
-                    self._tasks_to_watch.remove(task)
+            if not self._epoll:
+                return
+
+            self._epoll.close()
+            self._epoll = None
+
+            for pidfd in self._pidfds:
+                os.close(pidfd)
+            self._pidfds.clear()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _drain_wake(self):
+
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
 
-            else:
 
-                self._prof.prof('task_run_stop', uid=tid)
+    # --------------------------------------------------------------------------
+    #
+    def _check_running(self, exited=None):
+        '''
+        Collect the tasks whose processes exited (all running tasks are polled
+        if `exited` is `None`).  Tasks whose cancellation got requested are
+        reported as canceled.  Completed tasks are passed on in one bulk.
+        '''
+
+        canceled = list()
+        done     = list()
+
+        # pids are unregistered under the cancel lock once the processes are
+        # collected, so that `command_cb` never signals a reused pid
+        with self._cancel_lock:
 
-                # make sure proc is collected
-                task['proc'].wait()
+            if exited is None:
+                exited = [pid for pid, task in self._tasks_to_watch.items()
+                              if task['proc'].poll() is not None]
 
-                # we have a valid return code -- task is final
-                action += 1
-                self._log.info("Task %s has return code %s.", tid, exit_code)
+            for pid in exited:
 
-                task['exit_code'] = exit_code
+                task = self._tasks_to_watch.get(pid)
+                if not task:
+                    continue
 
-                # Free the Slots, Flee the Flots, Ree the Frots!
-                self._tasks_to_watch.remove(task)
-                del task['proc']  # proc is not json serializable
-                self._prof.prof('unschedule_start', uid=tid)
-                self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, task)
+                exit_code = task['proc'].poll()
+                if exit_code is None:
+                    continue
 
-                if exit_code != 0:
-                    # The task failed - fail after staging output
-                    task['target_state'] = rps.FAILED
+                tid = task['uid']
+
+                if self._task_usage:
+                    self._set_usage(task)
+
+                self._unwatch(pid)
+
+                if self._cancel_list.pop(tid):
+                    self._prof.prof('task_run_cancel_stop', uid=tid)
+                    canceled.append(task)
 
                 else:
-                    # The task finished cleanly, see if we need to deal with
-                    # output data.  We always move to stageout, even if there
-                    # are no directives -- at the very least, we'll upload
-                    # stdout/stderr
-                    task['target_state'] = rps.DONE
+                    self._set_exit_code(task, exit_code)
+                    done.append(task)
+
+        return self._advance_completed(canceled, done)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _set_exit_code(self, task, exit_code):
+
+        tid = task['uid']
+        self._prof.prof('task_run_stop', uid=tid)
+
+        # we have a valid return code -- task is final
+        self._log.info("Task %s has return code %s.", tid, exit_code)
 
-                self.advance(task, rps.AGENT_STAGING_OUTPUT_PENDING,
-                                   publish=True, push=True)
+        task['exit_code'] = exit_code
 
-        return action
+        if exit_code != 0:
+            # The task failed - fail after staging output
+            task['target_state'] = rps.FAILED
+
+        else:
+            # The task finished cleanly, see if we need to deal with
+            # output data.  We always move to stageout, even if there
+            # are no directives -- at the very least, we'll upload
+            # stdout/stderr
+            task['target_state'] = rps.DONE
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _set_usage(self, task):
+        '''
+        Attach the resource usage of a completed task to the task dict (as
+        `usage`) and to the profile.  The usage is taken from the task's cgroup
+        if it has one, otherwise from the `wait4` rusage of its launch script.
+        '''
+
+        tid    = task['uid']
+        path   = self._cgroup_path.pop(tid, None)
+        rusage = getattr(task['proc'], 'rusage', None)
+
+        if path:
+            usage = self._cgroups.collect(path)
+
+        elif rusage:
+            # `ru_maxrss` is the peak of the largest process (kB on Linux)
+            usage = {'cpu_time': rusage.ru_utime + rusage.ru_stime,
+                     'mem_peak': rusage.ru_maxrss * 1024,
+                     'source'  : 'rusage'}
+        else:
+            return
+
+        task['usage'] = usage
+        self._prof.prof('task_usage', uid=tid,
+                        msg='cpu_time=%s mem_peak=%s' % (usage['cpu_time'],
+                                                         usage['mem_peak']))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _drop_cgroup(self, tid):
+
+        path = self._cgroup_path.pop(tid, None)
+        if path:
+            self._cgroups.remove(path)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _advance_completed(self, canceled, done):
+
+        # Free the Slots, Flee the Flots, Ree the Frots!
+        for task in canceled + done:
+            self._prof.prof('unschedule_start', uid=task['uid'])
+
+        if canceled or done:
+            self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, canceled + done)
+
+        if canceled:
+            self.advance(canceled, rps.CANCELED, publish=True, push=False)
+
+        if done:
+            self.advance(done, rps.AGENT_STAGING_OUTPUT_PENDING,
+                               publish=True, push=True)
+
+        return len(canceled) + len(done)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _unwatch(self, pid):
+
+        task = self._tasks_to_watch.pop(pid)
+        del self._uids_to_watch[task['uid']]
+        del task['proc']  # proc is not json serializable
+
+        _pids.discard(pid)
 
 
     # --------------------------------------------------------------------------
@@ -592,10 +1254,13 @@ class Popen(AgentExecutingComponent):
 
     # --------------------------------------------------------------------------
     #
-    def _get_launch_cmds(self, task, launcher, exec_path):
+    def _get_launch_cmds(self, task, launcher, exec_path, direct=False):
 
         ret  = '( \\\n'
-        cmds = ru.as_list(launcher.get_launch_cmds(task, exec_path))
+
+        if direct: cmds = [exec_path]
+        else     : cmds = ru.as_list(launcher.get_launch_cmds(task, exec_path))
+
         for cmd in cmds:
             ret += '  %s \\\n' % cmd
 
@@ -1,10 +1,12 @@
-
 __copyright__ = "Copyright 2013-2016, http://radical.rutgers.edu"
 __license__   = "MIT"
 
 
 import os
+import glob
 import time
+import heapq
+import random
 
 import threading     as mt
 
@@ -16,9 +18,107 @@ from ...  import constants as rpc
 from .base import AgentExecutingComponent
 
 
+# ------------------------------------------------------------------------------
+#
+# runtime distributions: `<name>:<p1>[,<p2>]`
+_DISTRIBUTIONS = {
+    'const'    : lambda rng, t   : t,
+    'uniform'  : lambda rng, a, b: rng.uniform(a, b),
+    'normal'   : lambda rng, m, s: rng.gauss(m, s),
+    'exp'      : lambda rng, m   : rng.expovariate(1.0 / m),
+    'lognormal': lambda rng, m, s: rng.lognormvariate(m, s),
+}
+
+
+# ------------------------------------------------------------------------------
+#
+def sample_runtime(spec, rng=random):
+    '''
+    Return a runtime (in seconds) for the given spec, which is either a number
+    of seconds, or a distribution (`'exp:10'`, `'normal:10,2'`,
+    `'uniform:5,15'`, `'lognormal:2,0.5'`, `'const:10'`).  Runtimes are never
+    negative.
+    '''
+
+    if isinstance(spec, (int, float)):
+        return max(0.0, float(spec))
+
+    spec = str(spec).strip()
+
+    if ':' not in spec:
+        return max(0.0, float(spec))
+
+    name, params = spec.split(':', 1)
+
+    if name not in _DISTRIBUTIONS:
+        raise ValueError('unknown runtime distribution %s' % name)
+
+    params = [float(p) for p in params.split(',')]
+
+    return max(0.0, _DISTRIBUTIONS[name](rng, *params))
+
+
+# ------------------------------------------------------------------------------
+#
+def load_trace(path):
+    '''
+    Load task runtimes from a trace, which is either a JSON file (`{uid:
+    runtime}`), a profile, or a session directory with profiles (the runtimes
+    are derived from the `task_run_start` and `task_run_stop` events).  Return
+    a dict of runtimes by task uid, and the list of runtimes in the order the
+    tasks were started.
+    '''
+
+    if path.endswith('.json'):
+        runtimes = {uid: float(rt) for uid, rt in ru.read_json(path).items()}
+        return runtimes, list(runtimes.values())
+
+    if os.path.isdir(path):
+        profiles  = glob.glob('%s/*.prof'   % path)
+        profiles += glob.glob('%s/*/*.prof' % path)
+    else:
+        profiles  = [path]
+
+    starts = dict()
+    stops  = dict()
+    for fname in profiles:
+        with ru.ru_open(fname, 'r') as fin:
+            for line in fin:
+                if not line or line[0] == '#':
+                    continue
+                elems = line.split(',', 6)
+                if len(elems) < 5:
+                    continue
+                if   elems[1] == 'task_run_start': starts[elems[4]] = elems[0]
+                elif elems[1] == 'task_run_stop' : stops[elems[4]]  = elems[0]
+
+    runtimes = dict()
+    for uid in sorted(starts, key=lambda x: float(starts[x])):
+        if uid in stops:
+            runtimes[uid] = max(0.0, float(stops[uid]) - float(starts[uid]))
+
+    return runtimes, list(runtimes.values())
+
+
 # ------------------------------------------------------------------------------
 #
 class Sleep(AgentExecutingComponent) :
+    '''
+    This executor does not run tasks, but lets them complete after an emulated
+    runtime - which makes it possible to measure the throughput of the other
+    agent components with large numbers of (fake) resources.  The runtime of
+    a task is taken from:
+
+      - the trace given by the `sleep_trace` config setting (see `load_trace`):
+        recorded runtimes are replayed by task uid, tasks unknown to the trace
+        get the recorded runtimes in their original order;
+      - the task description's `metadata['runtime']`, or the first task
+        argument (as for `/bin/sleep`), which can specify a distribution (see
+        `sample_runtime`).  Samples are reproducible via `sleep_seed`.
+
+    Tasks complete at their deadline, and tasks with the same deadline complete
+    in one bulk (as they would when they were started together).
+    '''
 
     # --------------------------------------------------------------------------
     #
@@ -40,11 +140,28 @@ class Sleep(AgentExecutingComponent) :
                              rpc.AGENT_STAGING_OUTPUT_QUEUE)
 
         self.register_publisher (rpc.AGENT_UNSCHEDULE_PUBSUB)
+        self.register_subscriber(rpc.CONTROL_PUBSUB, self.command_cb)
+
+        self._rng        = random.Random(self._cfg.get('sleep_seed'))
+        self._trace      = dict()    # uid: runtime
+        self._trace_seq  = list()    # runtimes in start order
+        self._trace_idx  = 0
+
+        if self._cfg.get('sleep_trace'):
+            self._trace, self._trace_seq = load_trace(self._cfg['sleep_trace'])
+            self._log.info('replay %d task runtimes from %s',
+                           len(self._trace), self._cfg['sleep_trace'])
 
         self._terminate  = mt.Event()
-        self._tasks_lock = ru.RLock()
-        self._tasks      = list()
-        self._delay      = 0.1
+        self._tasks_cond = mt.Condition()
+        self._tasks      = dict()    # uid: task
+        self._deadlines  = list()    # heap of [to_finish, uid]
+        self._delay      = 1.0       # max time to wait for termination
+
+        # completion delays, for the final report
+        self._n_done     = 0
+        self._late_sum   = 0.0
+        self._late_max   = 0.0
 
         self._watcher = mt.Thread(target=self._timed)
         self._watcher.daemon = True
@@ -56,8 +173,15 @@ class Sleep(AgentExecutingComponent) :
     def finalize(self):
 
         self._terminate.set()
+        with self._tasks_cond:
+            self._tasks_cond.notify()
         self._watcher.join()
 
+        if self._n_done:
+            self._log.info('emulated %d tasks, completion delay: '
+                           'mean %.3fs, max %.3fs', self._n_done,
+                           self._late_sum / self._n_done, self._late_max)
+
 
     # --------------------------------------------------------------------------
     #
@@ -65,11 +189,15 @@ class Sleep(AgentExecutingComponent) :
 
         self.advance(tasks, rps.AGENT_EXECUTING, publish=True, push=False)
 
+        # tasks of one bulk start together
+        now     = time.time()
+        started = list()
         for task in tasks:
 
             try:
                 self._prof.prof('task_start', uid=task['uid'])
-                self._handle_task(task)
+                self._handle_task(task, now)
+                started.append(task)
 
             except Exception:
                 # append the startup error to the tasks stderr.  This is
@@ -91,18 +219,52 @@ class Sleep(AgentExecutingComponent) :
             finally:
                 self._prof.prof('task_stop', uid=task['uid'])
 
-        with self._tasks_lock:
-            self._tasks.extend(tasks)
+        # tasks may have been canceled while being handled
+        canceled = list()
+        with self._tasks_cond:
+            for task in started:
+                uid = task['uid']
+                if self._cancel_list.pop(uid):
+                    canceled.append(task)
+                else:
+                    self._tasks[uid] = task
+                    heapq.heappush(self._deadlines, [task['to_finish'], uid])
+
+            # the new tasks may complete before the ones waited for
+            self._tasks_cond.notify()
+
+        self._cancel(canceled)
 
 
     # --------------------------------------------------------------------------
     #
-    def _handle_task(self, task):
+    def _get_runtime(self, task):
+
+        uid = task['uid']
+
+        if uid in self._trace:
+            return self._trace[uid]
+
+        if self._trace_seq:
+            runtime = self._trace_seq[self._trace_idx % len(self._trace_seq)]
+            self._trace_idx += 1
+            return runtime
 
-        now = time.time()
+        td   = task['description']
+        meta = td.get('metadata')
+
+        if isinstance(meta, dict) and 'runtime' in meta:
+            return sample_runtime(meta['runtime'], self._rng)
 
         # assert t['description']['executable'].endswith('sleep')
-        task['to_finish'] = now + float(task['description']['arguments'][0])
+        return sample_runtime(td['arguments'][0], self._rng)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _handle_task(self, task, now):
+
+        task['to_finish'] = now + self._get_runtime(task)
 
         uid = task['uid']
         self._prof.prof('task_run_start', uid=uid)
@@ -118,25 +280,53 @@ class Sleep(AgentExecutingComponent) :
 
         while not self._terminate.is_set():
 
-            time.sleep(self._delay)
+            with self._tasks_cond:
 
-            with self._tasks_lock:
-                now = time.time()
-                to_finish   = [t for t in self._tasks if t['to_finish'] <= now]
-                self._tasks = [t for t in self._tasks if t['to_finish'] >  now]
+                now       = time.time()
+                to_finish = list()
 
-            for task in to_finish:
-                uid = task['uid']
-                task['target_state'] = 'DONE'
-                self._prof.prof('app_stop',         uid=uid)
-                self._prof.prof('exec_stop',        uid=uid)
-                self._prof.prof('launch_stop',      uid=uid)
-                self._prof.prof('task_run_stop',    uid=uid)
-                self._prof.prof('unschedule_start', uid=uid)
-                self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, task)
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, uid = heapq.heappop(self._deadlines)
+                    task   = self._tasks.pop(uid, None)
+                    if task:
+                        # canceled tasks are gone already
+                        to_finish.append(task)
 
-            self.advance(to_finish, rps.AGENT_STAGING_OUTPUT_PENDING,
-                                    publish=True, push=True)
+                if not to_finish:
+                    timeout = self._delay
+                    if self._deadlines:
+                        timeout = min(timeout, self._deadlines[0][0] - now)
+                    self._tasks_cond.wait(timeout)
+                    continue
+
+            self._finish(to_finish, now)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _finish(self, tasks, now):
+
+        for task in tasks:
+
+            uid  = task['uid']
+            late = now - task['to_finish']
+
+            self._n_done   += 1
+            self._late_sum += late
+            self._late_max  = max(self._late_max, late)
+
+            task['target_state'] = rps.DONE
+            task['exit_code']    = 0
+
+            self._prof.prof('app_stop',         uid=uid)
+            self._prof.prof('exec_stop',        uid=uid)
+            self._prof.prof('launch_stop',      uid=uid)
+            self._prof.prof('task_run_stop',    uid=uid)
+            self._prof.prof('unschedule_start', uid=uid)
+
+        self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, tasks)
+        self.advance(tasks, rps.AGENT_STAGING_OUTPUT_PENDING,
+                            publish=True, push=True)
 
 
     # --------------------------------------------------------------------------
@@ -146,14 +336,45 @@ class Sleep(AgentExecutingComponent) :
         self._log.info('command_cb [%s]: %s', topic, msg)
 
         cmd = msg['cmd']
+        arg = msg['arg']
 
         if cmd == 'cancel_tasks':
 
-            # FIXME: clarify how to cancel tasks
-            pass
+            uids = ru.as_list(arg['uids'])
+
+            # sleeping tasks are canceled right away - the others are canceled
+            # when they arrive (see `work()` and the component base)
+            self._cancel_list.add(uids)
+
+            canceled = list()
+            with self._tasks_cond:
+                for uid in uids:
+                    task = self._tasks.pop(uid, None)
+                    if task:
+                        self._cancel_list.pop(uid)
+                        canceled.append(task)
+
+            self._cancel(canceled)
 
         return True
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _cancel(self, tasks):
+
+        if not tasks:
+            return
+
+        for task in tasks:
+            uid = task['uid']
+            self._prof.prof('task_run_cancel_start', uid=uid)
+            self._prof.prof('task_run_cancel_stop',  uid=uid)
+            self._prof.prof('unschedule_start',      uid=uid)
+
+        self.publish(rpc.AGENT_UNSCHEDULE_PUBSUB, tasks)
+        self.advance(tasks, rps.CANCELED, publish=True, push=False)
+
+
 # ------------------------------------------------------------------------------
 
@@ -60,6 +60,8 @@ class RMInfo(ru.TypedDict):
             'lfs_path'         : str,           # node local FS path
             'mem_per_node'     : int,           # memory per node (MB)
 
+            'numa_domains'     : [None],        # cores and gpus per domain
+
             'details'          : {None: None},  # dict of launch method info
             'lm_info'          : {str: None},   # dict of launch method info
     }
@@ -71,6 +73,7 @@ class RMInfo(ru.TypedDict):
             'threads_per_core' : 1,
             'gpus_per_node'    : 0,
             'threads_per_gpu'  : 1,
+            'numa_domains'     : [],            # node topology is unknown
     }
 
 
@@ -202,6 +205,52 @@ class ResourceManager(object):
         raise NotImplementedError('_init_from_scratch is not implemented')
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _get_numa_domains(self, rm_info, spec):
+        '''
+        Expand the NUMA domain specification from the resource config
+        (`system_architecture.numa_domains`) into a list of domains, each
+        listing the indexes of the node's cores and GPUs which belong to that
+        domain:
+
+            numa_domains = [{'cores': [0, 1, ..., 20], 'gpus': [0, 1, 2]},
+                            {'cores': [21, 22, ..., 41], 'gpus': [3, 4, 5]}]
+
+        The specification can either be such a list, or the number of domains
+        to split the cores and GPUs of a node into evenly.  Core and GPU
+        indexes refer to the node's `cores` and `gpus` lists, and thus to all
+        hardware threads if SMT is used.
+        '''
+
+        if not spec:
+            return []
+
+        n_cores = len(rm_info.node_list[0]['cores'])
+        n_gpus  = len(rm_info.node_list[0]['gpus'])
+
+        if isinstance(spec, int):
+            domains = [{'cores': list(range(n_cores * i       // spec,
+                                            n_cores * (i + 1) // spec)),
+                        'gpus' : list(range(n_gpus  * i       // spec,
+                                            n_gpus  * (i + 1) // spec))}
+                       for i in range(spec)]
+
+        else:
+            domains = [{'cores': list(domain.get('cores', [])),
+                        'gpus' : list(domain.get('gpus',  []))}
+                       for domain in spec]
+
+        for domain in domains:
+            if any(not 0 <= idx < n_cores for idx in domain['cores']) or \
+               any(not 0 <= idx < n_gpus  for idx in domain['gpus']):
+                raise RuntimeError('invalid NUMA domain: %s' % domain)
+
+        self._log.info('numa domains: %s', domains)
+
+        return domains
+
+
     # --------------------------------------------------------------------------
     #
     def init_from_scratch(self):
@@ -233,6 +282,10 @@ class ResourceManager(object):
         # we expect to have a valid node list now
         self._log.info('node list: %s', rm_info.node_list)
 
+        # the config can describe the node topology
+        rm_info.numa_domains = self._get_numa_domains(
+                rm_info, rcfg.get('system_architecture', {}).get('numa_domains'))
+
         # number of nodes could be unknown if `cores_per_node` is not in config,
         # but is provided by a corresponding RM in `_init_from_scratch`
         if not rm_info.requested_nodes:
@@ -0,0 +1,304 @@
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import time
+import bisect
+
+from ... import constants as rpc
+
+
+# ------------------------------------------------------------------------------
+#
+# 'enum' for the backfill modes
+#
+BACKFILL_EASY         = 'easy'
+BACKFILL_CONSERVATIVE = 'conservative'
+
+
+# ------------------------------------------------------------------------------
+#
+# The backfill planner protects waiting tasks which do not fit onto the pilot
+# from being starved by a stream of smaller tasks.  It uses runtime estimates
+# for tasks, which are either specified by the application
+# (`td['metadata']['runtime_estimate']`, in seconds), or are learned from the
+# time completed tasks of the same tuple size held their resources.
+#
+# From the estimated end times of running tasks, the planner derives a profile
+# of free cores and GPUs over time:
+#
+#     times: [now, t_1, t_2, ...]   # profile breakpoints
+#     cores: [c_0, c_1, c_2, ...]   # free cores in [t_i, t_i+1)
+#     gpus : [g_0, g_1, g_2, ...]   # free GPUs  in [t_i, t_i+1)
+#
+# Running tasks without runtime estimate never release their resources in that
+# profile.  A waiting task which cannot be placed gets a reservation at the
+# earliest time the profile has sufficient free resources for the task's
+# estimated runtime.  Any other task is then only admitted for placement if it
+# fits into the profile right now, i.e., if it does not delay any reservation.
+# In `easy` mode, only the first task which cannot be placed in a scheduling
+# pass gets a reservation, in `conservative` mode all of them do.
+#
+# The profile only considers the total amount of free resources on the pilot,
+# not their distribution over nodes, so reservations will not protect against
+# fragmentation.
+#
+class Backfill(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, nodes, mode):
+
+        if mode not in [BACKFILL_EASY, BACKFILL_CONSERVATIVE]:
+            raise ValueError('backfill mode %s unknown' % mode)
+
+        self._mode    = mode
+        self._cores   = sum(node['cores'].count(rpc.FREE) for node in nodes)
+        self._gpus    = sum(node['gpus'].count(rpc.FREE)  for node in nodes)
+        self._running = dict()   # uid: [start, end, cores, gpus]
+        self._learned = dict()   # tuple_size: [n_tasks, mean runtime]
+
+        self._times   = None     # resource profile (see `_build`)
+        self._free_c  = None
+        self._free_g  = None
+        self._n_resv  = 0        # number of reservations in this pass
+
+
+    # --------------------------------------------------------------------------
+    #
+    def estimate(self, task):
+        '''
+        Return the estimated runtime of a task, or `None` if unknown.
+        '''
+
+        md = task['description'].get('metadata')
+        if isinstance(md, dict) and md.get('runtime_estimate') is not None:
+            return float(md['runtime_estimate'])
+
+        learned = self._learned.get(tuple(task['tuple_size']))
+        if learned:
+            return learned[1]
+
+        return None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def start(self, task, now=None):
+        '''
+        Record that a task got placed.
+        '''
+
+        if now is None:
+            now = time.time()
+
+        est = self.estimate(task)
+        end = None if est is None else now + est
+
+        cores, gpus = self._request(task)
+        self._running[task['uid']] = [now, end, cores, gpus]
+
+        if self._times:
+            self._allocate(now, end, cores, gpus)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stop(self, task, now=None):
+        '''
+        Record that a task released its resources, and learn its runtime.  The
+        resource profile is not updated: it gets rebuilt on the next `reset()`.
+        '''
+
+        info = self._running.pop(task['uid'], None)
+        if not info:
+            return
+
+        if now is None:
+            now = time.time()
+
+        ts      = tuple(task['tuple_size'])
+        runtime = now - info[0]
+        n, mean = self._learned.get(ts, [0, 0.0])
+
+        self._learned[ts] = [n + 1, mean + (runtime - mean) / (n + 1)]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def reset(self):
+        '''
+        Drop all reservations, to be called at the begin of a scheduling pass.
+        '''
+
+        self._times  = None
+        self._free_c = None
+        self._free_g = None
+        self._n_resv = 0
+
+
+    # --------------------------------------------------------------------------
+    #
+    def admit(self, task, now=None):
+        '''
+        Return `True` if the task can be placed without delaying any reserved
+        task.
+        '''
+
+        if not self._times:
+            # no reservations
+            return True
+
+        if now is None:
+            now = time.time()
+
+        cores, gpus = self._request(task)
+        return self._earliest(now, self.estimate(task), cores, gpus) == now
+
+
+    # --------------------------------------------------------------------------
+    #
+    def reserve(self, task, now=None):
+        '''
+        Reserve resources for a task which could not be placed, at the earliest
+        time the resource profile allows.  Return the reservation time, or
+        `None` if no reservation was made.
+        '''
+
+        if self._mode == BACKFILL_EASY and self._n_resv:
+            return None
+
+        if now is None:
+            now = time.time()
+
+        if not self._times:
+            self._build(now)
+
+        est         = self.estimate(task)
+        cores, gpus = self._request(task)
+        start       = self._earliest(now, est, cores, gpus)
+
+        if start is None:
+            # resources are held by tasks with unknown runtime
+            return None
+
+        self._allocate(start, None if est is None else start + est,
+                       cores, gpus)
+        self._n_resv += 1
+
+        return start
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _request(self, task):
+
+        ranks, cores, gpus = task['tuple_size'][:3]
+        return ranks * cores, ranks * gpus
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _build(self, now):
+
+        free_c = self._cores
+        free_g = self._gpus
+        ends   = list()
+
+        for _, end, cores, gpus in self._running.values():
+            free_c -= cores
+            free_g -= gpus
+            if end is not None:
+                # overdue tasks are expected to end right away
+                ends.append([max(end, now), cores, gpus])
+
+        self._times  = [now]
+        self._free_c = [free_c]
+        self._free_g = [free_g]
+
+        for end, cores, gpus in sorted(ends):
+
+            free_c += cores
+            free_g += gpus
+
+            if end == self._times[-1]:
+                self._free_c[-1] = free_c
+                self._free_g[-1] = free_g
+            else:
+                self._times.append(end)
+                self._free_c.append(free_c)
+                self._free_g.append(free_g)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _split(self, t):
+        '''
+        make sure the profile has a breakpoint at time `t`, return its index
+        '''
+
+        idx = max(0, bisect.bisect_right(self._times, t) - 1)
+
+        if self._times[idx] == t:
+            return idx
+
+        if t < self._times[idx]:
+            # before profile start
+            return idx
+
+        self._times .insert(idx + 1, t)
+        self._free_c.insert(idx + 1, self._free_c[idx])
+        self._free_g.insert(idx + 1, self._free_g[idx])
+
+        return idx + 1
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _allocate(self, start, end, cores, gpus):
+        '''
+        remove the given resources from the profile between `start` and `end`
+        (`None` meaning forever)
+        '''
+
+        idx_s = self._split(start)
+        idx_e = len(self._times) if end is None else self._split(end)
+
+        for idx in range(idx_s, idx_e):
+            self._free_c[idx] -= cores
+            self._free_g[idx] -= gpus
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _earliest(self, now, duration, cores, gpus):
+        '''
+        Return the earliest time at or after `now` from which the profile has
+        the given free resources for the given duration (`None` meaning
+        forever), or `None` if there is no such time.
+        '''
+
+        times = self._times
+        n     = len(times)
+        start = None
+        idx_0 = max(0, bisect.bisect_right(times, now) - 1)
+
+        for idx in range(idx_0, n):
+
+            if self._free_c[idx] < cores or self._free_g[idx] < gpus:
+                start = None
+                continue
+
+            if start is None:
+                start = max(now, times[idx])
+
+            if duration is not None and idx + 1 < n and \
+               times[idx + 1] >= start + duration:
+                return start
+
+        # the last profile segment lasts forever
+        return start
+
+
+# ------------------------------------------------------------------------------
+
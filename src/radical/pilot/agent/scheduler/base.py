@@ -4,9 +4,9 @@ __license__   = 'MIT'
 
 import copy
 import time
-import queue
 import pprint
 import logging
+import collections
 
 import threading          as mt
 import multiprocessing    as mp
@@ -19,6 +19,11 @@ from ... import constants as rpc
 
 from ..resource_manager import ResourceManager
 
+from .ordering import Ordering, ORDERING_LARGEST_FIRST
+from .backfill import Backfill
+from .waitpool import WaitPool
+from .shards   import Shards, SHARD_ROUTING_LOAD
+
 
 # ------------------------------------------------------------------------------
 #
@@ -80,6 +85,9 @@ SCHEDULER_NAME_NOOP               = "NOOP"
 #   unschedule_task(task):
 #     - release the allocation held by that task
 #
+# and may overload `unschedule_tasks(tasks)` to release many allocations at
+# once, and `_index_nodes()` to maintain additional indexes over `self.nodes`.
+#
 #
 # The scheduler needs (in the general case) three pieces of information:
 #
@@ -169,6 +177,7 @@ SCHEDULER_NAME_NOOP               = "NOOP"
 #        schedule_try    : search for task resources starts    (uid: uid)
 #        schedule_fail   : search for task resources failed    (uid: uid)
 #        schedule_ok     : search for task resources succeeded (uid: uid)
+#        schedule_fast   : task took over a completed task's slots (uid: uid)
 #        unschedule_start: task resource freeing starts        (uid: uid)
 #        unschedule_stop : task resource freeing stops         (uid: uid)
 #
@@ -199,6 +208,10 @@ class AgentSchedulingComponent(rpu.Component):
     # respectively.  Some schedulers may need a more elaborate structures - but
     # where the above is suitable, it should be used for code consistency.
     #
+    # The core and gpu markers are stored as lists, or as `bytearray`s if the
+    # `compact_nodes` option is set (see `_compact_nodes()`).  Schedulers should
+    # only use operations which are supported by both types.
+    #
 
     def __init__(self, cfg, session):
 
@@ -220,30 +233,57 @@ class AgentSchedulingComponent(rpu.Component):
 
         self._partitions = self._rm.get_partitions()  # {plabel : [node_ids]}
 
-        # create and initialize the wait pool.  Also maintain a mapping of that
-        # waitlist to a binned list where tasks are binned by size for faster
-        # lookups of replacement tasks.  And outdated binlist is mostly
-        # sufficient, only rebuild when we run dry
-        self._waitpool   = dict()  # map uid:task
-        self._ts_map     = dict()
-        self._ts_valid   = False   # set to False to trigger re-binning
+        # If slot reuse is enabled, the slots of a completed task are passed
+        # on to a waiting task of the same size, without freeing and searching
+        # resources (see `_unschedule_completed`).
+        self._waitpool   = None    # created after configuration
+        self._ts_reuse   = self._cfg.get('reuse_slots', False)
         self._active_cnt = 0       # count of currently scheduled tasks
         self._named_envs = list()  # record available named environments
+        self._index      = None    # optional resource index
+        self._node_map   = dict()  # map node_id:node (see `_index_nodes`)
 
         # the scheduler algorithms have two inputs: tasks to be scheduled, and
-        # slots becoming available (after tasks complete).
-        self._queue_sched   = mp.Queue()
-        self._queue_unsched = mp.Queue()
+        # slots becoming available (after tasks complete).  Any put to those
+        # queues sets the `wakeup` event, which the scheduling process waits
+        # for when idle.  We use simple queues: their `put` has written the
+        # data to the pipe when it returns, so that the scheduler process will
+        # find it on wakeup.
+        self._queue_sched   = mp.SimpleQueue()
+        self._queue_unsched = mp.SimpleQueue()
+        self._wakeup        = mp.Event()
         self._term          = mp.Event()  # reassign Event (multiprocessing)
 
+        # when idle, the scheduler process checks for termination at least
+        # every `idle_timeout` seconds.  When woken up, it waits for
+        # `batch_window` seconds to collect more tasks or freed slots before
+        # scheduling.
+        self._idle_timeout  = self._cfg.get('sched_idle_timeout', 1.0)
+        self._batch_window  = self._cfg.get('sched_batch_window', 0.0)
+
         # initialize the node list to be used by the scheduler.  A scheduler
         # instance may decide to overwrite or extend this structure.
         self.nodes = copy.deepcopy(self._rm.info.node_list)
 
+        # large pilots can opt to keep core and gpu states in compact arrays
+        if self._cfg.get('compact_nodes', False):
+            self._compact_nodes()
+
         # configure the scheduler instance
         self._configure()
+        self._index_nodes()
+        self._init_policies()
         self.slot_status("slot status after  init")
 
+        # large pilots can split the node list into shards, each handled by
+        # a separate scheduling process (see `shards.py`)
+        self._shards = None
+        n_shards     = self._cfg.get('sched_shards', 1)
+        if n_shards > 1:
+            self._shards = Shards(self.nodes, n_shards, self._partitions,
+                                  self._cfg.get('sched_shard_routing',
+                                                SHARD_ROUTING_LOAD))
+
         # register task input channels
         self.register_input(rps.AGENT_SCHEDULING_PENDING,
                             rpc.AGENT_SCHEDULING_QUEUE, self.work)
@@ -254,16 +294,115 @@ class AgentSchedulingComponent(rpu.Component):
         self.register_subscriber(rpc.AGENT_UNSCHEDULE_PUBSUB, self.unschedule_cb)
 
         # start a process to host the actual scheduling algorithm
-        self._p = mp.Process(target=self._schedule_tasks)
-        self._p.daemon = True
-        self._p.start()
+        if not self._shards:
+            self._p = mp.Process(target=self._schedule_tasks)
+            self._p.daemon = True
+            self._p.start()
+            self._procs = [self._p]
+
+        else:
+            self._start_shards()
 
 
     # --------------------------------------------------------------------------
     #
     def finalize(self):
 
-        self._p.terminate()
+        for proc in self._procs:
+            proc.terminate()
+
+        if self._shards:
+            self._queue_coord.put(None)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _init_policies(self):
+        '''
+        Create the ordering policy, waitpool and (optional) backfill planner
+        for the current node list.
+        '''
+
+        # the ordering policy determines the order in which waiting tasks are
+        # placed (see `ordering.py`)
+        self._ordering = Ordering.create(
+                self._cfg.get('sched_ordering', ORDERING_LARGEST_FIRST),
+                self.nodes)
+
+        # create the wait pool for tasks which cannot be placed right away
+        self._waitpool = WaitPool(self._ordering)
+
+        # optionally, reserve resources for waiting tasks which don't fit, and
+        # only backfill tasks which do not delay those (see `backfill.py`)
+        self._backfill = None
+        backfill       = self._cfg.get('sched_backfill')
+        if backfill:
+            self._backfill = Backfill(self.nodes, backfill)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _start_shards(self):
+        '''
+        Start one scheduling process per shard.  Each shard process is fed by
+        its own queues, and places tasks on the shard's nodes only.  Tasks
+        which span shards are coordinated by this (the component) process: the
+        shards report placed and failed parts of such tasks on the `coord`
+        queue, and also report other tasks which failed (to release their
+        load, see `Shards.fail()`).
+        '''
+
+        self._shard       = None
+        self._shard_lock  = mt.Lock()
+        self._shard_queues = [[mp.SimpleQueue(), mp.SimpleQueue(), mp.Event()]
+                              for _ in range(len(self._shards))]
+        self._queue_coord = mp.SimpleQueue()
+
+        self._span_waiting = collections.deque()  # spanning tasks to place
+        self._span_task    = None                 # spanning task in placement
+        self._span_parts   = None                 # {shard: slots} placed
+        self._span_aborted = dict()               # {uid: {shard}} pending parts
+
+        self._procs = list()
+        for idx in range(len(self._shards)):
+            proc = mp.Process(target=self._run_shard, args=(idx,))
+            proc.daemon = True
+            proc.start()
+            self._procs.append(proc)
+
+        self._log.info('started %d scheduler shards', len(self._shards))
+
+        # the component process now also pushes tasks to the executor (tasks
+        # which span shards)
+        self.register_output(rps.AGENT_EXECUTING_PENDING,
+                             rpc.AGENT_EXECUTING_QUEUE)
+
+        self._coord_thread = mt.Thread(target=self._coordinate)
+        self._coord_thread.daemon = True
+        self._coord_thread.start()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _run_shard(self, idx):
+        '''
+        This method runs in a shard's scheduling process: restrict the node
+        list to the shard's nodes and run the scheduling loop on the shard's
+        queues.
+        '''
+
+        node_ids    = self._shards.node_ids(idx)
+        self._shard = idx
+        self.nodes  = [node for node in self.nodes
+                            if  node['node_id'] in node_ids]
+
+        self._queue_sched, self._queue_unsched, self._wakeup = \
+                self._shard_queues[idx]
+
+        self._index_nodes()
+        self._init_policies()
+
+        self._schedule_tasks()
 
 
     # --------------------------------------------------------------------------
@@ -324,6 +463,9 @@ class AgentSchedulingComponent(rpu.Component):
             env_name = arg['env_name']
             self._named_envs.append(env_name)
 
+            # tasks may be waiting for that env
+            self._wakeup.set()
+
 
         elif cmd == 'register_raptor_queue':
 
@@ -334,7 +476,14 @@ class AgentSchedulingComponent(rpu.Component):
             self._log.debug('register raptor queue: %s', name)
             with self._raptor_lock:
 
-                self._raptor_queues[name] = ru.zmq.Putter(queue, addr)
+                putter = ru.zmq.Putter(queue, addr)
+
+                # tasks routed to raptor leave the task store
+                if self._task_store:
+                    putter = rpu.TaskStorePutter(putter, self._task_store,
+                                                 release=True)
+
+                self._raptor_queues[name] = putter
 
                 # send tasks which were collected for this queue
                 if name in self._raptor_tasks:
@@ -382,6 +531,38 @@ class AgentSchedulingComponent(rpu.Component):
         return True
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _compact_nodes(self):
+        '''
+        Store the core and gpu states of all nodes in `bytearray`s instead of
+        lists.  A byte array uses one byte per core (a list uses one pointer
+        per core), and it supports the list operations used on node states
+        (indexing, item assignment, iteration, `count()` and `index()`), which
+        operate on the plain byte buffer.  `rpc.FREE`, `rpc.BUSY` and
+        `rpc.DOWN` are small integers and are stored unchanged.
+        '''
+
+        for node in self.nodes:
+            node['cores'] = bytearray(node['cores'])
+            node['gpus']  = bytearray(node['gpus'])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _index_nodes(self):
+        '''
+        Map node IDs to the entries in `self.nodes`, so that nodes referenced
+        by slots can be found without a search over the node list.  This method
+        is called after `_configure()`, and needs to be called again whenever
+        `self.nodes` is replaced.  Schedulers which maintain additional indexes
+        over the node list can overload this method to (re)build them, but MUST
+        call the base class implementation.
+        '''
+
+        self._node_map = {node['node_id']: node for node in self.nodes}
+
+
     # --------------------------------------------------------------------------
     #
     # Change the reserved state of slots (rpc.FREE or rpc.BUSY)
@@ -394,40 +575,45 @@ class AgentSchedulingComponent(rpu.Component):
         This function is used to update the state for a list of slots that
         have been allocated or deallocated.  For details on the data structure,
         see top of `base.py`.
+
+        `slots` can also be a list of slot structures, which are then changed
+        in one pass (see `unschedule_tasks()`).
         '''
         # This method needs to change if the DS changes.
 
-        # for node_name, node_id, cores, gpus in slots['ranks']:
-        for rank in slots['ranks']:
+        if isinstance(slots, dict):
+            ranks = slots['ranks']
+        else:
+            ranks = [rank for s in slots for rank in s['ranks']]
 
-            # Find the entry in the the slots list
+        # count how the number of free cores/gpus changes per node, to keep the
+        # resource index (if any) up to date
+        is_free = (new_state == rpc.FREE)
+        changes = dict()
 
-            # TODO: [Optimization] Assuming 'node_id' is the ID of the node, it
-            #       seems a bit wasteful to have to look at all of the nodes
-            #       available for use if at most one node can have that uid.
-            #       Maybe it would be worthwhile to simply keep a list of nodes
-            #       that we would read, and keep a dictionary that maps the uid
-            #       of the node to the location on the list?
+        # for node_name, node_id, cores, gpus in slots['ranks']:
+        for rank in ranks:
 
-            node = None
-            node_found = False
-            for node in self.nodes:
-                if node['node_id'] == rank['node_id']:
-                    node_found = True
-                    break
+            node_id = rank['node_id']
+            node    = self._node_map.get(node_id)
 
-            if not node_found:
+            if node is None:
                 raise RuntimeError('inconsistent node information')
 
-            # iterate over cores/gpus in the slot, and update state
+            # iterate over cores/gpus in the slot, and update state.
+            d_cores = 0
+            d_gpus  = 0
+
             cores = rank['core_map']
             for cslot in cores:
                 for core in cslot:
+                    d_cores += is_free - (node['cores'][core] == rpc.FREE)
                     node['cores'][core] = new_state
 
             gpus = rank['gpu_map']
             for gslot in gpus:
                 for gpu in gslot:
+                    d_gpus += is_free - (node['gpus'][gpu] == rpc.FREE)
                     node['gpus'][gpu] = new_state
 
             if rank['lfs']:
@@ -442,6 +628,16 @@ class AgentSchedulingComponent(rpu.Component):
                 else:
                     node['mem'] += rank['mem']
 
+            if self._index:
+                if node_id in changes:
+                    changes[node_id][0] += d_cores
+                    changes[node_id][1] += d_gpus
+                else:
+                    changes[node_id] = [d_cores, d_gpus]
+
+        # update the resource index once per node
+        for node_id, (d_cores, d_gpus) in changes.items():
+            self._index.update(node_id, d_cores, d_gpus)
 
 
     # --------------------------------------------------------------------------
@@ -477,29 +673,15 @@ class AgentSchedulingComponent(rpu.Component):
 
     # --------------------------------------------------------------------------
     #
-    def _refresh_ts_map(self):
-
-        # The ts map only gets invalidated when new tasks get added to the
-        # waitpool.  Removing tasks does *not* invalidate it.
-        #
-        # This method should only be called opportunistically, i.e., when a task
-        # lookup failed and it is worthwhile checking the waitlist tasks.
-
-        if self._ts_valid:
-            # nothing to do, the map is valid
-            return
-
-        # we can only rebuild if we have waiting tasks
-        if not self._waitpool:
-            return
-
-        for uid, task in self._waitpool.items():
-            ts = task['tuple_size']
-            if ts not in self._ts_map:
-                self._ts_map[ts] = set()
-            self._ts_map[ts].add(uid)
+    def _set_resources(self, task):
+        '''
+        Record the amount of resources assigned to a placed task.
+        '''
 
-        self._ts_valid = True
+        td = task['description']
+        task['$set']      = ['resources']
+        task['resources'] = {'cpu': td['ranks'] * td['cores_per_rank'],
+                             'gpu': td['ranks'] * td['gpus_per_rank']}
 
 
     # --------------------------------------------------------------------------
@@ -516,6 +698,18 @@ class AgentSchedulingComponent(rpu.Component):
         raise NotImplementedError('unschedule_task needs to be implemented.')
 
 
+    # --------------------------------------------------------------------------
+    #
+    def unschedule_tasks(self, tasks):
+        '''
+        Release the allocations held by a set of tasks.  Schedulers which can
+        free many allocations in one pass should overload this method.
+        '''
+
+        for task in tasks:
+            self.unschedule_task(task)
+
+
     # --------------------------------------------------------------------------
     #
     def work(self, tasks):
@@ -534,22 +728,265 @@ class AgentSchedulingComponent(rpu.Component):
 
         # advance state, publish state change, and push to scheduler process
         self.advance(tasks, rps.AGENT_SCHEDULING, publish=True, push=False)
+
+        if self._shards:
+            self._route(ru.as_list(tasks))
+            return
+
         self._queue_sched.put(tasks)
+        self._wakeup.set()
 
 
     # --------------------------------------------------------------------------
     #
     def unschedule_cb(self, topic, msg):
         '''
-        release (for whatever reason) all slots allocated to this task
+        release (for whatever reason) all slots allocated to this task (or to
+        a list of tasks)
         '''
 
+        if self._shards:
+            released = list()
+            with self._shard_lock:
+                for task in ru.as_list(msg):
+                    released += self._shards.release(task)
+
+            for idx, task in released:
+                self._unschedule_on(idx, task)
+
+            return True
+
         self._queue_unsched.put(msg)
+        self._wakeup.set()
 
         # return True to keep the cb registered
         return True
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _unschedule_on(self, idx, task):
+        '''
+        pass a task (or a part of a spanning task) on to the given shard to
+        release its slots
+        '''
+
+        if 'tuple_size' not in task:
+            # part of a task which spans shards
+            self._set_tuple_size(task)
+
+        queue_unsched, wakeup = self._shard_queues[idx][1:]
+        queue_unsched.put(task)
+        wakeup.set()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _route(self, tasks):
+        '''
+        pass incoming tasks on to the scheduler shards
+        '''
+
+        bulks    = [list() for _ in range(len(self._shards))]
+        spanning = list()
+
+        with self._shard_lock:
+
+            for task in tasks:
+                idx = self._shards.route(task)
+                if idx is None:
+                    spanning.append(task)
+                else:
+                    bulks[idx].append(task)
+
+        for idx, bulk in enumerate(bulks):
+            if bulk:
+                queue_sched, _, wakeup = self._shard_queues[idx]
+                queue_sched.put(bulk)
+                wakeup.set()
+
+        if spanning:
+            with self._shard_lock:
+                self._span_waiting.extend(spanning)
+                self._span_next()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _span_next(self):
+        '''
+        Pass the parts of the next waiting spanning task on to the shards,
+        unless a spanning task is being placed already.  Only one spanning task
+        is placed at any time: its placed parts hold their resources until all
+        parts are placed, and concurrent spanning tasks could block each other.
+        The caller must hold the shard lock.
+        '''
+
+        while self._span_waiting and not self._span_task:
+
+            task  = self._span_waiting.popleft()
+            parts = self._shards.split(task)
+
+            if not parts:
+                self._log.error('task cannot be scheduled ever: %s',
+                                task['uid'])
+                self._fail_task(task, 'insufficient resources')
+                continue
+
+            self._log.debug('span %s over shards %s', task['uid'],
+                            [idx for idx, _ in parts])
+
+            self._span_task  = task
+            self._span_parts = dict.fromkeys(idx for idx, _ in parts)
+
+            for idx, part_td in parts:
+                queue_sched, _, wakeup = self._shard_queues[idx]
+                queue_sched.put([{'uid'        : task['uid'],
+                                  'description': part_td,
+                                  'shard_part' : idx}])
+                wakeup.set()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _coordinate(self):
+        '''
+        This method runs in a thread of the component process and collects the
+        parts of spanning tasks placed by the shards.  Once all parts of a task
+        are placed, the task is passed on to the executor.  If a part fails,
+        the placed parts are released and the task fails.  The shards also
+        report the failure of other tasks, which releases their shard load.
+
+        Messages are `['placed', shard, part, slots]` or `['failed', shard,
+        task, error]`, where `part` and `task` only hold the uid and the
+        description (and `shard_part` for parts).
+        '''
+
+        while True:
+
+            msg = self._queue_coord.get()
+            if msg is None:
+                break
+
+            kind, idx, part, info = msg
+
+            if kind == 'failed':
+                self._coordinate_failed(idx, part, info)
+                continue
+
+            uid   = part['uid']
+            slots = info
+
+            with self._shard_lock:
+
+                task = self._span_task
+                if not task or task['uid'] != uid:
+                    self._release_aborted(idx, part, slots)
+                    continue
+
+                self._span_parts[idx] = slots
+                if None in self._span_parts.values():
+                    continue
+
+                # all parts are placed - merge the slots in shard order
+                parts = [self._span_parts[i] for i in sorted(self._span_parts)]
+                ranks = [rank for part in parts for rank in part['ranks']]
+                task['slots'] = {'ranks'       : ranks,
+                                 'partition_id': parts[0].get('partition_id')}
+
+                self._span_task  = None
+                self._span_parts = None
+                self._span_next()
+
+            self._set_resources(task)
+            self._prof.prof('schedule_ok', uid=uid)
+            self.advance(task, rps.AGENT_EXECUTING_PENDING, publish=True,
+                                                            push=True)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _coordinate_failed(self, idx, part, error):
+        '''
+        Handle a task (or a part of a spanning task) which failed on a shard.
+        A failed part aborts its spanning task: the parts placed so far are
+        released, the parts still pending are released once placed (see
+        `_release_aborted()`), and the task fails.
+        '''
+
+        uid = part['uid']
+
+        with self._shard_lock:
+
+            if 'shard_part' not in part:
+                # the shard failed the task already
+                self._shards.fail(idx, part)
+                return
+
+            pending = self._span_aborted.get(uid)
+            if pending and idx in pending:
+                # pending part of an aborted task
+                pending.discard(idx)
+                if not pending:
+                    del self._span_aborted[uid]
+                return
+
+            task = self._span_task
+            if not task or task['uid'] != uid:
+                self._log.error('unexpected task part %s', uid)
+                return
+
+            parts      = self._shards.abort(uid)
+            to_release = list()
+            pending    = set()
+
+            for i, slots in self._span_parts.items():
+                if i == idx:
+                    continue
+                if slots is None:
+                    pending.add(i)
+                else:
+                    to_release.append([i, {'uid'        : uid,
+                                           'description': parts[i],
+                                           'slots'      : slots}])
+            if pending:
+                self._span_aborted[uid] = pending
+
+            self._span_task  = None
+            self._span_parts = None
+            self._span_next()
+
+        for i, released in to_release:
+            self._unschedule_on(i, released)
+
+        self._log.error('part of %s failed on shard %d: %s', uid, idx, error)
+        self._fail_task(task, error)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _release_aborted(self, idx, part, slots):
+        '''
+        Release a placed part of an aborted spanning task.  The caller must hold
+        the shard lock.
+        '''
+
+        uid     = part['uid']
+        pending = self._span_aborted.get(uid)
+
+        if not pending or idx not in pending:
+            self._log.error('unexpected task part %s', uid)
+            return
+
+        pending.discard(idx)
+        if not pending:
+            del self._span_aborted[uid]
+
+        self._unschedule_on(idx, {'uid'        : uid,
+                                  'description': part['description'],
+                                  'slots'      : slots})
+
+
     # --------------------------------------------------------------------------
     #
     def _schedule_tasks(self):
@@ -622,6 +1059,10 @@ class AgentSchedulingComponent(rpu.Component):
             self._log.debug_3('schedule tasks 0: %s, w: %d', resources,
                     len(self._waitpool))
 
+            # reset the wakeup signal *before* checking the queues: anything
+            # queued after this point will trigger the signal again.
+            self._wakeup.clear()
+
             active = 0  # see if we do anything in this iteration
 
             # if we have new resources, try to place waiting tasks.
@@ -654,89 +1095,159 @@ class AgentSchedulingComponent(rpu.Component):
             self._log.debug_3('schedule tasks c: %s %s', r, a)
 
             if not active:
-                time.sleep(0.1)  # FIXME: configurable
+                # nothing to do - wait for new tasks or freed resources
+                if self._wakeup.wait(timeout=self._idle_timeout):
+                    if self._batch_window:
+                        time.sleep(self._batch_window)
 
             self._log.debug_3('schedule tasks x: %s %s', resources, active)
 
 
-    # --------------------------------------------------------------------------
-    #
-    def _prof_sched_skip(self, task):
-
-        pass
-      # self._prof.prof('schedule_skip', uid=task['uid'])
-
-
     # --------------------------------------------------------------------------
     #
     def _schedule_waitpool(self):
 
       # self.slot_status("before schedule waitpool")
 
-        # sort by inverse tuple size to place larger tasks first and backfill
-        # with smaller tasks.  We only look at cores right now - this needs
-        # fixing for GPU dominated loads.
-        # We define `tuple_size` as
-        #     `ranks * cores_per_rank * gpus_per_rank`
+        # Walk through the classes of waiting tasks in the order of the
+        # ordering policy, and attempt to place their tasks, backfilling with
+        # any later classes which fit.  Placement only gets harder during the
+        # walk (resources get allocated, not freed), so once a task fails to
+        # be placed, we skip all other tasks of the same or larger tuple size
+        # - unless they have placement constraints.
         #
-        to_wait    = list()
-        to_test    = list()
-
-        for task in self._waitpool.values():
-            named_env = task['description'].get('named_env')
-            if named_env:
-                if named_env in self._named_envs:
-                    to_test.append(task)
-                else:
-                    to_wait.append(task)
-            else:
-                to_test.append(task)
-
-        to_test.sort(key=lambda x:
-                x['tuple_size'][0] * x['tuple_size'][1] * x['tuple_size'][2],
-                 reverse=True)
-
-        # cycle through waitpool, and see if we get anything placed now.
-      # self._log.debug_9('before bisec: %d', len(to_test))
-        scheduled, unscheduled, failed = ru.lazy_bisect(to_test,
-                                                check=self._try_allocation,
-                                                on_skip=self._prof_sched_skip,
-                                                log=self._log)
-      # self._log.debug_9('after  bisec: %d : %d : %d', len(scheduled),
-      #                                           len(unscheduled), len(failed))
+        # With backfill enabled, tasks which fail to be placed get
+        # a reservation, and later tasks are only placed if they don't delay
+        # any reservation.  A task refused for that reason does not mean that
+        # its tuple size does not fit, so it is not added to `no_fit`.
+        scheduled = list()
+        no_fit    = list()  # tuple sizes which failed to be placed
+        unfit     = 0       # number of task classes which failed to be placed
+
+        if self._backfill:
+            self._backfill.reset()
+
+        for cls in self._waitpool.classes():
+
+            _, ts, constrained = cls
+
+            if constrained:
+                for task in self._waitpool.queue(cls):
+                    named_env = task['description'].get('named_env')
+                    if named_env and named_env not in self._named_envs:
+                        continue
+                    if not self._place_waiting(task, scheduled):
+                        unfit += 1
+                continue
+
+            task = self._waitpool.head(cls)
+
+            if self._may_fit(ts, no_fit):
+
+                placed = True
+                while task and placed:
+                    placed = self._place_waiting(task, scheduled)
+                    if placed:
+                        task = self._waitpool.head(cls)
+
+                if not task:
+                    # all tasks of this class got placed
+                    continue
 
-        for task, error in failed:
-            task['stderr']       = error
-            task['control']      = 'tmgr_pending'
-            task['target_state'] = 'FAILED'
-            task['$all']         = True
+                if placed is None:
+                    # refused by backfill - the tuple size may still fit
+                    unfit += 1
+                    continue
 
-            self._log.error('bisect failed on %s: %s', task['uid'], error)
-            self.advance(scheduled, rps.FAILED, publish=True, push=False)
+            elif self._backfill:
+                self._backfill.reserve(task)
 
-        self._waitpool = {task['uid']: task for task in (unscheduled + to_wait)}
+            no_fit.append(ts)
+            unfit += 1
 
         # update task resources
         for task in scheduled:
-            td = task['description']
-            task['$set']      = ['resources']
-            task['resources'] = {'cpu': td['ranks'] *
-                                        td['cores_per_rank'],
-                                 'gpu': td['ranks'] *
-                                        td['gpus_per_rank']}
-        self.advance(scheduled, rps.AGENT_EXECUTING_PENDING, publish=True,
-                                                             push=True)
+            self._set_resources(task)
+        self._advance_scheduled(scheduled)
 
         # method counts as `active` if anything was scheduled
         active = bool(scheduled)
 
-        # if we sccheduled some tasks but not all, we ran out of resources
-        resources = not (bool(unscheduled) and bool(unscheduled))
+        # if some tasks did not fit, we ran out of resources
+        resources = not unfit
 
       # self.slot_status("after  schedule waitpool")
         return resources, active
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _may_fit(self, ts, no_fit):
+        '''
+        Return `False` if tasks of the given tuple size can't be placed: if they
+        are at least as large as any tuple size known not to fit, or (if the
+        scheduler maintains a resource index and some tasks are scheduled) if
+        there are not enough free resources for them.
+        '''
+
+        for other in no_fit:
+            if all(a >= b for a, b in zip(ts, other)):
+                return False
+
+        # without any scheduled task, `_try_allocation` must run, as it fails
+        # the tasks which can never be placed
+        if self._index and self._active_cnt:
+
+            ranks, cores, gpus = ts[:3]
+            free_cores, free_gpus = self._index.total()
+
+            if ranks * cores > free_cores or ranks * gpus > free_gpus:
+                return False
+
+            # single rank tasks need all resources on one node
+            if ranks == 1 and self._index.find(0, cores, gpus) is None:
+                return False
+
+        return True
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _place_waiting(self, task, scheduled):
+        '''
+        Attempt to place a waiting task.  Return `True` if the task left the
+        waitpool (because it got placed, or because it failed), `False` if it
+        did not fit, and `None` if backfill did not admit it (placing it would
+        delay a reserved task).
+        '''
+
+        uid = task['uid']
+
+        if self._backfill and not self._backfill.admit(task):
+            # placing this task would delay a reserved one
+            self._backfill.reserve(task)
+            return None
+
+        try:
+            if self._try_allocation(task):
+                self._waitpool.pop(uid)
+                scheduled.append(task)
+                return True
+
+        except Exception as e:
+
+            self._waitpool.pop(uid)
+
+            self._log.exception('scheduling failed for %s', uid)
+            self._fail_task(task, str(e))
+            return True
+
+        if self._backfill:
+            self._backfill.reserve(task)
+
+        return False
+
+
     # --------------------------------------------------------------------------
     #
     def _schedule_incoming(self):
@@ -744,33 +1255,39 @@ class AgentSchedulingComponent(rpu.Component):
         # fetch all tasks from the queue
         to_schedule = list()  # some tasks get scheduled here
         to_raptor   = dict()  # some tasks get forwared to raptor
-        try:
+        keys        = dict()  # ordering keys of the tasks to schedule
+        while not self._term.is_set() and not self._queue_sched.empty():
 
-            while not self._term.is_set():
+            data = self._queue_sched.get()
 
-                data = self._queue_sched.get(timeout=0.001)
+            if not isinstance(data, list):
+                data = [data]
 
-                if not isinstance(data, list):
-                    data = [data]
+            for task in data:
+                # check if this task is to be scheduled by sub-schedulers
+                # like raptor
+                raptor = task['description'].get('scheduler')
+                if raptor:
+                    if raptor not in to_raptor:
+                        to_raptor[raptor] = [task]
+                    else:
+                        to_raptor[raptor].append(task)
 
-                for task in data:
-                    # check if this task is to be scheduled by sub-schedulers
-                    # like raptor
-                    raptor = task['description'].get('scheduler')
-                    if raptor:
-                        if raptor not in to_raptor:
-                            to_raptor[raptor] = [task]
-                        else:
-                            to_raptor[raptor].append(task)
+                else:
+                    # no raptor - schedule it here
+                    self._set_tuple_size(task)
 
-                    else:
-                        # no raptor - schedule it here
-                        self._set_tuple_size(task)
-                        to_schedule.append(task)
+                    # the ordering key depends on the task description (e.g.,
+                    # on a `priority` tag) - fail tasks it is invalid for
+                    try:
+                        keys[task['uid']] = self._ordering.key(task)
+                    except Exception as e:
+                        self._log.exception('cannot order task %s',
+                                            task['uid'])
+                        self._fail_task(task, 'invalid task: %s' % e)
+                        continue
 
-        except queue.Empty:
-            # no more unschedule requests
-            pass
+                    to_schedule.append(task)
 
         # forward raptor tasks to their designated raptor
         if to_raptor:
@@ -812,11 +1329,9 @@ class AgentSchedulingComponent(rpu.Component):
 
       # self.slot_status("before schedule incoming [%d]" % len(to_schedule))
 
-        # handle largest to_schedule first
-        # FIXME: this needs lazy-bisect
+        # handle tasks in the order of the ordering policy
         to_wait    = list()
-        for task in sorted(to_schedule, key=lambda x: x['tuple_size'][0],
-                           reverse=True):
+        for task in sorted(to_schedule, key=lambda t: keys[t['uid']]):
 
             # FIXME: This is a slow and inefficient way to wait for named VEs.
             #        The semantics should move to the upcoming eligibility
@@ -830,38 +1345,33 @@ class AgentSchedulingComponent(rpu.Component):
                                     task['uid'], named_env)
                     continue
 
+            # tasks must not delay tasks which have reservations
+            if self._backfill and not self._backfill.admit(task):
+                to_wait.append(task)
+                continue
+
             # either we can place the task straight away, or we have to
             # put it in the wait pool.
             try:
                 if self._try_allocation(task):
                     # task got scheduled - advance state, notify world about the
                     # state change, and push it out toward the next component.
-                    td = task['description']
-                    task['$set']      = ['resources']
-                    task['resources'] = {'cpu': td['ranks'] *
-                                                td['cores_per_rank'],
-                                         'gpu': td['ranks'] *
-                                                td['gpus_per_rank']}
-                    self.advance(task, rps.AGENT_EXECUTING_PENDING,
-                                 publish=True, push=True)
+                    self._set_resources(task)
+                    self._advance_scheduled([task])
 
                 else:
+                    if self._backfill:
+                        self._backfill.reserve(task)
                     to_wait.append(task)
 
             except Exception as e:
 
-                task['stderr']       = str(e)
-                task['control']      = 'tmgr_pending'
-                task['target_state'] = 'FAILED'
-                task['$all']         = True
-
                 self._log.exception('scheduling failed for %s', task['uid'])
-
-                self.advance(task, rps.FAILED, publish=True, push=False)
+                self._fail_task(task, str(e))
 
 
         # all tasks which could not be scheduled are added to the waitpool
-        self._waitpool.update({task['uid']: task for task in to_wait})
+        self._waitpool.add(to_wait, keys)
 
         # we performed some activity (worked on tasks)
         active = True
@@ -869,10 +1379,6 @@ class AgentSchedulingComponent(rpu.Component):
         # if tasks remain waiting, we are out of usable resources
         resources = not bool(to_wait)
 
-        # incoming tasks which have to wait are the only reason to rebuild the
-        # tuple_size map
-        self._ts_valid = False
-
       # self.slot_status("after  schedule incoming")
         return resources, active
 
@@ -881,73 +1387,56 @@ class AgentSchedulingComponent(rpu.Component):
     #
     def _unschedule_completed(self):
 
+        # We only collect what is queued right now (the scheduling loop waits
+        # for new entries if idle).  The bulk limit avoids starving the
+        # scheduling of waiting and incoming tasks under a steady stream of
+        # completed tasks.
         to_unschedule = list()
-        try:
-
-            # Timeout and bulk limit below are somewhat arbitrary, but the
-            # behaviour is benign.  The goal is to avoid corner cases: for the
-            # sleep, avoid no sleep (busy idle) and also significant latencies.
-            # Anything smaller than 0.01 is under our noise level and works ok
-            # for the latency, and anything larger than 0 is sufficient to avoid
-            # busy idle.
-            #
-            # For the unschedule bulk, the corner case to avoid is waiting for
-            # too long to fill a bulk so that latencies add a up and negate the
-            # bulk optimization. For the 0.001 sleep, 128 as bulk size results
-            # in a max added latency of about 0.1 second, which is one order of
-            # magnitude above our noise level again and thus acceptable (tm).
-            while not self._term.is_set():
-                task = self._queue_unsched.get(timeout=0.01)
-                to_unschedule.append(task)
-                if len(to_unschedule) > 512:
-                    break
-
-        except queue.Empty:
-            # no more unschedule requests
-            pass
+        while not self._term.is_set() and not self._queue_unsched.empty():
+            to_unschedule.extend(ru.as_list(self._queue_unsched.get()))
+            if len(to_unschedule) > 512:
+                break
 
         to_release = list()  # slots of unscheduling tasks
-        placed     = list()  # uids of waiting tasks replacing unscheduled ones
+        placed     = list()  # waiting tasks replacing unscheduled ones
 
-        if to_unschedule:
-
-            # rebuild the tuple_size binning, maybe
-            self._refresh_ts_map()
+        for task in to_unschedule:
 
+            if self._backfill:
+                self._backfill.stop(task)
 
-        for task in to_unschedule:
             # if we find a waiting task with the same tuple size, we don't free
             # the slots, but just pass them on unchanged to the waiting task.
             # Thus we replace the unscheduled task on the same cores / GPUs
             # immediately. This assumes that the `tuple_size` is good enough to
             # judge the legality of the resources for the new target task.
-            #
-            # FIXME
-
-          # ts = tuple(task['tuple_size'])
-          # if self._ts_map.get(ts):
-          #
-          #     replace = self._waitpool[self._ts_map[ts].pop()]
-          #     replace['slots'] = task['slots']
-          #     placed.append(placed)
-          #
-          #     # unschedule task A and schedule task B have the same
-          #     # timestamp
-          #     ts = time.time()
-          #     self._prof.prof('unschedule_stop', uid=task['uid'],
-          #                     timestamp=ts)
-          #     self._prof.prof('schedule_fast', uid=replace['uid'],
-          #                     timestamp=ts)
-          #     self.advance(replace, rps.AGENT_EXECUTING_PENDING,
-          #                  publish=True, push=True)
-          # else:
-          #
-          #     # no replacement task found: free the slots, and try to
-          #     # schedule other tasks of other sizes.
-          #     to_release.append(task)
-
-            self._active_cnt -= 1
-            to_release.append(task)
+            # Note that the tuple size arrives as list after serialization.
+            replace = None
+            if self._ts_reuse and self._waitpool and task.get('tuple_size'):
+                replace = self._waitpool.pop_shape(tuple(task['tuple_size']))
+
+            if replace:
+
+                replace['slots'] = task['slots']
+                self._set_resources(replace)
+                placed.append(replace)
+
+                if self._backfill:
+                    self._backfill.start(replace)
+
+                # unschedule task A and schedule task B have the same timestamp
+                ts = time.time()
+                self._prof.prof('unschedule_stop', uid=task['uid'], ts=ts)
+                self._prof.prof('schedule_fast', uid=replace['uid'], ts=ts)
+
+            else:
+                # no replacement task found: free the slots, and try to
+                # schedule other tasks of other sizes.
+                self._active_cnt -= 1
+                to_release.append(task)
+
+        if placed:
+            self._advance_scheduled(placed)
 
         if not to_release:
             if not to_unschedule:
@@ -960,19 +1449,37 @@ class AgentSchedulingComponent(rpu.Component):
         # we have tasks to unschedule, which will free some resources. We can
         # thus try to schedule larger tasks again, and also inform the caller
         # about resource availability.
+        self.unschedule_tasks(to_release)
         for task in to_release:
-            self.unschedule_task(task)
             self._prof.prof('unschedule_stop', uid=task['uid'])
 
-        # we placed some previously waiting tasks, and need to remove those from
-        # the waitpool
-        self._waitpool = {task['uid']: task for task in self._waitpool.values()
-                                            if  task['uid'] not in placed}
-
         # we have new resources, and were active
         return True, True
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _advance_scheduled(self, tasks):
+        '''
+        Pass placed tasks on toward the executor.  Placed parts of tasks which
+        span scheduler shards are reported to the component process instead
+        (see `_coordinate`).
+        '''
+
+        if self._shards:
+
+            parts = [task for task in tasks if 'shard_part' in task]
+            if parts:
+                tasks = [task for task in tasks if 'shard_part' not in task]
+                for part in parts:
+                    self._queue_coord.put(['placed', self._shard,
+                                           self._shard_report(part),
+                                           part['slots']])
+
+        self.advance(tasks, rps.AGENT_EXECUTING_PENDING, publish=True,
+                                                         push=True)
+
+
     # --------------------------------------------------------------------------
     #
     def _try_allocation(self, task):
@@ -1007,12 +1514,57 @@ class AgentSchedulingComponent(rpu.Component):
         self._change_slot_states(slots, rpc.BUSY)
         task['slots'] = slots
 
+        if self._backfill:
+            self._backfill.start(task)
+
         # got an allocation, we can go off and launch the process
         self._prof.prof('schedule_ok', uid=uid)
 
         return True
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _fail_task(self, task, error):
+        '''
+        Fail a task which cannot be scheduled, and report the reason.  Shards
+        report failed tasks to the component process (see `_coordinate()`),
+        which fails spanning tasks when one of their parts fails.
+        '''
+
+        if self._shards and self._shard is not None:
+
+            self._queue_coord.put(['failed', self._shard,
+                                   self._shard_report(task), error])
+
+            if 'shard_part' in task:
+                return
+
+        task['stderr']       = error
+        task['control']      = 'tmgr_pending'
+        task['target_state'] = 'FAILED'
+        task['$all']         = True
+
+        self.advance(task, rps.FAILED, publish=True, push=False)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _shard_report(self, task):
+        '''
+        return what the component process needs to know about a task (or part)
+        handled by a shard
+        '''
+
+        ret = {'uid'        : task['uid'],
+               'description': task['description']}
+
+        if 'shard_part' in task:
+            ret['shard_part'] = task['shard_part']
+
+        return ret
+
+
     # --------------------------------------------------------------------------
     #
     def _set_tuple_size(self, task):
@@ -1033,7 +1585,9 @@ class AgentSchedulingComponent(rpu.Component):
         d = task['description']
         task['tuple_size'] = tuple([d.get('ranks'         , 1),
                                     d.get('cores_per_rank', 1),
-                                    d.get('gpus_per_rank' , 0)])
+                                    d.get('gpus_per_rank' , 0),
+                                    d.get('lfs_per_rank'  , 0),
+                                    d.get('mem_per_rank'  , 0)])
 
 
 # ------------------------------------------------------------------------------
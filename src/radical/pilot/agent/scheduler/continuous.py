@@ -3,11 +3,12 @@ __copyright__ = 'Copyright 2013-2021, The RADICAL-Cybertools Team'
 __license__   = 'MIT'
 
 import math as m
-import pprint
 
 from ...   import constants as rpc
 from .base import AgentSchedulingComponent
 
+from .resource_index import ResourceIndex
+
 
 # ------------------------------------------------------------------------------
 #
@@ -80,6 +81,7 @@ class Continuous(AgentSchedulingComponent):
         self._tagged_nodes = set()
         self._scattered    = None
         self._node_offset  = 0
+        self._domains      = None
 
 
     # --------------------------------------------------------------------------
@@ -95,20 +97,65 @@ class Continuous(AgentSchedulingComponent):
         #
         self._scattered = self._cfg.get('scattered', False)
 
+        # * NUMA domains:
+        #   If the resource manager knows the node topology, the cores and
+        #   GPUs of each slot are placed within a single NUMA domain if
+        #   possible (see `_find_domain_slot`).
+        #
+        self._domains = [(domain['cores'], domain['gpus'])
+                         for domain in self._rm.info.numa_domains] or None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _index_nodes(self):
+
+        AgentSchedulingComponent._index_nodes(self)
+
+        # the resource index tracks free cores and GPUs per node, so that
+        # `schedule_task` can skip nodes which cannot host a request without
+        # inspecting them.  The index is kept up to date by
+        # `_change_slot_states`.
+        self._index = ResourceIndex(self.nodes)
+
 
     # --------------------------------------------------------------------------
     #
-    def _iterate_nodes(self):
-        # note that the first index is yielded twice, so that the respecitve
-        # node can function as first and last node in an allocation.
+    def _iterate_nodes(self, need=None):
+        '''
+        Iterate over all nodes once, starting at the node offset left by the
+        last iteration.
+
+        `need` can be a list `[cores, gpus]` which is evaluated on each
+        iteration step: if a resource index is available, nodes which have
+        fewer free cores or GPUs than needed are skipped without being yielded.
+        The caller can change the values (in place) while iterating - `[0, 0]`
+        will yield all nodes.  Skipped nodes count toward the iteration length,
+        so that the node offset evolves as if those nodes were yielded.
+        '''
 
+        n_nodes        = len(self.nodes)
         iterator_count = 0
 
-        while iterator_count < len(self.nodes):
+        while iterator_count < n_nodes:
+
+            if self._index and need and (need[0] or need[1]):
+
+                skip = self._index.find(self._node_offset, need[0], need[1])
+
+                if skip is None or iterator_count + skip >= n_nodes:
+                    # no suitable node left - we are done
+                    self._node_offset = (self._node_offset + n_nodes
+                                         - iterator_count) % n_nodes
+                    return
+
+                iterator_count    += skip
+                self._node_offset  = (self._node_offset + skip) % n_nodes
+
             yield self.nodes[self._node_offset]
             iterator_count    += 1
             self._node_offset += 1
-            self._node_offset  = self._node_offset % len(self.nodes)
+            self._node_offset  = self._node_offset % n_nodes
 
 
     # --------------------------------------------------------------------------
@@ -124,6 +171,80 @@ class Continuous(AgentSchedulingComponent):
         self._change_slot_states(task['slots'], rpc.FREE)
 
 
+    # --------------------------------------------------------------------------
+    #
+    def unschedule_tasks(self, tasks):
+        '''
+        Release the slots of all given tasks in a single pass over their ranks.
+        '''
+
+        self._change_slot_states([task['slots'] for task in tasks], rpc.FREE)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _find_domain_slot(self, node, cores_per_slot, gpus_per_slot, taken):
+        '''
+        Find the cores and GPUs for a single slot on a node with known NUMA
+        domains.  The slot is placed into a single domain if one can host it
+        (preferring the domain with the fewest free resources, and for slots
+        without GPUs, domains with fewer free GPUs).  Otherwise the slot's GPUs
+        are picked first, and its cores are picked from the domain of its first
+        GPU before other domains.  `taken` holds the sets of cores and GPUs
+        already assigned to other slots on this node.
+
+        The caller must ensure that the node has sufficient free resources.
+        '''
+
+        node_cores = node['cores']
+        node_gpus  = node['gpus']
+        free       = list()  # free [cores], [gpus] per domain
+
+        for d_cores, d_gpus in self._domains:
+            free.append(([c for c in d_cores if node_cores[c] == rpc.FREE
+                                            and c not in taken[0]],
+                         [g for g in d_gpus  if node_gpus[g]  == rpc.FREE
+                                            and g not in taken[1]]))
+
+        fits = [(0 if gpus_per_slot else len(f_gpus), len(f_cores), idx)
+                for idx, (f_cores, f_gpus) in enumerate(free)
+                if len(f_cores) >= cores_per_slot and
+                   len(f_gpus)  >= gpus_per_slot]
+
+        if fits:
+            f_cores, f_gpus = free[min(fits)[2]]
+            return f_cores[:cores_per_slot], f_gpus[:gpus_per_slot]
+
+        # the slot needs to span domains
+        gpus  = list()
+        order = list(range(len(free)))
+        for idx, (_, f_gpus) in enumerate(free):
+            if f_gpus and len(gpus) < gpus_per_slot:
+                if not gpus:
+                    # prefer cores close to the first GPU
+                    order.remove(idx)
+                    order.insert(0, idx)
+                gpus += f_gpus[:gpus_per_slot - len(gpus)]
+
+        cores = list()
+        for idx in order:
+            cores += free[idx][0][:cores_per_slot - len(cores)]
+
+        # fill up with cores and GPUs which are not part of any domain
+        for res, states, n, busy in [[cores, node_cores, cores_per_slot,
+                                      taken[0]],
+                                     [gpus,  node_gpus,  gpus_per_slot,
+                                      taken[1]]]:
+            idx = 0
+            while len(res) < n:
+                idx = states.index(rpc.FREE, idx)
+                if idx not in busy and idx not in res:
+                    res.append(idx)
+                idx += 1
+
+        return cores, gpus
+
+
     # --------------------------------------------------------------------------
     #
     def _find_resources(self, node, find_slots, cores_per_slot, gpus_per_slot,
@@ -145,8 +266,9 @@ class Continuous(AgentSchedulingComponent):
         The call will *not* change the allocation status of the node, atomicity
         must be guaranteed by the caller.
 
-        We don't care about continuity within a single node - cores `[1, 5]` are
-        assumed to be as close together as cores `[1, 2]`.
+        Unless the node topology is known (`self._domains`), we don't care
+        about continuity within a single node - cores `[1, 5]` are assumed to be
+        as close together as cores `[1, 2]`.
 
         When `partial` is set, the method CAN return less than `find_slots`
         number of slots - otherwise, the method returns the requested number of
@@ -160,8 +282,10 @@ class Continuous(AgentSchedulingComponent):
         '''
 
         # check if the node can host the request
-        free_cores = node['cores'].count(rpc.FREE)
-        free_gpus  = node['gpus'].count(rpc.FREE)
+        node_cores = node['cores']
+        node_gpus  = node['gpus']
+        free_cores = node_cores.count(rpc.FREE)
+        free_gpus  = node_gpus.count(rpc.FREE)
         free_lfs   = node['lfs']
         free_mem   = node['mem']
 
@@ -197,23 +321,33 @@ class Continuous(AgentSchedulingComponent):
 
         core_idx  = 0
         gpu_idx   = 0
+        taken     = [set(), set()]  # cores and gpus assigned to slots
 
+        # we know that sufficient resources are free, so `index()` will find
+        # the next free core / gpu (that search is not done in Python code).
         for _ in range(alc_slots):
 
-            cores = list()
-            gpus  = list()
+            if self._domains:
+                cores, gpus = self._find_domain_slot(node, cores_per_slot,
+                                                     gpus_per_slot, taken)
+                taken[0].update(cores)
+                taken[1].update(gpus)
+
+            else:
+                cores = list()
+                gpus  = list()
 
-            while len(cores) < cores_per_slot:
+                while len(cores) < cores_per_slot:
 
-                if node['cores'][core_idx] == rpc.FREE:
+                    core_idx = node_cores.index(rpc.FREE, core_idx)
                     cores.append(core_idx)
-                core_idx += 1
+                    core_idx += 1
 
-            while len(gpus) < gpus_per_slot:
+                while len(gpus) < gpus_per_slot:
 
-                if node['gpus'][gpu_idx] == rpc.FREE:
+                    gpu_idx = node_gpus.index(rpc.FREE, gpu_idx)
                     gpus.append(gpu_idx)
-                gpu_idx += 1
+                    gpu_idx += 1
 
             core_map = [cores]
             gpu_map  = [[gpu] for gpu in gpus]
@@ -279,8 +413,6 @@ class Continuous(AgentSchedulingComponent):
         # Iterate over all nodes until we find something. Check if it fits the
         # allocation mode and sequence.  If not, start over with the next node.
         # If it matches, add the slots found and continue to next node.
-        #
-        # FIXME: persistent node index
 
         cores_per_node = self._rm.info.cores_per_node
         gpus_per_node  = self._rm.info.gpus_per_node
@@ -340,8 +472,19 @@ class Continuous(AgentSchedulingComponent):
         alc_slots = list()
         rem_slots = req_slots
 
+        # Nodes which cannot host at least one slot are skipped by the node
+        # iterator.  Non-MPI tasks need to find all slots on a single node.
+        # A continuous (non-scattered) MPI allocation must not skip nodes once
+        # the first slots are found, as a node without free resources would
+        # break continuity - so we reset `need` in that case.
+        if mpi: need_init = [cores_per_slot,
+                             gpus_per_slot]
+        else  : need_init = [cores_per_slot * req_slots,
+                             gpus_per_slot  * req_slots]
+        need = list(need_init)
+
         # start the search
-        for node in self._iterate_nodes():
+        for node in self._iterate_nodes(need):
 
             node_id   = node['node_id']
             node_name = node['node_name']
@@ -426,6 +569,7 @@ class Continuous(AgentSchedulingComponent):
                     rem_slots       = req_slots
                     is_first        = True
                     is_last         = False
+                    need[:]         = need_init
 
                 # try next node
                 continue
@@ -438,13 +582,17 @@ class Continuous(AgentSchedulingComponent):
             rem_slots -= len(new_slots)
             alc_slots.extend(new_slots)
 
-            self._log.debug_3('new slots: %s', pprint.pformat(new_slots))
+            self._log.debug_3('new slots: %s', new_slots)
             self._log.debug_3('req2: %s = %s + %s <> %s', req_slots, rem_slots,
                                                   len(new_slots), len(alc_slots))
 
             # we are young only once.  kinda...
             is_first = False
 
+            # continuous allocations need to inspect all following nodes
+            if mpi and not self._scattered:
+                need[:] = [0, 0]
+
             # or maybe don't continue the search if we have in fact enough!
             if rem_slots == 0:
                 break
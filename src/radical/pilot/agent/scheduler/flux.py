@@ -4,6 +4,7 @@ __license__   = 'MIT'
 
 
 import os
+import json
 import shlex
 import textwrap
 
@@ -68,10 +69,7 @@ class Flux(AgentSchedulingComponent):
         # toward the executor *without state change* - state changes are
         # performed in retrospect by the executor, based on the scheduling and
         # execution events collected from Flux.
-        qname   = rpc.AGENT_EXECUTING_QUEUE
-        fname   = '%s/%s.cfg' % (self._cfg.path, qname)
-        cfg     = ru.read_json(fname)
-        self._q = ru.zmq.Putter(qname, cfg['put'])
+        self._q = self.get_output_ep(rpc.AGENT_EXECUTING_QUEUE)
 
         lm_cfg  = self._cfg.resource_cfg.launch_methods.get('FLUX')
         lm_cfg['pid']       = self._cfg.pid
@@ -79,6 +77,9 @@ class Flux(AgentSchedulingComponent):
         self._lm            = LaunchMethod.create('FLUX', lm_cfg, self._cfg,
                                                   self._log, self._prof)
 
+        # flux handle for job submission, created on first use
+        self._fh            = None
+
 
     # --------------------------------------------------------------------------
     #
@@ -89,9 +90,9 @@ class Flux(AgentSchedulingComponent):
         self.advance(tasks, rps.AGENT_SCHEDULING, publish=True, push=False)
 
         # FIXME: need actual job description, obviously
-        jds = [self.task_to_spec(task) for task in tasks]
+        jds  = [self.task_to_spec(task) for task in tasks]
         self._log.debug('submit tasks: %s', [jd for jd in jds])
-        jids = self._lm.fh.submit_jobs([jd for jd in jds])
+        jids = self._submit(jds)
         self._log.debug('submitted tasks')
 
         for task, jid in zip(tasks, jids):
@@ -101,6 +102,27 @@ class Flux(AgentSchedulingComponent):
         self._q.put(tasks)
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _submit(self, specs):
+        '''
+        Submit the given job specs as one batch: all submission requests are
+        sent before any response is awaited, so that the flux job manager can
+        ingest them in bulk.  Return the flux job IDs in the order of `specs`.
+        '''
+
+        # pylint: disable=import-error
+        import flux.job
+
+        if not self._fh:
+            self._fh = self._lm.fh.get_handle()
+
+        futures = [flux.job.submit_async(self._fh, json.dumps(spec))
+                   for spec in specs]
+
+        return [int(future.get_id()) for future in futures]
+
+
     # --------------------------------------------------------------------------
     #
     def task_to_spec(self, task):
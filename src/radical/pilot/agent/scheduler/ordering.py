@@ -0,0 +1,185 @@
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import radical.utils as ru
+
+
+# ------------------------------------------------------------------------------
+#
+# 'enum' for the built-in task ordering policies
+#
+ORDERING_LARGEST_FIRST  = 'largest_first'
+ORDERING_SMALLEST_FIRST = 'smallest_first'  # alias for `drf`
+ORDERING_GPU_FIRST      = 'gpu_first'
+ORDERING_DRF            = 'drf'
+ORDERING_PRIORITY       = 'priority'
+
+
+# ------------------------------------------------------------------------------
+#
+# An ordering policy defines in what order the agent scheduler attempts to
+# place incoming and waiting tasks.  The policy's `key()` method maps a task to
+# a sortable value, and tasks with smaller keys are placed first.  Tasks with
+# equal keys are placed in order of arrival.
+#
+# Keys are computed once when a task enters the scheduler's waitpool, and must
+# thus only depend on the task and on the (static) pilot resources, not on the
+# current resource utilization.
+#
+# Custom policies can be specified as `<path/to/file.py>:<ClassName>`, where
+# the class must inherit from `Ordering`.
+#
+class Ordering(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, nodes):
+
+        # total pilot resources, for policies which normalize task requests
+        self._cores = sum(len(node['cores']) for node in nodes)
+        self._gpus  = sum(len(node['gpus'])  for node in nodes)
+        self._lfs   = sum(node['lfs']        for node in nodes)
+        self._mem   = sum(node['mem']        for node in nodes)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def create(cls, name, nodes):
+
+        # make sure that we are the base-class!
+        if cls != Ordering:
+            raise TypeError('Ordering factory only available to base class!')
+
+        impl = {
+            ORDERING_LARGEST_FIRST  : LargestFirst,
+            ORDERING_SMALLEST_FIRST : DominantResourceShare,
+            ORDERING_GPU_FIRST      : GPUFirst,
+            ORDERING_DRF            : DominantResourceShare,
+            ORDERING_PRIORITY       : Priority,
+        }
+
+        if name in impl:
+            return impl[name](nodes)
+
+        if ':' in name:
+            fpath, cname = name.rsplit(':', 1)
+            ocls = ru.load_class(fpath, cname, Ordering)
+            if ocls:
+                return ocls(nodes)
+
+        raise ValueError('task ordering policy %s unknown' % name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def key(self, task):
+
+        raise NotImplementedError('key needs to be implemented.')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _totals(self, task):
+        '''
+        return the total number of cores, GPUs, LFS and memory requested by
+        the task
+        '''
+
+        ranks, cores, gpus, lfs, mem = task['tuple_size']
+
+        return ranks * cores, ranks * gpus, ranks * lfs, ranks * mem
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _share(self, task):
+        '''
+        return the task's dominant share of the pilot resources, i.e., the
+        largest fraction of any of the pilot's resource types it requests
+        '''
+
+        share = 0.0
+        for req, total in zip(self._totals(task),
+                              (self._cores, self._gpus, self._lfs, self._mem)):
+            if req and total:
+                share = max(share, req / total)
+
+        return share
+
+
+# ------------------------------------------------------------------------------
+#
+class LargestFirst(Ordering):
+    '''
+    Place tasks with the most cores first, then the most GPUs, and backfill
+    with smaller tasks.
+    '''
+
+    def key(self, task):
+
+        cores, gpus, _, _ = self._totals(task)
+        return (-cores, -gpus)
+
+
+# ------------------------------------------------------------------------------
+#
+class GPUFirst(Ordering):
+    '''
+    Place tasks with the most GPUs first, so that CPU-only tasks do not occupy
+    the cores which GPU tasks need to run alongside their GPUs.
+    '''
+
+    def key(self, task):
+
+        cores, gpus, _, _ = self._totals(task)
+        return (-gpus, -cores)
+
+
+# ------------------------------------------------------------------------------
+#
+class DominantResourceShare(Ordering):
+    '''
+    Place tasks with the smallest dominant share of the pilot resources first
+    (as in Dominant Resource Fairness), where the dominant share is the largest
+    fraction of any resource type (cores, GPUs, LFS, memory) the task requests.
+    Unlike ordering by size, this weighs resource types by their scarcity on
+    the pilot, and it maximizes the number of concurrently running tasks.
+    '''
+
+    def key(self, task):
+
+        return self._share(task)
+
+
+# ------------------------------------------------------------------------------
+#
+class Priority(Ordering):
+    '''
+    Place tasks with the highest `priority` tag first (`td['tags']`, default:
+    `0`).  Tasks of the same priority are placed in the `LargestFirst` order.
+    Priorities must be integers (or integer strings), or `None` for the
+    default.
+    '''
+
+    def key(self, task):
+
+        tags     = task['description'].get('tags') or {}
+        priority = tags.get('priority')
+
+        if priority is None:
+            priority = 0
+
+        try:
+            priority = int(priority)
+        except (TypeError, ValueError) as e:
+            raise ValueError('invalid priority %r' % (priority,)) from e
+
+        cores, gpus, _, _ = self._totals(task)
+
+        return (-priority, -cores, -gpus)
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,140 @@
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import bisect
+
+from ... import constants as rpc
+
+
+# ------------------------------------------------------------------------------
+#
+# The resource index keeps track of the number of free cores and GPUs on each
+# node of a scheduler's node list, and sorts the nodes into buckets keyed by
+# that free capacity:
+#
+#     buckets = {(free_cores, free_gpus) : [node_idx, node_idx, ...],
+#                ...}
+#
+# The node indexes in each bucket are kept sorted, so that the next node (in
+# node list order) which can host a given request can be found by a bisection
+# over the (few) buckets with sufficient capacity, instead of a scan over all
+# nodes and all their cores.  The number of buckets is bounded by the node
+# layout (`cores_per_node * gpus_per_node`), not by the number of nodes.
+#
+# The index does not inspect the node list after creation: it MUST be informed
+# about any state change of the node's cores and GPUs (see `update()`).
+#
+class ResourceIndex(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, nodes):
+
+        self._n_nodes = len(nodes)
+        self._idx     = dict()   # node_id : node_idx
+        self._cores   = list()   # node_idx: free cores
+        self._gpus    = list()   # node_idx: free gpus
+        self._buckets = dict()   # (free cores, free gpus) : [node_idx]
+        self._total   = [0, 0]   # free cores and gpus on all nodes
+
+        for idx, node in enumerate(nodes):
+
+            cores = node['cores'].count(rpc.FREE)
+            gpus  = node['gpus'].count(rpc.FREE)
+
+            self._idx[node['node_id']] = idx
+            self._cores.append(cores)
+            self._gpus.append(gpus)
+
+            self._total[0] += cores
+            self._total[1] += gpus
+
+            # nodes are added in order, so the bucket lists remain sorted
+            self._buckets.setdefault((cores, gpus), list()).append(idx)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def free(self, node_id):
+        '''
+        return a tuple of free cores and free GPUs for the given node
+        '''
+
+        idx = self._idx[node_id]
+        return self._cores[idx], self._gpus[idx]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def total(self):
+        '''
+        return a tuple of free cores and free GPUs over all nodes
+        '''
+
+        return tuple(self._total)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def update(self, node_id, cores, gpus):
+        '''
+        Change the number of free cores and GPUs on the given node by the given
+        (positive or negative) amounts, and move the node to the matching
+        bucket.
+        '''
+
+        if not cores and not gpus:
+            return
+
+        idx = self._idx[node_id]
+        old = (self._cores[idx], self._gpus[idx])
+        new = (old[0] + cores, old[1] + gpus)
+
+        bucket = self._buckets[old]
+        del bucket[bisect.bisect_left(bucket, idx)]
+        if not bucket:
+            del self._buckets[old]
+
+        bisect.insort(self._buckets.setdefault(new, list()), idx)
+
+        self._cores[idx] = new[0]
+        self._gpus[idx]  = new[1]
+
+        self._total[0] += cores
+        self._total[1] += gpus
+
+
+    # --------------------------------------------------------------------------
+    #
+    def find(self, start, cores, gpus):
+        '''
+        Return the number of nodes to skip, starting at node index `start` and
+        wrapping around the end of the node list, until a node is found which
+        has at least `cores` free cores and `gpus` free GPUs.  Return `None` if
+        no such node exists.
+        '''
+
+        n_nodes = self._n_nodes
+        dist    = None
+
+        for (n_cores, n_gpus), bucket in self._buckets.items():
+
+            if n_cores < cores or n_gpus < gpus:
+                continue
+
+            pos = bisect.bisect_left(bucket, start)
+            if pos < len(bucket): tmp = bucket[pos] - start
+            else                : tmp = bucket[0]   - start + n_nodes
+
+            if dist is None or tmp < dist:
+                dist = tmp
+                if not dist:
+                    # can't get any closer
+                    break
+
+        return dist
+
+
+# ------------------------------------------------------------------------------
+
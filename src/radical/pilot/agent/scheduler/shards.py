@@ -0,0 +1,345 @@
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import zlib
+
+from ... import constants as rpc
+
+
+# ------------------------------------------------------------------------------
+#
+# 'enum' for the shard routing policies
+#
+SHARD_ROUTING_LOAD  = 'load'
+SHARD_ROUTING_SHAPE = 'shape'
+
+
+# ------------------------------------------------------------------------------
+#
+# On large pilots, the agent scheduler can be sharded: the node list is split
+# into shards, and each shard is handled by a separate scheduling process which
+# owns the nodes of that shard.  This class implements the bookkeeping for
+# that, and is used by the scheduler component to route tasks to shards:
+#
+#   - tasks with a `partition` tag are routed to the shard which owns that
+#     partition (partitions are never split over shards);
+#   - tasks with a `colocate` tag are routed to the shard the tag was first
+#     routed to;
+#   - raptor tasks are routed to the first shard;
+#   - other tasks are routed to the least loaded shard which can host them
+#     (routing `load`), or to a shard chosen by their shape (routing `shape`),
+#     so that tasks of the same shape end up in the same waitpool (which
+#     helps slot reuse).
+#
+# The load of a shard is its dominant share of cores and GPUs requested by
+# routed and not yet released tasks.  Tasks which fail on a shard are released
+# via `fail()`.
+#
+# MPI tasks which are too large for any shard span shards: `split()` breaks
+# such a task into parts, one per shard, which are placed by the shards like
+# any other task.  The scheduler component merges the parts' slots once all
+# parts are placed, and `release()` breaks the task up again when it
+# completes.  If a part fails, `abort()` drops the task's parts.
+#
+class Shards(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, nodes, n_shards, partitions=None,
+                       routing=SHARD_ROUTING_LOAD):
+
+        if routing not in [SHARD_ROUTING_LOAD, SHARD_ROUTING_SHAPE]:
+            raise ValueError('shard routing %s unknown' % routing)
+
+        if not nodes:
+            raise ValueError('cannot shard an empty node list')
+
+        self._routing    = routing
+        self._partitions = dict()  # partition label: shard
+        self._colocate   = dict()  # colocate tag: shard
+        self._spanning   = dict()  # uid: {shard: part description}
+        self._capacity   = dict()  # rank size: [ranks per shard]
+
+        # each shard needs at least one node
+        n_shards = max(1, min(n_shards, len(nodes)))
+        shards   = [list() for _ in range(n_shards)]
+
+        if partitions:
+            # keep partitions whole, and balance the number of nodes per shard
+            node_map    = {node['node_id']: node for node in nodes}
+            partitioned = set()
+            for plabel, node_ids in partitions.items():
+                idx = min(range(n_shards), key=lambda i: len(shards[i]))
+                shards[idx].extend(node_map[nid] for nid in node_ids
+                                                 if  nid in node_map)
+                self._partitions[str(plabel)] = idx
+                partitioned.update(node_ids)
+
+            for node in nodes:
+                if node['node_id'] not in partitioned:
+                    idx = min(range(n_shards), key=lambda i: len(shards[i]))
+                    shards[idx].append(node)
+
+        else:
+            # contiguous node ranges of (almost) equal size
+            n_nodes = len(nodes)
+            for idx in range(n_shards):
+                shards[idx] = nodes[n_nodes *  idx      // n_shards:
+                                    n_nodes * (idx + 1) // n_shards]
+
+        # shards remain empty if there are fewer partitions than shards
+        used   = [idx for idx, shard in enumerate(shards) if shard]
+        shards = [shards[idx] for idx in used]
+        self._partitions = {plabel: used.index(idx)
+                            for plabel, idx in self._partitions.items()}
+
+        self._node_ids   = [set(node['node_id'] for node in shard)
+                            for shard in shards]
+        # usable resources per node: free cores and gpus, lfs and memory
+        self._sizes      = [[(node['cores'].count(rpc.FREE),
+                              node['gpus'].count(rpc.FREE),
+                              node['lfs'], node['mem'])
+                             for node in shard] for shard in shards]
+        self._cores      = [sum(s[0] for s in sizes) for sizes in self._sizes]
+        self._gpus       = [sum(s[1] for s in sizes) for sizes in self._sizes]
+        self._load       = [[0, 0] for _ in shards]  # requested cores, gpus
+        self._node_shard = {node_id: idx
+                            for idx, node_ids in enumerate(self._node_ids)
+                            for node_id   in node_ids}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __len__(self):
+
+        return len(self._node_ids)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def node_ids(self, idx):
+        '''
+        return the set of IDs of the nodes owned by the given shard
+        '''
+
+        return self._node_ids[idx]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def route(self, task):
+        '''
+        Return the index of the shard the task is to be scheduled by, or `None`
+        if the task needs to span shards (see `split()`).
+        '''
+
+        td = task['description']
+
+        if td.get('scheduler'):
+            # raptor tasks are only forwarded, and don't add load
+            return 0
+
+        ranks, cores, gpus = self._request(td)
+
+        tags      = td.get('tags') or {}
+        partition = tags.get('partition')
+        colocate  = tags.get('colocate')
+
+        if partition is not None and str(partition) in self._partitions:
+            idx = self._partitions[str(partition)]
+
+        elif colocate is not None and str(colocate) in self._colocate:
+            idx = self._colocate[str(colocate)]
+
+        else:
+            capacity = self._get_capacity(td)
+            fits     = [i for i in range(len(self)) if capacity[i] >= ranks]
+
+            if not fits:
+                if ranks > 1 and not self._partitions:
+                    return None
+                # let the first shard deal with that task (and fail it)
+                fits = [0]
+
+            if self._routing == SHARD_ROUTING_SHAPE:
+                shape = ('%s' % [ranks, cores, gpus]).encode()
+                idx   = fits[zlib.crc32(shape) % len(fits)]
+            else:
+                idx   = min(fits, key=self._share)
+
+            if colocate is not None:
+                self._colocate[str(colocate)] = idx
+
+        self._load[idx][0] += ranks * cores
+        self._load[idx][1] += ranks * gpus
+
+        return idx
+
+
+    # --------------------------------------------------------------------------
+    #
+    def split(self, task):
+        '''
+        Split a task which spans shards into parts.  Return a list of
+        `[shard, part description]` pairs, where the part description is the
+        task description with the number of ranks to be placed on that shard.
+        The least loaded shards are used first, and are filled up as far as
+        possible.  Return an empty list if the pilot cannot host the task.
+        '''
+
+        td = task['description']
+        ranks, cores, gpus = self._request(td)
+
+        capacity = self._get_capacity(td)
+        if sum(capacity) < ranks:
+            return list()
+
+        parts = list()
+        rem   = ranks
+        for idx in sorted(range(len(self)), key=self._share):
+
+            n = min(rem, capacity[idx])
+            if not n:
+                continue
+
+            part_td = dict(td)
+            part_td['ranks'] = n
+            parts.append([idx, part_td])
+
+            self._load[idx][0] += n * cores
+            self._load[idx][1] += n * gpus
+
+            rem -= n
+            if not rem:
+                break
+
+        self._spanning[task['uid']] = dict(parts)
+
+        return parts
+
+
+    # --------------------------------------------------------------------------
+    #
+    def release(self, task):
+        '''
+        Return a list of `[shard, task]` pairs for a completed task: the
+        shard(s) which hold the task's slots, and the task (or the parts of the
+        task) to be unscheduled by them.
+        '''
+
+        parts = self._spanning.pop(task['uid'], None)
+
+        if not parts:
+            ranks, cores, gpus = self._request(task['description'])
+            idx = self._node_shard[task['slots']['ranks'][0]['node_id']]
+            self._load[idx][0] -= ranks * cores
+            self._load[idx][1] -= ranks * gpus
+            return [[idx, task]]
+
+        ret = list()
+        for idx, part_td in parts.items():
+
+            n, cores, gpus = self._request(part_td)
+            ranks = [rank for rank in task['slots']['ranks']
+                          if self._node_shard[rank['node_id']] == idx]
+            self._load[idx][0] -= n * cores
+            self._load[idx][1] -= n * gpus
+
+            ret.append([idx, {'uid'        : task['uid'],
+                              'description': part_td,
+                              'slots'      : {'ranks': ranks}}])
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def fail(self, idx, task):
+        '''
+        Release the load of a task which was routed to the given shard, but
+        failed there.
+        '''
+
+        td = task['description']
+        if td.get('scheduler'):
+            # raptor tasks don't add load
+            return
+
+        ranks, cores, gpus = self._request(td)
+        self._load[idx][0] -= ranks * cores
+        self._load[idx][1] -= ranks * gpus
+
+
+    # --------------------------------------------------------------------------
+    #
+    def abort(self, uid):
+        '''
+        Release the load of all parts of a spanning task which failed, and
+        return the parts as `{shard: part description}`.
+        '''
+
+        parts = self._spanning.pop(uid, None) or dict()
+
+        for idx, part_td in parts.items():
+            n, cores, gpus = self._request(part_td)
+            self._load[idx][0] -= n * cores
+            self._load[idx][1] -= n * gpus
+
+        return parts
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _request(self, td):
+
+        return (td.get('ranks', 1),
+                td.get('cores_per_rank', 1) or 1,
+                td.get('gpus_per_rank', 0))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _share(self, idx):
+
+        cores, gpus = self._load[idx]
+        share       = cores / self._cores[idx] if self._cores[idx] else 0.0
+
+        if self._gpus[idx]:
+            share = max(share, gpus / self._gpus[idx])
+
+        return share
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get_capacity(self, td):
+        '''
+        return the number of ranks of the task's rank size each shard can host
+        '''
+
+        _, cores, gpus = self._request(td)
+        lfs  = td.get('lfs_per_rank', 0) or 0
+        mem  = td.get('mem_per_rank', 0) or 0
+        size = (cores, gpus, lfs, mem)
+
+        capacity = self._capacity.get(size)
+
+        if capacity is None:
+            capacity = list()
+            for sizes in self._sizes:
+                n = 0
+                for n_cores, n_gpus, n_lfs, n_mem in sizes:
+                    ranks = n_cores // cores
+                    if gpus: ranks = min(ranks, n_gpus // gpus)
+                    if lfs : ranks = min(ranks, n_lfs  // lfs)
+                    if mem : ranks = min(ranks, n_mem  // mem)
+                    n += ranks
+                capacity.append(n)
+            self._capacity[size] = capacity
+
+        return capacity
+
+
+# ------------------------------------------------------------------------------
+
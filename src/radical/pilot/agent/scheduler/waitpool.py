@@ -0,0 +1,214 @@
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import bisect
+import collections
+
+
+# ------------------------------------------------------------------------------
+#
+# The wait pool holds the tasks which could not be placed by the agent
+# scheduler.  Waiting tasks are grouped into classes of tasks which are
+# indistinguishable for placement: tasks with the same tuple size and the same
+# ordering key.  Each class holds a FIFO queue of task IDs, and the classes are
+# kept sorted by ordering key:
+#
+#     classes = [(key, tuple_size, constrained), ...]
+#     queues  = {(key, tuple_size, constrained): deque([uid, ...]),
+#                ...}
+#
+# A scheduling pass thus only needs to try the first task of each class, and
+# can stop trying a class once a task fails to be placed.  That does not hold
+# for tasks with placement constraints beyond their size (named environments,
+# colocation, partitions): those are grouped into separate classes whose
+# tasks need to be tried one by one.
+#
+# Tasks are removed from the pool via `pop()` (or `pop_shape()`).  Their queue
+# entries are removed lazily, when found at the head of their queue.
+#
+class WaitPool(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, ordering):
+
+        self._ordering = ordering
+        self._tasks    = dict()   # uid: task
+        self._queues   = dict()   # class: deque(uid)
+        self._classes  = list()   # sorted classes
+        self._shapes   = dict()   # tuple_size: sorted classes (unconstrained)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __len__(self):
+
+        return len(self._tasks)
+
+
+    def __iter__(self):
+
+        return iter(self._tasks)
+
+
+    def __contains__(self, uid):
+
+        return uid in self._tasks
+
+
+    def get(self, uid):
+
+        return self._tasks.get(uid)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @staticmethod
+    def is_constrained(task):
+        '''
+        Return `True` if the task has placement constraints beyond its size, so
+        that it can't be treated like other tasks of the same tuple size.
+        '''
+
+        td   = task['description']
+        tags = td.get('tags') or {}
+
+        return bool(td.get('named_env')    or
+                    'colocate'  in tags    or
+                    'partition' in tags)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def add(self, tasks, keys=None):
+        '''
+        Add tasks to the end of their classes' queues.  `keys` can map task IDs
+        to their ordering keys if those are known already.
+        '''
+
+        for task in tasks:
+
+            uid = task['uid']
+
+            if keys and uid in keys:
+                key = keys[uid]
+            else:
+                key = self._ordering.key(task)
+
+            ts          = tuple(task['tuple_size'])
+            constrained = self.is_constrained(task)
+            cls         = (key, ts, constrained)
+
+            queue = self._queues.get(cls)
+            if queue is None:
+
+                queue = collections.deque()
+                self._queues[cls] = queue
+                bisect.insort(self._classes, cls)
+
+                if not constrained:
+                    bisect.insort(self._shapes.setdefault(ts, list()), cls)
+
+            queue.append(uid)
+            self._tasks[uid] = task
+
+
+    # --------------------------------------------------------------------------
+    #
+    def pop(self, uid):
+        '''
+        remove a task from the pool and return it (or `None` if not found)
+        '''
+
+        return self._tasks.pop(uid, None)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def pop_shape(self, ts):
+        '''
+        Remove and return the first task of the first class of unconstrained
+        tasks with the given tuple size, or `None` if there is no such task.
+        '''
+
+        for cls in list(self._shapes.get(ts, [])):
+
+            task = self.head(cls)
+            if task:
+                self._queues[cls].popleft()
+                return self._tasks.pop(task['uid'])
+
+        return None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def classes(self):
+        '''
+        Return a list of the current task classes, in order.  Empty classes are
+        removed.
+        '''
+
+        for cls in list(self._classes):
+            if not self.head(cls):
+                self._remove(cls)
+
+        return list(self._classes)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def head(self, cls):
+        '''
+        Return the first task of the class' queue (or `None` if it is empty),
+        and drop removed tasks from the queue.
+        '''
+
+        queue = self._queues.get(cls)
+
+        while queue:
+            task = self._tasks.get(queue[0])
+            if task:
+                return task
+            queue.popleft()
+
+        return None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def queue(self, cls):
+        '''
+        Return the list of tasks in the given class, and drop removed tasks
+        from the queue.
+        '''
+
+        queue = self._queues.get(cls)
+        if not queue:
+            return list()
+
+        tasks = [self._tasks[uid] for uid in queue if uid in self._tasks]
+        if len(tasks) != len(queue):
+            self._queues[cls] = collections.deque(t['uid'] for t in tasks)
+
+        return tasks
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _remove(self, cls):
+
+        del self._queues[cls]
+        del self._classes[bisect.bisect_left(self._classes, cls)]
+
+        key, ts, constrained = cls
+        if not constrained:
+            shapes = self._shapes[ts]
+            del shapes[bisect.bisect_left(shapes, cls)]
+            if not shapes:
+                del self._shapes[ts]
+
+
+# ------------------------------------------------------------------------------
+
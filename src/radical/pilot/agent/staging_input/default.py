@@ -7,6 +7,8 @@ import os
 import shutil
 import tarfile
 
+import concurrent.futures as cf
+
 import radical.saga  as rs
 import radical.utils as ru
 
@@ -48,11 +50,30 @@ class Default(AgentStagingInputComponent):
         self.register_output(rps.AGENT_SCHEDULING_PENDING,
                              rpc.AGENT_SCHEDULING_QUEUE)
 
+        # task sandboxes are created for whole bulks by a thread pool, ahead of
+        # execution, so that the executor does not need to create them one by
+        # one
+        self._mkdir_pool = cf.ThreadPoolExecutor(
+                                max_workers=self._cfg.get('mkdir_workers', 8),
+                                thread_name_prefix='mkdir')
+        self._mkdir_dirs = set()  # sandbox parent dirs known to exist
+
+
+    # --------------------------------------------------------------------------
+    #
+    def finalize(self):
+
+        self._mkdir_pool.shutdown(wait=True)
+
 
     # --------------------------------------------------------------------------
     #
     def _work(self, tasks):
 
+        tasks = ru.as_list(tasks)
+
+        self._create_sandboxes(tasks)
+
         # we first filter out any tasks which don't need any input staging, and
         # advance them again as a bulk.  We work over the others one by one, and
         # advance them individually, to avoid stalling from slow staging ops.
@@ -60,7 +81,7 @@ class Default(AgentStagingInputComponent):
         no_staging_tasks = list()
         staging_tasks    = list()
 
-        for task in ru.as_list(tasks):
+        for task in tasks:
 
             # check if we have any staging directives to be enacted in this
             # component
@@ -83,6 +104,60 @@ class Default(AgentStagingInputComponent):
             self._handle_task(task, actionables)
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _create_sandboxes(self, tasks):
+        '''
+        Create the sandboxes of the given tasks.  Their parent directories (the
+        pilot sandbox, or the subdirectories of a hashed fan-out, see the
+        resource config setting `task_sandbox_fanout`) are created once, the
+        sandboxes themselves are created concurrently.  Tasks whose sandbox got
+        created are marked with `sandbox_exists`, so that the executor can skip
+        the `mkdir`.  Failures are left to the executor to handle.
+        '''
+
+        todo = [task for task in tasks
+                     if  task.get('task_sandbox_path')
+                     and not task.get('sandbox_exists')]
+
+        if not todo:
+            return
+
+        sboxes  = [os.path.normpath(task['task_sandbox_path']) for task in todo]
+        parents = set(os.path.dirname(sbox) for sbox in sboxes)
+
+        for parent in parents - self._mkdir_dirs:
+            try:
+                os.makedirs(parent, exist_ok=True)
+                self._mkdir_dirs.add(parent)
+            except OSError:
+                self._log.exception('cannot create %s', parent)
+
+        if len(todo) == 1: results = [self._mkdir(sboxes[0])]
+        else             : results = self._mkdir_pool.map(self._mkdir, sboxes)
+
+        for task, ok in zip(todo, results):
+            if ok:
+                task['sandbox_exists'] = True
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _mkdir(self, path):
+
+        try:
+            os.mkdir(path)
+
+        except FileExistsError:
+            pass
+
+        except OSError:
+            self._log.exception('cannot create sandbox %s', path)
+            return False
+
+        return True
+
+
     # --------------------------------------------------------------------------
     #
     def _handle_task(self, task, actionables):
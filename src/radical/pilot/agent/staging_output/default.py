@@ -7,6 +7,8 @@ import os
 import errno
 import shutil
 
+import concurrent.futures as cf
+
 import radical.utils as ru
 
 from ...  import utils     as rpu
@@ -52,6 +54,19 @@ class Default(AgentStagingOutputComponent):
         # we don't need an output queue -- tasks are picked up via mongodb
         self.register_output(rps.TMGR_STAGING_OUTPUT_PENDING, None)  # drop
 
+        # task stdio is collected for whole bulks by a thread pool, so that the
+        # latency of (shared) file systems does not add up over tasks
+        self._stdio_pool = cf.ThreadPoolExecutor(
+                                max_workers=self._cfg.get('stdio_workers', 8),
+                                thread_name_prefix='stdio')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def finalize(self):
+
+        self._stdio_pool.shutdown(wait=True)
+
 
     # --------------------------------------------------------------------------
     #
@@ -66,7 +81,12 @@ class Default(AgentStagingOutputComponent):
         no_staging_tasks = list()
         staging_tasks    = list()
 
-        for task in ru.as_list(tasks):
+        tasks = ru.as_list(tasks)
+
+        # we always dig for stdout/stderr
+        self._handle_stdio(tasks)
+
+        for task in tasks:
 
             uid = task['uid']
 
@@ -76,13 +96,10 @@ class Default(AgentStagingOutputComponent):
             task['$all']    = True
             task['control'] = 'tmgr_pending'
 
-            # we always dig for stdout/stderr
-            self._handle_task_stdio(task)
-
             # NOTE: all tasks get here after execution, even those which did not
             #       finish successfully.  We do that so that we can make
             #       stdout/stderr available for failed tasks (see
-            #       _handle_task_stdio above).  But we don't need to perform any
+            #       _handle_stdio above).  But we don't need to perform any
             #       other staging for those tasks, and in fact can make them
             #       final.
             if task['target_state'] != rps.DONE \
@@ -156,64 +173,100 @@ class Default(AgentStagingOutputComponent):
 
     # --------------------------------------------------------------------------
     #
-    def _handle_task_stdio(self, task):
+    def _handle_stdio(self, tasks):
+        '''
+        Collect stdout/stderr and profiles of the given tasks.  Files are read
+        concurrently, the task profiles are merged in one batch.
+        '''
 
-        if task.get('stdio'):
-            # no need to fetch stdio, the LM or launcher did that
-            # FIXME: do we need to pull profile events?
-            return
+        todo = list()
+        for task in tasks:
 
-        sbox = task.get('task_sandbox_path')
-        uid  = task['uid']
+            if task.get('stdio'):
+                # no need to fetch stdio, the LM or launcher did that
+                # FIXME: do we need to pull profile events?
+                continue
 
-        # no sbox, no io
-        if not sbox:
+            # no sbox, no io
+            if not task.get('task_sandbox_path'):
+                continue
+
+            todo.append(task)
+
+        if not todo:
             return
 
+        if len(todo) == 1: results = [self._read_task_stdio(todo[0])]
+        else             : results = self._stdio_pool.map(self._read_task_stdio,
+                                                          todo)
+        events = list()
+        for task, (stdout, stderr, idmap, prof) in zip(todo, results):
+
+            if stdout is not None: task['stdout'] += stdout
+            if stderr is not None: task['stderr'] += stderr
+
+            for tid in idmap:
+                self._log.info('PRTE IDMAP: %s:%s' % (tid, task['uid']))
+
+            events += prof
+
+        for ts, event, comp, tid, uid, state, msg in events:
+            self._prof.prof(ts=float(ts), event=event, comp=comp, tid=tid,
+                            uid=uid, state=state, msg=msg)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _read_task_stdio(self, task):
+        '''
+        Return the tails of a task's stdout and stderr (`None` if not
+        available), the PRTE job IDs found on stderr, and the events of the
+        task's profile.
+        '''
+
+        sbox   = task['task_sandbox_path']
+        uid    = task['uid']
+        stdout = None
+        stderr = None
+        idmap  = list()
+        prof   = list()
+
         self._prof.prof('staging_stdout_start', uid=uid)
       # self._log.debug('out: %s', task.get('stdout_file'))
 
         # TODO: disable this at scale?
         if task.get('stdout_file') and os.path.isfile(task['stdout_file']):
-            with ru.ru_open(task['stdout_file'], 'r') as stdout_f:
-                try:
-                    txt = ru.as_string(stdout_f.read())
-                except UnicodeDecodeError:
-                    txt = "task stdout is binary -- use file staging"
-
-                task['stdout'] += rpu.tail(txt)
+            try:
+                stdout = rpu.tail_file(task['stdout_file'])
+            except UnicodeDecodeError:
+                stdout = "task stdout is binary -- use file staging"
 
         self._prof.prof('staging_stdout_stop',  uid=uid)
         self._prof.prof('staging_stderr_start', uid=uid)
 
         # TODO: disable this at scale?
         if task.get('stderr_file') and os.path.isfile(task['stderr_file']):
-            with ru.ru_open(task['stderr_file'], 'r') as stderr_f:
-                try:
-                    txt = ru.as_string(stderr_f.read())
-                except UnicodeDecodeError:
-                    txt = "task stderr is binary -- use file staging"
-
-                task['stderr'] += rpu.tail(txt)
 
             # to help with ID mapping, also parse for PRTE output:
             # [batch3:122527] JOB [3673,4] EXECUTING
-            with ru.ru_open(task['stderr_file'], 'r') as stderr_f:
+            try:
+                stderr, lines = rpu.tail_file(task['stderr_file'],
+                                              grep=b'EXECUTING')
+            except UnicodeDecodeError:
+                stderr = "task stderr is binary -- use file staging"
+                lines  = list()
 
-                for line in stderr_f.readlines():
-                    line = line.strip()
-                    if not line:
-                        continue
-                    if line[0] == '[' and line.endswith('EXECUTING'):
-                        elems = line.replace('[', '').replace(']', '').split()
-                        tid   = elems[2]
-                        self._log.info('PRTE IDMAP: %s:%s' % (tid, uid))
+            for line in lines:
+                if line and line[0] == '[' and line.endswith('EXECUTING'):
+                    elems = line.replace('[', '').replace(']', '').split()
+                    idmap.append(elems[2])
 
         self._prof.prof('staging_stderr_stop', uid=uid)
         self._prof.prof('staging_uprof_start', uid=uid)
 
+        # task profiles are of no use if we don't profile
         task_prof = "%s/%s.prof" % (sbox, uid)
-        if os.path.isfile(task_prof):
+        if self._prof.enabled and os.path.isfile(task_prof):
             try:
                 with ru.ru_open(task_prof, 'r') as prof_f:
                     txt = ru.as_string(prof_f.read())
@@ -224,14 +277,14 @@ class Default(AgentStagingOutputComponent):
                             continue
                         ts, event, comp, tid, _uid, state, msg = \
                                                              line.split(',')
-                        self._prof.prof(ts=float(ts), event=event,
-                                        comp=comp, tid=tid, uid=_uid,
-                                        state=state, msg=msg)
+                        prof.append([ts, event, comp, tid, _uid, state, msg])
             except Exception as e:
                 self._log.error("Pre/Post profile read failed: `%s`" % e)
 
         self._prof.prof('staging_uprof_stop', uid=uid)
 
+        return stdout, stderr, idmap, prof
+
 
     # --------------------------------------------------------------------------
     #
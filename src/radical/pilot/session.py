@@ -146,6 +146,7 @@ class Session(rs.Session):
                             'resource_sandbox' : dict(),
                             'session_sandbox'  : dict(),
                             'pilot_sandbox'    : dict(),
+                            'sandbox_fanout'   : dict(),
                             'client_sandbox'   : self._cfg.client_sandbox,
                             'js_shells'        : dict(),
                             'fs_dirs'          : dict()}
@@ -908,6 +909,28 @@ class Session(rs.Session):
             return self._cache['endpoint_fs'][resource]
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _get_sandbox_fanout(self, pilot):
+        '''
+        Return the number of subdirectories of the pilot sandbox over which
+        task sandboxes are spread (resource config `task_sandbox_fanout`), or
+        `0` if task sandboxes are created in the pilot sandbox directly.
+        '''
+
+        resource = pilot['description'].get('resource')
+        schema   = pilot['description'].get('access_schema')
+
+        with self._cache_lock:
+
+            if resource not in self._cache['sandbox_fanout']:
+                rcfg = self.get_resource_config(resource, schema)
+                self._cache['sandbox_fanout'][resource] = \
+                                        int(rcfg.get('task_sandbox_fanout', 0))
+
+            return self._cache['sandbox_fanout'][resource]
+
+
     # --------------------------------------------------------------------------
     #
     def _get_task_sandbox(self, task, pilot):
@@ -933,6 +956,11 @@ class Session(rs.Session):
         # default
         if not task_sandbox:
             task_sandbox = ru.Url(self._get_pilot_sandbox(pilot))
+            fanout       = self._get_sandbox_fanout(pilot)
+            if fanout:
+                # spread task sandboxes over hashed subdirectories
+                task_sandbox.path += '/%s' % rpu.sandbox_bucket(task['uid'],
+                                                                fanout)
             task_sandbox.path += "/%s/" % task['uid']
 
         # cache
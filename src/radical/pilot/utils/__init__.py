@@ -35,6 +35,11 @@ from .db_utils     import *
 from .prof_utils   import *
 from .misc         import *
 from .session      import *
+from .cancel       import *
+from .codec        import *
+from .task_store   import *
+from .bulking      import *
+from .worker_pool  import *
 from .component    import *
 from .serializer   import *
 
@@ -0,0 +1,54 @@
+
+__copyright__ = 'Copyright 2023, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+
+# default bounds for adaptive bulk sizes
+BULK_MIN = 1
+BULK_MAX = 1024
+
+
+# ------------------------------------------------------------------------------
+#
+class BulkSizer(object):
+    '''
+    Adapt a bulk size to the observed load: the size doubles while things
+    back up, and halves when the load drains.  The size stays within
+    `[size_min, size_max]`.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, size_min=BULK_MIN, size_max=BULK_MAX):
+
+        self._min  = max(1, size_min)
+        self._max  = max(self._min, size_max)
+        self._size = self._min
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def size(self):
+        return self._size
+
+
+    # --------------------------------------------------------------------------
+    #
+    def update(self, backlog, drained):
+        '''
+        Grow the bulk size if there is a backlog of things, shrink it if the
+        load drained, and return the new size.
+        '''
+
+        if backlog:
+            self._size = min(self._size * 2, self._max)
+
+        elif drained:
+            self._size = max(self._size // 2, self._min)
+
+        return self._size
+
+
+# ------------------------------------------------------------------------------
+
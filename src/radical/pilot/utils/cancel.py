@@ -0,0 +1,100 @@
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import time
+
+import threading as mt
+
+
+# time in seconds after which cancel requests expire
+CANCEL_TTL = 3600.0
+
+
+# ------------------------------------------------------------------------------
+#
+class CancelRegistry(object):
+    '''
+    Thread safe registry of the UIDs of entities to be canceled.
+
+    Cancel requests are broadcast to all components, and most components never
+    see most of the canceled entities - or see them only after the request
+    arrived.  Requests are thus kept until the respective entity shows up and
+    is looked up via `pop()`, but expire after `ttl` seconds, so that the
+    registry does not grow without bounds.  All operations are O(1)
+    (amortized).
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, ttl=CANCEL_TTL):
+
+        self._ttl  = ttl
+        self._lock = mt.Lock()
+        self._uids = dict()  # uid: expiry time, ordered by expiry time
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __len__(self):
+
+        return len(self._uids)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __contains__(self, uid):
+
+        return uid in self._uids
+
+
+    # --------------------------------------------------------------------------
+    #
+    def add(self, uids):
+        '''
+        register the given UIDs for cancellation
+        '''
+
+        now    = time.time()
+        expiry = now + self._ttl
+
+        with self._lock:
+
+            for uid in uids:
+                # re-registration renews the request
+                self._uids.pop(uid, None)
+                self._uids[uid] = expiry
+
+            self._expire(now)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def pop(self, uid):
+        '''
+        Return `True` if the given UID was registered for cancellation, and
+        remove it from the registry.
+        '''
+
+        # avoid locking for the common case
+        if not self._uids:
+            return False
+
+        with self._lock:
+            return self._uids.pop(uid, None) is not None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _expire(self, now):
+
+        # the oldest requests come first
+        while self._uids:
+            uid, expiry = next(iter(self._uids.items()))
+            if expiry > now:
+                break
+            del self._uids[uid]
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,488 @@
+
+__copyright__ = 'Copyright 2023, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import zlib
+import struct
+
+import msgpack
+
+from .. import states           as rps
+from .. import task_description as rptd
+
+# compression backends beyond zlib are optional
+lz4     = None
+lz4_ex  = None
+zstd    = None
+zstd_ex = None
+
+try:
+    import lz4.frame as lz4
+except ImportError as ex:
+    lz4_ex = ex
+
+try:
+    import zstandard as zstd
+except ImportError as ex:
+    zstd_ex = ex
+
+
+# ------------------------------------------------------------------------------
+#
+# Wire codecs for component queues and pubsubs.
+#
+# By default, radical.utils sends messages as plain msgpack, and queue bridges
+# unpack and repack every single message they buffer.  A bridge can instead be
+# configured with a `codec`, in which case the components connected to it send
+# each bulk of things as a single msgpack extension object (an 'envelope').
+# Bridges and radical.utils pass envelopes on as opaque blobs, and components
+# decode them on receipt.  Envelopes are self-describing, so plain messages and
+# envelopes can be mixed on the same channel.
+#
+# The envelope payload is a header (format, compressor, table checksum) and
+# the encoded bulk.  Two formats exist:
+#
+#   'msgpack': the bulk as list of plain msgpack documents
+#   'compact': the bulk as list of records, where
+#                [0, type, state, uid_prefix, [uid_suffix, ...]]
+#              is a run of state-only updates (`{uid, type, state}`) for things
+#              of the same type, state and uid prefix,
+#                [1, {field: value, ...}]
+#              is a document with interned field names, description field
+#              names and state names, and
+#                [2, thing]
+#              is any other thing, stored as is.
+#
+# Envelopes larger than `compress_min` bytes are compressed with the configured
+# compressor (`zlib`, or `lz4` and `zstd` if installed).
+#
+# The interning tables are derived from the state model and task description
+# schema, and must match on both ends of a channel: the table checksum in the
+# header guards against peers which run different RP versions.
+#
+WIRE_EXT_CODE     = 42
+WIRE_COMPRESS_MIN = 16 * 1024
+
+_FMT_MSGPACK      = 0
+_FMT_COMPACT      = 1
+_FORMATS          = {'msgpack': _FMT_MSGPACK,
+                     'compact': _FMT_COMPACT}
+
+_COMP_NONE        = 0
+_COMP_ZLIB        = 1
+_COMP_LZ4         = 2
+_COMP_ZSTD        = 3
+_COMPRESSORS      = {'zlib'   : _COMP_ZLIB,
+                     'lz4'    : _COMP_LZ4,
+                     'zstd'   : _COMP_ZSTD}
+
+_REC_STATES       = 0
+_REC_DOC          = 1
+_REC_RAW          = 2
+
+_HEADER           = struct.Struct('!BBH')
+
+# fields which are set on tasks and pilots along the component chain - new
+# fields MUST be appended
+_FIELDS = ['uid', 'type', 'state', 'target_state', 'description', 'tmgr',
+           'pmgr', 'name', 'origin', 'pilot', 'exit_code', 'stdout', 'stderr',
+           'return_value', 'exception', 'exception_detail', 'endpoint_fs',
+           'resource_sandbox', 'session_sandbox', 'pilot_sandbox',
+           'task_sandbox', 'task_sandbox_path', 'client_sandbox', 'slots',
+           'resources', 'control', 'states', 'stdout_file', 'stderr_file',
+           'stdout_file_short', 'stderr_file_short', 'sandbox_exists',
+           'restarted', 'flux_id', 'pid', 'rank', 'ranks', 'usage', 'error',
+           'worker', 'partition', 'tuple_size', 'to_finish', 'js_hostname',
+           'lm_info', 'rm_info', 'resource', 'resource_details', 'job_name',
+           'job_id', 'rsb']
+
+_DESCR_FIELDS = list(rptd.TaskDescription._schema.keys())
+
+_STATES = list()
+for _s in list(rps._task_state_values) + list(rps._pilot_state_values):
+    if _s and _s not in _STATES:
+        _STATES.append(_s)
+
+_FIELD_IDS    = {_f: _i for _i, _f in enumerate(_FIELDS)}
+_DESCR_IDS    = {_f: _i for _i, _f in enumerate(_DESCR_FIELDS)}
+_STATE_IDS    = {_s: _i for _i, _s in enumerate(_STATES)}
+_STATE_FIELDS = {_FIELD_IDS['state'], _FIELD_IDS['target_state']}
+_DESCR_FIELD  = _FIELD_IDS['description']
+
+_TABLES_CRC   = zlib.crc32(('|'.join(_FIELDS + [''] + _DESCR_FIELDS + [''] +
+                                     _STATES)).encode()) & 0xffff
+
+
+# ------------------------------------------------------------------------------
+#
+class WireCodec(object):
+    '''
+    Encode bulks of things into wire envelopes, and decode envelopes back into
+    bulks of things.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, fmt='compact', compress=None,
+                       compress_min=WIRE_COMPRESS_MIN):
+
+        if fmt not in _FORMATS:
+            raise ValueError('unknown wire codec %s' % fmt)
+
+        if compress and compress not in _COMPRESSORS:
+            raise ValueError('unknown wire compressor %s' % compress)
+
+        # compressors are optional dependencies - raise the import exception
+        # if one is requested but not available
+        if compress == 'lz4'  and lz4_ex : raise lz4_ex
+        if compress == 'zstd' and zstd_ex: raise zstd_ex
+
+        self._fmt          = _FORMATS[fmt]
+        self._comp         = _COMPRESSORS[compress] if compress else _COMP_NONE
+        self._compress_min = compress_min
+
+        self._zstd_c = None
+        if self._comp == _COMP_ZSTD:
+            self._zstd_c = zstd.ZstdCompressor()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def encode(self, things):
+        '''
+        Encode a thing or a list of things into a single envelope.
+        '''
+
+        if not isinstance(things, list):
+            things = [things]
+
+        if self._fmt == _FMT_COMPACT:
+            body = msgpack.packb(_pack_compact(things))
+        else:
+            body = msgpack.packb(things)
+
+        comp = _COMP_NONE
+        if self._comp and len(body) >= self._compress_min:
+
+            comp = self._comp
+            if   comp == _COMP_ZLIB: body = zlib.compress(body, 1)
+            elif comp == _COMP_LZ4 : body = lz4.compress(body)
+            elif comp == _COMP_ZSTD: body = self._zstd_c.compress(body)
+
+        header = _HEADER.pack(self._fmt, comp, _TABLES_CRC)
+
+        return msgpack.ExtType(WIRE_EXT_CODE, header + body)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @staticmethod
+    def decode(envelope):
+        '''
+        Decode an envelope into the list of things it contains.
+        '''
+
+        data = envelope.data
+        fmt, comp, crc = _HEADER.unpack_from(data)
+        body = data[_HEADER.size:]
+
+        if comp:
+            if   comp == _COMP_ZLIB: body = zlib.decompress(body)
+            elif comp == _COMP_LZ4 :
+                if lz4_ex: raise lz4_ex
+                body = lz4.decompress(body)
+            elif comp == _COMP_ZSTD:
+                if zstd_ex: raise zstd_ex
+                body = zstd.ZstdDecompressor().decompress(body)
+            else:
+                raise ValueError('unknown wire compressor %d' % comp)
+
+        if fmt == _FMT_MSGPACK:
+            return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+        if fmt != _FMT_COMPACT:
+            raise ValueError('unknown wire codec %d' % fmt)
+
+        if crc != _TABLES_CRC:
+            raise ValueError('wire codec table mismatch (RP version skew?)')
+
+        return _unpack_compact(msgpack.unpackb(body, raw=False,
+                                               strict_map_key=False))
+
+
+# ------------------------------------------------------------------------------
+#
+def _pack_doc(thing):
+
+    doc = dict()
+    for key, val in thing.items():
+
+        if not isinstance(key, str):
+            return None
+
+        fid = _FIELD_IDS.get(key)
+
+        if fid is None:
+            doc[key] = val
+            continue
+
+        if fid in _STATE_FIELDS:
+            if isinstance(val, int):
+                return None
+            val = _STATE_IDS.get(val, val)
+
+        elif fid == _DESCR_FIELD and isinstance(val, dict):
+            descr = dict()
+            for dkey, dval in val.items():
+                if not isinstance(dkey, str):
+                    return None
+                descr[_DESCR_IDS.get(dkey, dkey)] = dval
+            val = descr
+
+        doc[fid] = val
+
+    return doc
+
+
+# ------------------------------------------------------------------------------
+#
+def _unpack_doc(doc):
+
+    thing = dict()
+    for fid, val in doc.items():
+
+        if not isinstance(fid, int):
+            thing[fid] = val
+            continue
+
+        if fid in _STATE_FIELDS:
+            if isinstance(val, int):
+                val = _STATES[val]
+
+        elif fid == _DESCR_FIELD and isinstance(val, dict):
+            val = {_DESCR_FIELDS[dkey] if isinstance(dkey, int) else dkey: dval
+                   for dkey, dval in val.items()}
+
+        thing[_FIELDS[fid]] = val
+
+    return thing
+
+
+# ------------------------------------------------------------------------------
+#
+def _pack_compact(things):
+
+    records = list()
+    run     = None      # the current run of state-only updates
+
+    for thing in things:
+
+        if isinstance(thing, dict)   and len(thing) == 3 and \
+           'uid'  in thing           and 'state'    in thing and \
+           'type' in thing           and thing['state'] in _STATE_IDS:
+
+            uid = thing['uid']
+            if isinstance(uid, str):
+
+                prefix, sep, suffix = uid.rpartition('.')
+                sid = _STATE_IDS[thing['state']]
+
+                if not sep:
+                    prefix = None
+
+                if run and run[1] == thing['type'] and run[2] == sid \
+                       and run[3] == prefix:
+                    run[4].append(suffix)
+
+                else:
+                    run = [_REC_STATES, thing['type'], sid, prefix, [suffix]]
+                    records.append(run)
+
+                continue
+
+        run = None
+        doc = _pack_doc(thing) if isinstance(thing, dict) else None
+
+        if doc is None:
+            records.append([_REC_RAW, thing])
+        else:
+            records.append([_REC_DOC, doc])
+
+    return records
+
+
+# ------------------------------------------------------------------------------
+#
+def _unpack_compact(records):
+
+    things = list()
+    for rec in records:
+
+        rtype = rec[0]
+
+        if rtype == _REC_STATES:
+            _, ttype, sid, prefix, suffixes = rec
+            state = _STATES[sid]
+            if prefix is not None:
+                things.extend({'uid'  : '%s.%s' % (prefix, suffix),
+                               'type' : ttype,
+                               'state': state} for suffix in suffixes)
+            else:
+                things.extend({'uid'  : suffix,
+                               'type' : ttype,
+                               'state': state} for suffix in suffixes)
+
+        elif rtype == _REC_DOC:
+            things.append(_unpack_doc(rec[1]))
+
+        elif rtype == _REC_RAW:
+            things.append(rec[1])
+
+        else:
+            raise ValueError('unknown wire record type %s' % rtype)
+
+    return things
+
+
+# ------------------------------------------------------------------------------
+#
+def wire_codec(cfg):
+    '''
+    Return a `WireCodec` for the given bridge config, or `None` if the bridge
+    uses plain msgpack messages.  The bridge config can specify:
+
+        'codec'       : 'msgpack' or 'compact'
+        'compress'    : 'zlib', 'lz4' or 'zstd' (optional)
+        'compress_min': minimal envelope size to compress, in bytes
+    '''
+
+    fmt = cfg.get('codec')
+    if not fmt:
+        return None
+
+    compress_min = cfg.get('compress_min') or WIRE_COMPRESS_MIN
+
+    return WireCodec(fmt, compress=cfg.get('compress'),
+                     compress_min=compress_min)
+
+
+# ------------------------------------------------------------------------------
+#
+def is_wire_envelope(obj):
+
+    return isinstance(obj, msgpack.ExtType) and obj.code == WIRE_EXT_CODE
+
+
+# ------------------------------------------------------------------------------
+#
+def wire_expand(things):
+    '''
+    Replace all envelopes in the given list of things by the things they
+    contain.  Other things are passed through, in order.
+    '''
+
+    ret = None
+    for idx, thing in enumerate(things):
+
+        if is_wire_envelope(thing):
+            if ret is None:
+                ret = things[:idx]
+            ret.extend(WireCodec.decode(thing))
+
+        elif ret is not None:
+            ret.append(thing)
+
+    if ret is None:
+        return things
+
+    return ret
+
+
+# ------------------------------------------------------------------------------
+#
+class WirePutter(object):
+    '''
+    Wrap a `ru.zmq.Putter` to send bulks of things as envelopes.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, putter, codec):
+
+        self._putter = putter
+        self._codec  = codec
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __getattr__(self, name):
+
+        return getattr(self._putter, name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def put(self, things, qname=None):
+
+        if not isinstance(things, list):
+            things = [things]
+
+        if not things:
+            return
+
+        self._putter.put([self._codec.encode(things)], qname=qname)
+
+
+# ------------------------------------------------------------------------------
+#
+class WirePublisher(object):
+    '''
+    Wrap a `ru.zmq.Publisher` to send the bulk argument of messages (`arg`) as
+    envelopes.  The message command (`cmd`) remains readable for all peers.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, publisher, codec):
+
+        self._publisher = publisher
+        self._codec     = codec
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __getattr__(self, name):
+
+        return getattr(self._publisher, name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def put(self, topic, msg):
+
+        if isinstance(msg, dict) and isinstance(msg.get('arg'), list):
+            msg = dict(msg)
+            msg['arg'] = self._codec.encode(msg['arg'])
+
+        self._publisher.put(topic, msg)
+
+
+# ------------------------------------------------------------------------------
+#
+def wire_callback(cb):
+    '''
+    Wrap a subscriber callback to receive messages with decoded arguments.
+    '''
+
+    def _cb(topic, msg):
+
+        if isinstance(msg, dict) and is_wire_envelope(msg.get('arg')):
+            msg['arg'] = WireCodec.decode(msg['arg'])
+
+        return cb(topic, msg)
+
+    return _cb
+
+
+# ------------------------------------------------------------------------------
+
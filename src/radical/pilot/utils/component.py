@@ -8,6 +8,7 @@ import os
 import sys
 import copy
 import time
+import logging
 
 import threading       as mt
 import radical.utils   as ru
@@ -15,6 +16,13 @@ import radical.utils   as ru
 from ..          import constants      as rpc
 from ..          import states         as rps
 
+from .cancel      import CancelRegistry, CANCEL_TTL
+from .codec       import wire_codec, wire_expand, wire_callback
+from .codec       import WirePutter, WirePublisher
+from .task_store  import TaskStore, TaskStorePutter, TASK_STORE_MIN
+from .bulking     import BulkSizer
+from .worker_pool import WorkerPool, POOL_DEPTH
+
 
 # ------------------------------------------------------------------------------
 #
@@ -448,9 +456,16 @@ class Component(object):
                                         # guard threaded callback invokations
         self._work_lock  = mt.RLock()
                                         # guard threaded callback invokations
+        self._pub_lock   = mt.Lock()    # guard publishers shared by pools
 
         self._subscribers = dict()      # ZMQ Subscriber classes
 
+        self._task_store     = None     # shared memory task store
+        self._task_store_out = False    # do we push tasks into the store?
+
+        # time to collect input bulks for (seconds, `0` disables bulking)
+        self._bulk_latency   = cfg.get('bulk_latency', 0.0)
+
         if self._owner == self.uid:
             self._owner = 'root'
 
@@ -597,8 +612,7 @@ class Component(object):
 
             self._log.debug('register for cancellation: %s', uids)
 
-            with self._cancel_lock:
-                self._cancel_list += uids
+            self._cancel_list.add(uids)
 
         if cmd == 'terminate':
             self._log.info('got termination command')
@@ -641,8 +655,8 @@ class Component(object):
         self.register_publisher(rpc.CONTROL_PUBSUB)
 
         # set controller callback to handle cancellation requests
-        self._cancel_list = list()
-        self._cancel_lock = mt.RLock()
+        self._cancel_list = CancelRegistry(self._cfg.get('cancel_ttl',
+                                                         CANCEL_TTL))
         self.register_subscriber(rpc.CONTROL_PUBSUB, self._cancel_monitor_cb)
 
         # call component level initialize
@@ -666,6 +680,10 @@ class Component(object):
         for thread in self._threads.values():
             thread.stop()
 
+        for inp in self._inputs.values():
+            if inp.get('pool'):
+                inp['pool'].stop()
+
         self._log.debug('%s close prof', self.uid)
         try:
             self._prof.prof('component_final')
@@ -700,7 +718,7 @@ class Component(object):
 
     # --------------------------------------------------------------------------
     #
-    def register_input(self, states, qname, worker=None):
+    def register_input(self, states, qname, worker=None, pool=None):
         '''
         Using this method, the component can be connected to a queue on which
         things are received to be worked upon.  The given set of states (which
@@ -717,6 +735,14 @@ class Component(object):
 
         Worker invocation is synchronous, ie. the main event loop will only
         check for the next thing once the worker method returns.
+
+        Unless `pool` threads are used for the input (default: the component
+        config's `worker_pool` setting, `0` disables pools).  Bulks are then
+        worked upon concurrently by that many threads, while all bulks with
+        a given thing are worked upon in order.  Workers are then not guarded
+        by the component's work lock, and MUST be thread safe.  Bulks pending
+        in a pool are still worked upon when the input is unregistered or the
+        component terminates.
         '''
 
         states = ru.as_list(states)
@@ -729,8 +755,22 @@ class Component(object):
         if name in self._inputs:
             raise ValueError('input %s already registered' % name)
 
+        bulk = None
+        if self._bulk_latency:
+            bulk = BulkSizer()
+
+        if pool is None:
+            pool = self._cfg.get('worker_pool', 0)
+
+        if pool:
+            depth = self._cfg.get('worker_pool_depth', POOL_DEPTH)
+            pool  = WorkerPool(name, pool, self._work_pooled, depth=depth)
+            self._log.debug('input %s uses %d worker threads', name, pool.size)
+
         self._inputs[name] = {'queue'  : self.get_input_ep(qname),
-                              'states' : states}
+                              'states' : states,
+                              'bulk'   : bulk,
+                              'pool'   : pool or None}
 
         self._log.debug('registered input %s', name)
 
@@ -769,6 +809,8 @@ class Component(object):
             return
 
         self._inputs[name]['queue'].stop()
+        if self._inputs[name].get('pool'):
+            self._inputs[name]['pool'].stop()
         del self._inputs[name]
         self._log.debug('unregistered input %s [%s]', name, qname)
 
@@ -834,6 +876,10 @@ class Component(object):
         fname = '%s/%s.cfg' % (self._cfg.path, qname)
         cfg   = ru.read_json(fname)
 
+        # tasks received from this queue refer to the task store
+        if cfg.get('task_store'):
+            self._get_task_store(cfg)
+
         return ru.zmq.Getter(qname, url=cfg['get'])
 
 
@@ -848,7 +894,30 @@ class Component(object):
         fname = '%s/%s.cfg' % (self._cfg.path, qname)
         cfg   = ru.read_json(fname)
 
-        return ru.zmq.Putter(qname, url=cfg['put'])
+        putter = ru.zmq.Putter(qname, url=cfg['put'])
+
+        # send bulks as envelopes if the bridge is configured with a codec
+        codec = wire_codec(cfg)
+        if codec:
+            putter = WirePutter(putter, codec)
+
+        # pass task descriptions via the task store if so configured
+        if cfg.get('task_store'):
+            putter = TaskStorePutter(putter, self._get_task_store(cfg))
+            self._task_store_out = True
+
+        return putter
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get_task_store(self, cfg):
+
+        if not self._task_store:
+            min_size = cfg.get('task_store_min') or TASK_STORE_MIN
+            self._task_store = TaskStore(self._cfg.sid, self._log, min_size)
+
+        return self._task_store
 
 
     # --------------------------------------------------------------------------
@@ -1015,10 +1084,16 @@ class Component(object):
         fname = '%s/%s.cfg' % (self._cfg.path, pubsub)
         cfg   = ru.read_json(fname)
 
-        self._publishers[pubsub] = ru.zmq.Publisher(channel=pubsub,
-                                                    url=cfg['pub'],
-                                                    log=self._log,
-                                                    prof=self._prof)
+        publisher = ru.zmq.Publisher(channel=pubsub, url=cfg['pub'],
+                                     log=self._log, prof=self._prof)
+
+        # send bulk arguments as envelopes if the bridge is configured with
+        # a codec
+        codec = wire_codec(cfg)
+        if codec:
+            publisher = WirePublisher(publisher, codec)
+
+        self._publishers[pubsub] = publisher
 
         self._log.debug('registered publisher for %s', pubsub)
 
@@ -1052,6 +1127,9 @@ class Component(object):
                                                           log=self._log,
                                                           prof=self._prof)
 
+        if wire_codec(cfg):
+            cb = wire_callback(cb)
+
         self._subscribers[pubsub].subscribe(topic=pubsub, cb=cb,
                                             lock=self._cb_lock)
 
@@ -1075,14 +1153,13 @@ class Component(object):
 
         for name in self._inputs:
 
-            qname  = self._inputs[name]['queue']
             states = self._inputs[name]['states']
+            pool   = self._inputs[name].get('pool')
+            things = self._get_bulk(name)
 
-            # FIXME: a simple, 1-thing caching mechanism would likely
-            #        remove the req/res overhead completely (for any
-            #        non-trivial worker).
-            things = qname.get_nowait(500)  # in microseconds
-            things = ru.as_list(things)
+            # tasks leave the task store if we don't pass them on in it
+            if self._task_store:
+                self._task_store.load(things, release=not self._task_store_out)
 
             if not things:
                 # return to have a chance to catch term signals
@@ -1110,17 +1187,16 @@ class Component(object):
 
                 try:
                     to_cancel = list()
+                    to_work   = list()
 
                     for thing in things:
 
                         uid = thing.get('uid')
 
-                        # FIXME: this can become expensive over time
-                        #        if the cancel list is never cleaned
-                        if uid and uid in self._cancel_list:
-                            with self._cancel_lock:
-                                self._cancel_list.remove(uid)
+                        if uid and self._cancel_list.pop(uid):
                             to_cancel.append(thing)
+                        else:
+                            to_work.append(thing)
 
                         self._log.debug('got %s (%s)', uid, state)
 
@@ -1129,8 +1205,12 @@ class Component(object):
                         if state:
                             self.advance(to_cancel, rps.CANCELED, publish=True,
                                                                   push=False)
-                    with self._work_lock:
-                        self._workers[state](things)
+                    if to_work and pool:
+                        pool.submit(state, to_work)
+
+                    elif to_work:
+                        with self._work_lock:
+                            self._workers[state](to_work)
 
                 except Exception:
 
@@ -1146,6 +1226,77 @@ class Component(object):
         return True
 
 
+    # --------------------------------------------------------------------------
+    #
+    def _work_pooled(self, state, things):
+        '''
+        Work on things in a worker pool thread.
+        '''
+
+        try:
+            self._workers[state](things)
+
+        except Exception:
+
+            # this is not fatal -- only the 'things' fail, not
+            # the component
+            self._log.exception("work %s failed", self._workers.get(state))
+
+            if state:
+                self.advance(things, rps.FAILED, publish=True, push=False)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _get_bulk(self, name):
+        '''
+        Get a bulk of things from the named input.  If bulking is enabled, more
+        things are collected until the input's adaptive bulk size is reached,
+        the input drained, or the latency budget (`bulk_latency`) is used up.
+        The bulk size doubles while things back up in the input, and halves
+        when the input drains -- so we only wait for more things after
+        a previous get showed a backlog.
+        '''
+
+        queue = self._inputs[name]['queue']
+        sizer = self._inputs[name].get('bulk')
+
+        # FIXME: a simple, 1-thing caching mechanism would likely
+        #        remove the req/res overhead completely (for any
+        #        non-trivial worker).
+        things = queue.get_nowait(500)  # in milliseconds
+        things = wire_expand(ru.as_list(things))
+
+        if not things or not sizer:
+            return things
+
+        start   = time.time()
+        drained = False
+
+        while len(things) < sizer.size:
+
+            remaining = self._bulk_latency - (time.time() - start)
+            if remaining <= 0:
+                break
+
+            more = queue.get_nowait(max(1, int(remaining * 1000)))
+            more = wire_expand(ru.as_list(more))
+
+            if not more:
+                drained = True
+                break
+
+            things += more
+
+        size = sizer.update(backlog=len(things) >= sizer.size, drained=drained)
+
+        # expose the observed bulk sizes
+        self._prof.prof('get_bulk', uid=self._uid,
+                        msg='%s:%d:%d' % (queue.channel, len(things), size))
+
+        return things
+
+
     # --------------------------------------------------------------------------
     #
     def advance(self, things, state=None, publish=True, push=False, ts=None,
@@ -1180,11 +1331,18 @@ class Component(object):
 
         things = ru.as_list(things)
 
-        # assign state, sort things by state
-        buckets = dict()
-        for thing in things:
+        # assign state, sort things by state, and collect the state updates to
+        # publish - all in one pass over the things.
+        #
+        # If '$all' is set, we update the complete thing_dict.
+        # Things in final state are also published in full.
+        # If '$set' is set, we also publish all keys listed in there.
+        # In all other cases, we only send 'uid', 'type' and 'state'.
+        # We never carry $all across component boundaries!
+        buckets    = dict()
+        to_publish = list()
 
-            uid = thing['uid']
+        for thing in things:
 
           # if thing['type'] not in ['task', 'pilot']:
           #     raise TypeError("thing has unknown type (%s)" % uid)
@@ -1195,102 +1353,95 @@ class Component(object):
 
             _state = thing['state']
 
-            if prof:
-                self._prof.prof('advance', uid=uid, state=_state, ts=ts)
-
-            if _state not in buckets:
-                buckets[_state] = list()
-            buckets[_state].append(thing)
+            bucket = buckets.get(_state)
+            if bucket is None:
+                bucket = buckets[_state] = list()
+            bucket.append(thing)
 
-        for _state,_things in buckets.items():
-            self._log.debug('advance bulk: %s [%s, %s, %s]',
-                            len(_things), push, publish, _state)
-
-        # should we publish state information on the state pubsub?
-        if publish:
-
-            to_publish = list()
-
-            # If '$all' is set, we update the complete thing_dict.
-            # Things in final state are also published in full.
-            # If '$set' is set, we also publish all keys listed in there.
-            # In all other cases, we only send 'uid', 'type' and 'state'.
-            for thing in things:
-                if '$all' in thing:
-                    del thing['$all']
+            if '$all' in thing:
+                del thing['$all']
+                if publish:
                     if '$set' in thing:
                         del thing['$set']
                     to_publish.append(thing)
 
-                elif thing['state'] in rps.FINAL:
-                    to_publish.append(thing)
+            elif not publish:
+                pass
 
-                else:
-                    tmp = {'uid'   : thing['uid'],
-                           'type'  : thing['type'],
-                           'state' : thing['state']}
-                    if '$set' in thing:
-                        for key in thing['$set']:
-                            tmp[key] = thing[key]
-                        del thing['$set']
-                    to_publish.append(tmp)
+            elif _state in rps.FINAL:
+                to_publish.append(thing)
 
-            self.publish(rpc.STATE_PUBSUB, {'cmd': 'update', 'arg': to_publish})
+            else:
+                tmp = {'uid'   : thing['uid'],
+                       'type'  : thing['type'],
+                       'state' : _state}
+                if '$set' in thing:
+                    for key in thing['$set']:
+                        tmp[key] = thing[key]
+                    del thing['$set']
+                to_publish.append(tmp)
+
+        # profile and log per bucket, and only if enabled
+        prof  = prof and self._prof.enabled
+        debug = self._log.isEnabledFor(logging.DEBUG)
 
-          # ts = time.time()
-          # for thing in things:
-          #     self._prof.prof('publish', uid=thing['uid'],
-          #                     state=thing['state'], ts=ts)
+        for _state,_things in buckets.items():
 
-        # never carry $all and across component boundaries!
-        for thing in things:
-            if '$all' in thing:
-                del thing['$all']
+            if prof:
+                uids = [thing['uid'] for thing in _things]
+                self._prof.prof('advance', uid=uids, state=_state, ts=ts)
+            if debug:
+                self._log.debug('advance bulk: %s [%s, %s, %s]',
+                                len(_things), push, publish, _state)
+
+            # things in final state leave the task store
+            if self._task_store and _state in rps.FINAL:
+                self._task_store.release([thing['uid'] for thing in _things])
+
+        # should we publish state information on the state pubsub?
+        if publish:
+            self.publish(rpc.STATE_PUBSUB, {'cmd': 'update', 'arg': to_publish})
 
         # should we push things downstream, to the next component
         if push:
 
-            # the push target depends on the state of things, so we need to sort
-            # the things into buckets by state before pushing them
-            # now we can push the buckets as bulks
+            # the push target depends on the state of things, so we push the
+            # buckets as bulks
             for _state,_things in buckets.items():
 
-              # ts = time.time()
                 if _state in rps.FINAL:
                     # things in final state are dropped
-                    for thing in _things:
-                        self._log.debug('final %s [%s]', thing['uid'], _state)
-                        self._prof.prof('drop', uid=thing['uid'], state=_state,
-                                        ts=ts)
-                    continue
+                    event = 'drop'
 
-                if _state not in self._outputs:
+                elif _state not in self._outputs:
                     # unknown target state -- error
-                    for thing in _things:
-                        self._log.debug("lost  %s [%s] : %s", thing['uid'],
-                                _state, self._outputs)
-                        self._prof.prof('lost', uid=thing['uid'], state=_state,
-                                        ts=ts)
-                    continue
+                    event = 'lost'
 
-                if not self._outputs[_state]:
+                elif not self._outputs[_state]:
                     # empty output -- drop thing
-                    for thing in _things:
-                        self._log.debug('drop  %s [%s]', thing['uid'], _state)
-                        self._prof.prof('drop', uid=thing['uid'], state=_state,
-                                        ts=ts)
+                    event = 'drop'
+
+                else:
+                    event = None
+
+                if event:
+                    uids = [thing['uid'] for thing in _things]
+                    if debug:
+                        self._log.debug('%s %s [%s]', event, uids, _state)
+                    self._prof.prof(event, uid=uids, state=_state, ts=ts)
                     continue
 
                 output = self._outputs[_state]
 
                 # push the thing down the drain
-                self._log.debug('put bulk %s: %s', _state, len(_things))
+                if debug:
+                    self._log.debug('put bulk %s: %s', _state, len(_things))
                 output.put(_things)
 
-                ts = time.time()
-                for thing in _things:
-                    self._prof.prof('put', uid=thing['uid'], state=_state,
-                                    msg=output.name, ts=ts)
+                if self._prof.enabled:
+                    uids = [thing['uid'] for thing in _things]
+                    self._prof.prof('put', uid=uids, state=_state,
+                                    msg=output.name, ts=time.time())
 
 
     # --------------------------------------------------------------------------
@@ -1303,7 +1454,8 @@ class Component(object):
         if not self._publishers.get(pubsub):
             raise RuntimeError("no msg route for '%s': %s" % (pubsub, msg))
 
-        self._publishers[pubsub].put(pubsub, msg)
+        with self._pub_lock:
+            self._publishers[pubsub].put(pubsub, msg)
 
 
 # ------------------------------------------------------------------------------
@@ -3,14 +3,18 @@
 
 import os
 import time
+import zlib
 
-from typing import Union
+from typing import List, Optional, Tuple, Union
 
 import radical.utils as ru
 
 # max number of t out/err chars to push to tail
 MAX_IO_LOGLENGTH = 1024
 
+# chunk size for files read by `tail_file`
+_TAIL_CHUNK = 1024 * 1024
+
 # cache resource configs
 _rcfgs = None
 
@@ -32,6 +36,85 @@ def tail(txt: str, maxlen: int = MAX_IO_LOGLENGTH) -> str:
         return txt
 
 
+# ------------------------------------------------------------------------------
+#
+def tail_file(path: str, maxlen: int = MAX_IO_LOGLENGTH,
+              grep: Optional[bytes] = None
+             ) -> Union[str, Tuple[str, List[str]]]:
+    '''
+    Return `tail()` of the content of the given file, but only read the end of
+    the file, so that memory consumption is bounded.  A `UnicodeDecodeError` is
+    raised for binary content.
+
+    If `grep` is given, the file is read once, in chunks, and the lines which
+    contain `grep` are returned as well: `(tail, lines)`.
+    '''
+
+    # UTF-8 uses up to 4 bytes per character: the last `nbytes` bytes hold the
+    # last `maxlen` characters, even if the first character is cut
+    nbytes = 4 * maxlen + 3
+    lines  = list()
+
+    with open(path, 'rb') as fin:
+
+        if grep is None:
+            size = os.fstat(fin.fileno()).st_size
+            if size > nbytes:
+                fin.seek(size - nbytes)
+            data = fin.read()
+
+        else:
+            data = b''
+            rest = b''
+            size = 0
+            while True:
+
+                chunk = fin.read(_TAIL_CHUNK)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                data  = (data + chunk)[-nbytes:]
+                buf   = rest + chunk
+                idx   = buf.rfind(b'\n') + 1
+                rest  = buf[idx:][-_TAIL_CHUNK:]  # overlong lines are cut
+
+                if grep in buf[:idx]:
+                    lines += [line for line in buf[:idx].split(b'\n')
+                                   if grep in line]
+
+            if grep in rest:
+                lines.append(rest)
+
+            lines = [line.decode('utf-8', errors='replace').strip()
+                     for line in lines]
+
+    shortened = size > len(data)
+
+    if shortened:
+        # skip the remainder of a character cut by the read offset
+        idx = 0
+        while idx < 3 and idx < len(data) and data[idx] & 0xC0 == 0x80:
+            idx += 1
+        data = data[idx:]
+
+    txt = data.decode('utf-8')
+
+    # universal newlines, as for files opened in text mode
+    if '\r' in txt:
+        txt = txt.replace('\r\n', '\n').replace('\r', '\n')
+
+    if shortened:
+        txt = "[... CONTENT SHORTENED ...]\n%s" % txt[-maxlen:]
+    else:
+        txt = tail(txt, maxlen)
+
+    if grep is None:
+        return txt
+
+    return txt, lines
+
+
 # ------------------------------------------------------------------------------
 #
 def get_rusage() -> str:
@@ -50,6 +133,21 @@ def get_rusage() -> str:
          % (rtime, utime, stime, rss)
 
 
+# ------------------------------------------------------------------------------
+#
+def sandbox_bucket(uid: str, fanout: int) -> str:
+    '''
+    Return the name of the subdirectory (one of `fanout`) which holds the
+    sandbox of the entity with the given uid.  Spreading sandboxes over
+    subdirectories keeps directory sizes (and metadata contention on parallel
+    file systems) bounded.  The mapping is stable across processes.
+    '''
+
+    width = len('%x' % (fanout - 1))
+
+    return '%0*x' % (width, zlib.crc32(uid.encode()) % fanout)
+
+
 # ------------------------------------------------------------------------------
 #
 def create_tar(tgt: str, dnames: str) -> None:
@@ -1353,3 +1353,81 @@ def get_resource_timelines(task, transitions):
 
 # ------------------------------------------------------------------------------
 
+#
+# agent side task states, in the order tasks pass them
+AGENT_STAGES = [s.AGENT_STAGING_INPUT_PENDING,
+                s.AGENT_STAGING_INPUT,
+                s.AGENT_SCHEDULING_PENDING,
+                s.AGENT_SCHEDULING,
+                s.AGENT_EXECUTING_PENDING,
+                s.AGENT_EXECUTING,
+                s.AGENT_STAGING_OUTPUT_PENDING,
+                s.AGENT_STAGING_OUTPUT]
+
+
+# ------------------------------------------------------------------------------
+#
+def get_stage_report(profile, stages=None):
+    '''
+    For each stage (task state) of a pipeline (default: `AGENT_STAGES`), report
+    how many tasks passed the stage (`n`), at which rate (`throughput`, in
+    tasks/s), and how long tasks stayed in the stage (`latency`: `mean`, `p50`,
+    `p95` and `max`, in seconds).  A stage ends with the next later state of
+    the task.  `profile` is a list of events as returned by
+    `get_session_profile()`.
+    '''
+
+    if not stages:
+        stages = AGENT_STAGES
+
+    # time of the first transition to each state, per task (`clean_profile`
+    # renames `advance` events to `state`)
+    transitions = dict()
+    for row in profile:
+        if row[ru.EVENT] in ['advance', 'state'] and row[ru.STATE]:
+            trans = transitions.setdefault(row[ru.UID], dict())
+            trans.setdefault(row[ru.STATE], float(row[ru.TIME]))
+
+    ends   = stages + [s.TMGR_STAGING_OUTPUT_PENDING] + s.FINAL
+    report = dict()
+
+    for idx, state in enumerate(stages):
+
+        t_in    = list()
+        t_out   = list()
+        latency = list()
+
+        for trans in transitions.values():
+
+            t0 = trans.get(state)
+            if t0 is None:
+                continue
+
+            t1 = [trans[x] for x in ends[idx + 1:] if x in trans]
+            t1 = [t for t in t1 if t >= t0]
+            if not t1:
+                continue
+
+            t_in.append(t0)
+            t_out.append(min(t1))
+            latency.append(min(t1) - t0)
+
+        n = len(latency)
+        if not n:
+            report[state] = {'n': 0, 'throughput': None, 'latency': None}
+            continue
+
+        latency.sort()
+        span = max(t_out) - min(t_in)
+
+        report[state] = {'n'         : n,
+                         'throughput': n / span if span else None,
+                         'latency'   : {'mean': sum(latency) / n,
+                                        'p50' : latency[int(n * 0.50)],
+                                        'p95' : latency[int(n * 0.95)],
+                                        'max' : latency[-1]}}
+
+    return report
+
+
+# ------------------------------------------------------------------------------
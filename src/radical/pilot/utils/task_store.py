@@ -0,0 +1,304 @@
+
+__copyright__ = 'Copyright 2023, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+# pylint: disable=protected-access
+
+import os
+import glob
+import zlib
+import struct
+import inspect
+
+import msgpack
+
+from multiprocessing import shared_memory, resource_tracker
+
+
+# ------------------------------------------------------------------------------
+#
+# Agent components run on the same node, but pass complete task dicts through
+# the agent queues - on each hop, the task description is serialized, copied
+# through the bridge, and deserialized again.  A bridge can instead be
+# configured with `task_store`, in which case the description of each task is
+# written once into a shared memory segment keyed by the task uid, and the
+# queue carries the remainder of the task dict plus a reference to that
+# segment (`$descr`).  Receiving components read the description from shared
+# memory.  Descriptions smaller than `task_store_min` bytes are passed inline,
+# as accessing a segment costs more than serializing a small description.
+#
+# A segment is removed when its task leaves the store: when a component which
+# does not push to a store enabled queue receives the task, when the task is
+# advanced to a final state, or when the task is passed on to a queue outside
+# of the store.  The remaining segments of a session are removed when the
+# agent terminates.
+#
+# Task descriptions MUST NOT be changed once a task entered the store: changes
+# are not passed on to the next component.
+#
+_SIZE = struct.Struct('!I')
+
+TASK_STORE_MIN = 4 * 1024
+
+# avoid the resource tracker, which would remove segments when the creating or
+# reading process terminates - segment lifetime is managed by the store
+_TRACK = 'track' in inspect.signature(shared_memory.SharedMemory).parameters
+
+
+# ------------------------------------------------------------------------------
+#
+def _shm(name, create=False, size=0):
+
+    if _TRACK:
+        return shared_memory.SharedMemory(name, create=create, size=size,
+                                          track=False)
+
+    shm = shared_memory.SharedMemory(name, create=create, size=size)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+
+    return shm
+
+
+# ------------------------------------------------------------------------------
+#
+class TaskStore(object):
+    '''
+    Keep task descriptions in shared memory, and pass references to them along
+    with the tasks.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, sid, log, min_size=TASK_STORE_MIN):
+
+        self._sid      = sid
+        self._log      = log
+        self._min_size = min_size
+        self._prefix   = self._get_prefix(sid)
+        self._refs     = dict()     # uid: segment, for tasks held by us
+
+
+    # --------------------------------------------------------------------------
+    #
+    @staticmethod
+    def _get_prefix(sid):
+
+        return 'rp_%08x_' % zlib.crc32(sid.encode())
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _write(self, uid, descr):
+
+        data = msgpack.packb(descr)
+        if len(data) < self._min_size:
+            return None
+
+        name = self._prefix + uid.replace('/', '_')
+
+        try:
+            shm = _shm(name, create=True, size=_SIZE.size + len(data))
+
+        except FileExistsError:
+            # the task entered the store before - the description may have
+            # changed since, so replace the segment
+            self._unlink(name)
+            shm = _shm(name, create=True, size=_SIZE.size + len(data))
+
+        try:
+            _SIZE.pack_into(shm.buf, 0, len(data))
+            shm.buf[_SIZE.size:_SIZE.size + len(data)] = data
+        finally:
+            shm.close()
+
+        return name
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _read(self, name):
+
+        shm = _shm(name)
+        try:
+            size = _SIZE.unpack_from(shm.buf)[0]
+            with shm.buf[_SIZE.size:_SIZE.size + size] as view:
+                return msgpack.unpackb(view, raw=False, strict_map_key=False)
+        finally:
+            shm.close()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _unlink(self, name):
+
+        # `unlink()` also unregisters the segment from the resource tracker
+        try:
+            if _TRACK:
+                shm = shared_memory.SharedMemory(name, track=False)
+            else:
+                shm = shared_memory.SharedMemory(name)
+            shm.close()
+            shm.unlink()
+
+        except FileNotFoundError:
+            pass
+
+
+    # --------------------------------------------------------------------------
+    #
+    def strip(self, things):
+        '''
+        Return the given things, where tasks have their description replaced by
+        a reference to the store.  The things are not altered, but tasks are
+        shallow copied.
+        '''
+
+        ret = list()
+        for thing in things:
+
+            descr = None
+            if isinstance(thing, dict):
+                descr = thing.get('description')
+
+            if not isinstance(descr, dict):
+                ret.append(thing)
+                continue
+
+            uid  = thing['uid']
+            name = self._refs.pop(uid, None)
+
+            if name is None:
+                name = self._write(uid, descr)
+
+            if name is None:
+                ret.append(thing)
+                continue
+
+            ref = {key: val for key, val in thing.items()
+                            if  key != 'description'}
+            ref['$descr'] = name
+            ret.append(ref)
+
+        return ret
+
+
+    # --------------------------------------------------------------------------
+    #
+    def load(self, things, release=False):
+        '''
+        Restore the descriptions of the given tasks from the store (in place).
+        With `release`, the tasks leave the store.
+        '''
+
+        for thing in things:
+
+            if not isinstance(thing, dict):
+                continue
+
+            name = thing.pop('$descr', None)
+            if name is None:
+                continue
+
+            try:
+                thing['description'] = self._read(name)
+
+            except FileNotFoundError:
+                # the task will fail in the component
+                self._log.error('no description for %s', thing.get('uid'))
+                thing['description'] = dict()
+                continue
+
+            if release:
+                self._unlink(name)
+            else:
+                self._refs[thing['uid']] = name
+
+        return things
+
+
+    # --------------------------------------------------------------------------
+    #
+    def release(self, uids):
+        '''
+        Remove the descriptions of the given tasks (if held by this process)
+        from the store.
+        '''
+
+        for uid in uids:
+            name = self._refs.pop(uid, None)
+            if name:
+                self._unlink(name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def cleanup(self):
+        '''
+        Remove all descriptions of the session from the store.
+        '''
+
+        self._refs = dict()
+        self.purge(self._sid)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @staticmethod
+    def purge(sid):
+        '''
+        Remove all descriptions of the given session from shared memory - this
+        does not require a store instance, as the process which cleans up may
+        not have used the store itself.
+        '''
+
+        prefix = TaskStore._get_prefix(sid)
+
+        # segments are only enumerable on Linux
+        for path in glob.glob('/dev/shm/%s*' % prefix):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+# ------------------------------------------------------------------------------
+#
+class TaskStorePutter(object):
+    '''
+    Wrap a `ru.zmq.Putter` to pass tasks with references to their descriptions
+    (or, with `release`, to pass complete tasks out of the store).
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, putter, store, release=False):
+
+        self._putter  = putter
+        self._store   = store
+        self._release = release
+
+
+    # --------------------------------------------------------------------------
+    #
+    def __getattr__(self, name):
+
+        return getattr(self._putter, name)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def put(self, things, qname=None):
+
+        if not isinstance(things, list):
+            things = [things]
+
+        if self._release:
+            self._putter.put(things, qname=qname)
+            self._store.release([thing['uid'] for thing in things
+                                              if isinstance(thing, dict)])
+        else:
+            self._putter.put(self._store.strip(things), qname=qname)
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,143 @@
+
+__copyright__ = 'Copyright 2023, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import queue
+
+import threading as mt
+
+
+# max number of bulks waiting per lane before `submit()` blocks
+POOL_DEPTH = 4
+
+
+# ------------------------------------------------------------------------------
+#
+class WorkerPool(object):
+    '''
+    Work on bulks of things concurrently, in a set of worker threads (lanes).
+    Things are assigned to lanes by uid, so that the bulks containing a given
+    thing are worked upon in the order they were submitted, while independent
+    things are worked upon concurrently.  Things without uid are assigned
+    round-robin.
+
+    Each lane buffers up to `depth` bulks - `submit()` blocks when the lane is
+    full, so that things are not pulled from the inputs faster than they are
+    worked upon.
+
+    No bulk is dropped when the pool is stopped: the lanes finish all bulks
+    submitted before `stop()`, and bulks submitted after `stop()` are worked
+    upon in the submitting thread.
+    '''
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self, name, size, work, depth=POOL_DEPTH):
+        '''
+        `work(state, things)` is called in the lanes, and is expected to handle
+        its own errors.
+        '''
+
+        self._name    = name
+        self._size    = max(1, size)
+        self._work    = work
+        self._next    = 0
+        self._term    = mt.Event()
+        self._lock    = mt.Lock()       # order submissions and `stop()`
+        self._lanes   = [queue.Queue(maxsize=depth) for _ in range(self._size)]
+        self._threads = list()
+
+        for idx, lane in enumerate(self._lanes):
+            thread = mt.Thread(target=self._run, args=[lane],
+                               name='%s.%d' % (name, idx))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @property
+    def size(self):
+        return self._size
+
+
+    # --------------------------------------------------------------------------
+    #
+    def submit(self, state, things):
+
+        shards = dict()
+        for thing in things:
+
+            uid = thing.get('uid')
+            if uid:
+                idx = hash(uid) % self._size
+            else:
+                idx = self._next
+                self._next = (self._next + 1) % self._size
+
+            if idx not in shards:
+                shards[idx] = list()
+            shards[idx].append(thing)
+
+        for idx, shard in shards.items():
+
+            queued = False
+            while not queued:
+
+                with self._lock:
+
+                    if self._term.is_set():
+                        break
+
+                    try:
+                        self._lanes[idx].put((state, shard), timeout=0.1)
+                        queued = True
+                    except queue.Full:
+                        pass
+
+            if not queued:
+                # the pool got stopped - work on the shard after the lane
+                # drained, to keep the order of bulks
+                thread = self._threads[idx]
+                if thread is not mt.current_thread():
+                    thread.join()
+                self._work(state, shard)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _run(self, lane):
+
+        # once stopped, no bulks are added - drain the lane and finish
+        while True:
+
+            try:
+                state, things = lane.get(timeout=0.1)
+            except queue.Empty:
+                if self._term.is_set():
+                    break
+                continue
+
+            self._work(state, things)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def stop(self, timeout=None):
+        '''
+        Stop the pool, and wait (up to `timeout` seconds) for the lanes to
+        finish all bulks submitted so far.  Bulks are not dropped: lanes which
+        are still busy after `timeout` continue to work on their bulks.
+        '''
+
+        with self._lock:
+            self._term.set()
+
+        for thread in self._threads:
+            if thread is not mt.current_thread():
+                thread.join(timeout=timeout)
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+'''
+Measure the cost of `Component.advance()` for bulks of things, with state
+publication, pushing to an output queue, and profiling to a file (unless
+`--noprof` is given).
+
+The current implementation is compared to the one which profiled and built
+the state update records per thing, in separate passes (`--legacy`).
+
+usage: bench_advance.py [n_things] [n_rounds] [--legacy] [--noprof]
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import radical.utils        as ru
+import radical.pilot.states as rps
+
+from radical.pilot.utils import Component
+
+
+# ------------------------------------------------------------------------------
+#
+class _Output(object):
+
+    name = 'agent_scheduling_queue'
+
+    def put(self, things):
+        pass
+
+
+# ------------------------------------------------------------------------------
+#
+def advance_legacy(self, things, state=None, publish=True, push=False,
+                   ts=None, prof=True):
+
+    # the former `Component.advance()` implementation
+    if not things:
+        return
+
+    if not ts:
+        ts = time.time()
+
+    things = ru.as_list(things)
+
+    buckets = dict()
+    for thing in things:
+
+        uid = thing['uid']
+
+        if state:
+            thing['state'] = state
+
+        _state = thing['state']
+
+        if prof:
+            self._prof.prof('advance', uid=uid, state=_state, ts=ts)
+
+        if _state not in buckets:
+            buckets[_state] = list()
+        buckets[_state].append(thing)
+
+    for _state,_things in buckets.items():
+        self._log.debug('advance bulk: %s [%s, %s, %s]',
+                        len(_things), push, publish, _state)
+
+    if publish:
+
+        to_publish = list()
+        for thing in things:
+            if '$all' in thing:
+                del thing['$all']
+                if '$set' in thing:
+                    del thing['$set']
+                to_publish.append(thing)
+
+            elif thing['state'] in rps.FINAL:
+                to_publish.append(thing)
+
+            else:
+                tmp = {'uid'   : thing['uid'],
+                       'type'  : thing['type'],
+                       'state' : thing['state']}
+                if '$set' in thing:
+                    for key in thing['$set']:
+                        tmp[key] = thing[key]
+                    del thing['$set']
+                to_publish.append(tmp)
+
+        self.publish(None, {'cmd': 'update', 'arg': to_publish})
+
+    for thing in things:
+        if '$all' in thing:
+            del thing['$all']
+
+    if push:
+        for _state,_things in buckets.items():
+
+            output = self._outputs[_state]
+            self._log.debug('put bulk %s: %s', _state, len(_things))
+            output.put(_things)
+
+            ts = time.time()
+            for thing in _things:
+                self._prof.prof('put', uid=thing['uid'], state=_state,
+                                msg=output.name, ts=ts)
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_things, n_rounds, legacy, prof_dir):
+
+    comp = Component.__new__(Component)
+    comp._log     = ru.Logger('bench', targets=['null'], level='INFO')
+    comp._prof    = ru.Profiler('bench', ns='radical.pilot', path=prof_dir)
+    comp._outputs = {rps.AGENT_SCHEDULING_PENDING: _Output()}
+    comp.publish  = lambda pubsub, msg: None
+
+    comp._task_store = None
+
+    things = [{'uid'  : 'task.%06d' % i,
+               'type' : 'task',
+               'state': rps.AGENT_STAGING_INPUT}
+              for i in range(n_things)]
+
+    if legacy: advance = lambda *args, **kwargs: \
+                                advance_legacy(comp, *args, **kwargs)
+    else     : advance = comp.advance
+
+    start = time.time()
+    for _ in range(n_rounds):
+        advance(things, rps.AGENT_SCHEDULING_PENDING, publish=True, push=True)
+    stop = time.time()
+
+    comp._prof.close()
+
+    return stop - start
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    args     = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    legacy   = '--legacy' in sys.argv
+    noprof   = '--noprof' in sys.argv
+    n_things = int(args[0]) if len(args) > 0 else 10000
+    n_rounds = int(args[1]) if len(args) > 1 else 10
+
+    # the profiler is enabled via the environment
+    os.environ['RADICAL_PILOT_PROFILE'] = 'False' if noprof else 'True'
+
+    prof_dir = tempfile.mkdtemp()
+    try:
+        ttc = run(n_things, n_rounds, legacy, prof_dir)
+    finally:
+        shutil.rmtree(prof_dir)
+
+    print('implementation : %s' % ('legacy' if legacy else 'current'))
+    print('profiling      : %s' % ('off' if noprof else 'on'))
+    print('things         : %8d x %d' % (n_things, n_rounds))
+    print('time           : %8.3f s' % ttc)
+    print('rate           : %8.0f things/s' % (n_things * n_rounds / ttc))
+
+
+# ------------------------------------------------------------------------------
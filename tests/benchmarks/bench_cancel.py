@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+'''
+Measure the cost of mass task cancellation.
+
+  - `component`: one cancel request for `n_cancel` tasks is registered, then
+    `n_tasks` tasks (half of them canceled) pass through the cancel check of
+    `Component.work_cb`.  The `CancelRegistry` is compared to the list the
+    component base used to keep (`--list`), whose lookups scan all pending
+    cancel requests.
+
+  - `popen`: `n_running` task processes are started and watched by the `Popen`
+    executor's watcher thread, then all of them are canceled by one cancel
+    request.  Reported is the time until all tasks are reported as canceled.
+
+usage: bench_cancel.py [n_tasks] [n_running] [--list]
+'''
+
+import os
+import sys
+import time
+import queue
+import select
+import subprocess
+
+import threading as mt
+
+import radical.pilot.states as rps
+
+from radical.pilot.agent.executing.popen import Popen
+from radical.pilot.utils                 import CancelRegistry
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def run_component(n_tasks, use_list):
+
+    uids      = ['task.%06d' % i for i in range(n_tasks)]
+    to_cancel = uids[::2]
+    lock      = mt.RLock()
+
+    start = time.time()
+
+    if use_list:
+        # the former `Component` implementation
+        cancel_list = list()
+        with lock:
+            cancel_list += to_cancel
+
+        canceled = 0
+        for uid in uids:
+            if uid in cancel_list:
+                with lock:
+                    cancel_list.remove(uid)
+                canceled += 1
+
+    else:
+        cancel_list = CancelRegistry()
+        cancel_list.add(to_cancel)
+
+        canceled = 0
+        for uid in uids:
+            if cancel_list.pop(uid):
+                canceled += 1
+
+    assert canceled == len(to_cancel)
+
+    return time.time() - start
+
+
+# ------------------------------------------------------------------------------
+#
+def run_popen(n_running):
+
+    pex = Popen.__new__(Popen)
+    pex._log            = _Log()
+    pex._prof           = _Log()
+    pex._term           = mt.Event()
+    pex._cancel_lock    = mt.RLock()
+    pex._cancel_list    = CancelRegistry()
+    pex._task_usage     = False
+    pex._cgroups        = None
+    pex._cgroup_path    = dict()
+    pex._tasks_to_watch = dict()
+    pex._uids_to_watch  = dict()
+    pex._watch_queue    = queue.Queue()
+    pex._watch_timeout  = 0.1
+    pex._pidfds         = dict()
+    pex._epoll          = None
+    pex._epoll_lock     = mt.Lock()
+    pex._na_lock        = mt.Lock()
+    pex._na_tasks       = dict()
+    pex._wake_r, pex._wake_w = os.pipe()
+
+    os.set_blocking(pex._wake_r, False)
+    os.set_blocking(pex._wake_w, False)
+
+    if hasattr(os, 'pidfd_open'):
+        pex._epoll = select.epoll()
+        pex._epoll.register(pex._wake_r, select.EPOLLIN)
+
+    done = queue.Queue()
+
+    def advance(tasks, state, *args, **kwargs):
+        assert state == rps.CANCELED, state
+        for _ in tasks:
+            done.put(None)
+
+    pex.publish = lambda *args, **kwargs: None
+    pex.advance = advance
+
+    watcher = mt.Thread(target=pex._watch)
+    watcher.daemon = True
+    watcher.start()
+
+    uids = list()
+    for i in range(n_running):
+
+        # register the process as `Popen._spawn_task` does
+        uid  = 'task.%06d' % i
+        task = {'uid' : uid,
+                'proc': subprocess.Popen(['sleep', '3600'],
+                                         start_new_session=True)}
+        pid  = task['proc'].pid
+
+        with pex._cancel_lock:
+            pex._uids_to_watch[uid] = pid
+
+        pex._watch_queue.put(task)
+        if pex._epoll:
+            pidfd = os.pidfd_open(pid)
+            pex._pidfds[pidfd] = pid
+            pex._epoll.register(pidfd, select.EPOLLIN)
+        uids.append(uid)
+
+    pex._wake()
+
+    start = time.time()
+    pex.command_cb(None, {'cmd': 'cancel_tasks', 'arg': {'uids': uids}})
+    for _ in range(n_running):
+        done.get()
+    stop = time.time()
+
+    pex._term.set()
+    watcher.join()
+
+    return stop - start
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    args      = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    use_list  = '--list' in sys.argv
+    n_tasks   = int(args[0]) if len(args) > 0 else 50000
+    n_running = int(args[1]) if len(args) > 1 else 1000
+
+    t_comp  = run_component(n_tasks, use_list)
+    t_popen = run_popen(n_running)
+
+    print('cancel index  : %s' % ('list' if use_list else 'registry'))
+    print('tasks         : %8d (%d canceled)' % (n_tasks, n_tasks // 2))
+    print('component     : %8.3f s' % t_comp)
+    print('running tasks : %8d' % n_running)
+    print('popen cancel  : %8.3f s' % t_popen)
+
+
+# ------------------------------------------------------------------------------
+
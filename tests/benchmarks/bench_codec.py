@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+'''
+Measure the throughput of a local queue bridge for bulks of task documents
+(`tasks`), task documents with large descriptions (`large`) or state-only
+updates (`updates`), with and without a wire codec.  The bridge and the
+producer run in separate processes, the consumer receives and decodes all
+things in the main process.  The rate is measured from the first put to the
+last thing decoded.
+
+With `--store`, task descriptions are passed via the shared memory task store.
+The descriptions are placed in the store before the measurement, as it happens
+once per task, on its first hop through the agent.
+
+usage: bench_codec.py [tasks|large|updates] [n_things] [bulk_size]
+                      [--codec=msgpack|compact] [--compress=zlib|lz4|zstd]
+                      [--store]
+'''
+
+import sys
+import time
+import shutil
+import tempfile
+
+import msgpack
+
+import multiprocessing as mp
+
+import radical.utils        as ru
+import radical.pilot        as rp
+import radical.pilot.states as rps
+
+from radical.pilot.utils import WireCodec, WirePutter, wire_expand
+from radical.pilot.utils import TaskStore, TaskStorePutter
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def make_things(kind, n_things):
+
+    things = list()
+    for i in range(n_things):
+
+        uid = 'task.%06d' % i
+
+        if kind == 'updates':
+            things.append({'uid'  : uid,
+                           'type' : 'task',
+                           'state': rps.AGENT_EXECUTING})
+            continue
+
+        td = rp.TaskDescription({'uid'        : uid,
+                                 'executable' : '/bin/sleep',
+                                 'arguments'  : ['%d' % (i % 10)],
+                                 'ranks'      : 1,
+                                 'environment': {'OMP_NUM_THREADS': '1'},
+                                 'pre_exec'   : ['module load gcc'],
+                                 'metadata'   : {'idx': i}})
+        if kind == 'large':
+            td.arguments   = ['--input=data.%04d.dat' % j for j in range(1000)]
+            td.environment = {'VAR_%03d' % j: 'value_%03d' % j
+                                                         for j in range(200)}
+        sbox = 'file://localhost/scratch/rp.session.0000/pilot.0000/'
+        things.append({'uid'             : uid,
+                       'type'            : 'task',
+                       'state'           : rps.AGENT_SCHEDULING_PENDING,
+                       'target_state'    : None,
+                       'tmgr'            : 'tmgr.0000',
+                       'pilot'           : 'pilot.0000',
+                       'name'            : None,
+                       'origin'          : 'client',
+                       'exit_code'       : None,
+                       'stdout'          : None,
+                       'stderr'          : None,
+                       'return_value'    : None,
+                       'exception'       : None,
+                       'endpoint_fs'     : 'file://localhost/',
+                       'resource_sandbox': 'file://localhost/scratch/',
+                       'session_sandbox' : sbox[:-11],
+                       'pilot_sandbox'   : sbox,
+                       'task_sandbox'    : '%s%s/' % (sbox, uid),
+                       'client_sandbox'  : '/home/user/',
+                       'control'         : 'agent',
+                       'description'     : td.as_dict()})
+    return things
+
+
+# ------------------------------------------------------------------------------
+#
+def run_bridge(path, addrs, term):
+
+    bridge = ru.zmq.Queue(cfg={'channel'  : 'bench_queue',
+                               'uid'      : 'bench_queue',
+                               'path'     : path,
+                               'log_level': 'error'})
+    bridge.start()
+
+    addrs.put([str(bridge.addr_put), str(bridge.addr_get)])
+    term.wait()
+
+
+# ------------------------------------------------------------------------------
+#
+def run_producer(path, addr, things, bulk_size, codec, compress, store,
+                 start):
+
+    putter = ru.zmq.Putter('bench_queue', url=addr, path=path)
+
+    if codec:
+        putter = WirePutter(putter, WireCodec(codec, compress=compress))
+
+    if store:
+        store  = TaskStore('bench', _Log())
+        putter = TaskStorePutter(putter, store)
+        things = store.load(store.strip(things))
+
+    start.wait()
+    for idx in range(0, len(things), bulk_size):
+        putter.put(things[idx:idx + bulk_size])
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    args      = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    opts      = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:]
+                                                   if arg.startswith('--'))
+    kind      = args[0]      if len(args) > 0 else 'tasks'
+    n_things  = int(args[1]) if len(args) > 1 else 10000
+    bulk_size = int(args[2]) if len(args) > 2 else 1024
+    codec     = opts.get('codec')
+    compress  = opts.get('compress')
+    store     = 'store' in opts
+
+    things = make_things(kind, n_things)
+
+    # size of one bulk on the wire
+    bulk = things[:bulk_size]
+    if store:
+        bulk = [dict(thing, description=None) for thing in bulk]
+    if codec:
+        size = len(msgpack.packb([WireCodec(codec, compress)
+                                                  .encode(bulk)]))
+    else:
+        size = len(msgpack.packb(bulk))
+
+    path  = tempfile.mkdtemp()
+    addrs = mp.Queue()
+    term  = mp.Event()
+    start = mp.Event()
+
+    bridge = mp.Process(target=run_bridge, args=(path, addrs, term))
+    bridge.daemon = True
+    bridge.start()
+
+    try:
+        addr_put, addr_get = addrs.get(timeout=30)
+
+        producer = mp.Process(target=run_producer,
+                              args=(path, addr_put, things, bulk_size,
+                                    codec, compress, store, start))
+        producer.daemon = True
+        producer.start()
+
+        getter = ru.zmq.Getter('bench_queue', url=addr_get, path=path)
+        loader = TaskStore('bench', _Log())
+        time.sleep(5 if store else 1)
+
+        n_recv = 0
+        start.set()
+        t_0 = time.time()
+        while n_recv < n_things:
+            msgs = getter.get_nowait(100)
+            if msgs:
+                msgs = wire_expand(ru.as_list(msgs))
+                if store:
+                    loader.load(msgs)
+                n_recv += len(msgs)
+        t_1 = time.time()
+
+        producer.join()
+
+    finally:
+        term.set()
+        bridge.join(timeout=5)
+        shutil.rmtree(path)
+        TaskStore('bench', _Log()).cleanup()
+
+    ttc = t_1 - t_0
+
+    print('things         : %8d %s' % (n_things, kind))
+    print('codec          : %s' % (codec or 'none'))
+    print('compress       : %s' % (compress or 'none'))
+    print('task store     : %s' % ('yes' if store else 'no'))
+    print('bulk bytes     : %8d (%d things)' % (size, len(bulk)))
+    print('time           : %8.3f s' % ttc)
+    print('rate           : %8.0f things/s' % (n_things / ttc))
+
+
+# ------------------------------------------------------------------------------
+
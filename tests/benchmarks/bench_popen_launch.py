@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+'''
+Measure the task launch rate of the `Popen` executor: the number of tasks per
+second which get from `AGENT_EXECUTING_PENDING` (i.e., being passed to
+`work()`) to `task_run_ok` (i.e., their launch script process got spawned).
+Tasks are passed to the executor in bulks, as the executing component receives
+them from the scheduler.
+
+The bulk launch path (scripts written for the whole bulk, processes created via
+`posix_spawn`) is compared to launching the tasks one by one via
+`subprocess.Popen` (`--serial`), as the executor used to do.  The agent's
+memory footprint can be inflated (`--rss=<MB>`) to show how process creation
+depends on it.  The script fragment cache can be disabled (`--cache=0`).
+With `--node-agent`, tasks are launched by a node agent on the local host,
+which takes process creation off the executor.
+
+The launched tasks compete with the executor for CPU, so on hosts with few
+cores the launch rate is limited by the tasks themselves.  The executor's CPU
+time per task (until all tasks are reported as completed) is thus reported as
+well: it bounds the launch rate on a host with spare cores.
+
+usage: bench_popen_launch.py [n_tasks] [bulk_size] [--serial] [--rss=<MB>]
+                             [--cache=<n>] [--node-agent]
+'''
+
+import os
+import sys
+import time
+import queue
+import select
+import shutil
+import tempfile
+import collections
+
+import threading as mt
+
+from unittest import mock
+
+import radical.pilot.states as rps
+
+from radical.pilot.agent.executing.popen    import Popen
+from radical.pilot.agent.launch_method.fork import Fork
+from radical.pilot.utils                    import CancelRegistry
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+class _Prof(_Log):
+
+    enabled = False
+
+    def __init__(self):
+        self.run_ok = dict()
+
+    def prof(self, event, uid=None, **kwargs):
+        if event == 'task_run_ok':
+            self.run_ok[uid] = time.time()
+
+
+# ------------------------------------------------------------------------------
+#
+def create_executor(pwd, cache_size):
+
+    launcher = Fork.__new__(Fork)
+    launcher.name    = 'FORK'
+    launcher._env_sh = 'env.sh'
+
+    pex = Popen.__new__(Popen)
+    pex._log                = _Log()
+    pex._prof               = _Prof()
+    pex._rm                 = mock.Mock()
+    pex._rm.find_launcher.return_value = launcher
+    pex._cancel_lock        = mt.RLock()
+    pex._cancel_list        = CancelRegistry()
+    pex._task_usage         = False
+    pex._cgroups            = None
+    pex._cgroup_path        = dict()
+    pex._tasks_to_watch     = dict()
+    pex._uids_to_watch      = dict()
+    pex._watch_queue        = queue.Queue()
+    pex._watch_timeout      = 0.1
+    pex._pidfds             = dict()
+    pex._epoll              = None
+    pex._epoll_lock         = mt.Lock()
+    pex._script_cache       = collections.OrderedDict()
+    pex._script_cache_size  = cache_size
+    pex._script_hits        = 0
+    pex._script_misses      = 0
+    pex._node_agents        = dict()
+    pex._node_agent_lms     = ['FORK']
+    pex._na_lock            = mt.Lock()
+    pex._na_tasks           = dict()
+    pex._na_launch          = dict()
+    pex._term               = mt.Event()
+    pex._pwd                = pwd
+    pex._pid                = 'pilot.0000'
+    pex.sid                 = 'session.0000'
+    pex.resource            = 'local.localhost'
+    pex.rsbox               = pwd
+    pex.ssbox               = pwd
+    pex.psbox               = pwd
+    pex.gtod                = 'true'
+    pex.prof                = 'true'
+
+    pex._wake_r, pex._wake_w = os.pipe()
+
+    os.set_blocking(pex._wake_r, False)
+    os.set_blocking(pex._wake_w, False)
+
+    if hasattr(os, 'pidfd_open'):
+        pex._epoll = select.epoll()
+        pex._epoll.register(pex._wake_r, select.EPOLLIN)
+
+    pex._n_done = 0
+
+    def advance(tasks, state, *args, **kwargs):
+        if state == rps.AGENT_STAGING_OUTPUT_PENDING:
+            pex._n_done += len(tasks)
+
+    pex.advance = advance
+    pex.publish = lambda *args, **kwargs: None
+
+    with open('%s/env.sh' % pwd, 'w') as fout:
+        fout.write('\n')
+
+    return pex
+
+
+# ------------------------------------------------------------------------------
+#
+def create_task(pwd, uid):
+
+    return {'uid'              : uid,
+            'task_sandbox_path': '%s/%s' % (pwd, uid),
+            'slots'            : {'ranks': [{'node_name': 'localhost',
+                                             'node_id'  : 'localhost',
+                                             'core_map' : [[0]],
+                                             'gpu_map'  : [],
+                                             'lfs'      : 0,
+                                             'mem'      : 0}]},
+            'description'      : {'executable' : '/bin/true',
+                                  'arguments'  : [],
+                                  'environment': {},
+                                  'named_env'  : '',
+                                  'pre_launch' : [],
+                                  'post_launch': [],
+                                  'pre_exec'   : [],
+                                  'post_exec'  : [],
+                                  'pre_rank'   : [],
+                                  'post_rank'  : [],
+                                  'stdout'     : None,
+                                  'stderr'     : None,
+                                  'ranks'      : 1}}
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_tasks, bulk_size, serial, cache_size, node_agent):
+
+    pwd   = tempfile.mkdtemp(prefix='bench_popen_launch.')
+    pex   = create_executor(pwd, cache_size)
+    tasks = [create_task(pwd, 'task.%06d' % i) for i in range(n_tasks)]
+    bulks = [tasks[i:i + bulk_size] for i in range(0, n_tasks, bulk_size)]
+    start = dict()
+
+    if node_agent:
+        pex._cfg = {'node_agent_timeout': 60.0}
+        pex._rm.info.node_list = [{'node_name': 'localhost',
+                                   'node_id'  : 'localhost'}]
+        pex._start_node_agents()
+        assert pex._node_agents, 'node agent did not start'
+
+    watcher = mt.Thread(target=pex._watch)
+    watcher.daemon = True
+    watcher.start()
+
+    try:
+        t_0 = time.time()
+        cpu = time.process_time()
+        for bulk in bulks:
+
+            now = time.time()
+            for task in bulk:
+                start[task['uid']] = now
+
+            if serial:
+                # hide `posix_spawn` to get the `subprocess.Popen` code path
+                with mock.patch.dict(os.__dict__):
+                    del os.__dict__['posix_spawn']
+                    for task in bulk:
+                        pex._handle_task(task)
+            else:
+                pex.work(bulk)
+
+        while pex._n_done < n_tasks:
+            time.sleep(0.01)
+
+        cpu    = time.process_time() - cpu
+        run_ok = pex._prof.run_ok
+        t_1    = max(run_ok.values())
+
+        assert len(run_ok) == n_tasks, 'only %d tasks launched' % len(run_ok)
+
+        latency = sorted(run_ok[uid] - start[uid] for uid in run_ok)
+
+        return (n_tasks / (t_1 - t_0),
+                cpu / n_tasks,
+                sum(latency) / n_tasks,
+                latency[int(n_tasks * 0.99)])
+
+    finally:
+        pex.finalize()
+        pex._term.set()
+        watcher.join()
+        shutil.rmtree(pwd)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    args      = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    opts      = [arg for arg in sys.argv[1:] if     arg.startswith('-')]
+    serial    = '--serial'     in opts
+    node_ag   = '--node-agent' in opts
+    rss       = [int(opt.split('=')[1]) for opt in opts
+                                        if  opt.startswith('--rss=')]
+    cache     = [int(opt.split('=')[1]) for opt in opts
+                                        if  opt.startswith('--cache=')]
+    n_tasks   = int(args[0]) if len(args) > 0 else 2000
+    bulk_size = int(args[1]) if len(args) > 1 else 100
+
+    if not serial and not hasattr(os, 'posix_spawn'):
+        print('posix_spawn not supported - use --serial')
+        sys.exit(1)
+
+    # touch the pages, so that they count
+    ballast = bytearray(b'x' * (rss[0] * 1024 * 1024)) if rss else None
+
+    rate, cpu, mean, p99 = run(n_tasks, bulk_size, serial,
+                                 cache[0] if cache else 1024, node_ag)
+
+    print('launch path   : %s' % ('serial'     if serial  else
+                                  'node agent' if node_ag else 'bulk'))
+    print('agent ballast : %8d MB' % (rss[0] if rss else 0))
+    print('tasks         : %8d' % n_tasks)
+    print('bulk size     : %8d' % bulk_size)
+    print('script cache  : %8d' % (cache[0] if cache else 1024))
+    print('launch rate   : %8.0f tasks/s' % rate)
+    print('cpu per task  : %8.2f ms' % (cpu  * 1e3))
+    print('max rate      : %8.0f tasks/s (executor cpu bound)' % (1 / cpu))
+    print('mean latency  : %8.2f ms' % (mean * 1e3))
+    print('p99  latency  : %8.2f ms' % (p99  * 1e3))
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+'''
+Measure how fast the `Popen` executor's watcher thread detects the completion
+of task processes, and how much CPU time it uses for that.  A number of long
+running processes is started and watched, to mimic a pilot with many
+concurrent tasks.  Then short processes are started one by one, and the time
+between each process' exit and its completion being reported by the watcher is
+recorded.
+
+The watcher either uses pidfds (where available), or polls all running
+processes (`--poll`).
+
+usage: bench_popen_watch.py [n_running] [n_short] [--poll]
+'''
+
+import os
+import sys
+import time
+import queue
+import select
+import signal
+import subprocess
+
+import threading as mt
+
+from radical.pilot.agent.executing.popen import Popen
+from radical.pilot.utils                 import CancelRegistry
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def create_executor(poll, done):
+
+    pex = Popen.__new__(Popen)
+    pex._log             = _Log()
+    pex._prof            = _Log()
+    pex._term            = mt.Event()
+    pex._cancel_lock     = mt.RLock()
+    pex._cancel_list     = CancelRegistry()
+    pex._task_usage      = False
+    pex._cgroups         = None
+    pex._cgroup_path     = dict()
+    pex._tasks_to_watch  = dict()
+    pex._uids_to_watch   = dict()
+    pex._watch_queue     = queue.Queue()
+    pex._watch_timeout   = 0.1
+    pex._pidfds          = dict()
+    pex._epoll           = None
+    pex._epoll_lock      = mt.Lock()
+    pex._wake_r, pex._wake_w = os.pipe()
+
+    os.set_blocking(pex._wake_r, False)
+    os.set_blocking(pex._wake_w, False)
+
+    if not poll:
+        pex._epoll = select.epoll()
+        pex._epoll.register(pex._wake_r, select.EPOLLIN)
+
+    def advance(tasks, *args, **kwargs):
+        now = time.time()
+        for task in tasks:
+            done.put([task['uid'], now])
+
+    pex.publish = lambda *args, **kwargs: None
+    pex.advance = advance
+
+    return pex
+
+
+# ------------------------------------------------------------------------------
+#
+def watch(pex, uid, cmd, pass_fds=()):
+    '''
+    start a process and pass it to the watcher, as `Popen._handle_task` does
+    '''
+
+    task = {'uid' : uid,
+            'proc': subprocess.Popen(cmd, start_new_session=True,
+                                     pass_fds=pass_fds)}
+    pid  = task['proc'].pid
+
+    pex._uids_to_watch[uid] = pid
+    pex._watch_queue.put(task)
+
+    if pex._epoll:
+        pidfd = os.pidfd_open(pid)
+        pex._pidfds[pidfd] = pid
+        pex._epoll.register(pidfd, select.EPOLLIN)
+    else:
+        pex._wake()
+
+    return task
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_running, n_short, poll):
+
+    done = queue.Queue()
+    pex  = create_executor(poll, done)
+
+    watcher = mt.Thread(target=pex._watch)
+    watcher.daemon = True
+    watcher.start()
+
+    running = [watch(pex, 'long.%06d' % i, ['sleep', '3600']) for i in
+               range(n_running)]
+
+    latency = list()
+    cpu_0   = time.process_time()
+
+    for i in range(n_short):
+
+        # the process writes its exit time to a pipe
+        rfd, wfd = os.pipe()
+        watch(pex, 'short.%06d' % i,
+              [sys.executable, '-c',
+               'import os, time; os.write(%d, b"%%f" %% time.time()); '
+               'os._exit(0)' % wfd], pass_fds=(wfd,))
+        os.close(wfd)
+
+        t_exit = float(os.read(rfd, 64))
+        os.close(rfd)
+
+        _, t_done = done.get()
+        latency.append(t_done - t_exit)
+
+    cpu = time.process_time() - cpu_0
+
+    pex._term.set()
+    for task in running:
+        os.killpg(task['proc'].pid, signal.SIGKILL)
+        task['proc'].wait()
+    watcher.join()
+
+    latency.sort()
+    return (sum(latency) / len(latency),
+            latency[int(len(latency) * 0.99)],
+            cpu / n_short)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    args      = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    poll      = '--poll' in sys.argv
+    n_running = int(args[0]) if len(args) > 0 else 2000
+    n_short   = int(args[1]) if len(args) > 1 else 100
+
+    if not poll and not hasattr(os, 'pidfd_open'):
+        print('pidfds not supported - use --poll')
+        sys.exit(1)
+
+    mean, p99, cpu = run(n_running, n_short, poll)
+
+    print('watcher       : %s' % ('poll' if poll else 'pidfd'))
+    print('running tasks : %8d' % n_running)
+    print('short tasks   : %8d' % n_short)
+    print('mean latency  : %8.2f ms' % (mean * 1e3))
+    print('p99  latency  : %8.2f ms' % (p99  * 1e3))
+    print('cpu per task  : %8.2f ms' % (cpu  * 1e3))
+
+
+# ------------------------------------------------------------------------------
+
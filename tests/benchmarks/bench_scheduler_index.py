@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+'''
+Measure the per-task cost of `Continuous.schedule_task` with and without the
+resource index, for increasing node counts.  The pilot is first filled
+completely with single-core tasks, then a stream of tasks is scheduled while
+random running tasks are released, so that the scheduler always operates on
+a full pilot and needs to find the one node with a free core.
+
+usage: bench_scheduler_index.py [n_tasks] [cores_per_node]
+'''
+
+import sys
+import time
+import random
+
+from unittest import mock
+
+import radical.pilot.constants as rpc
+
+from radical.pilot.agent.resource_manager     import RMInfo
+from radical.pilot.agent.scheduler.continuous import Continuous
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def create_scheduler(n_nodes, cpn, gpn, indexed):
+
+    sched = Continuous.__new__(Continuous)
+    sched._uid          = 'agent_scheduling.0000'
+    sched._log          = _Log()
+    sched._rm           = mock.Mock()
+    sched._rm.info      = RMInfo({'cores_per_node': cpn,
+                                  'gpus_per_node' : gpn,
+                                  'lfs_per_node'  : 0,
+                                  'mem_per_node'  : 0})
+    sched._colo_history = dict()
+    sched._tagged_nodes = set()
+    sched._scattered    = False
+    sched._domains      = None
+    sched._node_offset  = 0
+    sched._partitions   = dict()
+    sched.nodes         = [{'node_name': 'node.%06d' % i,
+                            'node_id'  : 'node.%06d' % i,
+                            'cores'    : [rpc.FREE] * cpn,
+                            'gpus'     : [rpc.FREE] * gpn,
+                            'lfs'      : 0,
+                            'mem'      : 0} for i in range(n_nodes)]
+    sched._index_nodes()
+
+    if not indexed:
+        sched._index = None
+
+    return sched
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_nodes, cpn, n_tasks, indexed):
+
+    sched   = create_scheduler(n_nodes, cpn, 0, indexed)
+    rng     = random.Random(n_nodes)
+    running = list()
+    td      = {'ranks'         : 1,
+               'cores_per_rank': 1,
+               'gpus_per_rank' : 0,
+               'lfs_per_rank'  : 0,
+               'mem_per_rank'  : 0,
+               'tags'          : {}}
+
+    # fill the pilot completely - every new task then needs to find the node
+    # which just got a core released
+    for i in range(n_nodes * cpn):
+        slots = sched.schedule_task({'uid': 'fill.%d' % i, 'description': td})
+        sched._change_slot_states(slots, rpc.BUSY)
+        running.append(slots)
+
+    # steady state: one task out, one task in
+    t_sched = 0.0
+    for i in range(n_tasks):
+
+        slots = running.pop(rng.randrange(len(running)))
+        sched._change_slot_states(slots, rpc.FREE)
+
+        start = time.time()
+        slots = sched.schedule_task({'uid': 'task.%d' % i, 'description': td})
+        t_sched += time.time() - start
+
+        assert slots
+        sched._change_slot_states(slots, rpc.BUSY)
+        running.append(slots)
+
+    return t_sched / n_tasks
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    n_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    cpn     = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    print('%8s  %14s  %14s' % ('nodes', 'scan [us/task]', 'index [us/task]'))
+    for n_nodes in [128, 256, 512, 1024, 2048, 4096]:
+        t_scan  = run(n_nodes, cpn, n_tasks, indexed=False)
+        t_index = run(n_nodes, cpn, n_tasks, indexed=True)
+        print('%8d  %14.1f  %14.1f' % (n_nodes, t_scan * 1e6, t_index * 1e6))
+
+
+# ------------------------------------------------------------------------------
+
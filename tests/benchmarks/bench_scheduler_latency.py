@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+'''
+Measure the scheduling latency of short tasks: the time between a task being
+passed to the agent scheduler and the task being scheduled.  A `Continuous`
+scheduler loop and a `Sleep` executor run in this process, connected as in
+the agent: the scheduler passes scheduled tasks to the executor, and the
+executor publishes completed tasks back to the scheduler.  Tasks are
+submitted in small bulks at a fixed rate, and the pilot is small enough that
+most tasks need to wait for resources freed by completed tasks.
+
+usage: bench_scheduler_latency.py [n_tasks] [runtime] [batch_window]
+'''
+
+import sys
+import time
+
+import threading        as mt
+import multiprocessing  as mp
+
+from unittest import mock
+
+import radical.pilot.states    as rps
+import radical.pilot.constants as rpc
+
+from radical.pilot.agent.resource_manager     import RMInfo
+from radical.pilot.agent.scheduler.continuous import Continuous
+from radical.pilot.agent.scheduler.ordering   import Ordering
+from radical.pilot.agent.scheduler.waitpool   import WaitPool
+from radical.pilot.agent.executing.sleep      import Sleep
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def create_executor(delay):
+
+    executor = Sleep.__new__(Sleep)
+    executor._log        = _Log()
+    executor._prof       = _Log()
+    executor._terminate  = mt.Event()
+    executor._tasks_lock = mt.RLock()
+    executor._tasks      = list()
+    executor._delay      = delay
+    executor.advance     = lambda *args, **kwargs: None
+
+    return executor
+
+
+# ------------------------------------------------------------------------------
+#
+def create_scheduler(n_nodes, cpn, batch_window):
+
+    sched = Continuous.__new__(Continuous)
+    sched._uid           = 'agent_scheduling.0000'
+    sched._log           = _Log()
+    sched._prof          = _Log()
+    sched._rm            = mock.Mock()
+    sched._rm.info       = RMInfo({'cores_per_node': cpn,
+                                   'gpus_per_node' : 0,
+                                   'lfs_per_node'  : 0,
+                                   'mem_per_node'  : 0})
+    sched._colo_history  = dict()
+    sched._tagged_nodes  = set()
+    sched._scattered     = False
+    sched._domains       = None
+    sched._node_offset   = 0
+    sched._partitions    = dict()
+    sched._ts_reuse      = False
+    sched._backfill      = None
+    sched._shards        = None
+    sched._active_cnt    = 0
+    sched._named_envs    = list()
+    sched._queue_sched   = mp.SimpleQueue()
+    sched._queue_unsched = mp.SimpleQueue()
+    sched._wakeup        = mp.Event()
+    sched._term          = mp.Event()
+    sched._idle_timeout  = 1.0
+    sched._batch_window  = batch_window
+    sched.nodes          = [{'node_name': 'node.%06d' % i,
+                             'node_id'  : 'node.%06d' % i,
+                             'cores'    : [rpc.FREE] * cpn,
+                             'gpus'     : list(),
+                             'lfs'      : 0,
+                             'mem'      : 0} for i in range(n_nodes)]
+    sched._index_nodes()
+    sched._ordering      = Ordering.create('largest_first', sched.nodes)
+    sched._waitpool      = WaitPool(sched._ordering)
+
+    sched.register_subscriber = lambda *args, **kwargs: None
+    sched.register_output     = lambda *args, **kwargs: None
+    sched.register_publisher  = lambda *args, **kwargs: None
+
+    return sched
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_tasks, runtime, batch_window, n_nodes=4, cpn=8, bulk=8, rate=1000):
+
+    sched    = create_scheduler(n_nodes, cpn, batch_window)
+    executor = create_executor(delay=0.001)
+    latency  = dict()
+    done     = mt.Event()
+
+    def sched_advance(tasks, state, publish, push):
+        if state != rps.AGENT_EXECUTING_PENDING:
+            return
+        if not isinstance(tasks, list):
+            tasks = [tasks]
+        now = time.time()
+        for task in tasks:
+            latency[task['uid']] = now - task['t_submit']
+        executor.work(tasks)
+        if len(latency) == n_tasks:
+            done.set()
+
+    sched.advance    = sched_advance
+    executor.publish = sched.unschedule_cb
+
+    threads = [mt.Thread(target=sched._schedule_tasks),
+               mt.Thread(target=executor._timed)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    td = {'ranks'         : 1,
+          'cores_per_rank': 1,
+          'gpus_per_rank' : 0,
+          'lfs_per_rank'  : 0,
+          'mem_per_rank'  : 0,
+          'tags'          : {},
+          'arguments'     : [runtime]}
+
+    start = time.time()
+    for i in range(0, n_tasks, bulk):
+        now   = time.time()
+        tasks = [{'uid'        : 'task.%06d' % j,
+                  'description': td,
+                  't_submit'   : now} for j in range(i, min(i + bulk, n_tasks))]
+        sched.work(tasks)
+        time.sleep(max(0, start + (i + bulk) / rate - time.time()))
+
+    done.wait()
+    ttc = time.time() - start
+
+    sched._term.set()
+    sched._wakeup.set()
+    executor._terminate.set()
+    for thread in threads:
+        thread.join()
+
+    values = sorted(latency.values())
+    return (sum(values) / len(values),
+            values[len(values) // 2],
+            values[int(len(values) * 0.99)],
+            ttc)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    n_tasks = int  (sys.argv[1]) if len(sys.argv) > 1 else 2000
+    runtime = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    windows = [float(sys.argv[3])] if len(sys.argv) > 3 else [0.0, 0.001, 0.01]
+
+    print('%8s  %10s  %10s  %10s  %8s'
+          % ('window', 'mean [ms]', 'p50 [ms]', 'p99 [ms]', 'ttc [s]'))
+    for window in windows:
+        mean, p50, p99, ttc = run(n_tasks, runtime, window)
+        print('%8.3f  %10.2f  %10.2f  %10.2f  %8.2f'
+              % (window, mean * 1e3, p50 * 1e3, p99 * 1e3, ttc))
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+'''
+Compare memory use and latency of the list based and the compact (`bytearray`
+based) node state representation of the agent scheduler, on a synthetic pilot
+of 10k nodes with 128 cores each.
+
+usage: bench_scheduler_nodes.py [n_nodes] [cores_per_node] [n_tasks]
+'''
+
+import sys
+import time
+import random
+import tracemalloc
+
+from unittest import mock
+
+import radical.pilot.constants as rpc
+
+from radical.pilot.agent.resource_manager     import RMInfo
+from radical.pilot.agent.scheduler.continuous import Continuous
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def create_scheduler(n_nodes, cpn, compact):
+
+    sched = Continuous.__new__(Continuous)
+    sched._uid          = 'agent_scheduling.0000'
+    sched._log          = _Log()
+    sched._rm           = mock.Mock()
+    sched._rm.info      = RMInfo({'cores_per_node': cpn,
+                                  'gpus_per_node' : 0,
+                                  'lfs_per_node'  : 0,
+                                  'mem_per_node'  : 0})
+    sched._colo_history = dict()
+    sched._tagged_nodes = set()
+    sched._scattered    = False
+    sched._domains      = None
+    sched._node_offset  = 0
+    sched._partitions   = dict()
+
+    tracemalloc.start()
+    sched.nodes = [{'node_name': 'node.%06d' % i,
+                    'node_id'  : 'node.%06d' % i,
+                    'cores'    : [rpc.FREE] * cpn,
+                    'gpus'     : list(),
+                    'lfs'      : 0,
+                    'mem'      : 0} for i in range(n_nodes)]
+    if compact:
+        sched._compact_nodes()
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    sched._index_nodes()
+
+    return sched, mem
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_nodes, cpn, n_tasks, compact):
+
+    sched, mem = create_scheduler(n_nodes, cpn, compact)
+    rng        = random.Random(n_nodes)
+
+    # fragment the node states: mark a random half of all cores as busy
+    for node in sched.nodes:
+        for idx in rng.sample(range(cpn), cpn // 2):
+            node['cores'][idx] = rpc.BUSY
+    sched._index_nodes()
+
+    # free core count over all nodes
+    start = time.time()
+    for node in sched.nodes:
+        node['cores'].count(rpc.FREE)
+    t_count = (time.time() - start) / n_nodes
+
+    # first-fit search for a large request on each node
+    start = time.time()
+    for node in sched.nodes:
+        sched._find_resources(node, find_slots=1, cores_per_slot=cpn // 4,
+                              gpus_per_slot=0, lfs_per_slot=0, mem_per_slot=0,
+                              partial=False)
+    t_find = (time.time() - start) / n_nodes
+
+    # schedule and allocate tasks
+    td = {'ranks'         : 1,
+          'cores_per_rank': 8,
+          'gpus_per_rank' : 0,
+          'lfs_per_rank'  : 0,
+          'mem_per_rank'  : 0,
+          'tags'          : {}}
+
+    start = time.time()
+    for i in range(n_tasks):
+        slots = sched.schedule_task({'uid': 'task.%d' % i, 'description': td})
+        sched._change_slot_states(slots, rpc.BUSY)
+    t_alloc = (time.time() - start) / n_tasks
+
+    return mem, t_count, t_find, t_alloc
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 10 * 1024
+    cpn     = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    n_tasks = int(sys.argv[3]) if len(sys.argv) > 3 else 10 * 1024
+
+    print('%d nodes x %d cores, %d tasks' % (n_nodes, cpn, n_tasks))
+    print('%-8s  %10s  %12s  %12s  %12s' % ('backend', 'mem [MB]',
+          'count [us]', 'find [us]', 'alloc [us]'))
+
+    for compact in [False, True]:
+        mem, t_count, t_find, t_alloc = run(n_nodes, cpn, n_tasks, compact)
+        print('%-8s  %10.1f  %12.2f  %12.2f  %12.2f'
+              % ('compact' if compact else 'list', mem / 1024 / 1024,
+                 t_count * 1e6, t_find * 1e6, t_alloc * 1e6))
+
+
+# ------------------------------------------------------------------------------
+
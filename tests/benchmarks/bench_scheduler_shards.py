@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+'''
+Measure the scheduling throughput of a sharded agent scheduler.  The nodes of
+a large synthetic pilot are split into shards, and tasks are routed to the
+shards as the scheduler component does.  Each shard then places its tasks in
+a separate process, on the nodes it owns.  Tasks are released again in bulks
+whenever a shard runs out of resources, so that placement never stalls.
+
+Throughput is reported in tasks per second over the CPU time of the busiest
+shard, i.e., the throughput the shards reach when each runs on its own CPU
+core, and should scale about linearly with the number of shards.  The wall
+time of the slowest shard is reported as well, and only scales if the host has
+sufficient CPU cores.
+
+usage: bench_scheduler_shards.py [n_tasks] [n_nodes] [max_shards]
+'''
+
+import sys
+import time
+import random
+
+import multiprocessing as mp
+
+from unittest import mock
+
+import radical.pilot.constants as rpc
+
+from radical.pilot.agent.resource_manager     import RMInfo
+from radical.pilot.agent.scheduler.continuous import Continuous
+from radical.pilot.agent.scheduler.shards     import Shards
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def create_nodes(n_nodes, cpn):
+
+    return [{'node_name': 'node.%06d' % i,
+             'node_id'  : 'node.%06d' % i,
+             'cores'    : [rpc.FREE] * cpn,
+             'gpus'     : list(),
+             'lfs'      : 0,
+             'mem'      : 0} for i in range(n_nodes)]
+
+
+# ------------------------------------------------------------------------------
+#
+def create_scheduler(nodes, cpn):
+
+    sched = Continuous.__new__(Continuous)
+    sched._uid          = 'agent_scheduling.0000'
+    sched._log          = _Log()
+    sched._prof         = _Log()
+    sched._rm           = mock.Mock()
+    sched._rm.info      = RMInfo({'cores_per_node': cpn,
+                                  'gpus_per_node' : 0,
+                                  'lfs_per_node'  : 0,
+                                  'mem_per_node'  : 0})
+    sched._colo_history = dict()
+    sched._tagged_nodes = set()
+    sched._scattered    = False
+    sched._domains      = None
+    sched._node_offset  = 0
+    sched._partitions   = dict()
+    sched._backfill     = None
+    sched._shards       = None
+    sched._active_cnt   = 0
+    sched.nodes         = nodes
+    sched._index_nodes()
+
+    return sched
+
+
+# ------------------------------------------------------------------------------
+#
+def run_shard(nodes, cpn, tasks, results):
+
+    sched   = create_scheduler(nodes, cpn)
+    running = list()
+
+    start = time.time()
+    cpu   = time.process_time()
+    for task in tasks:
+
+        sched._set_tuple_size(task)
+        while not sched._try_allocation(task):
+            # release the older half of the running tasks
+            n_release = max(1, len(running) // 2)
+            sched.unschedule_tasks(running[:n_release])
+            sched._active_cnt -= n_release
+            del running[:n_release]
+
+        running.append(task)
+
+    results.put([time.time() - start, time.process_time() - cpu])
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_tasks, n_nodes, n_shards, cpn=64):
+
+    nodes  = create_nodes(n_nodes, cpn)
+    rng    = random.Random(42)
+    shapes = [[1, 1], [1, 2], [1, 4], [2, 8], [4, 16]]
+    tasks  = [{'uid'        : 'task.%06d' % i,
+               'description': {'ranks'         : ranks,
+                               'cores_per_rank': cores,
+                               'gpus_per_rank' : 0,
+                               'lfs_per_rank'  : 0,
+                               'mem_per_rank'  : 0,
+                               'tags'          : {}}}
+              for i, (ranks, cores) in enumerate(rng.choice(shapes)
+                                                 for _ in range(n_tasks))]
+
+    shards = Shards(nodes, n_shards)
+    routed = [list() for _ in range(len(shards))]
+
+    start = time.time()
+    for task in tasks:
+        routed[shards.route(task)].append(task)
+    t_route = time.time() - start
+
+    results = mp.Queue()
+    procs   = list()
+    for idx in range(len(shards)):
+        node_ids = shards.node_ids(idx)
+        s_nodes  = [node for node in nodes if node['node_id'] in node_ids]
+        procs.append(mp.Process(target=run_shard,
+                                args=(s_nodes, cpn, routed[idx], results)))
+
+    for proc in procs:
+        proc.start()
+
+    times = [results.get() for _ in procs]
+
+    for proc in procs:
+        proc.join()
+
+    return t_route, max(t[0] for t in times), max(t[1] for t in times)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    n_tasks    = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_nodes    = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    max_shards = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    print('%8s  %10s  %10s  %10s  %12s  %8s'
+          % ('shards', 'route [s]', 'wall [s]', 'cpu [s]', 'tasks/s',
+             'speedup'))
+
+    base     = None
+    n_shards = 1
+    while n_shards <= max_shards:
+        t_route, t_wall, t_cpu = run(n_tasks, n_nodes, n_shards)
+        rate = n_tasks / t_cpu
+        base = base or rate
+        print('%8d  %10.2f  %10.2f  %10.2f  %12.0f  %8.2f'
+              % (n_shards, t_route, t_wall, t_cpu, rate, rate / base))
+        n_shards *= 2
+
+
+# ------------------------------------------------------------------------------
+
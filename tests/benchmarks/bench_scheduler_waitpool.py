@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+'''
+Measure the cost of scheduling passes over a large waitpool.  The pilot is
+filled with tasks, and a large number of tasks of a few different shapes is
+left waiting.  Then running tasks are released one at a time, each followed by
+a waitpool scheduling pass, as the agent scheduler does when tasks complete.
+To sustain a given release rate, the average pass needs to be shorter than
+the interval between releases.
+
+usage: bench_scheduler_waitpool.py [n_waiting] [n_releases] [rate]
+'''
+
+import sys
+import time
+import random
+
+from unittest import mock
+
+import radical.pilot.constants as rpc
+
+from radical.pilot.agent.resource_manager     import RMInfo
+from radical.pilot.agent.scheduler.continuous import Continuous
+from radical.pilot.agent.scheduler.ordering   import Ordering
+from radical.pilot.agent.scheduler.waitpool   import WaitPool
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def create_scheduler(n_nodes, cpn, gpn):
+
+    sched = Continuous.__new__(Continuous)
+    sched._uid          = 'agent_scheduling.0000'
+    sched._log          = _Log()
+    sched._prof         = _Log()
+    sched._rm           = mock.Mock()
+    sched._rm.info      = RMInfo({'cores_per_node': cpn,
+                                  'gpus_per_node' : gpn,
+                                  'lfs_per_node'  : 0,
+                                  'mem_per_node'  : 0})
+    sched._colo_history = dict()
+    sched._tagged_nodes = set()
+    sched._scattered    = False
+    sched._domains      = None
+    sched._node_offset  = 0
+    sched._partitions   = dict()
+    sched._ts_reuse     = False
+    sched._backfill     = None
+    sched._shards       = None
+    sched._active_cnt   = 0
+    sched._named_envs   = list()
+    sched.nodes         = [{'node_name': 'node.%06d' % i,
+                            'node_id'  : 'node.%06d' % i,
+                            'cores'    : [rpc.FREE] * cpn,
+                            'gpus'     : [rpc.FREE] * gpn,
+                            'lfs'      : 0,
+                            'mem'      : 0} for i in range(n_nodes)]
+    sched._index_nodes()
+    sched._ordering     = Ordering.create('largest_first', sched.nodes)
+    sched._waitpool     = WaitPool(sched._ordering)
+
+    return sched
+
+
+# ------------------------------------------------------------------------------
+#
+def create_task(sched, uid, ranks, cores, gpus):
+
+    task = {'uid'        : uid,
+            'description': {'ranks'         : ranks,
+                            'cores_per_rank': cores,
+                            'gpus_per_rank' : gpus,
+                            'lfs_per_rank'  : 0,
+                            'mem_per_rank'  : 0,
+                            'tags'          : {}}}
+    sched._set_tuple_size(task)
+
+    return task
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_waiting, n_releases, n_nodes=256, cpn=64, gpn=4):
+
+    sched   = create_scheduler(n_nodes, cpn, gpn)
+    rng     = random.Random(42)
+    shapes  = [[1, 1, 0], [1, 4, 0], [1, 8, 1], [4, 16, 0], [2, 32, 2]]
+    running = list()
+    placed  = list()
+
+    sched.advance = lambda tasks, *args, **kwargs: placed.extend(tasks)
+
+    # fill the pilot
+    idx = 0
+    while True:
+        task = create_task(sched, 'fill.%d' % idx, *rng.choice(shapes))
+        idx += 1
+        if not sched._try_allocation(task):
+            break
+        running.append(task)
+
+    # the rest waits
+    sched._waitpool.add([create_task(sched, 'task.%d' % i, *rng.choice(shapes))
+                         for i in range(n_waiting)])
+
+    t_pass = 0.0
+    for _ in range(n_releases):
+
+        task = running.pop(rng.randrange(len(running)))
+        sched._active_cnt -= 1
+        sched.unschedule_tasks([task])
+
+        del placed[:]
+        start = time.time()
+        sched._schedule_waitpool()
+        t_pass += time.time() - start
+
+        running.extend(placed)
+
+    return t_pass / n_releases, len(sched._waitpool)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    n_waiting  = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_releases = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rate       = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    t_pass, n_left = run(n_waiting, n_releases)
+
+    print('waiting tasks : %8d' % n_waiting)
+    print('releases      : %8d' % n_releases)
+    print('still waiting : %8d' % n_left)
+    print('time per pass : %8.1f us' % (t_pass * 1e6))
+    print('max rate      : %8.0f releases/s (target: %d/s, %s)'
+          % (1 / t_pass, rate, 'ok' if 1 / t_pass >= rate else 'too slow'))
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+'''
+Measure how fast the agent's output staging component collects the stdout and
+stderr tails (and profiles) of a bulk of tasks.  Each task has a stdout and
+stderr file of the given size.
+
+The collection via `rpu.tail_file` on a thread pool (`--workers=<n>`) is
+compared to reading the full files one after the other, as the component used
+to do (`--full`).
+
+usage: bench_stageout_stdio.py [n_tasks] [size_kb] [--workers=<n>] [--full]
+'''
+
+import sys
+import time
+import shutil
+import tempfile
+
+import concurrent.futures as cf
+
+import radical.pilot.utils as rpu
+
+from radical.pilot.agent.staging_output.default import Default
+
+
+# ------------------------------------------------------------------------------
+#
+class _Log(object):
+
+    enabled = True
+
+    # mock loggers record all calls, which distorts timings
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# ------------------------------------------------------------------------------
+#
+def read_full(task):
+    '''
+    the former implementation: read all files, scan stderr a second time
+    '''
+
+    with open(task['stdout_file'], 'r') as fin:
+        task['stdout'] += rpu.tail(fin.read())
+
+    with open(task['stderr_file'], 'r') as fin:
+        task['stderr'] += rpu.tail(fin.read())
+
+    with open(task['stderr_file'], 'r') as fin:
+        for line in fin.readlines():
+            line = line.strip()
+            if line and line[0] == '[' and line.endswith('EXECUTING'):
+                pass
+
+
+# ------------------------------------------------------------------------------
+#
+def run(n_tasks, size, workers, full):
+
+    pwd   = tempfile.mkdtemp(prefix='bench_stageout_stdio.')
+    line  = 'x' * 79 + '\n'
+    data  = line * (size * 1024 // len(line))
+    tasks = list()
+
+    for i in range(n_tasks):
+        uid  = 'task.%06d' % i
+        task = {'uid'              : uid,
+                'task_sandbox_path': pwd,
+                'stdout'           : '',
+                'stderr'           : '',
+                'stdout_file'      : '%s/%s.out' % (pwd, uid),
+                'stderr_file'      : '%s/%s.err' % (pwd, uid)}
+        for fname in [task['stdout_file'], task['stderr_file']]:
+            with open(fname, 'w') as fout:
+                fout.write(data)
+        tasks.append(task)
+
+    comp = Default.__new__(Default)
+    comp._log        = _Log()
+    comp._prof       = _Log()
+    comp._stdio_pool = cf.ThreadPoolExecutor(max_workers=workers)
+
+    try:
+        start = time.time()
+        if full:
+            for task in tasks:
+                read_full(task)
+        else:
+            comp._handle_stdio(tasks)
+        return time.time() - start
+
+    finally:
+        comp._stdio_pool.shutdown()
+        shutil.rmtree(pwd)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    args    = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    opts    = [arg for arg in sys.argv[1:] if     arg.startswith('-')]
+    full    = '--full' in opts
+    workers = [int(opt.split('=')[1]) for opt in opts
+                                      if  opt.startswith('--workers=')]
+    workers = workers[0] if workers else 8
+    n_tasks = int(args[0]) if len(args) > 0 else 1000
+    size    = int(args[1]) if len(args) > 1 else 256
+
+    ttc = run(n_tasks, size, workers, full)
+
+    print('stdio reader  : %s' % ('full' if full else
+                                  'tail, %d workers' % workers))
+    print('tasks         : %8d' % n_tasks)
+    print('file size     : %8d kB' % size)
+    print('time          : %8.3f s' % ttc)
+    print('rate          : %8.0f tasks/s' % (n_tasks / ttc))
+
+
+# ------------------------------------------------------------------------------
@@ -2,8 +2,11 @@
 
 import glob
 import os
+import shutil
 import tempfile
 
+import radical.utils as ru
+
 from unittest import mock, TestCase
 
 from radical.pilot                        import TaskDescription
@@ -165,6 +168,46 @@ class TestComponent(TestCase):
         with self.assertRaises(ValueError):
             agent_0._start_sub_agents()
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Agent_0, '__init__', return_value=None)
+    @mock.patch('radical.pilot.utils.TaskStore.purge')
+    def test_finalize(self, mocked_purge, mocked_init):
+
+        agent_0 = Agent_0(None, None)
+        agent_0._log          = mock.Mock()
+        agent_0._hb           = mock.Mock()
+        agent_0._cmgr         = mock.Mock()
+        agent_0._reg_service  = mock.Mock()
+        agent_0._dbs          = mock.Mock()
+        agent_0._rm           = None
+        agent_0._pid          = 'pilot.0000'
+        agent_0._final_cause  = 'timeout'
+        agent_0.stage_output  = mock.Mock()
+
+        pwd  = os.getcwd()
+        sbox = tempfile.mkdtemp()
+        os.chdir(sbox)
+
+        try:
+            # no bridge uses the task store
+            agent_0._cfg = ru.Config(from_dict={
+                            'sid'    : 'rp.session.0000',
+                            'bridges': {'state_pubsub': {'kind': 'pubsub'}}})
+            agent_0.finalize()
+            mocked_purge.assert_not_called()
+
+            # the task descriptions of all store enabled bridges are removed,
+            # even if this agent did not use the store
+            agent_0._cfg['bridges']['agent_executing_queue'] = \
+                                        {'kind': 'queue', 'task_store': True}
+            agent_0.finalize()
+            mocked_purge.assert_called_once_with('rp.session.0000')
+
+        finally:
+            os.chdir(pwd)
+            shutil.rmtree(sbox)
+
 # ------------------------------------------------------------------------------
 
 
@@ -173,6 +216,7 @@ if __name__ == '__main__':
     tc = TestComponent()
     tc.test_check_control()
     tc.test_start_sub_agents()
+    tc.test_finalize()
 
 
 # ------------------------------------------------------------------------------
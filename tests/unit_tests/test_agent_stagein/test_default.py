@@ -2,6 +2,10 @@
 
 import os
 import glob
+import shutil
+import tempfile
+
+import concurrent.futures as cf
 
 from unittest import TestCase, mock
 
@@ -75,10 +79,61 @@ class TestDefault(TestCase):
             self.assertEqual(global_state, test[1][1])
 
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Default, '__init__', return_value=None)
+    def test_create_sandboxes(self, mocked_init):
+
+        component = Default(cfg=None, session=None)
+        component._log        = mock.Mock()
+        component._mkdir_pool = cf.ThreadPoolExecutor(max_workers=4)
+        component._mkdir_dirs = set()
+
+        pwd   = tempfile.mkdtemp()
+        tasks = [{'uid'              : 'task.%04d' % i,
+                  'task_sandbox_path': '%s/%d/task.%04d/' % (pwd, i % 2, i)}
+                 for i in range(6)]
+
+        # existing sandboxes are fine, tasks w/o sandbox are ignored
+        os.makedirs(tasks[0]['task_sandbox_path'])
+        tasks.append({'uid': 'task.0006', 'task_sandbox_path': None})
+
+        # sandboxes which cannot be created are left to the executor
+        with open('%s/2' % pwd, 'w') as fout:
+            fout.write('not a dir')
+        tasks.append({'uid'              : 'task.0007',
+                      'task_sandbox_path': '%s/2/task.0007/' % pwd})
+
+        try:
+            component._create_sandboxes(tasks)
+
+            for task in tasks[:6]:
+                self.assertTrue(task['sandbox_exists'])
+                self.assertTrue(os.path.isdir(task['task_sandbox_path']))
+
+            self.assertNotIn('sandbox_exists', tasks[6])
+            self.assertNotIn('sandbox_exists', tasks[7])
+
+            # parent dirs are created once
+            self.assertEqual(component._mkdir_dirs, {'%s/0' % pwd,
+                                                     '%s/1' % pwd})
+            with mock.patch('os.makedirs') as mocked_mkdir:
+                tasks = [{'uid'              : 'task.0008',
+                          'task_sandbox_path': '%s/0/task.0008' % pwd}]
+                component._create_sandboxes(tasks)
+                mocked_mkdir.assert_not_called()
+                self.assertTrue(tasks[0]['sandbox_exists'])
+
+        finally:
+            component._mkdir_pool.shutdown()
+            shutil.rmtree(pwd)
+
+
 if __name__ == '__main__':
 
     tc = TestDefault()
     tc.test_work()
+    tc.test_create_sandboxes()
 
 
 # ------------------------------------------------------------------------------
@@ -0,0 +1,120 @@
+# pylint: disable=protected-access, no-value-for-parameter, unused-argument
+
+import shutil
+import tempfile
+
+import concurrent.futures as cf
+
+from unittest import TestCase, mock
+
+import radical.utils as ru
+
+from radical.pilot.agent.staging_output.default import Default
+
+
+# ------------------------------------------------------------------------------
+#
+class TestDefault(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def setUp(self):
+
+        self._sbox = tempfile.mkdtemp()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def tearDown(self):
+
+        shutil.rmtree(self._sbox)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _task(self, uid, stdout=None, stderr=None, prof=None):
+
+        task = {'uid'              : uid,
+                'task_sandbox_path': self._sbox,
+                'stdout'           : '',
+                'stderr'           : '',
+                'stdout_file'      : '%s/%s.out' % (self._sbox, uid),
+                'stderr_file'      : '%s/%s.err' % (self._sbox, uid)}
+
+        for fname, content in [[task['stdout_file'],               stdout],
+                               [task['stderr_file'],               stderr],
+                               ['%s/%s.prof' % (self._sbox, uid),  prof  ]]:
+            if content is not None:
+                mode = 'wb' if isinstance(content, bytes) else 'w'
+                with open(fname, mode) as fout:
+                    fout.write(content)
+
+        return task
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Default, '__init__', return_value=None)
+    def test_handle_stdio(self, mocked_init):
+
+        component = Default(cfg=None, session=None)
+        component._log        = mock.Mock()
+        component._prof       = mock.Mock()
+        component._stdio_pool = cf.ThreadPoolExecutor(max_workers=2)
+
+        tasks = [self._task('task.0000', stdout='out\n',
+                            stderr='err\n[batch3:122527] JOB [3673,4] '
+                                   'EXECUTING\nmore err\n',
+                            prof='#time,event,comp,thread,uid,state,msg\n'
+                                 '1.0,exec_start,,MainThread,task.0000,,\n'
+                                 '2.0,exec_stop,,MainThread,task.0000,,\n'),
+                 self._task('task.0001', stdout='x' * 5000,
+                            stderr=b'\xff\xfe\x00'),
+                 self._task('task.0002'),
+                 {'uid': 'task.0003', 'stdio': True,
+                  'task_sandbox_path': self._sbox}]
+
+        component._handle_stdio(tasks)
+
+        self.assertEqual(tasks[0]['stdout'], 'out\n')
+        self.assertTrue (tasks[0]['stderr'].endswith('more err\n'))
+        self.assertTrue (tasks[1]['stdout'].startswith('[... CONTENT'))
+        self.assertTrue (tasks[1]['stdout'].endswith('x' * 1024))
+        self.assertIn   ('binary', tasks[1]['stderr'])
+        self.assertEqual(tasks[2]['stdout'], '')
+        self.assertNotIn('stdout', tasks[3])
+
+        component._log.info.assert_called_once_with(
+                                            'PRTE IDMAP: 3673,4:task.0000')
+
+        # task profile events are merged
+        component._prof.prof.assert_any_call(ts=1.0, event='exec_start',
+                                             comp='', tid='MainThread',
+                                             uid='task.0000', state='',
+                                             msg='')
+        component._prof.prof.assert_any_call(ts=2.0, event='exec_stop',
+                                             comp='', tid='MainThread',
+                                             uid='task.0000', state='',
+                                             msg='')
+
+        # ... but not read if profiling is disabled
+        component._prof.reset_mock()
+        component._prof.enabled = False
+        component._handle_stdio([self._task('task.0004', prof='1.0,x,,,,,\n')])
+        for call in component._prof.prof.call_args_list:
+            self.assertNotIn('ts', call[1])
+
+        component._stdio_pool.shutdown()
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestDefault()
+    tc.setUp()
+    tc.test_handle_stdio()
+    tc.tearDown()
+
+
+# ------------------------------------------------------------------------------
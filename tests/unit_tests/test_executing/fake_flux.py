@@ -0,0 +1,177 @@
+
+# pylint: disable=unused-argument
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import json
+import time
+import queue
+import types
+
+import threading as mt
+
+
+# ------------------------------------------------------------------------------
+#
+# Local stand-in for the parts of the flux python bindings which are used by
+# the Flux scheduler and executor.  Submitted jobs do not run, but tests can
+# let them progress via `FluxHandle.run()` and `FluxHandle.cancel()`, which
+# emit the respective journal events (and `job-state` events).
+#
+_JOB_EVENTS = ['submit', 'validate', 'depend', 'priority', 'alloc', 'start',
+               'finish', 'release', 'free', 'clean']
+
+_JOB_STATES = {'depend'  : 'DEPEND',
+               'priority': 'SCHED',
+               'alloc'   : 'RUN',
+               'finish'  : 'CLEANUP',
+               'clean'   : 'INACTIVE'}
+
+
+# ------------------------------------------------------------------------------
+#
+class JournalEvent(object):
+
+    def __init__(self, jobid, name, timestamp, context=None):
+
+        self.jobid     = jobid
+        self.name      = name
+        self.timestamp = timestamp
+        self.context   = context or dict()
+
+
+# ------------------------------------------------------------------------------
+#
+class FluxHandle(object):
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__(self):
+
+        self._lock    = mt.Lock()
+        self._next_id = 1000
+
+        self.jobs     = dict()          # jobid: jobspec
+        self.log      = list()          # ['submit' | 'get_id', jobid]
+        self.journal  = queue.Queue()   # JournalEvent
+        self.states   = queue.Queue()   # job-state event payloads
+        self.topics   = set()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def event_subscribe(self, topic):
+        self.topics.add(topic)
+
+    def event_unsubscribe(self, topic):
+        self.topics.discard(topic)
+
+    def event_recv(self):
+        return types.SimpleNamespace(payload=self.states.get())
+
+
+    # --------------------------------------------------------------------------
+    #
+    def submit(self, jobspec):
+
+        with self._lock:
+            jobid = self._next_id
+            self._next_id += 1
+            self.jobs[jobid] = json.loads(jobspec)
+            self.log.append(['submit', jobid])
+
+        return jobid
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _emit(self, jobid, names, context=None):
+
+        now   = time.time()
+        trans = list()
+        for name in names:
+            ctx = context if name in ['finish', 'exception'] else None
+            self.journal.put(JournalEvent(jobid, name, now, ctx))
+            if name in _JOB_STATES:
+                trans.append([jobid, _JOB_STATES[name], now])
+
+        self.states.put({'transitions': trans})
+
+
+    # --------------------------------------------------------------------------
+    #
+    def run(self, jobid, status=0):
+        '''
+        emit the events of a job which runs and exits with the given wait status
+        '''
+
+        self._emit(jobid, _JOB_EVENTS, {'status': status})
+
+
+    # --------------------------------------------------------------------------
+    #
+    def cancel(self, jobid):
+        '''
+        emit the events of a job which is canceled before it runs
+        '''
+
+        self._emit(jobid, ['submit', 'exception', 'clean'],
+                   {'type': 'cancel', 'severity': 0})
+
+
+# ------------------------------------------------------------------------------
+#
+class _SubmitFuture(object):
+
+    def __init__(self, fh, jobid):
+        self._fh    = fh
+        self._jobid = jobid
+
+    def get_id(self):
+        self._fh.log.append(['get_id', self._jobid])
+        return self._jobid
+
+
+# ------------------------------------------------------------------------------
+#
+class _JournalConsumer(object):
+
+    def __init__(self, fh):
+        self._fh = fh
+
+    def start(self):
+        return self
+
+    def poll(self, timeout=-1.0):
+        try:
+            return self._fh.journal.get(timeout=max(timeout, 0.001))
+        except queue.Empty as e:
+            raise TimeoutError() from e
+
+
+# ------------------------------------------------------------------------------
+#
+def flux_modules(journal=True):
+    '''
+    Return the stand-in `flux` and `flux.job` modules, to be patched into
+    `sys.modules`.  Without `journal`, the modules emulate a flux version
+    without `JournalConsumer`.
+    '''
+
+    job = types.ModuleType('flux.job')
+    job.submit_async = lambda fh, jobspec, **kwargs: \
+                              _SubmitFuture(fh, fh.submit(jobspec))
+    job.cancel       = lambda fh, jobid: fh.cancel(jobid)
+
+    if journal:
+        job.JournalConsumer = _JournalConsumer
+
+    flux     = types.ModuleType('flux')
+    flux.job = job
+
+    return {'flux': flux, 'flux.job': job}
+
+
+# ------------------------------------------------------------------------------
+
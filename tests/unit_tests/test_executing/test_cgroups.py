@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import os
+import errno
+import shutil
+import tempfile
+
+from unittest import mock, TestCase
+
+from radical.pilot.agent.executing.cgroups import TaskCgroups
+
+
+# ------------------------------------------------------------------------------
+#
+class TestCgroups(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def setUp(self):
+
+        self._base = tempfile.mkdtemp()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def tearDown(self):
+
+        shutil.rmtree(self._base)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch('os.rmdir')
+    def test_cgroups(self, mocked_rmdir):
+
+        log = mock.Mock()
+        cgs = TaskCgroups(log, 'pilot.0000', base=self._base)
+        self.assertTrue(cgs.available)
+
+        with open('%s/cgroup.subtree_control' % self._base) as fin:
+            self.assertEqual(fin.read(), '+memory +cpu')
+
+        # task cgroups are limited to the task's slots
+        path = cgs.create('task.0000', n_cores=2, mem=64)
+        self.assertEqual(path, '%s/task.0000' % self._base)
+
+        with open('%s/memory.max' % path) as fin:
+            self.assertEqual(fin.read(), '%d' % (64 * 1024 * 1024))
+        with open('%s/cpu.max' % path) as fin:
+            self.assertEqual(fin.read(), '200000 100000')
+
+        # no limits if the scheduler did not assign any
+        path_1 = cgs.create('task.0001')
+        self.assertEqual(sorted(os.listdir(path_1)), [])
+
+        # the usage is collected on completion, and the cgroup removed
+        with open('%s/cpu.stat' % path, 'w') as fout:
+            fout.write('usage_usec 1500000\nuser_usec 1000000\n')
+        with open('%s/memory.peak' % path, 'w') as fout:
+            fout.write('4096\n')
+
+        self.assertEqual(cgs.collect(path), {'cpu_time': 1.5,
+                                             'mem_peak': 4096,
+                                             'source'  : 'cgroup'})
+        mocked_rmdir.assert_called_once_with(path)
+
+        # old kernels don't report the memory peak
+        self.assertEqual(cgs.collect(path_1), {'cpu_time': None,
+                                               'mem_peak': None,
+                                               'source'  : 'cgroup'})
+
+        # cgroups are not available if they can't be set up
+        cgs = TaskCgroups(log, 'pilot.0000', base='/proc/no/such/cgroup')
+        self.assertFalse(cgs.available)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(TaskCgroups, '_own_cgroup', return_value='/job')
+    def test_cgroups_leaf(self, mocked_own_cgroup):
+
+        parent = '%s/job' % self._base
+        os.mkdir(parent)
+
+        with open('%s/cgroup.controllers' % self._base, 'w') as fout:
+            fout.write('cpu memory\n')
+        with open('%s/cgroup.procs' % parent, 'w') as fout:
+            fout.write('123\n456\n')
+
+        # controllers can't be enabled while the agent's cgroup has processes
+        moved = list()
+        error = [errno.EBUSY]
+        write = TaskCgroups._write
+
+        def _write(cgs, path, fname, data):
+            if fname == 'cgroup.procs':
+                moved.append([path, data])
+            elif fname == 'cgroup.subtree_control' and path == parent \
+                                                   and not moved:
+                raise OSError(error[0], os.strerror(error[0]))
+            write(cgs, path, fname, data)
+
+        log = mock.Mock()
+        with mock.patch('radical.pilot.agent.executing.cgroups.CGROUP_ROOT',
+                        self._base), \
+             mock.patch.object(TaskCgroups, '_write', autospec=True,
+                               side_effect=_write):
+
+            # the agent's processes are moved into a leaf cgroup first
+            cgs = TaskCgroups(log, 'pilot.0000')
+            self.assertTrue(cgs.available)
+            self.assertEqual(cgs._base, '%s/pilot.0000' % parent)
+            self.assertEqual(sorted(set(pid for _, pid in moved)),
+                             ['123', '456'])
+            self.assertEqual(set(path for path, _ in moved),
+                             {'%s/agent' % parent})
+
+            with open('%s/cgroup.subtree_control' % parent) as fin:
+                self.assertEqual(fin.read(), '+memory +cpu')
+
+            # other errors are not handled
+            moved.clear()
+            error[0] = errno.EACCES
+            cgs = TaskCgroups(log, 'pilot.0001')
+            self.assertFalse(cgs.available)
+            self.assertFalse(moved)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestCgroups()
+    tc.setUp()
+    tc.test_cgroups()
+    tc.tearDown()
+    tc.setUp()
+    tc.test_cgroups_leaf()
+    tc.tearDown()
+
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access, unused-argument
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import sys
+import time
+import queue
+
+import threading as mt
+
+from unittest import mock, TestCase
+
+import radical.utils        as ru
+import radical.pilot.states as rps
+
+from radical.pilot.agent.executing.flux import Flux
+from radical.pilot.utils                import CancelRegistry
+
+from .fake_flux import FluxHandle, flux_modules
+
+
+# ------------------------------------------------------------------------------
+#
+class TestFlux(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Flux, '__init__', return_value=None)
+    def _get_executor(self, mocked_init):
+
+        ex = Flux(cfg=None, session=None)
+        ex._log            = mock.Mock()
+        ex._prof           = mock.Mock()
+        ex._cfg            = ru.Config(from_dict={
+                                 'pid'         : 'pilot.0000',
+                                 'reg_addr'    : 'tcp://localhost:10000',
+                                 'resource_cfg': {'launch_methods': {
+                                                      'FLUX': {}}}})
+        ex._cancel_list    = CancelRegistry()
+        ex._term           = mt.Event()
+        ex._task_q         = queue.Queue()
+        ex._event_q        = queue.Queue()
+        ex._cancel_q       = queue.Queue()
+        ex._listener_setup = mt.Event()
+        ex._watcher_setup  = mt.Event()
+        ex._batch          = 1024
+        ex._lm             = None
+        ex._event_map      = {'NEW'     : None,
+                              'DEPEND'  : None,
+                              'SCHED'   : rps.AGENT_EXECUTING_PENDING,
+                              'RUN'     : rps.AGENT_EXECUTING,
+                              'CLEANUP' : None,
+                              'INACTIVE': rps.AGENT_STAGING_OUTPUT_PENDING,
+                              'PRIORITY': None}
+        ex._journal_map    = {'priority': 'SCHED',
+                              'alloc'   : 'RUN',
+                              'finish'  : 'CLEANUP',
+                              'clean'   : 'INACTIVE'}
+
+        ex.register_output = mock.Mock()
+        ex.publish         = mock.Mock()
+
+        return ex
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _run(self, journal):
+
+        fh = FluxHandle()
+        ex = self._get_executor()
+
+        advanced = list()   # [state, uids, push]
+        finals   = dict()   # uid: state
+        all_done = mt.Event()
+
+        def _advance(tasks, state, publish, push, prof=True, ts=None):
+            tasks = ru.as_list(tasks)
+            advanced.append([state, [t['uid'] for t in tasks], push])
+            if state in [rps.AGENT_STAGING_OUTPUT_PENDING, rps.CANCELED]:
+                for t in tasks:
+                    finals[t['uid']] = state
+                if len(finals) == 4:
+                    all_done.set()
+
+        ex.advance = mock.Mock(side_effect=_advance)
+
+        lm = mock.Mock()
+        lm.fh.get_handle.return_value = fh
+
+        with mock.patch.dict(sys.modules, flux_modules(journal=journal)), \
+             mock.patch('radical.pilot.agent.executing.flux.LaunchMethod') \
+                 as mocked_lm:
+
+            mocked_lm.create.return_value = lm
+
+            listener = mt.Thread(target=ex._listen)
+            watcher  = mt.Thread(target=ex._watch)
+            listener.daemon = True
+            watcher.daemon  = True
+            listener.start()
+            watcher.start()
+
+            self.assertTrue(ex._listener_setup.wait(timeout=5.0))
+            self.assertTrue(ex._watcher_setup.wait(timeout=5.0))
+
+            tasks = list()
+            for i in range(4):
+                flux_id = fh.submit('{}')
+                tasks.append({'uid'    : 'task.%04d' % i,
+                              'flux_id': flux_id,
+                              'stderr' : None})
+
+            # events arrive before the tasks, and are handled on arrival
+            fh.run(tasks[0]['flux_id'])
+            fh.run(tasks[1]['flux_id'], status=256)
+            fh.run(tasks[2]['flux_id'])
+            time.sleep(0.1)
+
+            ex.work(tasks)
+            ex.command_cb(None, {'cmd': 'cancel_tasks',
+                                 'arg': {'uids': ['task.0003']}})
+
+            self.assertTrue(all_done.wait(timeout=5.0))
+
+            ex._term.set()
+            watcher.join()
+            if journal:
+                listener.join()
+
+        self.assertEqual(finals,
+                         {'task.0000': rps.AGENT_STAGING_OUTPUT_PENDING,
+                          'task.0001': rps.AGENT_STAGING_OUTPUT_PENDING,
+                          'task.0002': rps.AGENT_STAGING_OUTPUT_PENDING,
+                          'task.0003': rps.CANCELED})
+
+        # only completed tasks are pushed
+        for state, _, push in advanced:
+            self.assertEqual(push, state == rps.AGENT_STAGING_OUTPUT_PENDING)
+
+        # transitions are advanced in bulks, in order of the state model
+        states = [state for state, _, _ in advanced]
+        self.assertEqual(states, [rps.AGENT_EXECUTING_PENDING,
+                                  rps.AGENT_EXECUTING,
+                                  rps.AGENT_STAGING_OUTPUT_PENDING,
+                                  rps.CANCELED])
+        self.assertEqual(advanced[1][1], ['task.0000', 'task.0001',
+                                          'task.0002'])
+
+        # state transitions are profiled with the event times
+        ex._prof.prof.assert_any_call('advance', uid='task.0000',
+                                      state=rps.AGENT_EXECUTING,
+                                      ts=mock.ANY)
+
+        return tasks
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_journal(self):
+
+        tasks = self._run(journal=True)
+
+        self.assertEqual(tasks[0]['exit_code'],    0)
+        self.assertEqual(tasks[0]['target_state'], rps.DONE)
+        self.assertEqual(tasks[1]['exit_code'],    1)
+        self.assertEqual(tasks[1]['target_state'], rps.FAILED)
+        self.assertNotIn('target_state', tasks[3])
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_job_states(self):
+
+        tasks = self._run(journal=False)
+
+        # `job-state` events don't carry exit codes
+        for task in tasks[:3]:
+            self.assertNotIn('exit_code', task)
+            self.assertEqual(task['target_state'], rps.DONE)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestFlux()
+    tc.test_journal()
+    tc.test_job_states()
+
+
+# ------------------------------------------------------------------------------
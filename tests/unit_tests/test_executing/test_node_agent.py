@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+import radical.utils as ru
+
+from unittest import TestCase
+
+
+# ------------------------------------------------------------------------------
+#
+class TestNodeAgent(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _get(self, pipe, timeout=30.0):
+
+        msg = pipe.get_nowait(timeout=timeout)
+        self.assertIsNotNone(msg)
+        return msg
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _launch(self, req, sbox, uid, cmd):
+
+        with ru.ru_open('%s/%s.launch.sh' % (sbox, uid), 'w') as fout:
+            fout.write('%s\n' % cmd)
+
+        req.put({'cmd'   : 'launch',
+                 'uid'   : uid,
+                 'sbox'  : sbox,
+                 'script': '%s.launch.sh' % uid,
+                 'out'   : '%s/%s.launch.out' % (sbox, uid)})
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_node_agent(self):
+
+        sbox = tempfile.mkdtemp()
+        req  = ru.zmq.Pipe(ru.zmq.MODE_PUSH)
+        res  = ru.zmq.Pipe(ru.zmq.MODE_PULL)
+        proc = subprocess.Popen([sys.executable, '-m',
+                                 'radical.pilot.agent.executing.node_agent',
+                                 'node_agent.0000',
+                                 ru.as_string(req.url),
+                                 ru.as_string(res.url)], cwd=sbox)
+
+        try:
+            self.assertEqual(self._get(res), {'cmd': 'hello',
+                                              'uid': 'node_agent.0000'})
+
+            # tasks run in their sandbox, and their exit codes are reported
+            self._launch(req, sbox, 'task.0000', 'pwd; exit 3')
+            self.assertEqual(self._get(res), {'cmd'  : 'done',
+                                              'tasks': [['task.0000', 3,
+                                                         False]]})
+            with ru.ru_open('%s/task.0000.launch.out' % sbox) as fin:
+                self.assertEqual(os.path.realpath(fin.read().strip()),
+                                 os.path.realpath(sbox))
+
+            # tasks which fail to launch are reported as failed
+            req.put({'cmd'   : 'launch',
+                     'uid'   : 'task.0002',
+                     'sbox'  : sbox,
+                     'script': 'task.0002.launch.sh',
+                     'out'   : '%s/missing/task.0002.launch.out' % sbox})
+            self.assertEqual(self._get(res), {'cmd'  : 'done',
+                                              'tasks': [['task.0002', 1,
+                                                         False]]})
+
+            # tasks can be canceled
+            self._launch(req, sbox, 'task.0001', 'exec sleep 30')
+            req.put({'cmd': 'cancel', 'uid': 'task.0001'})
+            self.assertEqual(self._get(res), {'cmd'  : 'done',
+                                              'tasks': [['task.0001', -15,
+                                                         True]]})
+
+            req.put({'cmd': 'stop'})
+            self.assertEqual(proc.wait(timeout=30), 0)
+
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            shutil.rmtree(sbox)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestNodeAgent()
+    tc.test_node_agent()
+
+
+# ------------------------------------------------------------------------------
+
@@ -6,16 +6,25 @@ __copyright__ = 'Copyright 2013-2021, The RADICAL-Cybertools Team'
 __license__   = 'MIT'
 
 import os
+import select
+import pytest
+import shutil
+import tempfile
+import subprocess
+import collections
+
 import threading as mt
 
-import radical.pilot.states as rps
+import radical.pilot.states    as rps
+import radical.pilot.constants as rpc
 import radical.utils as ru
 
 from unittest import mock, TestCase
 
 from radical.pilot.agent.resource_manager.base import ResourceManager
 from radical.pilot.agent.launch_method.fork    import Fork
-from radical.pilot.agent.executing.popen       import Popen
+from radical.pilot.agent.executing.popen       import Popen, _Proc
+from radical.pilot.utils                       import CancelRegistry
 
 base = os.path.abspath(os.path.dirname(__file__))
 
@@ -37,22 +46,41 @@ class TestPopen(TestCase):
     #
     @mock.patch.object(Popen, '__init__', return_value=None)
     @mock.patch('radical.utils.Logger')
-    def test_command_cb(self, mocked_logger, mocked_init):
+    @mock.patch('os.killpg')
+    def test_command_cb(self, mocked_killpg, mocked_logger, mocked_init):
 
         pex = Popen(cfg=None, session=None)
-        pex._log             = mocked_logger()
-        pex._cancel_lock     = mt.RLock()
-        pex._tasks_to_cancel = []
+        pex._log           = mocked_logger()
+        pex._prof          = mock.Mock()
+        pex._cancel_list   = CancelRegistry()
+        pex._cancel_lock   = mt.RLock()
+        pex._uids_to_watch = {'task.0000': 1234}
+        pex._na_lock       = mt.Lock()
+        pex._na_tasks      = {}
 
         msg = {'cmd': '', 'arg': {'uids': ['task.0000', 'task.0001']}}
         self.assertTrue(pex.command_cb(topic=None, msg=msg))
-        # tasks were not added to the list `_tasks_to_cancel`
-        self.assertFalse(pex._tasks_to_cancel)
+        # tasks were not registered for cancellation
+        self.assertFalse(pex._cancel_list)
+        mocked_killpg.assert_not_called()
 
         msg['cmd'] = 'cancel_tasks'
         self.assertTrue(pex.command_cb(topic=None, msg=msg))
-        # tasks were added to the list `_tasks_to_cancel`
-        self.assertEqual(pex._tasks_to_cancel, msg['arg']['uids'])
+        # tasks were registered for cancellation
+        self.assertIn('task.0000', pex._cancel_list)
+        self.assertIn('task.0001', pex._cancel_list)
+        # and the running task got killed right away
+        mocked_killpg.assert_called_once_with(1234, 15)
+
+        # tasks run by node agents are canceled by the node agent
+        pipe = mock.Mock()
+        mocked_killpg.reset_mock()
+        pex._uids_to_watch = {}
+        pex._na_tasks      = {'task.0001': [{'uid': 'task.0001'}, pipe]}
+        self.assertTrue(pex.command_cb(topic=None, msg=msg))
+        mocked_killpg.assert_not_called()
+        pipe.put.assert_called_once_with({'cmd': 'cancel',
+                                          'uid': 'task.0001'})
 
 
     # --------------------------------------------------------------------------
@@ -60,8 +88,8 @@ class TestPopen(TestCase):
     @mock.patch.object(Popen, '__init__', return_value=None)
     @mock.patch.object(ResourceManager, 'find_launcher', return_value=None)
     @mock.patch.object(Fork, '__init__', return_value=None)
-    @mock.patch('subprocess.Popen')
-    def test_handle_task(self, mocked_sp_popen, mocked_lm_init,
+    @mock.patch('os.posix_spawn', return_value=None)
+    def test_handle_task(self, mocked_spawn, mocked_lm_init,
                          mocked_find_launcher, mocked_init):
 
         launcher = Fork(name=None, lm_cfg={}, rm_info={}, log=None, prof=None)
@@ -74,7 +102,8 @@ class TestPopen(TestCase):
 
         pex = Popen(cfg=None, session=None)
 
-        pex._log = pex._prof = pex._watch_queue = mock.Mock()
+        pex._log = pex._prof = pex._watch_queue = pex._wake = mock.Mock()
+        pex._epoll   = None
         pex._pwd     = ''
         pex._pid     = 'pilot.0000'
         pex.sid      = 'session.0000'
@@ -88,8 +117,30 @@ class TestPopen(TestCase):
         pex._rm      = mock.Mock()
         pex._rm.find_launcher = mocked_find_launcher
 
+        pex._script_cache      = collections.OrderedDict()
+        pex._script_cache_size = 1
+        pex._script_hits       = 0
+        pex._script_misses     = 0
+        pex._node_agents       = {}
+        pex._na_launch         = {}
+        pex._cancel_list       = CancelRegistry()
+        pex._cancel_lock       = mt.RLock()
+        pex._uids_to_watch     = {}
+        pex._cgroups           = None
+        pex._cgroup_path       = {}
+
         pex._handle_task(task)
 
+        # the launch script is spawned in the task sandbox
+        args = mocked_spawn.call_args[0][1]
+        self.assertEqual(args[-2:], [task['task_sandbox_path'],
+                                     '%s.launch.sh' % task['uid']])
+        self.assertEqual(mocked_spawn.call_args[1]['setpgroup'], 0)
+        pex._watch_queue.put.assert_called_once_with(task)
+        pex._wake.assert_called_once_with()
+        # the task can be canceled from now on
+        self.assertIn(task['uid'], pex._uids_to_watch)
+
         for prefix in ['.launch.sh', '.exec.sh', '.sl']:
             path = '%s/%s%s' % (task['task_sandbox_path'], task['uid'], prefix)
             self.assertTrue(os.path.isfile(path))
@@ -100,40 +151,416 @@ class TestPopen(TestCase):
     # --------------------------------------------------------------------------
     #
     @mock.patch.object(Popen, '__init__', return_value=None)
-    @mock.patch('os.killpg')
-    def test_check_running(self, mocked_killpg, mocked_init):
+    def test_script_fragments(self, mocked_init):
 
-        task = dict(self._test_case['task'])
-        task['target_state'] = None
+        pex = Popen(cfg=None, session=None)
+        pex._prof              = mock.Mock()
+        pex._script_cache      = collections.OrderedDict()
+        pex._script_cache_size = 2
+        pex._script_hits       = 0
+        pex._script_misses     = 0
+
+        launcher = mock.Mock()
+        launcher.name = 'FORK'
+        launcher.get_launcher_env.return_value = ['. env/lm_fork.sh']
+        launcher.get_rank_cmd.return_value     = 'export RP_RANK=0\n'
+
+        def task(uid, pre_exec):
+            return {'uid'        : uid,
+                    'description': {'named_env'  : '',
+                                    'environment': {'FOO': 'bar'},
+                                    'pre_launch' : [],
+                                    'post_launch': [],
+                                    'pre_exec'   : pre_exec,
+                                    'post_exec'  : [],
+                                    'pre_rank'   : {'1': ['echo 1']},
+                                    'post_rank'  : []}}
+
+        # tasks of the same shape share the fragments
+        frags = pex._get_script_fragments(task('t.0', ['x']), launcher, 2)
+        self.assertIs(pex._get_script_fragments(task('t.1', ['x']),
+                                                launcher, 2), frags)
+        self.assertEqual([pex._script_hits, pex._script_misses], [1, 1])
+
+        # fragments hold no task specific data
+        self.assertNotIn('t.0', ''.join(frags))
+        self.assertIn('export FOO="bar"', frags[3])
+        self.assertIn('echo 1', frags[3])
+        self.assertIn('export RP_RANKS=2', frags[2])
+
+        # directives and rank counts are part of the key
+        pex._get_script_fragments(task('t.2', ['y']), launcher, 2)
+        pex._get_script_fragments(task('t.3', ['x']), launcher, 1)
+        self.assertEqual([pex._script_hits, pex._script_misses], [1, 3])
+
+        # the cache is bounded, and the least recently used entry is evicted
+        self.assertEqual(len(pex._script_cache), 2)
+        pex._get_script_fragments(task('t.4', ['x']), launcher, 2)
+        self.assertEqual([pex._script_hits, pex._script_misses], [1, 4])
+
+        self.assertEqual(pex._prof.prof.call_args_list[-1][0][0],
+                         'script_cache_miss')
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    def test_node_agents(self, mocked_init):
 
         pex = Popen(cfg=None, session=None)
-        pex._tasks_to_watch  = []
-        pex._tasks_to_cancel = []
+        pex._log            = pex._prof = mock.Mock()
+        pex._node_agent_lms = ['FORK', 'SSH']
+        pex._na_lock        = mt.Lock()
+        pex._na_tasks       = {}
+        pex._na_launch      = {}
+        pex._node_agents    = {}
+        pex._cancel_list    = CancelRegistry()
+        pex.advance         = mock.Mock()
+        pex.publish         = mock.Mock()
+
+        def task(uid, node_id='node.0000'):
+            return {'uid'              : uid,
+                    'task_sandbox_path': '/tmp/%s' % uid,
+                    'slots'            : {'ranks': [{'node_id': node_id}]}}
+
+        launcher      = mock.Mock()
+        launcher.name = 'FORK'
+        pipe          = mock.Mock()
+
+        # without node agents, tasks are launched by the executor
+        self.assertIsNone(pex._get_node_agent(task('t.0'), launcher, 1))
+
+        pex._node_agents = {'node.0000': pipe}
+        self.assertIs(pex._get_node_agent(task('t.0'), launcher, 1), pipe)
+        self.assertIsNone(pex._get_node_agent(task('t.0', 'node.0001'),
+                                              launcher, 1))
+        self.assertIsNone(pex._get_node_agent(task('t.0'), launcher, 2))
+        launcher.name = 'MPIRUN'
+        self.assertIsNone(pex._get_node_agent(task('t.0'), launcher, 1))
+
+        # the launch scripts of those tasks don't use the launch method
+        t0 = task('t.0')
+        t0['stdout_file_short'] = 't.0.out'
+        t0['stderr_file_short'] = 't.0.err'
+        cmds = pex._get_launch_cmds(t0, launcher, 'exec.sh', direct=True)
+        self.assertIn('exec.sh', cmds)
+        launcher.get_launch_cmds.assert_not_called()
+
+        # tasks are sent to the node agent
+        tasks = [task('t.%d' % i) for i in range(3)]
+        for t in tasks:
+            pex._na_launch[t['uid']] = pipe
+            pex._spawn_task(t)
+
+        self.assertEqual(pipe.put.call_count, 3)
+        self.assertEqual(pipe.put.call_args[0][0],
+                         {'cmd'   : 'launch',
+                          'uid'   : 't.2',
+                          'sbox'  : '/tmp/t.2',
+                          'script': 't.2.launch.sh',
+                          'out'   : '/tmp/t.2/t.2.launch.out'})
+        self.assertFalse(pex._na_launch)
+        self.assertEqual(len(pex._na_tasks), 3)
+
+        # tasks canceled before their launch are not sent
+        pex._cancel_list.add(['t.3'])
+        pex._na_launch['t.3'] = pipe
+        self.assertFalse(pex._spawn_task(task('t.3')))
+        self.assertEqual(pipe.put.call_count, 3)
+        self.assertFalse(pex._cancel_list)
+
+        # and completed in bulk when the node agent reports them
+        self.assertEqual(pex._node_agent_done([['t.0', 0, False],
+                                               ['t.1', 1, False],
+                                               ['t.2', -15, True],
+                                               ['t.x', 0, False]]), 3)
+        self.assertFalse(pex._na_tasks)
+        self.assertEqual(tasks[0]['target_state'], rps.DONE)
+        self.assertEqual(tasks[1]['target_state'], rps.FAILED)
+        self.assertEqual(tasks[1]['exit_code'], 1)
+        pex.publish.assert_called_once_with(rpc.AGENT_UNSCHEDULE_PUBSUB,
+                                            [tasks[2], tasks[0], tasks[1]])
+        pex.advance.assert_any_call([tasks[2]], rps.CANCELED,
+                                    publish=True, push=False)
+        pex.advance.assert_any_call([tasks[0], tasks[1]],
+                                    rps.AGENT_STAGING_OUTPUT_PENDING,
+                                    publish=True, push=True)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    def test_work(self, mocked_init):
+
+        pex = Popen(cfg=None, session=None)
+        pex._log      = pex._prof = mock.Mock()
+        pex._epoll       = None
+        pex._wake        = mock.Mock()
+        pex._cgroup_path = {}
+        pex.advance      = mock.Mock()
+        pex.publish      = mock.Mock()
+
+        tasks = [{'uid': 'task.%04d' % i, 'stderr': None} for i in range(5)]
+
+        # task.0001 fails to prepare, task.0002 fails to spawn, task.0004 got
+        # canceled before being spawned
+        def prepare(task):
+            if task['uid'] == 'task.0001':
+                raise RuntimeError('no launcher')
+
+        def spawn(task, env=None):
+            if task['uid'] == 'task.0002':
+                raise OSError('no shell')
+            return task['uid'] != 'task.0004'
+
+        pex._prepare_task = mock.Mock(side_effect=prepare)
+        pex._spawn_task   = mock.Mock(side_effect=spawn)
+
+        pex.work(tasks)
+
+        # scripts are prepared for the whole bulk before spawning
+        self.assertEqual(pex._prepare_task.call_count, 5)
+        self.assertEqual([c[0][0]['uid'] for c in
+                          pex._spawn_task.call_args_list],
+                         ['task.0000', 'task.0002', 'task.0003', 'task.0004'])
+        pex._wake.assert_called_once_with()
+
+        # failed tasks are unscheduled and failed in one bulk, as are canceled
+        # tasks
+        failed = [tasks[1], tasks[2]]
+        pex.publish.assert_any_call(rpc.AGENT_UNSCHEDULE_PUBSUB, failed)
+        pex.publish.assert_any_call(rpc.AGENT_UNSCHEDULE_PUBSUB, [tasks[4]])
+        pex.advance.assert_any_call(failed, rps.FAILED,
+                                    publish=True, push=False)
+        pex.advance.assert_called_with([tasks[4]], rps.CANCELED,
+                                       publish=True, push=False)
+        self.assertEqual(pex.advance.call_count, 3)
+        for task in failed:
+            self.assertIn('Pilot cannot start task', task['stderr'])
+            self.assertEqual(task['control'], 'tmgr_pending')
+
+
+    # --------------------------------------------------------------------------
+    #
+    @pytest.mark.skipif(not hasattr(os, 'posix_spawn'),
+                        reason='posix_spawn not supported')
+    def test_proc(self):
+
+        for cmd, ret in [['true', 0], ['false', 1], ['kill -9 $$', -9]]:
+            pid  = os.posix_spawn('/bin/sh', ['/bin/sh', '-c', cmd],
+                                  os.environ)
+            proc = _Proc(pid, mock.Mock())
+            self.assertEqual(proc.wait(), ret)
+            self.assertEqual(proc.poll(), ret)
+
+        pid  = os.posix_spawn('/bin/sh', ['/bin/sh', '-c', 'sleep 10'],
+                              os.environ)
+        proc = _Proc(pid, mock.Mock())
+        self.assertIsNone(proc.poll())
+        os.kill(pid, 15)
+        self.assertEqual(proc.wait(), -15)
+        self.assertIsNotNone(proc.rusage)
+
+        # processes reaped elsewhere are reported as failed
+        for method in ['poll', 'wait']:
+            pid  = os.posix_spawn('/bin/sh', ['/bin/sh', '-c', 'true'],
+                                  os.environ)
+            os.waitpid(pid, 0)
+            log  = mock.Mock()
+            proc = _Proc(pid, log)
+            self.assertEqual(getattr(proc, method)(), 1)
+            log.error.assert_called_once()
+
+
+    # --------------------------------------------------------------------------
+    #
+    @pytest.mark.skipif(not hasattr(os, 'posix_spawn'),
+                        reason='posix_spawn not supported')
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    def test_task_usage(self, mocked_init):
+
+        pex = Popen(cfg=None, session=None)
+        pex._log         = mock.Mock()
+        pex._prof        = mock.Mock()
+        pex._cgroups     = mock.Mock()
+        pex._cgroup_path = {}
+
+        sbox = tempfile.mkdtemp()
+        with ru.ru_open('%s/task.0000.launch.sh' % sbox, 'w') as fout:
+            fout.write('exit 0\n')
+
+        try:
+            # the launch script moves itself into the task's cgroup
+            os.mkdir('%s/cgroup' % sbox)
+            proc = pex._spawn(sbox, 'task.0000.launch.sh',
+                              '%s/task.0000.launch.out' % sbox,
+                              cgroup='%s/cgroup' % sbox)
+            self.assertEqual(proc.wait(), 0)
+            with ru.ru_open('%s/cgroup/cgroup.procs' % sbox) as fin:
+                self.assertEqual(int(fin.read()), proc.pid)
+
+            # without cgroup, the usage is taken from the process' rusage
+            task = {'uid': 'task.0000', 'proc': proc}
+            pex._set_usage(task)
+            self.assertEqual(task['usage']['source'], 'rusage')
+            self.assertGreater(task['usage']['mem_peak'], 0)
+            pex._cgroups.collect.assert_not_called()
+
+            # ... otherwise from the cgroup
+            usage = {'cpu_time': 1.0, 'mem_peak': 2, 'source': 'cgroup'}
+            pex._cgroups.collect.return_value = usage
+            pex._cgroup_path['task.0000'] = '%s/cgroup' % sbox
+            pex._set_usage(task)
+            self.assertEqual(task['usage'], usage)
+            pex._cgroups.collect.assert_called_once_with('%s/cgroup' % sbox)
+            self.assertFalse(pex._cgroup_path)
+            pex._prof.prof.assert_called_with('task_usage', uid='task.0000',
+                                              msg='cpu_time=1.0 mem_peak=2')
+
+        finally:
+            shutil.rmtree(sbox)
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    def test_check_running(self, mocked_init):
+
+        pex = Popen(cfg=None, session=None)
+        pex._tasks_to_watch  = {}
+        pex._uids_to_watch   = {}
+        pex._cancel_list     = CancelRegistry()
         pex._cancel_lock     = mt.RLock()
-        pex._log    = pex._prof   = mock.Mock()
-        pex.advance = pex.publish = mock.Mock()
-
-        # case 1: exit_code is None, task to be cancelled
-        task['proc'] = mock.Mock()
-        task['proc'].poll.return_value = None
-        pex._tasks_to_watch.append(task)
-        pex._tasks_to_cancel.append(task['uid'])
+        pex._task_usage      = False
+        pex._log    = pex._prof = mock.Mock()
+        pex.advance = mock.Mock()
+        pex.publish = mock.Mock()
+
+        def _watch(pid, exit_code):
+            task = dict(self._test_case['task'])
+            task['uid']          = 'task.%04d' % pid
+            task['target_state'] = None
+            task['proc']         = mock.Mock()
+            task['proc'].pid     = pid
+            task['proc'].poll.return_value = exit_code
+            pex._tasks_to_watch[pid]        = task
+            pex._uids_to_watch[task['uid']] = pid
+            return task
+
+        # case 1: task got killed after its cancellation was requested
+        task = _watch(1, -15)
+        pex._cancel_list.add([task['uid']])
         pex._check_running()
-        self.assertFalse(pex._tasks_to_cancel)
+        self.assertFalse(pex._cancel_list)
+        self.assertFalse(pex._tasks_to_watch)
+        self.assertFalse(pex._uids_to_watch)
+        pex.advance.assert_called_once_with([task], rps.CANCELED,
+                                            publish=True, push=False)
+
+        # case 2: exit_code == 0, and case 3: exit_code == 1 - completed
+        # tasks are passed on in bulk
+        pex.advance.reset_mock()
+        pex.publish.reset_mock()
+        tasks = [_watch(2, 0), _watch(3, 1), _watch(4, None)]
+        self.assertEqual(pex._check_running(), 2)
+        self.assertEqual(tasks[0]['target_state'], rps.DONE)
+        self.assertEqual(tasks[1]['target_state'], rps.FAILED)
+        self.assertEqual(tasks[0]['exit_code'], 0)
+        self.assertEqual(list(pex._tasks_to_watch), [4])
+        self.assertEqual(pex.publish.call_args[0][1], tasks[:2])
+        self.assertEqual(pex.advance.call_args[0][0], tasks[:2])
+
+        # only the given processes are checked if exits are known
+        tasks[2]['proc'].poll.reset_mock()
+        self.assertEqual(pex._check_running(exited=[]), 0)
+        tasks[2]['proc'].poll.assert_not_called()
 
-        # case 2: exit_code == 0
-        task['proc'] = mock.Mock()
-        task['proc'].poll.return_value = 0
-        pex._tasks_to_watch.append(task)
-        pex._check_running()
-        self.assertEqual(task['target_state'], rps.DONE)
+    # --------------------------------------------------------------------------
+    #
+    @pytest.mark.skipif(not hasattr(os, 'pidfd_open'),
+                        reason='pidfds not supported')
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    def test_wait_exited(self, mocked_init):
 
-        # case 3: exit_code == 1
-        task['proc'] = mock.Mock()
-        task['proc'].poll.return_value = 1
-        pex._tasks_to_watch.append(task)
-        pex._check_running()
-        self.assertEqual(task['target_state'], rps.FAILED)
+        pex = Popen(cfg=None, session=None)
+        pex._log            = mock.Mock()
+        pex._watch_timeout  = 10.0
+        pex._pidfds         = {}
+        pex._epoll          = select.epoll()
+        pex._epoll_lock     = mt.Lock()
+        pex._wake_r, pex._wake_w = os.pipe()
+        os.set_blocking(pex._wake_r, False)
+        pex._epoll.register(pex._wake_r, select.EPOLLIN)
+
+        # the watcher is woken up by process exits, and learns their pids
+        proc  = subprocess.Popen(['true'])
+        pidfd = os.pidfd_open(proc.pid)
+        pex._pidfds[pidfd] = proc.pid
+        pex._epoll.register(pidfd, select.EPOLLIN)
+
+        self.assertEqual(pex._wait_exited(), [proc.pid])
+        self.assertFalse(pex._pidfds)
+        self.assertEqual(proc.wait(), 0)
+
+        # and by wakeup requests
+        pex._wake()
+        self.assertEqual(pex._wait_exited(), [])
+
+        os.close(pex._wake_r)
+        os.close(pex._wake_w)
+        pex._epoll.close()
+
+    # --------------------------------------------------------------------------
+    #
+    @pytest.mark.skipif(not hasattr(os, 'pidfd_open'),
+                        reason='pidfds not supported')
+    @mock.patch.object(Popen, '__init__', return_value=None)
+    def test_pidfd_fallback(self, mocked_init):
+
+        pex = Popen(cfg=None, session=None)
+        pex._log            = pex._prof = mock.Mock()
+        pex._watch_timeout  = 0.1
+        pex._na_launch      = {}
+        pex._cancel_lock    = mt.RLock()
+        pex._cancel_list    = CancelRegistry()
+        pex._cgroup_path    = {}
+        pex._uids_to_watch  = {}
+        pex._watch_queue    = mock.Mock()
+        pex._spawn          = mock.Mock()
+        pex._pidfds         = {}
+        pex._epoll          = select.epoll()
+        pex._epoll_lock     = mt.Lock()
+        pex._wake_r, pex._wake_w = os.pipe()
+        os.set_blocking(pex._wake_r, False)
+        os.set_blocking(pex._wake_w, False)
+        pex._epoll.register(pex._wake_r, select.EPOLLIN)
+
+        proc  = subprocess.Popen(['sleep', '10'])
+        pidfd = os.pidfd_open(proc.pid)
+        pex._pidfds[pidfd] = proc.pid
+        pex._epoll.register(pidfd, select.EPOLLIN)
+        epoll = pex._epoll
+
+        try:
+            # if pidfds can't be opened, the epoll set and all pidfds are
+            # closed, and the watcher polls the running processes
+            with mock.patch('os.pidfd_open', side_effect=OSError):
+                self.assertTrue(pex._spawn_task({'uid'              : 't.0',
+                                                 'task_sandbox_path': '/tmp'}))
+
+            self.assertIsNone(pex._epoll)
+            self.assertTrue(epoll.closed)
+            self.assertFalse(pex._pidfds)
+            with self.assertRaises(OSError):
+                os.fstat(pidfd)
+
+            self.assertIsNone(pex._wait_exited())
+
+        finally:
+            proc.kill()
+            proc.wait()
+            os.close(pex._wake_r)
+            os.close(pex._wake_w)
 
     # --------------------------------------------------------------------------
     #
@@ -163,7 +590,13 @@ if __name__ == '__main__':
     tc.setUpClass()
     tc.test_command_cb()
     tc.test_check_running()
+    tc.test_wait_exited()
+    tc.test_pidfd_fallback()
     tc.test_handle_task()
+    tc.test_script_fragments()
+    tc.test_node_agents()
+    tc.test_work()
+    tc.test_proc()
 
 
 # ------------------------------------------------------------------------------
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access, unused-argument
+
+__copyright__ = 'Copyright 2022, The RADICAL-Cybertools Team'
+__license__   = 'MIT'
+
+import json
+import random
+import shutil
+import tempfile
+
+import threading as mt
+
+from unittest import mock, TestCase
+
+import radical.pilot.states as rps
+
+from radical.pilot.agent.executing.sleep import Sleep, sample_runtime, \
+                                               load_trace
+from radical.pilot.utils                 import CancelRegistry
+
+
+# ------------------------------------------------------------------------------
+#
+class TestSleep(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def setUp(self):
+
+        self._dir = tempfile.mkdtemp()
+
+
+    # --------------------------------------------------------------------------
+    #
+    def tearDown(self):
+
+        shutil.rmtree(self._dir)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_sample_runtime(self):
+
+        rng = random.Random(42)
+
+        self.assertEqual(sample_runtime(10),         10.0)
+        self.assertEqual(sample_runtime('2.5'),       2.5)
+        self.assertEqual(sample_runtime(-1),          0.0)
+        self.assertEqual(sample_runtime('const:3'),   3.0)
+
+        for _ in range(100):
+            self.assertTrue(5.0 <= sample_runtime('uniform:5,15', rng) <= 15.0)
+            self.assertTrue(0.0 <= sample_runtime('exp:10',       rng))
+            self.assertTrue(0.0 <= sample_runtime('normal:1,10',  rng))
+
+        # samples are reproducible
+        rts_1 = [sample_runtime('lognormal:2,0.5', random.Random(1))
+                 for _ in range(10)]
+        rts_2 = [sample_runtime('lognormal:2,0.5', random.Random(1))
+                 for _ in range(10)]
+        self.assertEqual(rts_1, rts_2)
+
+        with self.assertRaises(ValueError):
+            sample_runtime('weibull:1,2')
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_load_trace(self):
+
+        fname = '%s/trace.json' % self._dir
+        with open(fname, 'w') as fout:
+            json.dump({'task.0000': 3, 'task.0001': 1.5}, fout)
+
+        runtimes, seq = load_trace(fname)
+        self.assertEqual(runtimes, {'task.0000': 3.0, 'task.0001': 1.5})
+        self.assertEqual(seq, [3.0, 1.5])
+
+        # runtimes from recorded profiles, in start order
+        with open('%s/agent_executing.0000.prof' % self._dir, 'w') as fout:
+            fout.write('#time,event,comp,thread,uid,state,msg\n')
+            fout.write('100.0,task_run_start,exec,Main,task.0001,,\n')
+            fout.write('101.0,task_run_start,exec,Main,task.0000,,\n')
+            fout.write('102.0,task_run_start,exec,Main,task.0002,,\n')
+            fout.write('103.5,task_run_stop,exec,Main,task.0000,,\n')
+            fout.write('104.0,task_run_stop,exec,Main,task.0001,,\n')
+
+        runtimes, seq = load_trace(self._dir)
+        self.assertEqual(runtimes, {'task.0001': 4.0, 'task.0000': 2.5})
+        self.assertEqual(seq, [4.0, 2.5])
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Sleep, '__init__', return_value=None)
+    def test_get_runtime(self, mocked_init):
+
+        sex = Sleep(cfg=None, session=None)
+        sex._rng       = random.Random(42)
+        sex._trace     = dict()
+        sex._trace_seq = list()
+        sex._trace_idx = 0
+
+        task = {'uid'        : 'task.0000',
+                'description': {'arguments': ['5'],
+                                'metadata' : None}}
+        self.assertEqual(sex._get_runtime(task), 5.0)
+
+        task['description']['metadata'] = {'runtime': 'uniform:1,2'}
+        self.assertTrue(1.0 <= sex._get_runtime(task) <= 2.0)
+
+        # traces are replayed by uid, then in order
+        sex._trace     = {'task.0000': 7.0, 'task.0001': 8.0}
+        sex._trace_seq = [7.0, 8.0]
+        self.assertEqual(sex._get_runtime(task), 7.0)
+
+        task['uid'] = 'task.0002'
+        self.assertEqual([sex._get_runtime(task) for _ in range(3)],
+                         [7.0, 8.0, 7.0])
+
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Sleep, '__init__', return_value=None)
+    def test_timed(self, mocked_init):
+
+        sex = Sleep(cfg=None, session=None)
+        sex._log         = mock.Mock()
+        sex._prof        = mock.Mock()
+        sex._cancel_list = CancelRegistry()
+        sex._terminate   = mt.Event()
+        sex._tasks_cond  = mt.Condition()
+        sex._tasks       = dict()
+        sex._deadlines   = list()
+        sex._delay       = 0.1
+        sex._rng         = random.Random(42)
+        sex._trace       = dict()
+        sex._trace_seq   = list()
+        sex._trace_idx   = 0
+        sex._n_done      = 0
+        sex._late_sum    = 0.0
+        sex._late_max    = 0.0
+
+        finished = list()
+        advanced = mt.Event()
+
+        def _advance(tasks, state, publish, push):
+            if state == rps.AGENT_STAGING_OUTPUT_PENDING:
+                finished.append([t['uid'] for t in tasks])
+                if sum(len(f) for f in finished) == 3:
+                    advanced.set()
+
+        sex.advance = mock.Mock(side_effect=_advance)
+        sex.publish = mock.Mock()
+
+        tasks = [{'uid'        : 'task.%04d' % i,
+                  'stderr'     : None,
+                  'description': {'arguments': [rt], 'metadata': None}}
+                 for i, rt in enumerate([0.2, 0.0, 0.2, 3600])]
+
+        sex.work(tasks)
+        self.assertEqual(len(sex._tasks), 4)
+
+        # long running tasks are canceled right away
+        sex.command_cb(None, {'cmd': 'cancel_tasks',
+                              'arg': {'uids': ['task.0003']}})
+        self.assertNotIn('task.0003', sex._tasks)
+        sex.advance.assert_any_call([tasks[3]], rps.CANCELED,
+                                    publish=True, push=False)
+
+        watcher = mt.Thread(target=sex._timed)
+        watcher.daemon = True
+        watcher.start()
+
+        self.assertTrue(advanced.wait(timeout=5.0))
+        sex._terminate.set()
+        watcher.join()
+
+        # tasks with the same deadline complete in one bulk
+        self.assertEqual(finished, [['task.0001'], ['task.0000', 'task.0002']])
+        self.assertEqual(sex._n_done, 3)
+        for task in tasks[:3]:
+            self.assertEqual(task['target_state'], rps.DONE)
+            self.assertEqual(task['exit_code'], 0)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestSleep()
+    tc.test_sample_runtime()
+    tc.test_load_trace()
+    tc.test_get_runtime()
+    tc.test_timed()
+
+
+# ------------------------------------------------------------------------------
@@ -134,6 +134,40 @@ class RMBaseTestCase(TestCase):
                 self.assertEqual(rm_info_output.node_list, result)
 
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(ResourceManager, '__init__', return_value=None)
+    def test_get_numa_domains(self, mocked_init):
+
+        rm = ResourceManager(cfg=None, log=None, prof=None)
+        rm._log = mock.Mock()
+
+        rm_info = RMInfo({'node_list': [{'node_name': 'node00',
+                                         'node_id'  : '1',
+                                         'cores'    : [0] * 8,
+                                         'gpus'     : [0] * 2}]})
+
+        # topology unknown
+        self.assertEqual(rm._get_numa_domains(rm_info, None), [])
+
+        # even split
+        self.assertEqual(rm._get_numa_domains(rm_info, 2),
+                         [{'cores': [0, 1, 2, 3], 'gpus': [0]},
+                          {'cores': [4, 5, 6, 7], 'gpus': [1]}])
+        self.assertEqual(rm._get_numa_domains(rm_info, 4)[3],
+                         {'cores': [6, 7], 'gpus': [1]})
+
+        # explicit layout
+        spec = [{'cores': [0, 2, 4, 6], 'gpus': [1]},
+                {'cores': [1, 3, 5, 7]}]
+        self.assertEqual(rm._get_numa_domains(rm_info, spec),
+                         [{'cores': [0, 2, 4, 6], 'gpus': [1]},
+                          {'cores': [1, 3, 5, 7], 'gpus': []}])
+
+        with self.assertRaises(RuntimeError):
+            # node has no core #8
+            rm._get_numa_domains(rm_info, [{'cores': [7, 8], 'gpus': []}])
+
     # --------------------------------------------------------------------------
     #
     @mock.patch.object(ResourceManager, '__init__', return_value=None)
@@ -250,6 +284,7 @@ if __name__ == '__main__':
     tc.test_init_from_registry()
     tc.test_init_from_scratch()
     tc.test_cores_cpus_map()
+    tc.test_get_numa_domains()
     tc.test_set_info()
     tc.test_find_launcher()
     tc.test_prepare_launch_methods()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access
+
+from unittest import TestCase
+
+from radical.pilot.agent.scheduler.backfill import Backfill
+
+
+# ------------------------------------------------------------------------------
+#
+class TestBackfill(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _task(self, uid, cores, runtime=None, ranks=1):
+
+        md = None
+        if runtime is not None:
+            md = {'runtime_estimate': runtime}
+
+        return {'uid'        : uid,
+                'tuple_size' : (ranks, cores, 0, 0, 0),
+                'description': {'metadata': md}}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _backfill(self, mode):
+
+        # one node with 8 cores, 6 of which are busy: 4 until t=10, 2 until t=20
+        nodes = [{'cores': [0] * 8, 'gpus': [], 'lfs': 0, 'mem': 0}]
+        bf    = Backfill(nodes, mode)
+        bf.start(self._task('run.0', 4, 10), now=0)
+        bf.start(self._task('run.1', 2, 20), now=0)
+        bf.reset()
+
+        return bf
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_easy(self):
+
+        bf = self._backfill('easy')
+
+        # no reservations: everything gets admitted
+        self.assertTrue(bf.admit(self._task('t.0', 2, 100), now=0))
+
+        # the head task gets its reservation once the first task ends
+        self.assertEqual(bf.reserve(self._task('head', 6, 5), now=0), 10)
+        self.assertEqual(bf._times,  [0, 10, 15, 20])
+        self.assertEqual(bf._free_c, [2,  0,  6,  8])
+
+        # short tasks can backfill, long or unknown ones can't
+        self.assertTrue (bf.admit(self._task('t.1', 2,   10), now=0))
+        self.assertFalse(bf.admit(self._task('t.2', 2,   11), now=0))
+        self.assertFalse(bf.admit(self._task('t.3', 2, None), now=0))
+        self.assertFalse(bf.admit(self._task('t.4', 4,    1), now=0))
+
+        # only one reservation in easy mode
+        self.assertIsNone(bf.reserve(self._task('next', 2, 5), now=0))
+
+        # admitted tasks are accounted for in the profile
+        bf.start(self._task('t.1', 2, 10), now=0)
+        self.assertEqual(bf._free_c, [0, 0, 6, 8])
+        self.assertFalse(bf.admit(self._task('t.5', 1, 1), now=0))
+
+        # a new pass drops all reservations
+        bf.reset()
+        self.assertTrue(bf.admit(self._task('t.6', 2, 100), now=0))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_conservative(self):
+
+        bf = self._backfill('conservative')
+
+        self.assertEqual(bf.reserve(self._task('head.0', 6, 5), now=0), 10)
+        self.assertEqual(bf.reserve(self._task('head.1', 4, 5), now=0), 15)
+        self.assertEqual(bf.reserve(self._task('head.2', 8, 1), now=0), 20)
+
+        # tasks with unknown runtime reserve forever
+        self.assertEqual(bf.reserve(self._task('head.3', 2), now=0), 21)
+        self.assertEqual(bf._times,  [0, 10, 15, 20, 21])
+        self.assertEqual(bf._free_c, [2,  0,  2,  0,  6])
+        self.assertIsNone(bf.reserve(self._task('head.4', 8), now=0))
+
+        # backfill into the gaps between reservations
+        self.assertTrue (bf.admit(self._task('t.0', 2, 10), now=0))
+        self.assertFalse(bf.admit(self._task('t.1', 2, 10), now=5))
+        self.assertTrue (bf.admit(self._task('t.2', 2,  5), now=15))
+        self.assertFalse(bf.admit(self._task('t.3', 2,  6), now=15))
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_estimate(self):
+
+        bf = self._backfill('easy')
+
+        # estimates are learned per tuple size
+        self.assertIsNone(bf.estimate(self._task('t.0', 1)))
+
+        bf.start(self._task('t.0', 1), now=0)
+        bf.start(self._task('t.1', 1), now=0)
+        bf.stop (self._task('t.0', 1), now=2)
+        self.assertEqual(bf.estimate(self._task('t.2', 1)), 2)
+
+        bf.stop (self._task('t.1', 1), now=4)
+        self.assertEqual(bf.estimate(self._task('t.2', 1)), 3)
+        self.assertIsNone(bf.estimate(self._task('t.2', 1, ranks=2)))
+
+        # explicit estimates take precedence
+        self.assertEqual(bf.estimate(self._task('t.2', 1, 10)), 10)
+
+        # unknown tasks are ignored
+        bf.stop(self._task('t.3', 1), now=100)
+        self.assertEqual(bf.estimate(self._task('t.2', 1)), 3)
+
+        with self.assertRaises(ValueError):
+            Backfill([], 'unknown')
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestBackfill()
+    tc.test_easy()
+    tc.test_conservative()
+    tc.test_estimate()
+
+
+# ------------------------------------------------------------------------------
+
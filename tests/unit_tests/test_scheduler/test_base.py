@@ -3,12 +3,19 @@
 # pylint: disable=protected-access, unused-argument, no-value-for-parameter
 
 import os
+import queue
 import pytest
+import collections
 import radical.utils as ru
 
+import threading     as mt
+
 from unittest import mock, TestCase
 
-from radical.pilot.agent.scheduler.base import AgentSchedulingComponent
+from radical.pilot.agent.scheduler.base     import AgentSchedulingComponent
+from radical.pilot.agent.scheduler.ordering import Ordering
+from radical.pilot.agent.scheduler.waitpool import WaitPool
+from radical.pilot.agent.scheduler.shards   import Shards
 
 base = os.path.abspath(os.path.dirname(__file__))
 
@@ -78,9 +85,11 @@ class TestBaseScheduling(TestCase):
     def test_change_slot_states(self, mocked_init):
 
         sched = AgentSchedulingComponent(cfg=None, session=None)
+        sched._index = None
 
         for c in self._test_cases['change_slots']:
             sched.nodes = c['nodes']
+            sched._index_nodes()
             if c['result'] == 'RuntimeError':
                 with self.assertRaises(RuntimeError):
                     sched._change_slot_states(slots=c['slots'],
@@ -117,6 +126,8 @@ class TestBaseScheduling(TestCase):
 
         component = AgentSchedulingComponent(None, None)
         component._active_cnt    = 0
+        component._backfill      = None
+        component._shards        = None
         component._log           = mock.Mock()
         component._prof          = mock.Mock()
         component._prof.prof     = mock.Mock(return_value=True)
@@ -133,6 +144,524 @@ class TestBaseScheduling(TestCase):
 
             self.assertEqual(task['slots'], c['slots'])
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_schedule_waitpool(self, mocked_init):
+
+        component = AgentSchedulingComponent(None, None)
+        component._log        = mock.Mock()
+        component._prof       = mock.Mock()
+        component._ts_reuse   = False
+        component._named_envs = list()
+        component._backfill   = None
+        component._shards     = None
+        component._index      = None
+        component.advance     = mock.Mock()
+
+        nodes = [{'cores': [0] * 8, 'gpus': [0] * 2, 'lfs': 0, 'mem': 0}]
+
+        def _task(uid, cores, gpus):
+            task = {'uid'        : uid,
+                    'description': {'ranks'         : 1,
+                                    'cores_per_rank': cores,
+                                    'gpus_per_rank' : gpus,
+                                    'lfs_per_rank'  : 0,
+                                    'mem_per_rank'  : 0,
+                                    'tags'          : {}}}
+            component._set_tuple_size(task)
+            return task
+
+        # mixed workload: the large CPU tasks leave no cores for the GPU tasks
+        # unless those are placed first
+        mixed = [['c', 4, 0, 4], ['g', 1, 1, 2]]
+
+        # the `x` tasks are larger than the `s` tasks and are thus not tried
+        # once those don't fit
+        small = [['s', 3, 0, 3], ['x', 4, 0, 2]]
+
+        for ordering, workload, placed, n_tries in [
+                ['largest_first',  mixed, ['c.0', 'c.1'],        4],
+                ['gpu_first',      mixed, ['g.0', 'g.1', 'c.0'], 4],
+                ['smallest_first', small, ['s.0', 's.1'],        3]]:
+
+            free = {'cores': 8, 'gpus': 2}
+
+            def _try_allocation(task):
+                cores = task['description']['cores_per_rank']
+                gpus  = task['description']['gpus_per_rank']
+                if cores > free['cores'] or gpus > free['gpus']:
+                    return False
+                free['cores'] -= cores
+                free['gpus']  -= gpus
+                return True
+
+            component._try_allocation = mock.Mock(side_effect=_try_allocation)
+            component._ordering = Ordering.create(ordering, nodes)
+            component._waitpool = WaitPool(component._ordering)
+            for name, cores, gpus, n in workload:
+                component._waitpool.add([_task('%s.%d' % (name, i), cores, gpus)
+                                         for i in range(n)])
+
+            self.assertEqual(component._schedule_waitpool(), (False, True))
+
+            scheduled = component.advance.call_args[0][0]
+            self.assertEqual([t['uid'] for t in scheduled], placed)
+            self.assertEqual(len(component._waitpool),
+                             sum(w[3] for w in workload) - len(placed))
+
+            # tasks of a tuple size which did not fit are not tried again
+            self.assertEqual(component._try_allocation.call_count, n_tries)
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_schedule_waitpool_backfill(self, mocked_init):
+
+        component = AgentSchedulingComponent(None, None)
+        component._log        = mock.Mock()
+        component._prof       = mock.Mock()
+        component._named_envs = list()
+        component._shards     = None
+        component._index      = None
+        component.advance     = mock.Mock()
+        component._ordering   = Ordering.create('priority', [])
+        component._waitpool   = WaitPool(component._ordering)
+
+        component._try_allocation = mock.Mock(return_value=True)
+
+        # backfill refuses the highest priority task (it would delay
+        # a reservation)
+        component._backfill = mock.Mock()
+        component._backfill.admit.side_effect = \
+                                          lambda task: task['uid'] != 'a.0'
+
+        def _task(uid, cores, priority):
+            task = {'uid'        : uid,
+                    'description': {'ranks'         : 1,
+                                    'cores_per_rank': cores,
+                                    'gpus_per_rank' : 0,
+                                    'tags'          : {'priority': priority}}}
+            component._set_tuple_size(task)
+            return task
+
+        component._waitpool.add([_task('a.0', 2, 2),
+                                 _task('b.0', 2, 1),
+                                 _task('c.0', 4, 0)])
+
+        # a refused task does not block other tasks of the same or larger
+        # tuple sizes
+        self.assertEqual(component._schedule_waitpool(), (False, True))
+
+        scheduled = component.advance.call_args[0][0]
+        self.assertEqual([t['uid'] for t in scheduled], ['b.0', 'c.0'])
+        self.assertEqual(list(component._waitpool), ['a.0'])
+        component._backfill.reserve.assert_called_once()
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_schedule_incoming(self, mocked_init):
+
+        component = AgentSchedulingComponent(None, None)
+        component._log         = mock.Mock()
+        component._term        = mt.Event()
+        component._queue_sched = queue.Queue()
+        component._raptor_lock = mt.Lock()
+        component._named_envs  = list()
+        component._backfill    = None
+        component._shards      = None
+        component._ordering    = Ordering.create('priority', [])
+        component._waitpool    = WaitPool(component._ordering)
+        component.advance      = mock.Mock()
+
+        # count the computed ordering keys
+        key = component._ordering.key
+        component._ordering.key = mock.Mock(side_effect=key)
+
+        # the last task does not fit and has to wait
+        component._try_allocation     = mock.Mock(side_effect=[True, True,
+                                                               False])
+        component._set_resources      = mock.Mock()
+        component._advance_scheduled  = mock.Mock()
+
+        tasks = [{'uid'        : 'task.%04d' % i,
+                  'description': {'ranks'         : 1,
+                                  'cores_per_rank': 1,
+                                  'tags'          : {'priority': prio}}}
+                 for i, prio in enumerate([1, 'high', None, 2])]
+        component._queue_sched.put(tasks)
+
+        # tasks with an invalid priority fail, all others get scheduled in
+        # order of priority
+        self.assertEqual(component._schedule_incoming(), (False, True))
+
+        scheduled = [c[0][0][0]['uid']
+                     for c in component._advance_scheduled.call_args_list]
+        self.assertEqual(scheduled, ['task.0003', 'task.0000'])
+        self.assertEqual(list(component._waitpool), ['task.0002'])
+
+        component.advance.assert_called_once_with(tasks[1], 'FAILED',
+                                                  publish=True, push=False)
+        self.assertIn('invalid priority', tasks[1]['stderr'])
+
+        # ordering keys are computed once per task
+        self.assertEqual(component._ordering.key.call_count, 4)
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_schedule_tasks(self, mocked_init):
+
+        component = AgentSchedulingComponent(None, None)
+        component._log           = mock.Mock()
+        component._waitpool      = dict()
+        component._shards        = None
+        component._term          = mt.Event()
+        component._wakeup        = mt.Event()
+        component._queue_sched   = queue.Queue()
+        component._idle_timeout  = 10.0
+        component._batch_window  = 0.0
+        component.advance        = mock.Mock()
+        component.register_subscriber = mock.Mock()
+        component.register_output     = mock.Mock()
+        component.register_publisher  = mock.Mock()
+
+        component._schedule_waitpool   = mock.Mock(return_value=(False, False))
+        component._unschedule_completed = mock.Mock(return_value=(False, False))
+
+        received = queue.Queue()
+
+        def _schedule_incoming():
+            while not component._queue_sched.empty():
+                received.put(component._queue_sched.get())
+            return False, False
+
+        component._schedule_incoming = _schedule_incoming
+
+        thread = mt.Thread(target=component._schedule_tasks)
+        thread.daemon = True
+        thread.start()
+
+        # the idle scheduler loop picks up new tasks well before the idle
+        # timeout
+        try:
+            component.work(['task.0000'])
+            self.assertEqual(received.get(timeout=5.0), ['task.0000'])
+            component.work(['task.0001'])
+            self.assertEqual(received.get(timeout=5.0), ['task.0001'])
+
+        finally:
+            component._term.set()
+            component._wakeup.set()
+            thread.join(timeout=5.0)
+
+        self.assertFalse(thread.is_alive())
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_control_cb(self, mocked_init):
+
+        component = AgentSchedulingComponent(None, None)
+        component._named_envs = list()
+        component._wakeup     = mt.Event()
+
+        # a new named env wakes up the scheduler loop, as tasks may wait for it
+        msg = {'cmd': 'register_named_env', 'arg': {'env_name': 'env.0'}}
+        self.assertTrue(component._control_cb(None, msg))
+        self.assertEqual(component._named_envs, ['env.0'])
+        self.assertTrue(component._wakeup.is_set())
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_shards(self, mocked_init):
+
+        nodes = [{'node_name': 'node.%04d' % i,
+                  'node_id'  : 'node.%04d' % i,
+                  'cores'    : [0] * 8,
+                  'gpus'     : [],
+                  'lfs'      : 0,
+                  'mem'      : 0} for i in range(4)]
+
+        component = AgentSchedulingComponent(None, None)
+        component._log          = mock.Mock()
+        component._prof         = mock.Mock()
+        component._shards       = Shards(nodes, 2)
+        component._shard_lock   = mt.Lock()
+        component._shard_queues = [[queue.Queue(), queue.Queue(), mt.Event()]
+                                   for _ in range(2)]
+        component._queue_coord  = queue.Queue()
+        component._span_waiting = collections.deque()
+        component._span_task    = None
+        component._span_parts   = None
+        component._span_aborted = dict()
+        component._shard        = None
+        component.advance       = mock.Mock()
+
+        def _task(uid, ranks):
+            return {'uid'        : uid,
+                    'description': {'ranks'         : ranks,
+                                    'cores_per_rank': 4,
+                                    'gpus_per_rank' : 0,
+                                    'tags'          : {}}}
+
+        def _drain(idx, qidx=0):
+            ret = list()
+            q   = component._shard_queues[idx][qidx]
+            while not q.empty():
+                ret.extend(ru.as_list(q.get()))
+            return ret
+
+        # small tasks are routed to a shard, larger ones span shards - one at
+        # a time
+        small = _task('task.0000', 1)
+        large = [_task('task.0001', 6), _task('task.0002', 5)]
+        component.work([small] + large)
+
+        shard_0 = _drain(0)
+        shard_1 = _drain(1)
+        self.assertEqual([t['uid'] for t in shard_0], ['task.0000', 'task.0001'])
+        self.assertEqual([t['uid'] for t in shard_1], ['task.0001'])
+        self.assertEqual(shard_0[1]['description']['ranks'], 2)
+        self.assertEqual(shard_1[0]['description']['ranks'], 4)
+        self.assertTrue(component._shard_queues[0][2].is_set())
+        self.assertEqual(list(component._span_waiting), [large[1]])
+
+        # once all parts are placed, the task continues with the merged slots
+        def _slots(node_ids):
+            return {'ranks'       : [{'node_id' : nid,
+                                      'core_map': [[0, 1, 2, 3]],
+                                      'gpu_map' : [],
+                                      'lfs'     : 0,
+                                      'mem'     : 0} for nid in node_ids],
+                    'partition_id': None}
+
+        component._queue_coord.put(['placed', 1, shard_1[0],
+                                    _slots(['node.0002'] * 2 +
+                                           ['node.0003'] * 2)])
+        component._queue_coord.put(['placed', 0, shard_0[1],
+                                    _slots(['node.0001'] * 2)])
+        component._queue_coord.put(None)
+        component._coordinate()
+
+        task = component.advance.call_args[0][0]
+        self.assertIs(task, large[0])
+        self.assertEqual([r['node_id'] for r in task['slots']['ranks']],
+                         ['node.0001'] * 2 + ['node.0002'] * 2 +
+                         ['node.0003'] * 2)
+        self.assertEqual(task['resources'], {'cpu': 24, 'gpu': 0})
+
+        # and the next spanning task gets passed on to the shards
+        self.assertEqual(component._span_task, large[1])
+        self.assertEqual([t['uid'] for t in _drain(0) + _drain(1)],
+                         ['task.0002', 'task.0002'])
+
+        # completed tasks are released by the shards holding their slots
+        small['slots'] = _slots(['node.0001'])
+        component.unschedule_cb(None, small)
+        component.unschedule_cb(None, large[0])
+
+        released_0 = _drain(0, 1)
+        released_1 = _drain(1, 1)
+        self.assertEqual(released_0[0], small)
+        self.assertEqual(len(released_0[1]['slots']['ranks']), 2)
+        self.assertEqual(released_0[1]['tuple_size'], (2, 4, 0, 0, 0))
+        self.assertEqual(len(released_1[0]['slots']['ranks']), 4)
+        self.assertEqual(released_1[0]['tuple_size'], (4, 4, 0, 0, 0))
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_shards_failed(self, mocked_init):
+
+        nodes = [{'node_name': 'node.%04d' % i,
+                  'node_id'  : 'node.%04d' % i,
+                  'cores'    : [0] * 8,
+                  'gpus'     : [],
+                  'lfs'      : 0,
+                  'mem'      : 0} for i in range(6)]
+
+        component = AgentSchedulingComponent(None, None)
+        component._log          = mock.Mock()
+        component._prof         = mock.Mock()
+        component._shards       = Shards(nodes, 3)
+        component._shard_lock   = mt.Lock()
+        component._shard_queues = [[queue.Queue(), queue.Queue(), mt.Event()]
+                                   for _ in range(3)]
+        component._queue_coord  = queue.Queue()
+        component._span_waiting = collections.deque()
+        component._span_task    = None
+        component._span_parts   = None
+        component._span_aborted = dict()
+        component._shard        = None
+        component.advance       = mock.Mock()
+
+        def _task(uid, ranks):
+            return {'uid'        : uid,
+                    'description': {'ranks'         : ranks,
+                                    'cores_per_rank': 4,
+                                    'gpus_per_rank' : 0,
+                                    'tags'          : {}}}
+
+        def _drain(idx, qidx=0):
+            ret = list()
+            q   = component._shard_queues[idx][qidx]
+            while not q.empty():
+                ret.extend(ru.as_list(q.get()))
+            return ret
+
+        def _slots(node_id, n):
+            return {'ranks'       : [{'node_id' : node_id,
+                                      'core_map': [[0, 1, 2, 3]],
+                                      'gpu_map' : [],
+                                      'lfs'     : 0,
+                                      'mem'     : 0}] * n,
+                    'partition_id': None}
+
+        # a task spanning all three shards, and the next spanning task
+        large = [_task('task.0000', 12), _task('task.0001', 6)]
+        component.work(large)
+        parts = [_drain(idx)[0] for idx in range(3)]
+        self.assertEqual(component._span_task, large[0])
+        component.advance.reset_mock()
+
+        # shard 0 placed its part, shard 1 cannot place its part, and shard 2
+        # places its part only later
+        component._queue_coord.put(['placed', 0, parts[0],
+                                    _slots('node.0000', 4)])
+        component._queue_coord.put(['failed', 1, parts[1],
+                                    'insufficient resources'])
+        component._queue_coord.put(['placed', 2, parts[2],
+                                    _slots('node.0004', 4)])
+        component._queue_coord.put(None)
+        component._coordinate()
+
+        # the task fails, ...
+        component.advance.assert_called_once_with(large[0], 'FAILED',
+                                                  publish=True, push=False)
+        self.assertEqual(large[0]['stderr'], 'insufficient resources')
+
+        # ... its placed parts are released on their shards, ...
+        released_0 = _drain(0, 1)
+        released_2 = _drain(2, 1)
+        self.assertEqual(len(released_0), 1)
+        self.assertEqual(released_0[0]['uid'], 'task.0000')
+        self.assertEqual(released_0[0]['tuple_size'], (4, 4, 0, 0, 0))
+        self.assertEqual(len(released_2), 1)
+        self.assertEqual(_drain(1, 1), [])
+        self.assertEqual(component._span_aborted, dict())
+
+        # ... its load is released, and the next spanning task gets placed
+        self.assertEqual(component._span_task, large[1])
+        self.assertNotIn('task.0000', component._shards._spanning)
+
+        load = [[0, 0] for _ in range(3)]
+        for idx in range(3):
+            for part in _drain(idx):
+                load[idx][0] += part['description']['ranks'] * 4
+        self.assertEqual(component._shards._load, load)
+        self.assertEqual(sum(l[0] for l in load), 6 * 4)
+
+        # tasks failing on a shard release their load
+        small = _task('task.0002', 1)
+        component.work(small)
+        idx = [i for i in range(3) if _drain(i)][0]
+        self.assertEqual(component._shards._load[idx][0], load[idx][0] + 4)
+
+        component._queue_coord.put(['failed', idx, small, 'oops'])
+        component._queue_coord.put(None)
+        component._coordinate()
+        self.assertEqual(component._shards._load, load)
+
+        # shard processes report failed tasks and parts - parts are failed by
+        # the component process
+        component._shard = 1
+        component.advance.reset_mock()
+        component._fail_task(parts[1], 'oops')
+        component._fail_task(small, 'oops')
+
+        self.assertEqual(component._queue_coord.get(),
+                         ['failed', 1, parts[1], 'oops'])
+        self.assertEqual(component._queue_coord.get(),
+                         ['failed', 1, {'uid'        : 'task.0002',
+                                        'description': small['description']},
+                          'oops'])
+        component.advance.assert_called_once_with(small, 'FAILED',
+                                                  publish=True, push=False)
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(AgentSchedulingComponent, '__init__', return_value=None)
+    def test_unschedule_completed(self, mocked_init):
+
+        component = AgentSchedulingComponent(None, None)
+        component._log           = mock.Mock()
+        component._prof          = mock.Mock()
+        component._term          = mt.Event()
+        component._queue_unsched = queue.Queue()
+        component._backfill      = None
+        component._shards        = None
+        component.advance        = mock.Mock()
+        component.unschedule_tasks = mock.Mock()
+
+        def _task(uid, cores, tags=None):
+            task = {'uid'        : uid,
+                    'description': {'ranks'         : 1,
+                                    'cores_per_rank': cores,
+                                    'gpus_per_rank' : 0,
+                                    'lfs_per_rank'  : 0,
+                                    'mem_per_rank'  : 0,
+                                    'tags'          : tags or {}}}
+            component._set_tuple_size(task)
+            return task
+
+        for reuse in [True, False]:
+
+            component._active_cnt = 2
+            component._ts_reuse   = reuse
+            component.advance.reset_mock()
+            component.unschedule_tasks.reset_mock()
+
+            waiting = [_task('task.0002', 2),
+                       _task('task.0003', 2, {'colocate': 'a'}),
+                       _task('task.0004', 4)]
+            component._waitpool = WaitPool(Ordering.create('largest_first',
+                                                           []))
+            component._waitpool.add(waiting)
+
+            # tasks arrive as serialized dicts, i.e., tuple sizes are lists
+            done = [_task('task.0000', 2), _task('task.0001', 8)]
+            for task in done:
+                task['slots']      = {'ranks': [task['uid']]}
+                task['tuple_size'] = list(task['tuple_size'])
+
+            # executors publish completed tasks one by one or in bulk
+            if reuse:
+                for task in done:
+                    component._queue_unsched.put(task)
+            else:
+                component._queue_unsched.put(done)
+
+            self.assertEqual(component._unschedule_completed(), (True, True))
+
+            if reuse:
+                # task.0002 takes over the slots of task.0000
+                placed = component.advance.call_args[0][0]
+                self.assertEqual([t['uid'] for t in placed], ['task.0002'])
+                self.assertEqual(placed[0]['slots'], done[0]['slots'])
+                self.assertEqual(sorted(component._waitpool),
+                                 ['task.0003', 'task.0004'])
+                component.unschedule_tasks.assert_called_once_with([done[1]])
+                self.assertEqual(component._active_cnt, 1)
+
+            else:
+                component.advance.assert_not_called()
+                component.unschedule_tasks.assert_called_once_with(done)
+                self.assertEqual(len(component._waitpool), 3)
+                self.assertEqual(component._active_cnt, 0)
+
 
 # ------------------------------------------------------------------------------
 #
@@ -144,6 +673,12 @@ if __name__ == '__main__':
     tc.test_change_slot_states()
     tc.test_slot_status()
     tc.test_try_allocation()
+    tc.test_schedule_waitpool_backfill()
+    tc.test_schedule_incoming()
+    tc.test_control_cb()
+    tc.test_shards()
+    tc.test_shards_failed()
+    tc.test_unschedule_completed()
 
 
 # ------------------------------------------------------------------------------
@@ -5,6 +5,7 @@
 import os
 import copy
 import glob
+import random
 
 import multiprocessing as mp
 
@@ -12,10 +13,14 @@ from unittest import mock, TestCase
 
 import radical.utils           as ru
 import radical.pilot.constants as rpc
+import radical.pilot.states    as rps
 
 from radical.pilot.agent.resource_manager     import RMInfo
 
-from radical.pilot.agent.scheduler.continuous import Continuous
+from radical.pilot.agent.scheduler.continuous     import Continuous
+from radical.pilot.agent.scheduler.resource_index import ResourceIndex
+from radical.pilot.agent.scheduler.ordering       import Ordering
+from radical.pilot.agent.scheduler.waitpool       import WaitPool
 
 base = os.path.abspath(os.path.dirname(__file__))
 
@@ -42,6 +47,7 @@ class TestContinuous(TestCase):
         component._uid  = 'agent_scheduling.0001'
         component._log  = mock.Mock()
         component._prof = mock.Mock()
+        component._domains = None
 
         for test_case in self._test_cases:
 
@@ -62,6 +68,54 @@ class TestContinuous(TestCase):
 
             self.assertEqual(alc_slots, test_case['result']['slots']['ranks'])
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Continuous, '__init__', return_value=None)
+    def test_numa_domains(self, mocked_init):
+
+        component = Continuous(cfg=None, session=None)
+        component._uid     = 'agent_scheduling.0001'
+        component._log     = mock.Mock()
+        component._prof    = mock.Mock()
+        component._domains = [([0, 1, 2, 3], [0]),
+                              ([4, 5, 6, 7], [1])]
+
+        def _find(busy_cores, busy_gpus, n_slots, cores, gpus):
+
+            node = {'node_name': 'node.0000',
+                    'node_id'  : 'node.0000',
+                    'cores'    : [rpc.FREE] * 8,
+                    'gpus'     : [rpc.FREE] * 2,
+                    'lfs'      : 0,
+                    'mem'      : 0}
+            for idx in busy_cores:
+                node['cores'][idx] = rpc.BUSY
+            for idx in busy_gpus:
+                node['gpus'][idx]  = rpc.BUSY
+
+            slots = component._find_resources(node=node, find_slots=n_slots,
+                                              cores_per_slot=cores,
+                                              gpus_per_slot=gpus,
+                                              lfs_per_slot=0, mem_per_slot=0,
+                                              partial=False)
+            return [(slot['core_map'][0], [g[0] for g in slot['gpu_map']])
+                    for slot in slots]
+
+        # best fit: the domain with the fewest free cores which hosts the slot
+        self.assertEqual(_find([0, 1], [], 1, 2, 0), [([2, 3], [])])
+
+        # slots with GPUs stay with their GPU's cores
+        self.assertEqual(_find([], [0], 1, 1, 1), [([4], [1])])
+        self.assertEqual(_find([], [], 2, 2, 1), [([0, 1], [0]),
+                                                   ([4, 5], [1])])
+
+        # slots which span domains start with the cores close to the GPU
+        self.assertEqual(_find([], [0], 1, 6, 1), [([4, 5, 6, 7, 0, 1], [1])])
+
+        # without topology information, the first free cores are used
+        component._domains = None
+        self.assertEqual(_find([], [0], 1, 1, 1), [([0], [1])])
+
     # --------------------------------------------------------------------------
     #
     @mock.patch.object(Continuous, '__init__', return_value=None)
@@ -91,11 +145,18 @@ class TestContinuous(TestCase):
             component._active_cnt   = 0
             component._colo_history = {}
             component._tagged_nodes = set()
+            component._scattered    = False
+            component._domains      = None
             component._node_offset  = 0
             component._partitions   = {}
             component._term         = mp.Event()
-            component._queue_sched  = mp.Queue()
-            component._waitpool     = {}
+            component._queue_sched  = mp.SimpleQueue()
+            component._ts_reuse     = False
+            component._backfill     = None
+            component._shards       = None
+            component._index_nodes()
+            component._ordering     = Ordering.create('largest_first', nodes)
+            component._waitpool     = WaitPool(component._ordering)
 
             def advance(tasks, *args, **kwargs):
                 tasks = ru.as_list(tasks)
@@ -117,8 +178,68 @@ class TestContinuous(TestCase):
             component._change_slot_states(slots, rpc.FREE)
 
             component._set_tuple_size(task)
-            component._waitpool = {task['uid']: task}
+            component._waitpool.add([task])
             component._schedule_waitpool()
+            self.assertEqual(len(component._waitpool), 0)
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Continuous, '__init__', return_value=None)
+    def test_never_fits(self, mocked_init):
+
+        component = Continuous(cfg=None, session=None)
+        component._uid  = 'agent_scheduling.0004'
+        component._log  = mock.Mock()
+        component._prof = mock.Mock()
+
+        # 2 nodes with 4 cores each
+        nodes = [{'node_name': 'node.%d' % i,
+                  'node_id'  : str(i),
+                  'cores'    : [rpc.FREE] * 4,
+                  'gpus'     : [],
+                  'lfs'      : 0,
+                  'mem'      : 1024} for i in range(2)]
+
+        component.nodes    = nodes
+        component._rm      = mock.Mock()
+        component._rm.info = RMInfo({'cores_per_node': 4,
+                                     'gpus_per_node' : 0,
+                                     'lfs_per_node'  : 0,
+                                     'mem_per_node'  : 1024})
+
+        component._active_cnt   = 0
+        component._colo_history = {}
+        component._tagged_nodes = set()
+        component._scattered    = False
+        component._domains      = None
+        component._node_offset  = 0
+        component._partitions   = {}
+        component._named_envs   = list()
+        component._ts_reuse     = False
+        component._backfill     = None
+        component._shards       = None
+        component._index_nodes()
+        component._ordering     = Ordering.create('largest_first', nodes)
+        component._waitpool     = WaitPool(component._ordering)
+        component.advance       = mock.Mock()
+
+        # a task with 3 ranks of 4 cores can never be placed
+        task = {'uid'        : 'task.000000',
+                'description': {'ranks'         : 3,
+                                'cores_per_rank': 4,
+                                'gpus_per_rank' : 0,
+                                'lfs_per_rank'  : 0,
+                                'mem_per_rank'  : 0,
+                                'tags'          : {}}}
+        component._set_tuple_size(task)
+        component._waitpool.add([task])
+
+        component._schedule_waitpool()
+
+        self.assertEqual(len(component._waitpool), 0)
+        component.advance.assert_any_call(task, rps.FAILED,
+                                          publish=True, push=False)
+        self.assertEqual(task['stderr'], 'insufficient resources')
 
     # --------------------------------------------------------------------------
     #
@@ -145,9 +266,11 @@ class TestContinuous(TestCase):
             component._colo_history = {}
             component._tagged_nodes = set()
             component._scattered    = None
+            component._domains      = None
             component._node_offset  = 0
             component._partitions   = {}
             component.nodes         = nodes
+            component._index_nodes()
 
             slots = component.schedule_task(task)
 
@@ -188,7 +311,8 @@ class TestContinuous(TestCase):
 
         for test_case in self._test_cases:
 
-            component.nodes = copy.deepcopy(test_case['setup']['nodes'])
+            component.nodes  = copy.deepcopy(test_case['setup']['nodes'])
+            component._index_nodes()
 
             task = {'description': test_case['task']['description'],
                     'slots'      : test_case['result']['slots']}
@@ -203,6 +327,145 @@ class TestContinuous(TestCase):
             # nodes are back to the initial state
             self.assertEqual(component.nodes, test_case['setup']['nodes'])
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Continuous, '__init__', return_value=None)
+    @mock.patch('radical.utils.Logger')
+    def test_unschedule_tasks(self, mocked_logger, mocked_init):
+
+        component = Continuous(cfg=None, session=None)
+        component._uid = 'agent_scheduling.0006'
+        component._log = mocked_logger
+
+        for test_case in self._test_cases:
+
+            nodes = test_case['setup']['nodes']
+            slots = test_case['result']['slots']
+
+            component.nodes = copy.deepcopy(nodes)
+            component._index_nodes()
+
+            free  = [component._index.free(node['node_id']) for node in nodes]
+            total = component._index.total()
+            self.assertEqual(total, (sum(f[0] for f in free),
+                                     sum(f[1] for f in free)))
+
+            # allocate the same slots twice, then release both in one pass
+            tasks = [{'uid': 'task.%d' % i, 'slots': copy.deepcopy(slots)}
+                     for i in range(2)]
+
+            component._change_slot_states(tasks[0]['slots'], rpc.BUSY)
+            self.assertLessEqual(component._index.total(), total)
+            component.unschedule_tasks(tasks[:1])
+            self.assertEqual(component.nodes, nodes)
+
+            for task in tasks:
+                component._change_slot_states(task['slots'], rpc.BUSY)
+            component.unschedule_tasks(tasks)
+
+            self.assertEqual([component._index.free(node['node_id'])
+                              for node in nodes], free)
+            self.assertEqual(component._index.total(), total)
+
+        # unknown nodes are rejected
+        with self.assertRaises(RuntimeError):
+            component.unschedule_tasks([{'slots': {'ranks': [
+                {'node_id': 'unknown', 'core_map': [[0]], 'gpu_map': [],
+                 'lfs': 0, 'mem': 0}]}}])
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Continuous, '__init__', return_value=None)
+    @mock.patch('radical.utils.Logger')
+    def test_resource_index(self, mocked_logger, mocked_init):
+
+        # placement with and without resource index must be identical
+
+        def _component(scattered):
+
+            nodes = [{'node_name': 'node.%04d' % i,
+                      'node_id'  : 'node.%04d' % i,
+                      'cores'    : [rpc.FREE] * 8,
+                      'gpus'     : [rpc.FREE] * 2,
+                      'lfs'      : 0,
+                      'mem'      : 1024} for i in range(16)]
+
+            component = Continuous(cfg=None, session=None)
+            component._uid          = 'agent_scheduling.0005'
+            component._log          = mocked_logger
+            component._rm           = mock.Mock()
+            component._rm.info      = RMInfo({'cores_per_node': 8,
+                                              'gpus_per_node' : 2,
+                                              'lfs_per_node'  : 0,
+                                              'mem_per_node'  : 1024})
+            component._colo_history = {}
+            component._tagged_nodes = set()
+            component._scattered    = scattered
+            component._domains      = None
+            component._node_offset  = 0
+            component._partitions   = {}
+            component.nodes         = nodes
+            component._index_nodes()
+
+            return component
+
+        for scattered in [False, True]:
+
+            plain   = _component(scattered)
+            indexed = _component(scattered)
+            compact = _component(scattered)
+            plain._index = None
+
+            # compact node states must not change placement either
+            compact._compact_nodes()
+            compact._index_nodes()
+
+            self.assertIsInstance(indexed._index, ResourceIndex)
+            self.assertIsInstance(compact.nodes[0]['cores'], bytearray)
+
+            rng     = random.Random(42)
+            running = list()
+
+            for i in range(300):
+
+                td = {'ranks'         : rng.choice([1, 1, 1, 2, 5, 12]),
+                      'cores_per_rank': rng.choice([1, 1, 2, 3]),
+                      'gpus_per_rank' : rng.choice([0, 0, 0, 1]),
+                      'lfs_per_rank'  : 0,
+                      'mem_per_rank'  : rng.choice([0, 0, 128]),
+                      'tags'          : {}}
+
+                if td['ranks'] == 1:
+                    # non-mpi tasks must fit on a single node
+                    td['cores_per_rank'] = min(td['cores_per_rank'], 8)
+
+                slots = list()
+                for component in [plain, indexed, compact]:
+                    task = {'uid': 'task.%06d' % i, 'description': td}
+                    slots.append(component.schedule_task(task))
+                    if slots[-1]:
+                        component._change_slot_states(slots[-1], rpc.BUSY)
+
+                self.assertEqual(slots[0], slots[1])
+                self.assertEqual(slots[0], slots[2])
+                self.assertEqual(plain._node_offset, indexed._node_offset)
+                self.assertEqual(plain._node_offset, compact._node_offset)
+
+                if slots[0]:
+                    running.append(slots[0])
+
+                # release some random allocations
+                while running and rng.random() < 0.4:
+                    released = running.pop(rng.randrange(len(running)))
+                    for component in [plain, indexed, compact]:
+                        component._change_slot_states(released, rpc.FREE)
+
+            self.assertEqual(plain.nodes, indexed.nodes)
+            self.assertEqual(plain.slot_status(), compact.slot_status())
+            for node, cnode in zip(plain.nodes, compact.nodes):
+                self.assertEqual(node['cores'], list(cnode['cores']))
+                self.assertEqual(node['gpus'],  list(cnode['gpus']))
+
 
 # ------------------------------------------------------------------------------
 #
@@ -211,9 +474,13 @@ if __name__ == '__main__':
     tc = TestContinuous()
     tc.setUpClass()
     tc.test_find_resources()
+    tc.test_numa_domains()
     tc.test_scheduling()
     tc.test_schedule_task()
     tc.test_unschedule_task()
+    tc.test_unschedule_tasks()
+    tc.test_never_fits()
+    tc.test_resource_index()
 
 
 # ------------------------------------------------------------------------------
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access, unused-argument, no-value-for-parameter
+
+import sys
+
+from unittest import mock, TestCase
+
+import radical.pilot.states as rps
+
+from radical.pilot.agent.scheduler.flux import Flux
+
+from ..test_executing.fake_flux import FluxHandle, flux_modules
+
+
+# ------------------------------------------------------------------------------
+#
+class TestFluxScheduling(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Flux, '__init__', return_value=None)
+    def test_work(self, mocked_init):
+
+        fh = FluxHandle()
+
+        sched = Flux(cfg=None, session=None)
+        sched._log    = mock.Mock()
+        sched._q      = mock.Mock()
+        sched._fh     = None
+        sched._lm     = mock.Mock()
+        sched.advance = mock.Mock()
+
+        sched._lm.fh.get_handle.return_value = fh
+        sched.task_to_spec = lambda task: {'uid': task['uid']}
+
+        tasks = [{'uid': 'task.%04d' % i} for i in range(5)]
+
+        with mock.patch.dict(sys.modules, flux_modules()):
+            sched.work(tasks)
+
+        sched.advance.assert_called_once_with(tasks, rps.AGENT_SCHEDULING,
+                                              publish=True, push=False)
+        sched._q.put.assert_called_once_with(tasks)
+
+        # tasks get the flux IDs of their jobs
+        for task in tasks:
+            self.assertEqual(fh.jobs[task['flux_id']], {'uid': task['uid']})
+
+        # all jobs are submitted before any submission is waited for
+        self.assertEqual([op for op, _ in fh.log], ['submit'] * 5 +
+                                                   ['get_id'] * 5)
+
+        # the flux handle is reused
+        tasks = [{'uid': 'task.0005'}]
+        with mock.patch.dict(sys.modules, flux_modules()):
+            sched.work(tasks)
+
+        self.assertEqual(sched._lm.fh.get_handle.call_count, 1)
+        self.assertIn(tasks[0]['flux_id'], fh.jobs)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestFluxScheduling()
+    tc.test_work()
+
+
+# ------------------------------------------------------------------------------
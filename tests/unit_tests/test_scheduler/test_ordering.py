@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access
+
+import os
+import tempfile
+
+from unittest import TestCase
+
+from radical.pilot.agent.scheduler.ordering import Ordering, GPUFirst
+
+
+# ------------------------------------------------------------------------------
+#
+class TestOrdering(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        # 2 nodes: 16 cores, 2 GPUs, 1024 memory
+        cls._nodes = [{'cores': [0] * 8,
+                       'gpus' : [0] * 1,
+                       'lfs'  : 0,
+                       'mem'  : 512} for _ in range(2)]
+
+        # name: tuple_size (ranks, cores, gpus, lfs, mem), priority
+        cls._tasks = {'cpu.large': [(2, 3, 0, 0,   0), 0],
+                      'cpu.small': [(1, 1, 0, 0,   0), 0],
+                      'gpu'      : [(1, 1, 1, 0,   0), 0],
+                      'mem'      : [(1, 1, 0, 0, 768), 0],
+                      'prio'     : [(1, 1, 0, 0,   0), 2]}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _order(self, ordering):
+
+        tasks = list()
+        for uid, (ts, priority) in self._tasks.items():
+            tasks.append({'uid'        : uid,
+                          'tuple_size' : ts,
+                          'description': {'tags': {'priority': priority}}})
+
+        return [t['uid'] for t in sorted(tasks, key=ordering.key)]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_builtin(self):
+
+        for name, order in [
+                ['largest_first',  ['cpu.large', 'gpu', 'cpu.small', 'mem',
+                                    'prio']],
+                ['smallest_first', ['cpu.small', 'prio', 'cpu.large', 'gpu',
+                                    'mem']],
+                ['gpu_first',      ['gpu', 'cpu.large', 'cpu.small', 'mem',
+                                    'prio']],
+                ['drf',            ['cpu.small', 'prio', 'cpu.large', 'gpu',
+                                    'mem']],
+                ['priority',       ['prio', 'cpu.large', 'gpu', 'cpu.small',
+                                    'mem']]]:
+
+            ordering = Ordering.create(name, self._nodes)
+            self.assertEqual(self._order(ordering), order, name)
+
+        with self.assertRaises(ValueError):
+            Ordering.create('unknown', self._nodes)
+
+        with self.assertRaises(TypeError):
+            GPUFirst.create('gpu_first', self._nodes)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_custom(self):
+
+        src = '\n'.join([
+            'from radical.pilot.agent.scheduler.ordering import Ordering',
+            'class ByUID(Ordering):',
+            '    def key(self, task):',
+            '        return task["uid"]',
+            ''])
+
+        with tempfile.NamedTemporaryFile('w', suffix='.py') as fout:
+            fout.write(src)
+            fout.flush()
+
+            ordering = Ordering.create('%s:ByUID' % fout.name, self._nodes)
+            self.assertEqual(self._order(ordering), sorted(self._tasks))
+
+        with self.assertRaises(ValueError):
+            Ordering.create('/no/such/file.py:ByUID', self._nodes)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_priority_tags(self):
+
+        ordering = Ordering.create('priority', self._nodes)
+
+        def _key(priority):
+            return ordering.key({'tuple_size' : (1, 1, 0, 0, 0),
+                                 'description': {'tags': {'priority': priority}}})
+
+        self.assertEqual(_key(None), _key(0))
+        self.assertEqual(_key('3'),  _key(3))
+        self.assertLess (_key(3),    _key(0))
+
+        for priority in ['high', [1], 1.5j]:
+            with self.assertRaises(ValueError):
+                _key(priority)
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestOrdering()
+    tc.setUpClass()
+    tc.test_builtin()
+    tc.test_custom()
+    tc.test_priority_tags()
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access
+
+from unittest import TestCase
+
+import radical.pilot.constants as rpc
+
+from radical.pilot.agent.scheduler.shards import Shards
+
+
+# ------------------------------------------------------------------------------
+#
+class TestShards(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _nodes(self, n_nodes, cores=8, gpus=2):
+
+        return [{'node_name': 'node.%04d' % i,
+                 'node_id'  : 'node.%04d' % i,
+                 'cores'    : [0] * cores,
+                 'gpus'     : [0] * gpus,
+                 'lfs'      : 0,
+                 'mem'      : 0} for i in range(n_nodes)]
+
+
+    # --------------------------------------------------------------------------
+    #
+    def _task(self, uid, ranks, cores, gpus=0, tags=None, node_ids=None):
+
+        task = {'uid'        : uid,
+                'description': {'ranks'         : ranks,
+                                'cores_per_rank': cores,
+                                'gpus_per_rank' : gpus,
+                                'tags'          : tags or {}}}
+        if node_ids:
+            task['slots'] = {'ranks': [{'node_id': nid} for nid in node_ids]}
+
+        return task
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_init(self):
+
+        nodes  = self._nodes(10)
+        shards = Shards(nodes, 3)
+
+        self.assertEqual(len(shards), 3)
+        self.assertEqual(sorted(shards.node_ids(0)),
+                         ['node.0000', 'node.0001', 'node.0002'])
+        self.assertEqual(sorted(shards.node_ids(2)),
+                         ['node.0006', 'node.0007', 'node.0008', 'node.0009'])
+
+        # at most one shard per node
+        self.assertEqual(len(Shards(nodes[:2], 4)), 2)
+
+        # partitions are not split, and unpartitioned nodes are distributed
+        partitions = {0: ['node.0000', 'node.0001', 'node.0002'],
+                      1: ['node.0003', 'node.0004']}
+        shards     = Shards(nodes[:6], 2, partitions)
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(sorted(shards.node_ids(0)),
+                         ['node.0000', 'node.0001', 'node.0002'])
+        self.assertEqual(sorted(shards.node_ids(1)),
+                         ['node.0003', 'node.0004', 'node.0005'])
+
+        # fewer partitions than shards
+        shards = Shards(nodes[:5], 4, partitions)
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(shards._partitions, {'0': 0, '1': 1})
+
+        with self.assertRaises(ValueError):
+            Shards(nodes, 2, routing='random')
+
+        with self.assertRaises(ValueError):
+            Shards([], 2)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_route(self):
+
+        shards = Shards(self._nodes(4), 2)
+
+        # tasks go to the least loaded shard
+        self.assertEqual(shards.route(self._task('t.0', 2, 4)), 0)
+        self.assertEqual(shards.route(self._task('t.1', 1, 2)), 1)
+        self.assertEqual(shards.route(self._task('t.2', 1, 2)), 1)
+        self.assertEqual(shards.route(self._task('t.3', 1, 8)), 1)
+        self.assertEqual(shards.route(self._task('t.4', 1, 1)), 0)
+        self.assertEqual(shards._load, [[9, 0], [12, 0]])
+
+        # GPUs count as well
+        self.assertEqual(shards.route(self._task('t.5', 2, 1, 2)), 0)
+        self.assertEqual(shards.route(self._task('t.6', 1, 1)), 1)
+
+        # colocated tasks follow the first task with that tag
+        tags = {'colocate': 'x'}
+        self.assertEqual(shards.route(self._task('t.7', 1, 1, 0, tags)), 1)
+        self.assertEqual(shards.route(self._task('t.8', 1, 1, 0, tags)), 1)
+        self.assertEqual(shards.route(self._task('t.9', 1, 1, 0, tags)), 1)
+
+        # raptor tasks go to the first shard, without adding load
+        load = [list(load) for load in shards._load]
+        task = self._task('t.10', 1, 8)
+        task['description']['scheduler'] = 'master.0000'
+        self.assertEqual(shards.route(task), 0)
+        self.assertEqual(shards._load, load)
+
+        # tasks which don't fit any shard span shards, unless they are
+        # non-mpi tasks (which are left to fail)
+        self.assertIsNone(shards.route(self._task('t.11', 5, 4)))
+        self.assertEqual (shards.route(self._task('t.12', 1, 32)), 0)
+
+        # tasks of the same shape go to the same shard
+        shards = Shards(self._nodes(4), 2, routing='shape')
+        idx    = shards.route(self._task('t.0', 1, 2))
+        for i in range(1, 5):
+            self.assertEqual(shards.route(self._task('t.%d' % i, 1, 2)), idx)
+
+        # tasks of partitions go to the partition's shard
+        partitions = {'0': ['node.0000', 'node.0001'],
+                      '1': ['node.0002', 'node.0003']}
+        shards     = Shards(self._nodes(4), 2, partitions)
+        for i in range(4):
+            task = self._task('t.%d' % i, 1, 1, 0, {'partition': 1})
+            self.assertEqual(shards.route(task), 1)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_split_release(self):
+
+        shards = Shards(self._nodes(6), 3)
+
+        # a plain task is released on the shard which holds its nodes
+        task = self._task('t.0', 4, 4, 0, node_ids=['node.0002', 'node.0003'])
+        self.assertEqual(shards.route(task), 0)
+        self.assertEqual(shards.release(task), [[1, task]])
+        self.assertEqual(shards._load, [[16, 0], [-16, 0], [0, 0]])
+
+        shards._load = [[16, 0], [0, 0], [0, 0]]
+
+        # 10 ranks of 4 cores: least loaded shards first, as full as possible
+        task  = self._task('t.1', 10, 4)
+        parts = shards.split(task)
+        self.assertEqual([[idx, td['ranks']] for idx, td in parts],
+                         [[1, 4], [2, 4], [0, 2]])
+        self.assertEqual(parts[0][1]['cores_per_rank'], 4)
+        self.assertEqual(task['description']['ranks'], 10)
+        self.assertEqual(shards._load, [[24, 0], [16, 0], [16, 0]])
+
+        # on completion, each shard gets its part of the slots
+        task['slots'] = {'ranks': [{'node_id': 'node.%04d' % (2 + i // 2)}
+                                   for i in range(8)] +
+                                  [{'node_id': 'node.0000'}] * 2}
+        released = shards.release(task)
+        self.assertEqual([[idx, len(part['slots']['ranks'])]
+                          for idx, part in released],
+                         [[1, 4], [2, 4], [0, 2]])
+        self.assertEqual(released[2][1]['description']['ranks'], 2)
+        self.assertEqual(shards._load, [[16, 0], [0, 0], [0, 0]])
+
+        # tasks larger than the pilot can't be split
+        self.assertEqual(shards.split(self._task('t.2', 13, 4)), [])
+
+    # --------------------------------------------------------------------------
+    #
+    def test_capacity(self):
+
+        nodes = self._nodes(4)
+        for node in nodes:
+            node['lfs'] = 1000
+            node['mem'] = 1000
+
+        # shard 0 has only half of its cores up, shard 1 lacks memory
+        nodes[0]['cores'] = [rpc.FREE] * 4 + [rpc.DOWN] * 4
+        nodes[1]['cores'] = [rpc.FREE] * 4 + [rpc.DOWN] * 4
+        nodes[2]['mem']   = 100
+        nodes[3]['mem']   = 100
+
+        shards = Shards(nodes, 2)
+
+        def _task(uid, ranks, cores, gpus=0, lfs=0, mem=0):
+            task = self._task(uid, ranks, cores, gpus)
+            task['description']['lfs_per_rank'] = lfs
+            task['description']['mem_per_rank'] = mem
+            return task
+
+        # DOWN cores don't count
+        self.assertEqual(shards._get_capacity(_task('t', 1, 4)['description']),
+                         [2, 4])
+        self.assertEqual(shards.route(_task('t.0', 3, 4)), 1)
+
+        # gpus, lfs and memory limit the capacity, too
+        for kwargs, capacity in [[{'gpus': 2},  [2, 2]],
+                                 [{'lfs' : 600}, [2, 2]],
+                                 [{'mem' : 200}, [8, 0]]]:
+            td = _task('t', 1, 1, **kwargs)['description']
+            self.assertEqual(shards._get_capacity(td), capacity, kwargs)
+
+        self.assertEqual(shards.route(_task('t.1', 2, 1, mem=200)), 0)
+
+        # tasks which don't fit any single shard span shards
+        self.assertIsNone(shards.route(_task('t.2', 3, 1, mem=600)))
+        self.assertEqual([[idx, td['ranks']]
+                          for idx, td in shards.split(_task('t.2', 4, 1,
+                                                            lfs=600))],
+                         [[0, 2], [1, 2]])
+
+    # --------------------------------------------------------------------------
+    #
+    def test_fail_abort(self):
+
+        shards = Shards(self._nodes(6), 3)
+
+        # failed tasks release their load
+        task = self._task('t.0', 2, 4)
+        idx  = shards.route(task)
+        self.assertEqual(shards._load[idx], [8, 0])
+        shards.fail(idx, task)
+        self.assertEqual(shards._load[idx], [0, 0])
+
+        # aborted spanning tasks release the load of all their parts
+        task  = self._task('t.1', 10, 4)
+        parts = shards.split(task)
+        self.assertEqual(shards.abort('t.1'), dict(parts))
+        self.assertEqual(shards._load, [[0, 0]] * 3)
+        self.assertEqual(shards.abort('t.1'), dict())
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestShards()
+    tc.test_init()
+    tc.test_route()
+    tc.test_split_release()
+    tc.test_capacity()
+    tc.test_fail_abort()
+
+
+# ------------------------------------------------------------------------------
+
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# pylint: disable=protected-access
+
+from unittest import TestCase
+
+from radical.pilot.agent.scheduler.ordering import Ordering
+from radical.pilot.agent.scheduler.waitpool import WaitPool
+
+
+# ------------------------------------------------------------------------------
+#
+class TestWaitPool(TestCase):
+
+    # --------------------------------------------------------------------------
+    #
+    def _task(self, uid, cores, tags=None):
+
+        return {'uid'        : uid,
+                'tuple_size' : [1, cores, 0, 0, 0],
+                'description': {'tags': tags or {}}}
+
+
+    # --------------------------------------------------------------------------
+    #
+    def test_waitpool(self):
+
+        nodes = [{'cores': [0] * 8, 'gpus': [], 'lfs': 0, 'mem': 0}]
+        pool  = WaitPool(Ordering.create('largest_first', nodes))
+
+        pool.add([self._task('a.0', 1),
+                  self._task('b.0', 4),
+                  self._task('a.1', 1),
+                  self._task('c.0', 4, {'colocate': 'x'}),
+                  self._task('b.1', 4),
+                  self._task('c.1', 4, {'colocate': 'x'})])
+
+        self.assertEqual(len(pool), 6)
+        self.assertIn('a.1', pool)
+        self.assertEqual(pool.get('b.1')['uid'], 'b.1')
+
+        # classes are sorted by ordering key, constrained tasks are separate
+        classes = pool.classes()
+        self.assertEqual(classes, [((-4, 0), (1, 4, 0, 0, 0), False),
+                                   ((-4, 0), (1, 4, 0, 0, 0), True),
+                                   ((-1, 0), (1, 1, 0, 0, 0), False)])
+
+        # tasks are kept in order of arrival within each class
+        self.assertEqual(pool.head(classes[0])['uid'], 'b.0')
+        self.assertEqual([t['uid'] for t in pool.queue(classes[1])],
+                         ['c.0', 'c.1'])
+
+        # removed tasks are dropped from the queues lazily
+        self.assertEqual(pool.pop('b.0')['uid'], 'b.0')
+        self.assertIsNone(pool.pop('b.0'))
+        self.assertEqual(pool.head(classes[0])['uid'], 'b.1')
+
+        pool.pop('c.0')
+        self.assertEqual([t['uid'] for t in pool.queue(classes[1])], ['c.1'])
+
+        # tasks are popped by shape from unconstrained classes only
+        self.assertEqual(pool.pop_shape((1, 4, 0, 0, 0))['uid'], 'b.1')
+        self.assertIsNone(pool.pop_shape((1, 4, 0, 0, 0)))
+        self.assertIsNone(pool.pop_shape((1, 2, 0, 0, 0)))
+        self.assertEqual(pool.pop_shape((1, 1, 0, 0, 0))['uid'], 'a.0')
+
+        # empty classes are removed
+        self.assertEqual(pool.classes(), classes[1:])
+        self.assertEqual(sorted(pool), ['a.1', 'c.1'])
+
+        pool.pop('a.1')
+        pool.pop('c.1')
+        self.assertEqual(pool.classes(), [])
+        self.assertEqual(pool._shapes, {})
+        self.assertEqual(len(pool), 0)
+
+        # known ordering keys are not computed again
+        pool.add([self._task('d.0', 2), self._task('d.1', 2)], {'d.0': (0, 0)})
+        self.assertEqual(pool.classes(), [((-2, 0), (1, 2, 0, 0, 0), False),
+                                          (( 0, 0), (1, 2, 0, 0, 0), False)])
+
+
+# ------------------------------------------------------------------------------
+#
+if __name__ == '__main__':
+
+    tc = TestWaitPool()
+    tc.test_waitpool()
+
+
+# ------------------------------------------------------------------------------
+
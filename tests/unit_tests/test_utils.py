@@ -1,10 +1,17 @@
 # pylint: disable=protected-access, unused-argument, no-value-for-parameter
 
+import copy
 import glob
 import os
 import shutil
+import msgpack
+import tempfile
+import time
+import zlib
 
-from unittest import TestCase
+import threading as mt
+
+from unittest import mock, TestCase
 
 import radical.utils        as ru
 import radical.pilot.states as rps
@@ -12,6 +19,13 @@ import radical.pilot.states as rps
 import radical.pilot.utils.db_utils   as rpu_db
 import radical.pilot.utils.prof_utils as rpu_prof
 import radical.pilot.utils.misc       as rpu_misc
+import radical.pilot.utils.codec      as rpu_codec
+import radical.pilot.utils.task_store as rpu_store
+import radical.pilot.utils.bulking    as rpu_bulk
+import radical.pilot.utils.worker_pool as rpu_pool
+
+from radical.pilot.utils.cancel    import CancelRegistry
+from radical.pilot.utils.component import Component
 
 
 # ------------------------------------------------------------------------------
@@ -202,6 +216,661 @@ class TestUtils(TestCase):
         self.assertEqual(str(rj_url),
                          rcfgs.xsede.bridges2.gsissh.job_manager_endpoint)
 
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch('time.time', return_value=100.0)
+    def test_cancel_registry(self, mocked_time):
+
+        reg = CancelRegistry(ttl=10.0)
+        self.assertFalse(reg)
+        self.assertFalse(reg.pop('task.0000'))
+
+        reg.add(['task.0000', 'task.0001'])
+        self.assertEqual(len(reg), 2)
+        self.assertIn('task.0000', reg)
+
+        # requests are consumed once
+        self.assertTrue(reg.pop('task.0000'))
+        self.assertFalse(reg.pop('task.0000'))
+
+        # re-registration renews requests, expired requests are purged
+        mocked_time.return_value = 105.0
+        reg.add(['task.0002', 'task.0001'])
+        mocked_time.return_value = 112.0
+        reg.add(['task.0003'])
+        self.assertEqual(len(reg), 3)
+
+        mocked_time.return_value = 116.0
+        reg.add([])
+        self.assertNotIn('task.0001', reg)
+        self.assertNotIn('task.0002', reg)
+        self.assertTrue(reg.pop('task.0003'))
+        self.assertFalse(reg)
+
+    # --------------------------------------------------------------------------
+    #
+    def test_tail_file(self):
+
+        fname = tempfile.mktemp()
+        self._cleanup_files.append(fname)
+
+        for txt in ['', 'abc\n', 'x\r\ny' * 2000, '\u20ac' * 1500]:
+
+            with ru.ru_open(fname, 'w') as fout:
+                fout.write(txt)
+
+            with ru.ru_open(fname, 'r') as fin:
+                expected = rpu_misc.tail(fin.read())
+
+            # only the tail is read, but the result is the same
+            self.assertEqual(rpu_misc.tail_file(fname), expected)
+            self.assertEqual(rpu_misc.tail_file(fname, grep=b'EXEC'),
+                             (expected, []))
+
+        with ru.ru_open(fname, 'w') as fout:
+            fout.write('a\n[node:1] JOB [1,2] EXECUTING\nb\nEXECUTING')
+        self.assertEqual(rpu_misc.tail_file(fname, grep=b'EXECUTING')[1],
+                         ['[node:1] JOB [1,2] EXECUTING', 'EXECUTING'])
+
+        with open(fname, 'wb') as fout:
+            fout.write(b'\xff\xfe')
+        with self.assertRaises(UnicodeDecodeError):
+            rpu_misc.tail_file(fname)
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Component, '__init__', return_value=None)
+    def test_advance(self, mocked_init):
+
+        comp = Component(cfg=None, session=None)
+        comp._log     = mock.Mock()
+        comp._prof    = mock.Mock()
+        comp._outputs = {rps.AGENT_SCHEDULING_PENDING: mock.Mock(),
+                         rps.AGENT_EXECUTING_PENDING : None}
+        comp._outputs[rps.AGENT_SCHEDULING_PENDING].name = 'sched_queue'
+        comp.publish  = mock.Mock()
+        comp._task_store = None
+
+        things = [{'uid': 'task.%04d' % i, 'type': 'task', 'state': None,
+                   'foo': i} for i in range(4)]
+        things[1]['$all'] = True
+        things[1]['$set'] = ['foo']
+        things[2]['$set'] = ['foo']
+
+        comp.advance(things, rps.AGENT_SCHEDULING_PENDING, publish=True,
+                     push=True, ts=1.0)
+
+        # state updates only carry the requested fields
+        msg = comp.publish.call_args[0][1]
+        self.assertEqual(msg['cmd'], 'update')
+        self.assertEqual(msg['arg'],
+                [{'uid': 'task.0000', 'type': 'task',
+                  'state': rps.AGENT_SCHEDULING_PENDING},
+                 things[1],
+                 {'uid': 'task.0002', 'type': 'task', 'foo': 2,
+                  'state': rps.AGENT_SCHEDULING_PENDING},
+                 {'uid': 'task.0003', 'type': 'task',
+                  'state': rps.AGENT_SCHEDULING_PENDING}])
+        for thing in things:
+            self.assertNotIn('$all', thing)
+            self.assertNotIn('$set', thing)
+
+        # one profile call and one put per bucket
+        uids = [thing['uid'] for thing in things]
+        comp._prof.prof.assert_any_call('advance', uid=uids,
+                                        state=rps.AGENT_SCHEDULING_PENDING,
+                                        ts=1.0)
+        comp._prof.prof.assert_any_call('put', uid=uids,
+                                        state=rps.AGENT_SCHEDULING_PENDING,
+                                        msg='sched_queue', ts=mock.ANY)
+        comp._outputs[rps.AGENT_SCHEDULING_PENDING].put.assert_called_once_with(
+                                                                        things)
+
+        # things keep their state if none is given, final things and things
+        # without output are dropped, things w/o output target are lost
+        things[0]['state'] = rps.DONE
+        things[1]['state'] = rps.AGENT_EXECUTING_PENDING
+        things[2]['state'] = rps.AGENT_STAGING_OUTPUT_PENDING
+        things[3]['state'] = rps.AGENT_STAGING_OUTPUT_PENDING
+        things[3]['$all']  = True
+
+        comp._prof.reset_mock()
+        comp.publish.reset_mock()
+        comp.advance(things, publish=False, push=True, prof=False, ts=2.0)
+
+        comp.publish.assert_not_called()
+        self.assertNotIn('$all', things[3])
+        self.assertEqual(comp._prof.prof.call_args_list, [
+            mock.call('drop', uid=['task.0000'], state=rps.DONE, ts=2.0),
+            mock.call('drop', uid=['task.0001'],
+                      state=rps.AGENT_EXECUTING_PENDING, ts=2.0),
+            mock.call('lost', uid=['task.0002', 'task.0003'],
+                      state=rps.AGENT_STAGING_OUTPUT_PENDING, ts=2.0)])
+
+    # --------------------------------------------------------------------------
+    #
+    def test_sandbox_bucket(self):
+
+        buckets = [rpu_misc.sandbox_bucket('task.%06d' % i, 256)
+                   for i in range(10000)]
+
+        # stable, fixed width names, spread over all buckets
+        self.assertEqual(rpu_misc.sandbox_bucket('task.000000', 256),
+                         buckets[0])
+        self.assertEqual(set(len(b) for b in buckets), {2})
+        self.assertEqual(len(set(buckets)), 256)
+
+        self.assertEqual(rpu_misc.sandbox_bucket('task.000000', 1), '0')
+        self.assertEqual(len(rpu_misc.sandbox_bucket('task.000000', 4097)), 4)
+
+    # --------------------------------------------------------------------------
+    #
+    def test_get_stage_report(self):
+
+        def _state(t, uid, state):
+            return [t, 'state', 'comp', 'thread', uid, state, '']
+
+        profile = list()
+        for i in range(4):
+            uid = 'task.%04d' % i
+            profile += [_state(10.0 + i, uid, rps.AGENT_SCHEDULING_PENDING),
+                        _state(11.0 + i, uid, rps.AGENT_SCHEDULING),
+                        _state(12.0 + i, uid, rps.AGENT_EXECUTING_PENDING),
+                        _state(12.0 + i, uid, rps.AGENT_EXECUTING),
+                        _state(15.0 + i, uid, rps.AGENT_STAGING_OUTPUT_PENDING),
+                        _state(16.0 + i, uid, rps.DONE)]
+            profile.append([11.5 + i, 'schedule_ok', 'comp', 'thread', uid,
+                            '', ''])
+
+        # a task which failed during execution
+        profile += [_state(20.0, 'task.0004', rps.AGENT_EXECUTING),
+                    _state(21.0, 'task.0004', rps.FAILED)]
+
+        report = rpu_prof.get_stage_report(profile)
+        self.assertEqual(list(report), rpu_prof.AGENT_STAGES)
+
+        sched = report[rps.AGENT_SCHEDULING]
+        self.assertEqual(sched['n'], 4)
+        self.assertEqual(sched['throughput'], 4 / 4.0)
+        self.assertEqual(sched['latency'], {'mean': 1.0, 'p50': 1.0,
+                                            'p95' : 1.0, 'max': 1.0})
+
+        # a stage ends with any later state
+        execs = report[rps.AGENT_EXECUTING]
+        self.assertEqual(execs['n'], 5)
+        self.assertEqual(execs['latency']['mean'], 13.0 / 5)
+        self.assertEqual(execs['latency']['max'], 3.0)
+
+        self.assertEqual(report[rps.AGENT_STAGING_INPUT]['n'], 0)
+        self.assertEqual(report[rps.AGENT_STAGING_OUTPUT_PENDING]['n'], 4)
+
+    # --------------------------------------------------------------------------
+    #
+    def test_wire_codec(self):
+
+        tasks = [{'uid'         : 'task.%04d' % i,
+                  'type'        : 'task',
+                  'state'       : rps.AGENT_SCHEDULING_PENDING,
+                  'target_state': None,
+                  'foo'         : {1: 'bar'},
+                  'description' : {'executable': '/bin/date',
+                                   'arguments' : [str(i)],
+                                   'metadata'  : {'baz': i}}}
+                 for i in range(3)]
+        updates = [{'uid': 'task.%04d' % i, 'type': 'task',
+                    'state': rps.AGENT_EXECUTING} for i in range(5)]
+        updates[3]['state'] = rps.DONE
+
+        things = updates[:2] + tasks + updates[2:] + \
+                 [{'uid': 'pilot', 'type': 'pilot', 'state': rps.PMGR_ACTIVE},
+                  {1: 'not a doc'}, 'no dict']
+
+        for fmt in ['msgpack', 'compact']:
+            envelope = rpu_codec.WireCodec(fmt).encode(things)
+            self.assertTrue(rpu_codec.is_wire_envelope(envelope))
+
+            # envelopes pass the regular msgpack path as opaque blobs
+            envelope = msgpack.unpackb(msgpack.packb([envelope]))[0]
+            self.assertEqual(rpu_codec.WireCodec.decode(envelope), things)
+
+        # state-only updates are grouped into runs, names are interned
+        records = rpu_codec._pack_compact(things)
+        self.assertEqual([rec[0] for rec in records], [0, 1, 1, 1, 0, 0, 0, 0,
+                                                       2, 2])
+        self.assertEqual(records[0][1:], ['task',
+                      rpu_codec._STATE_IDS[rps.AGENT_EXECUTING], 'task',
+                      ['0000', '0001']])
+        self.assertEqual(records[7][3:], [None, ['pilot']])
+        self.assertNotIn('description', records[1][1])
+        self.assertIn('foo', records[1][1])
+
+        # large envelopes are compressed
+        codec = rpu_codec.WireCodec('compact', compress='zlib',
+                                    compress_min=1024)
+        small = codec.encode(updates)
+        large = codec.encode(tasks * 100)
+        self.assertEqual(small.data[1], 0)
+        self.assertEqual(large.data[1], 1)
+        self.assertLess(len(large.data), len(codec.encode(tasks).data) * 10)
+        self.assertEqual(rpu_codec.WireCodec.decode(large), tasks * 100)
+
+        # envelopes are expanded in place, other things are kept
+        mixed = [{'uid': 'x'}, codec.encode(updates[:2]), {'uid': 'y'},
+                 codec.encode(updates[2:])]
+        self.assertEqual(rpu_codec.wire_expand(mixed),
+                         [{'uid': 'x'}] + updates[:2] + [{'uid': 'y'}] +
+                         updates[2:])
+        plain = [{'uid': 'x'}]
+        self.assertIs(rpu_codec.wire_expand(plain), plain)
+
+        # the interning tables must match
+        data = bytearray(codec.encode(tasks).data)
+        data[2] ^= 0xff
+        with self.assertRaises(ValueError):
+            rpu_codec.WireCodec.decode(
+                    msgpack.ExtType(rpu_codec.WIRE_EXT_CODE, bytes(data)))
+
+        with self.assertRaises(ValueError):
+            rpu_codec.WireCodec('json')
+        with self.assertRaises(ValueError):
+            rpu_codec.WireCodec('compact', compress='bzip2')
+
+        self.assertIsNone(rpu_codec.wire_codec({'codec': None}))
+        self.assertIsInstance(rpu_codec.wire_codec({'codec': 'msgpack'}),
+                              rpu_codec.WireCodec)
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Component, '__init__', return_value=None)
+    @mock.patch('radical.utils.zmq.Subscriber')
+    @mock.patch('radical.utils.zmq.Publisher')
+    @mock.patch('radical.utils.zmq.Putter')
+    def test_wire_endpoints(self, mocked_put, mocked_pub, mocked_sub,
+                            mocked_init):
+
+        pwd = tempfile.mkdtemp()
+        self._cleanup_files.append(pwd)
+
+        ru.write_json('%s/plain_queue.cfg' % pwd,
+                      {'uid': 'plain_queue', 'put': 'tcp://x:1',
+                       'get': 'tcp://x:2', 'codec': None})
+        ru.write_json('%s/wire_queue.cfg' % pwd,
+                      {'uid': 'wire_queue', 'put': 'tcp://x:1',
+                       'get': 'tcp://x:2', 'codec': 'compact'})
+        ru.write_json('%s/wire_pubsub.cfg' % pwd,
+                      {'uid': 'wire_pubsub', 'pub': 'tcp://x:1',
+                       'sub': 'tcp://x:2', 'codec': 'compact'})
+
+        comp = Component(cfg=None, session=None)
+        comp._cfg         = ru.Config(from_dict={'path': pwd})
+        comp._log         = mock.Mock()
+        comp._prof        = mock.Mock()
+        comp._cb_lock     = mock.Mock()
+        comp._pub_lock    = mt.Lock()
+        comp._publishers  = dict()
+        comp._subscribers = dict()
+
+        comp._task_store     = None
+        comp._task_store_out = False
+
+        things = [{'uid': 'task.0000', 'type': 'task',
+                   'state': rps.AGENT_EXECUTING}]
+
+        # outputs send bulks as single envelopes
+        self.assertIs(comp.get_output_ep('plain_queue'),
+                      mocked_put.return_value)
+
+        output = comp.get_output_ep('wire_queue')
+        output.put(things)
+        envelopes = mocked_put.return_value.put.call_args[0][0]
+        self.assertEqual(len(envelopes), 1)
+        self.assertEqual(rpu_codec.wire_expand(envelopes), things)
+
+        # publishers encode bulk arguments, and keep the command readable
+        comp.register_publisher('wire_pubsub')
+        comp.publish('wire_pubsub', {'cmd': 'update', 'arg': things})
+        topic, msg = mocked_pub.return_value.put.call_args[0]
+        self.assertEqual(topic, 'wire_pubsub')
+        self.assertEqual(msg['cmd'], 'update')
+        self.assertTrue(rpu_codec.is_wire_envelope(msg['arg']))
+
+        # subscribers receive decoded arguments
+        cb = mock.Mock()
+        comp.register_subscriber('wire_pubsub', cb)
+        wrapped = mocked_sub.return_value.subscribe.call_args[1]['cb']
+        wrapped('wire_pubsub', msg)
+        cb.assert_called_once_with('wire_pubsub',
+                                   {'cmd': 'update', 'arg': things})
+
+        # envelopes are expanded before things are dispatched to workers
+        worker = mock.Mock()
+        getter = mock.Mock()
+        getter.get_nowait.return_value = envelopes
+        comp._inputs       = {'in': {'queue' : getter,
+                                     'states': [rps.AGENT_EXECUTING]}}
+        comp._workers      = {rps.AGENT_EXECUTING: worker}
+        comp._cancel_list  = CancelRegistry()
+        comp._work_lock    = mt.RLock()
+
+        self.assertTrue(comp.work_cb())
+        worker.assert_called_once_with(things)
+
+    # --------------------------------------------------------------------------
+    #
+    def test_task_store(self):
+
+        sid    = 'rp.session.test_task_store.%d' % os.getpid()
+        store  = rpu_store.TaskStore(sid, mock.Mock(), min_size=256)
+        prefix = '/dev/shm/rp_%08x_' % zlib.crc32(sid.encode())
+
+        def _segments():
+            return sorted(glob.glob('%s*' % prefix))
+
+        tasks = [{'uid'        : 'task.%04d' % i,
+                  'state'      : rps.AGENT_SCHEDULING,
+                  'description': {'arguments'  : [str(i)] * 200,
+                                  'environment': {'FOO': 'bar'}}}
+                 for i in range(3)]
+        pilot = {'uid': 'pilot.0000', 'state': rps.PMGR_ACTIVE}
+        small = {'uid': 'task.small', 'state': rps.AGENT_SCHEDULING,
+                 'description': {'executable': '/bin/date'}}
+
+        try:
+            # descriptions are replaced by references, the tasks are unchanged
+            refs = store.strip(tasks + [pilot, small])
+            self.assertEqual(len(_segments()), 3)
+            self.assertIs(refs[3], pilot)
+
+            # small descriptions are passed inline
+            self.assertIs(refs[4], small)
+            refs = refs[:4]
+            for task, ref in zip(tasks, refs):
+                self.assertIn('description', task)
+                self.assertNotIn('description', ref)
+                self.assertEqual(ref['uid'], task['uid'])
+                self.assertTrue(ref['$descr'].endswith(task['uid']))
+
+            # descriptions are restored from the store in another component
+            other  = rpu_store.TaskStore(sid, mock.Mock())
+            loaded = other.load(copy.deepcopy(refs))
+            self.assertEqual(loaded, tasks + [pilot])
+
+            # tasks passed on again refer to the same segments
+            self.assertEqual(other.strip(loaded), refs)
+            self.assertEqual(len(_segments()), 3)
+
+            # tasks leave the store on release, and on terminal load
+            other.load(copy.deepcopy(refs[:2]))
+            other.release(['task.0000', 'task.0002'])
+            self.assertEqual(len(_segments()), 2)
+
+            self.assertEqual(other.load(copy.deepcopy(refs[1:2]), release=True),
+                             tasks[1:2])
+            self.assertEqual(len(_segments()), 1)
+
+            # missing descriptions are reported
+            other.load(copy.deepcopy(refs[1:2]))
+            other._log.error.assert_called_once()
+
+            # puts to queues outside the store pass complete tasks
+            putter = mock.Mock()
+            store.load(copy.deepcopy(refs[2:3]))
+            rpu_store.TaskStorePutter(putter, store, release=True).put(tasks[2])
+            putter.put.assert_called_once_with([tasks[2]], qname=None)
+            self.assertEqual(_segments(), [])
+
+            store.strip(tasks)
+            store.cleanup()
+            self.assertEqual(_segments(), [])
+
+            # segments can be removed without a store instance
+            store.strip(tasks)
+            rpu_store.TaskStore.purge(sid)
+            self.assertEqual(_segments(), [])
+
+        finally:
+            store.cleanup()
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Component, '__init__', return_value=None)
+    @mock.patch('radical.utils.zmq.Putter')
+    def test_task_store_endpoints(self, mocked_put, mocked_init):
+
+        pwd = tempfile.mkdtemp()
+        self._cleanup_files.append(pwd)
+
+        ru.write_json('%s/store_queue.cfg' % pwd,
+                      {'uid': 'store_queue', 'put': 'tcp://x:1',
+                       'get': 'tcp://x:2', 'task_store': True,
+                       'task_store_min': 1})
+
+        def _component():
+            comp = Component(cfg=None, session=None)
+            comp._cfg            = ru.Config(from_dict={'path': pwd,
+                                                        'sid' : 'rp.test.%d'
+                                                                % os.getpid()})
+            comp._log            = mock.Mock()
+            comp._prof           = mock.Mock()
+            comp._task_store     = None
+            comp._task_store_out = False
+            comp._cancel_list    = CancelRegistry()
+            comp._work_lock      = mt.RLock()
+            comp._outputs        = dict()
+            comp.publish         = mock.Mock()
+            return comp
+
+        src = _component()
+        dst = _component()
+
+        task = {'uid'        : 'task.0000',
+                'type'       : 'task',
+                'state'      : rps.AGENT_SCHEDULING_PENDING,
+                'description': {'executable': '/bin/date'}}
+
+        try:
+            # the producer pushes references
+            src._outputs[rps.AGENT_SCHEDULING_PENDING] = \
+                                           src.get_output_ep('store_queue')
+            self.assertTrue(src._task_store_out)
+
+            src.advance(task, push=True, publish=False)
+            sent = mocked_put.return_value.put.call_args[0][0]
+            self.assertNotIn('description', sent[0])
+
+            # the consumer restores descriptions - it does not push into the
+            # store, so the task leaves the store
+            worker = mock.Mock()
+            getter = mock.Mock()
+            getter.get_nowait.return_value = copy.deepcopy(sent)
+
+            with mock.patch('radical.utils.zmq.Getter', return_value=getter):
+                dst._inputs = {'in': {'queue' : dst.get_input_ep('store_queue'),
+                                      'states': [task['state']]}}
+            dst._workers = {task['state']: worker}
+
+            self.assertTrue(dst.work_cb())
+            worker.assert_called_once_with([task])
+            self.assertEqual(dst._task_store._refs, dict())
+
+            # tasks in final state leave the store
+            src._task_store.strip([task])
+            dst._task_store_out = True
+            getter.get_nowait.return_value = copy.deepcopy(sent)
+            dst.work_cb()
+            self.assertIn(task['uid'], dst._task_store._refs)
+
+            dst.advance(task, rps.FAILED, publish=False, push=False)
+            self.assertEqual(dst._task_store._refs, dict())
+
+        finally:
+            src._task_store.cleanup()
+
+    # --------------------------------------------------------------------------
+    #
+    def test_bulk_sizer(self):
+
+        sizer = rpu_bulk.BulkSizer(size_min=2, size_max=16)
+        self.assertEqual(sizer.size, 2)
+
+        # grow under backlog, up to the max size
+        self.assertEqual([sizer.update(backlog=True, drained=False)
+                          for _ in range(4)], [4, 8, 16, 16])
+
+        # no change if neither backlogged nor drained
+        self.assertEqual(sizer.update(backlog=False, drained=False), 16)
+
+        # shrink when drained, down to the min size
+        self.assertEqual([sizer.update(backlog=False, drained=True)
+                          for _ in range(4)], [8, 4, 2, 2])
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Component, '__init__', return_value=None)
+    def test_get_bulk(self, mocked_init):
+
+        comp = Component(cfg=None, session=None)
+        comp._uid  = 'comp.0000'
+        comp._prof = mock.Mock()
+
+        things = [{'uid': 'task.%04d' % i} for i in range(8)]
+        getter = mock.Mock()
+        getter.channel = 'in_queue'
+
+        # without bulking, a single get is done
+        getter.get_nowait.side_effect = [things[:2], things[2:4]]
+        comp._inputs = {'in': {'queue': getter, 'states': []}}
+        self.assertEqual(comp._get_bulk('in'), things[:2])
+        self.assertEqual(getter.get_nowait.call_count, 1)
+
+        # with bulking, gets are repeated until the bulk size is reached
+        comp._bulk_latency = 10.0
+        sizer = rpu_bulk.BulkSizer()
+        comp._inputs = {'in': {'queue': getter, 'states': [], 'bulk': sizer}}
+
+        getter.reset_mock()
+        getter.get_nowait.side_effect = [things[:1], things[1:2]]
+        self.assertEqual(comp._get_bulk('in'), things[:1])
+        self.assertEqual(getter.get_nowait.call_count, 1)
+        self.assertEqual(sizer.size, 2)
+
+        # ... or the input drains
+        getter.reset_mock()
+        getter.get_nowait.side_effect = [things[:1], things[1:3], []]
+        self.assertEqual(comp._get_bulk('in'), things[:3])
+        self.assertEqual(sizer.size, 4)
+
+        getter.get_nowait.side_effect = [things[:1], []]
+        self.assertEqual(comp._get_bulk('in'), things[:1])
+        self.assertEqual(sizer.size, 2)
+
+        # bulk sizes are profiled
+        comp._prof.prof.assert_called_with('get_bulk', uid='comp.0000',
+                                           msg='in_queue:1:2')
+
+        # nothing is collected if the input is empty
+        getter.get_nowait.side_effect = [[]]
+        self.assertEqual(comp._get_bulk('in'), [])
+        self.assertEqual(sizer.size, 2)
+
+    # --------------------------------------------------------------------------
+    #
+    def test_worker_pool(self):
+
+        done = list()
+        lock = mt.Lock()
+
+        def work(state, things):
+            time.sleep(0.01)
+            with lock:
+                done.extend([(thing.get('uid'), state) for thing in things])
+
+        pool = rpu_pool.WorkerPool('test_pool', 4, work)
+        self.assertEqual(pool.size, 4)
+
+        # the bulks with a given thing are worked upon in order
+        states = ['A', 'B', 'C']
+        for state in states:
+            pool.submit(state, [{'uid': 'task.%04d' % i} for i in range(32)])
+        pool.submit(None, [dict() for _ in range(8)])
+
+        start = time.time()
+        while len(done) < 3 * 32 + 8 and time.time() - start < 10:
+            time.sleep(0.01)
+        pool.stop()
+
+        self.assertEqual(len(done), 3 * 32 + 8)
+        for i in range(32):
+            uid = 'task.%04d' % i
+            self.assertEqual([s for u, s in done if u == uid], states)
+
+        # stateless things without uid are spread over the lanes
+        self.assertEqual(len([u for u, s in done if u is None]), 8)
+
+        # a stopped pool works on submissions in the calling thread
+        del done[:]
+        pool.submit('D', [{'uid': 'task.%04d' % i} for i in range(8)])
+        self.assertEqual(sorted(done),
+                         [('task.%04d' % i, 'D') for i in range(8)])
+
+        # stopping a pool does not drop pending bulks
+        del done[:]
+        pool = rpu_pool.WorkerPool('test_pool', 2, work, depth=8)
+        for state in states:
+            for i in range(0, 32, 2):
+                pool.submit(state, [{'uid': 'task.%04d' % i},
+                                    {'uid': 'task.%04d' % (i + 1)}])
+        pool.stop()
+
+        self.assertEqual(len(done), 3 * 32)
+        for i in range(32):
+            uid = 'task.%04d' % i
+            self.assertEqual([s for u, s in done if u == uid], states)
+
+    # --------------------------------------------------------------------------
+    #
+    @mock.patch.object(Component, '__init__', return_value=None)
+    def test_work_pooled(self, mocked_init):
+
+        comp = Component(cfg=None, session=None)
+        comp._log          = mock.Mock()
+        comp._prof         = mock.Mock()
+        comp._cancel_list  = CancelRegistry()
+        comp._work_lock    = mt.RLock()
+        comp._task_store   = None
+        comp.advance       = mock.Mock()
+
+        things = [{'uid': 'task.%04d' % i, 'state': rps.AGENT_STAGING_INPUT}
+                  for i in range(8)]
+        worker = mock.Mock(side_effect=[None, RuntimeError('oops')])
+        getter = mock.Mock()
+        getter.get_nowait.return_value = things
+
+        # bulks are handed to the pool, which calls the worker
+        pool = rpu_pool.WorkerPool('test_pool', 1, comp._work_pooled)
+        comp._inputs  = {'in': {'queue' : getter,
+                                'states': [rps.AGENT_STAGING_INPUT],
+                                'pool'  : pool}}
+        comp._workers = {rps.AGENT_STAGING_INPUT: worker}
+
+        try:
+            self.assertTrue(comp.work_cb())
+            self.assertTrue(comp.work_cb())
+
+            start = time.time()
+            while not comp.advance.called and time.time() - start < 10:
+                time.sleep(0.01)
+
+        finally:
+            pool.stop()
+
+        self.assertEqual(worker.call_count, 2)
+        worker.assert_called_with(things)
+
+        # failed bulks fail their things
+        comp.advance.assert_called_once_with(things, rps.FAILED,
+                                             publish=True, push=False)
+
 
 # ------------------------------------------------------------------------------
 #
@@ -212,6 +881,19 @@ if __name__ == '__main__':
     tc.test_expand_sduration()
     tc.test_get_session_docs()
     tc.test_resource_cfg()
+    tc.test_cancel_registry()
+    tc.test_tail_file()
+    tc.test_advance()
+    tc.test_sandbox_bucket()
+    tc.test_get_stage_report()
+    tc.test_wire_codec()
+    tc.test_wire_endpoints()
+    tc.test_task_store()
+    tc.test_task_store_endpoints()
+    tc.test_bulk_sizer()
+    tc.test_get_bulk()
+    tc.test_worker_pool()
+    tc.test_work_pooled()
 
 # ------------------------------------------------------------------------------
 